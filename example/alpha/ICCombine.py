@@ -21,9 +21,7 @@ from __future__ import print_function
 from __future__ import absolute_import
 import time
 import numpy as np
-import numpy.linalg as nlg
 import pandas as pd
-import scipy.stats as stats
 import jaqs.trade.analyze as ana
 
 from jaqs.trade import PortfolioManager
@@ -33,6 +31,7 @@ from jaqs.trade import model
 from jaqs.trade import AlphaBacktestInstance
 from jaqs.trade import AlphaTradeApi
 from jaqs.trade import AlphaStrategy
+from jaqs.trade.signalcombine import ICSignalCombiner
 import jaqs.util as jutil
 
 from config_path import DATA_CONFIG_PATH, TRADE_CONFIG_PATH
@@ -76,66 +75,15 @@ def save_dataview():
     dv.save_dataview(folder_path=dataview_dir_path)
 
 
-def ic_calculation(snapshot, factorList):
-    """
-    Calculate factor IC on single date
-    :param snapshot:
-    :return: factor IC on single date
-    """
-    ICresult = []
-    for factor in factorList:
-        # drop na
-        factorPanel = snapshot[[factor, 'NextRet']]
-        factorPanel = factorPanel.dropna()
-        ic, _ = stats.spearmanr(factorPanel[factor], factorPanel['NextRet'])
-        ICresult.append(ic)
-    return ICresult
-
-
-def get_ic(dv):
-    """
-    Calculate factor IC on all dates and save it in a DataFrame
-    :param dv:
-    :return: DataFrame recording factor IC on all dates
-    """
-    factorList = jutil.read_json(custom_data_path)
-    ICPanel = {}
-    for singleDate in dv.dates:
-        singleSnapshot = dv.get_snapshot(singleDate)
-        ICPanel[singleDate] = ic_calculation(singleSnapshot, factorList)
-
-    ICPanel = pd.DataFrame(ICPanel).T
-    return ICPanel
-
-
-def ic_weight_calculation(icpanel):
-    """
-    Calculate factor IC weight on single date
-    :param icpanel:
-    :return:
-    """
-    mat = np.mat(icpanel.cov())
-    mat = nlg.inv(mat)
-    weight = mat * np.mat(icpanel.mean()).reshape(len(mat), 1)
-    weight = np.array(weight.reshape(len(weight), ))[0]
-    return weight
-
-
 def get_ic_weight(dv):
     """
     Calculate factor IC weight on all dates and save it in a DataFrame
     :param dv:
     :return:
     """
-    ICPanel = get_ic(dv)
-    ICPanel = ICPanel.dropna()
-    N = 10
-    IC_weight_Panel = {}
-    for i in range(N, len(ICPanel)):
-        ICPanel_sub = ICPanel.iloc[i - N:i, :]
-        ic_weight = ic_weight_calculation(ICPanel_sub)
-        IC_weight_Panel[ICPanel.index[i]] = ic_weight
-    IC_weight_Panel = pd.DataFrame(IC_weight_Panel).T
+    factorList = jutil.read_json(custom_data_path)
+    combiner = ICSignalCombiner(dv, factorList, price_field='close_adj', period=1, window=10)
+    IC_weight_Panel = combiner.calc_weights().dropna()
     return IC_weight_Panel
 
 
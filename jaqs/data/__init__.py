@@ -6,10 +6,12 @@ Modules relevant to data.
 """
 
 from .dataapi import DataApi
-from .dataservice import RemoteDataService, DataService
+from .dataservice import RemoteDataService, DataService, LocalDataService
+from .barstore import LocalBarStore
 from .dataview import DataView, EventDataView
 from .py_expression_eval import Parser
 
 
 # we do not expose align and basic
-__all__ = ['DataApi', 'DataService', 'RemoteDataService', 'DataView', 'Parser', 'EventDataView']
\ No newline at end of file
+__all__ = ['DataApi', 'DataService', 'RemoteDataService', 'LocalDataService', 'LocalBarStore',
+           'DataView', 'Parser', 'EventDataView']
\ No newline at end of file
@@ -0,0 +1,266 @@
+# encoding: utf-8
+"""
+Module barstore defines LocalBarStore, which keeps bars on local disk.
+
+Bars are partitioned by frequency and trade date:
+
+    folder_path/1M/20170104.npz
+    folder_path/1M/20170105.npz
+    folder_path/1d/20170104.npz
+
+Each file is a NumPy .npz archive with one array per column (columnar),
+rows are sorted by symbol, date and time. Start/end row of each symbol are
+stored as well, so reading a few symbols only slices the needed rows of the
+needed columns.
+
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+import os
+import glob
+
+import numpy as np
+import pandas as pd
+
+import jaqs.util as jutil
+
+try:
+    basestring
+except NameError:
+    basestring = str
+
+
+class LocalBarStore(object):
+    """
+    Store bars on local disk, one columnar file per frequency and trade date.
+
+    Attributes
+    ----------
+    folder_path : str
+        Root folder of the store.
+
+    """
+    _SYMBOL_INDEX = '_symbols'
+    _SYMBOL_START = '_starts'
+    _SORT_KEYS = ['symbol', 'date', 'time']
+
+    def __init__(self, folder_path):
+        self.folder_path = os.path.abspath(folder_path)
+
+    def _get_fp(self, freq, trade_date):
+        return os.path.join(self.folder_path, freq, '{:d}.npz'.format(int(trade_date)))
+
+    # -----------------------------------------------------------------------------------
+    # Write
+    def write(self, df, freq='1M'):
+        """
+        Write bars into the store. For each trade date, bars of symbols in df replace
+        existing bars of the same symbols, bars of other symbols are kept.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Must have columns: symbol, trade_date. Usually also has columns returned by DataService.bar,
+            eg. date, time, open, high, low, close, volume, turnover, vwap, oi.
+        freq : str
+            {'1M', '5M', '15M', '1d'}
+
+        """
+        if df is None or df.empty:
+            return
+        for name in ['symbol', 'trade_date']:
+            if name not in df.columns:
+                raise ValueError("column [{}] must be provided.".format(name))
+
+        df = df.copy()
+        if 'date' not in df.columns:
+            df['date'] = df['trade_date']
+        if 'time' not in df.columns:
+            df['time'] = 0
+
+        for trade_date, df_date in df.groupby(by='trade_date'):
+            df_old = self._read_file(self._get_fp(freq, trade_date))
+            if df_old is not None:
+                df_old = df_old.loc[~df_old['symbol'].isin(df_date['symbol'].unique())]
+                df_date = pd.concat([df_old, df_date], axis=0, ignore_index=True)
+            self._write_file(self._get_fp(freq, trade_date), df_date)
+
+    def _write_file(self, fp, df):
+        df = df.sort_values(self._SORT_KEYS).reset_index(drop=True)
+
+        arrays = dict()
+        for col in df.columns:
+            arr = df[col].values
+            if arr.dtype == object:
+                arr = arr.astype(str)
+            arrays[col] = arr
+        symbols = arrays['symbol']
+        starts = np.concatenate([[0], np.flatnonzero(symbols[1:] != symbols[:-1]) + 1, [len(symbols)]])
+        arrays[self._SYMBOL_INDEX] = symbols[starts[:-1]]
+        arrays[self._SYMBOL_START] = starts
+
+        # write to a temp file first, so that an interrupted write does not break the old file
+        jutil.create_dir(fp)
+        fp_tmp = fp[:-len('.npz')] + '.tmp.npz'
+        np.savez(fp_tmp, **arrays)
+        if os.path.exists(fp):
+            os.remove(fp)
+        os.rename(fp_tmp, fp)
+
+    def ingest_from_api(self, data_api, symbol, start_date, end_date, freq='1M'):
+        """
+        Download bars of each trade date from a DataService (eg. RemoteDataService) and write into the store.
+
+        Parameters
+        ----------
+        data_api : DataService
+        symbol : str
+            Separated by ','.
+        start_date : int
+        end_date : int
+        freq : str
+
+        Returns
+        -------
+        n : int
+            Number of bars written.
+
+        """
+        n = 0
+        trade_dates = data_api.query_trade_dates(start_date, end_date)
+        for trade_date in trade_dates:
+            if freq == '1d':
+                df, _ = data_api.daily(symbol=symbol, start_date=trade_date, end_date=trade_date, adjust_mode=None)
+            else:
+                df, _ = data_api.bar(symbol=symbol, trade_date=trade_date, freq=freq)
+            self.write(df, freq=freq)
+            n += len(df)
+        return n
+
+    def ingest_from_csv(self, fp, freq='1M', **kwargs):
+        """
+        Read bars from a CSV file and write into the store.
+
+        Parameters
+        ----------
+        fp : str
+            Path of the CSV file. Columns are the same as DataService.bar.
+        freq : str
+        kwargs
+            Passed to pd.read_csv.
+
+        Returns
+        -------
+        n : int
+            Number of bars written.
+
+        """
+        df = pd.read_csv(fp, **kwargs)
+        self.write(df, freq=freq)
+        return len(df)
+
+    # -----------------------------------------------------------------------------------
+    # Read
+    @staticmethod
+    def _read_file(fp, symbol=None, fields=None):
+        """
+        Read rows of selected symbols and selected columns from a partition file.
+        Return None if file does not exist.
+
+        """
+        if not os.path.exists(fp):
+            return None
+
+        with np.load(fp, allow_pickle=False) as npz:
+            columns = [name for name in npz.files if not name.startswith('_')]
+            if fields:
+                columns = [name for name in columns if name in fields]
+
+            if symbol is None:
+                return pd.DataFrame({name: npz[name] for name in columns}, columns=columns)
+
+            symbols = npz[LocalBarStore._SYMBOL_INDEX]
+            starts = npz[LocalBarStore._SYMBOL_START]
+            idx = np.flatnonzero(np.in1d(symbols, symbol))
+            slices = [slice(starts[i], starts[i + 1]) for i in idx]
+
+            dic = dict()
+            for name in columns:
+                arr = npz[name]
+                dic[name] = np.concatenate([arr[s] for s in slices]) if slices else arr[:0]
+        return pd.DataFrame(dic, columns=columns)
+
+    def read(self, symbol, start_date, end_date, freq='1M', fields="", start_time=None, end_time=None):
+        """
+        Read bars of selected symbols within a range of trade dates.
+
+        Parameters
+        ----------
+        symbol : str
+            Separated by ','. "" means all symbols.
+        start_date : int
+        end_date : int
+        freq : str
+        fields : str, optional
+            Separated by ','. symbol, trade_date, date and time are always included.
+        start_time : int, optional
+            HHMMSS. If start_time > end_time, bars of time >= start_time or time <= end_time are returned (night session).
+        end_time : int, optional
+
+        Returns
+        -------
+        df : pd.DataFrame
+            Sorted by trade_date, symbol, date, time.
+
+        """
+        symbol_list = [s for s in symbol.split(',') if s] if symbol else None
+        field_list = None
+        if fields:
+            field_list = set(fields.split(',')) | {'symbol', 'trade_date', 'date', 'time'}
+
+        df_list = []
+        for trade_date in self.query_trade_dates(start_date, end_date, freq=freq):
+            df = self._read_file(self._get_fp(freq, trade_date), symbol=symbol_list, fields=field_list)
+            if df is not None and not df.empty:
+                df_list.append(df)
+        if not df_list:
+            return pd.DataFrame()
+        df = pd.concat(df_list, axis=0, ignore_index=True)
+
+        if start_time is not None and end_time is not None:
+            times = df['time'].values
+            if start_time <= end_time:
+                mask = (times >= start_time) & (times <= end_time)
+            else:
+                mask = (times >= start_time) | (times <= end_time)
+            df = df.loc[mask].reset_index(drop=True)
+        return df
+
+    def query_trade_dates(self, start_date, end_date, freq='1M'):
+        """
+        Trade dates that have bars in the store.
+
+        Parameters
+        ----------
+        start_date : int
+        end_date : int
+        freq : str
+
+        Returns
+        -------
+        trade_dates_arr : np.ndarray
+            dtype = int
+
+        """
+        fp_list = glob.glob(os.path.join(self.folder_path, freq, '*.npz'))
+        names = [os.path.basename(fp)[:-len('.npz')] for fp in fp_list]
+        dates = np.array(sorted(int(name) for name in names if name.isdigit()), dtype=int)
+        return dates[(dates >= start_date) & (dates <= end_date)]
+
+    def query_freqs(self):
+        """Frequencies that have bars in the store."""
+        if not os.path.exists(self.folder_path):
+            return []
+        return sorted([name for name in os.listdir(self.folder_path)
+                       if os.path.isdir(os.path.join(self.folder_path, name))])
@@ -7,6 +7,7 @@ Basic data types:
 - `Instrument`: An Instrument represents a specific financial contract.
 - `InstManager`: InstManager query information of instruments from data server and store them.
 - `Bar`: A Bar is a summary of information of price and volume during a certain length of time span.
+- `BarBatch`: BarBatch stores Bars of many symbols at the same time in one NumPy record array.
 - `Quote`: Quote represents a snapshot of price and volume information.
 - `Order`: Basic order class.
 - `OrderStatusInd`: OrderStatusInd is a indication of status change of an order.
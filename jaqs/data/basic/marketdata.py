@@ -2,9 +2,16 @@
 """
 Classes defined in marketdata module represent different market data, including:
 - Bar
+- BarBatch
 - Quote
 
 """
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+import numpy as np
 
 
 class Bar(object):
@@ -34,7 +41,19 @@ class Bar(object):
     time : int
         %HH%mm%ss
     
+    Notes
+    -----
+    Attributes are stored in __slots__. Other attributes (eg. extra columns of a bar DataFrame)
+    can still be set, they are stored in __dict__.
+    
     """
+    __slots__ = ['symbol', 'open', 'close', 'high', 'low', 'volume', 'oi', 'vwap',
+                 'trade_date', 'date', 'time',
+                 '__dict__']
+    _bar_keys = ['open', 'close', 'high', 'low', 'vwap',
+                 'volume', 'oi',
+                 'trade_date', 'time']
+    
     def __init__(self):
         self.symbol = ""
         self.open = 0.
@@ -47,9 +66,6 @@ class Bar(object):
         
         self.trade_date = 0
         self.time = 0
-        self._bar_keys = ['open', 'close', 'high', 'low', 'vwap',
-                          'volume', 'oi',
-                          'trade_date', 'time']
     
     @classmethod
     def create_from_df(cls, df):
@@ -66,12 +82,9 @@ class Bar(object):
         bar_list : list of Bar
 
         """
-        bar_list = []
-        for _, row in df.iterrows():
-            dic = row.to_dict()
-            bar = Bar.create_from_dict(dic)
-            bar_list.append(bar)
-        return bar_list
+        records = df.to_records(index=False).view(np.ndarray)
+        names = records.dtype.names
+        return [cls._create_from_values(names, values) for values in records.tolist()]
 
     @classmethod
     def create_from_dict(cls, dic):
@@ -89,7 +102,34 @@ class Bar(object):
 
         """
         bar = cls()
-        bar.__dict__.update(dic)
+        for k, v in dic.items():
+            setattr(bar, k, v)
+        return bar
+
+    @classmethod
+    def create_from_record(cls, records, i):
+        """
+        Create a Bar from a row of a NumPy record array.
+        
+        Parameters
+        ----------
+        records : np.ndarray
+            Structured array whose field names are attribute names of Bar.
+        i : int
+            Row number.
+
+        Returns
+        -------
+        bar : Bar
+
+        """
+        return cls._create_from_values(records.dtype.names, records[i].item())
+
+    @classmethod
+    def _create_from_values(cls, names, values):
+        bar = cls()
+        for k, v in zip(names, values):
+            setattr(bar, k, v)
         return bar
 
     def __repr__(self):
@@ -101,6 +141,88 @@ class Bar(object):
         return self.__repr__()
 
 
+class BarBatch(Mapping):
+    """
+    BarBatch stores Bars of many symbols at the same time in one NumPy record array.
+    
+    It is a read-only mapping {symbol: Bar}, so it can be used wherever a dict of Bars is expected.
+    A Bar is created the first time its symbol is accessed, so symbols that are never
+    looked up cost nothing.
+    
+    Attributes
+    ----------
+    records : np.ndarray
+        Structured array, each row contains information of a Bar.
+    
+    """
+    __slots__ = ['records', '_index', '_rows', '_bars']
+    
+    def __init__(self, records):
+        self.records = records
+        self._index = None
+        self._rows = None
+        self._bars = dict()
+    
+    @classmethod
+    def create_from_df(cls, df, by='time'):
+        """
+        Split a DataFrame of bars into BarBatches, one batch for each distinct value of column [by].
+        
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Each row contains information of a Bar. Must be sorted by column [by].
+        by : str
+            Column name, eg. 'time' for intraday bars, 'trade_date' for daily bars.
+
+        Returns
+        -------
+        res : list of tuples
+            Two-element tuple: (value of column [by], BarBatch)
+
+        """
+        records = df.to_records(index=False).view(np.ndarray)
+        if not len(records):
+            return []
+        
+        keys = records[by]
+        starts = np.concatenate([[0], np.flatnonzero(keys[1:] != keys[:-1]) + 1])
+        ends = np.concatenate([starts[1:], [len(records)]])
+        # slices of a record array are views, no data is copied
+        return [(keys[start], cls(records[start: end])) for start, end in zip(starts, ends)]
+    
+    def _get_index(self):
+        if self._index is None:
+            self._index = {symbol: i for i, symbol in enumerate(self.records['symbol'].tolist())}
+        return self._index
+    
+    def __getitem__(self, symbol):
+        bar = self._bars.get(symbol, None)
+        if bar is None:
+            i = self._get_index()[symbol]
+            if self._rows is None:
+                # convert all rows to Python objects at once, much faster than row by row
+                self._rows = self.records.tolist()
+            bar = Bar._create_from_values(self.records.dtype.names, self._rows[i])
+            self._bars[symbol] = bar
+        return bar
+    
+    def __contains__(self, symbol):
+        return symbol in self._get_index()
+    
+    def __iter__(self):
+        return iter(self._get_index())
+    
+    def __len__(self):
+        return len(self.records)
+    
+    def __repr__(self):
+        return "BarBatch of {:d} symbols".format(len(self))
+    
+    def __str__(self):
+        return self.__repr__()
+
+
 class Quote(object):
     """
     Quote represents a snapshot of price and volume information.
@@ -137,8 +259,22 @@ class Quote(object):
     bidvolume1 : float
         Sum of tradable volume of all orders at the best bid price.
     
+    Notes
+    -----
+    Attributes are stored in __slots__. Other attributes can still be set, they are stored in __dict__.
     
     """
+    __slots__ = ['symbol', 'trade_date', 'date', 'time',
+                 'open', 'close', 'high', 'low', 'vwap', 'settle',
+                 'volume', 'turnover', 'oi',
+                 'preclose', 'presettle', 'preoi', 'last',
+                 'bidprice1', 'bidprice2', 'bidprice3', 'bidprice4', 'bidprice5',
+                 'askprice1', 'askprice2', 'askprice3', 'askprice4', 'askprice5',
+                 'bidvolume1', 'bidvolume2', 'bidvolume3', 'bidvolume4', 'bidvolume5',
+                 'askvolume1', 'askvolume2', 'askvolume3', 'askvolume4', 'askvolume5',
+                 'limit_up', 'limit_down',
+                 '__dict__']
+    
     def __init__(self):
         self.trade_date = 0
         self.date = 0
@@ -186,10 +322,37 @@ class Quote(object):
         self.limit_up = 0.0
         self.limit_down = 0.0
 
+    @classmethod
+    def create_from_df(cls, df):
+        """
+        Create a list of Quotes from a DataFrame.
+        
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Index does not matter. Each row contains information of a Quote.
+
+        Returns
+        -------
+        quote_list : list of Quote
+
+        """
+        records = df.to_records(index=False).view(np.ndarray)
+        names = records.dtype.names
+        return [cls._create_from_values(names, values) for values in records.tolist()]
+
     @classmethod
     def create_from_dict(cls, dic):
         quote = cls()
-        quote.__dict__.update(dic)
+        for k, v in dic.items():
+            setattr(quote, k, v)
+        return quote
+
+    @classmethod
+    def _create_from_values(cls, names, values):
+        quote = cls()
+        for k, v in zip(names, values):
+            setattr(quote, k, v)
         return quote
 
     def __repr__(self):
@@ -56,8 +56,18 @@ class Order(object):
     Methods
     -------
     copy
+    
+    Notes
+    -----
+    Attributes are stored in __slots__. Other attributes can still be set, they are stored in __dict__.
 
     """
+    __slots__ = ['ba_id', 'sa_id', 'task_id', 'entrust_no', 'symbol',
+                 'entrust_action', 'entrust_price', 'entrust_size', 'entrust_date', 'entrust_time',
+                 'ord_seq', 'batch_no', 'order_status', 'fill_price', 'fill_size',
+                 'algo', 'order_type', 'time_in_force', 'commission',
+                 '__dict__']
+    
     def __init__(self, order=None):
         """If order is provided, copy all attributes of it."""
         self.ba_id = ""
@@ -34,15 +34,18 @@ class Position(object):
 
     Methods
     -------
+    
+    Notes
+    -----
+    Attributes are stored in __slots__. Other attributes can still be set, they are stored in __dict__.
 
     """
-    '''
     __slots__ = ['symbol', 'side', 'cost_price',
                  'close_pnl', 'float_pnl', 'trading_pnl', 'holding_pnl',
                  'enable_size', 'frozen_size', 'want_size',
                  'today_size', 'pre_size', 'current_size', 'init_size',
-                 'commission']
-    '''
+                 'commission',
+                 '__dict__']
     
     def __init__(self, symbol=""):
         self.symbol = symbol
@@ -84,7 +87,8 @@ class Position(object):
     @classmethod
     def create_from_dict(cls, dic):
         bar = cls()
-        bar.__dict__.update(dic)
+        for k, v in dic.items():
+            setattr(bar, k, v)
         return bar
 
 
@@ -28,8 +28,16 @@ class Trade(object):
     fill_time : int
     fill_no : str
         ID of this trade.
+    
+    Notes
+    -----
+    Attributes are stored in __slots__. Other attributes can still be set, they are stored in __dict__.
 
     """
+    __slots__ = ['task_id', 'entrust_no', 'entrust_action', 'symbol',
+                 'fill_no', 'fill_price', 'fill_size', 'fill_date', 'fill_time', 'trade_date',
+                 'commission',
+                 '__dict__']
     
     def __init__(self, order=None):
         self.task_id = 0
@@ -72,7 +80,8 @@ class Trade(object):
     @classmethod
     def create_from_dict(cls, dic):
         trade_ind = cls()
-        trade_ind.__dict__.update(dic)
+        for k, v in dic.items():
+            setattr(trade_ind, k, v)
         return trade_ind
     
     def __repr__(self):
@@ -10,6 +10,7 @@ import numpy as np
 from . import jrpc_py
 # import jrpc
 from . import utils
+from jaqs.util.profile import latency_monitor
 
 
 # def set_log_dir(log_dir):
@@ -510,6 +511,10 @@ class DataApi(object):
                 if self._on_jsq_callback:
                     q = self._convert_quote_ind(data)
                     if q:
+                        recv_time = data.get('_recv_time', False)
+                        q['_recv_time'] = recv_time
+                        if recv_time:
+                            latency_monitor.record('quote_converted', method, recv_time)
                         self._on_jsq_callback("quote", q)
             
             elif method == ".sys.heartbeat":
@@ -18,6 +18,8 @@ import msgpack
 import snappy
 import copy
 
+from jaqs.util.profile import latency_monitor
+
 qEmpty = copy.copy(queue.Empty)
 
 
@@ -171,7 +173,7 @@ class JRpcClient(object):
                     if data:
                         # if not data.find("heartbeat"):
                         #    print time.ctime(), "RECV", data
-                        self._on_data_arrived(data)
+                        self._on_data_arrived(data, latency_monitor.stamp())
 
             except zmq.error.Again as e:
                 # print "RECV timeout: ", e
@@ -231,7 +233,7 @@ class JRpcClient(object):
         self._callback_thread.join()
         self._recv_thread.join()
 
-    def _on_data_arrived(self, str):
+    def _on_data_arrived(self, str, recv_time=None):
         try:
             msg = self._unpack(str)
             # print "RECV", msg
@@ -239,6 +241,12 @@ class JRpcClient(object):
             if not msg:
                 print("wrong message format")
                 return
+            
+            # ingress time of sampled notifications travels with results to later stages
+            if recv_time and not msg.get('id', None):
+                result = msg.get('result', None)
+                if isinstance(result, dict):
+                    result['_recv_time'] = recv_time
 
             if 'method' in msg and msg['method'] == '.sys.heartbeat':
                 self._last_heartbeat_rsp_time = time.time()
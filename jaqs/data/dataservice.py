@@ -1,10 +1,10 @@
 # encoding: UTF-8
 """
-Module dataservice defines DataService and RemoteDataService.
+Module dataservice defines DataService, RemoteDataService and LocalDataService.
 
 DataService is just an interface. RemoteDataService is a wrapper class for DataApi.
 It inherits all methods of DataApi and implements several convenient methods making
-query data more natural and easy.
+query data more natural and easy. LocalDataService reads bars from a LocalBarStore on disk.
 
 """
 
@@ -12,6 +12,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from builtins import str
 from abc import abstractmethod
+from functools import reduce
 from six import with_metaclass
 try:
     basestring
@@ -24,6 +25,7 @@ import pandas as pd
 from jaqs.trade.event import EVENT_TYPE, Event
 from jaqs.data import DataApi
 from jaqs.data import align
+from jaqs.data.barstore import LocalBarStore
 import jaqs.util as jutil
 
 
@@ -1072,9 +1074,8 @@ class RemoteDataService(with_metaclass(Singleton, DataService)):
         self.data_api.subscribe(symbols, func=self.mkt_data_callback)
 
     def mkt_data_callback(self, key, quote):
-        e = Event(EVENT_TYPE.MARKET_DATA)
-        # print quote
-        e.dic = {'quote': quote}
+        e = Event(EVENT_TYPE.MARKET_DATA, dic={'quote': quote})
+        e.ingress_time = quote.pop('_recv_time', None)
         if (self.ctx is not None) and (self.ctx.instance is not None):
             self.ctx.instance.put(e)
     
@@ -1174,3 +1175,160 @@ class RemoteDataService(with_metaclass(Singleton, DataService)):
         res = dates[mask][n-1]
     
         return int(res)
+
+
+class LocalDataService(DataService):
+    """
+    LocalDataService provides bars stored in a LocalBarStore, so that backtests can run without network.
+    
+    Daily bars are read from the '1d' partitions of the store. For trade dates which only have
+    minute bars, daily bars are aggregated from minute bars.
+
+    Attributes
+    ----------
+    store : LocalBarStore
+    
+    """
+    def __init__(self, folder_path=None):
+        super(LocalDataService, self).__init__()
+        
+        self.store = None
+        if folder_path is not None:
+            self.store = LocalBarStore(folder_path)
+        
+        self.MINUTE_FREQ = '1M'
+        self.DAILY_FREQ = '1d'
+    
+    def init_from_config(self, props):
+        """
+        
+        Parameters
+        ----------
+        props : dict
+            Configurations used for initialization.
+
+        Example
+        -------
+        {"local.data.path": "path/to/bar/store"}
+
+        """
+        folder_path = props.get("local.data.path", None)
+        if folder_path is not None:
+            self.store = LocalBarStore(folder_path)
+        if self.store is None:
+            raise InitializeError("no local.data.path available!")
+        return '0,'
+    
+    def bar(self, symbol, start_time=200000, end_time=160000, trade_date=None, freq='1M', fields=""):
+        """
+        Query minute bars of one trade date. See DataService.bar.
+
+        """
+        df = self.store.read(symbol, trade_date, trade_date, freq=freq, fields=fields,
+                             start_time=start_time, end_time=end_time)
+        return df, '0,'
+    
+    def daily(self, symbol, start_date, end_date, fields="", adjust_mode=None):
+        """
+        Query daily bars. See DataService.daily.
+        
+        adjust_mode is not supported: prices are stored as they are ingested.
+
+        """
+        if adjust_mode is not None:
+            raise NotImplementedError("adjust_mode = {} is not supported by LocalDataService.".format(adjust_mode))
+        
+        df = self.store.read(symbol, start_date, end_date, freq=self.DAILY_FREQ)
+        
+        dates_daily = set(df['trade_date'].values) if not df.empty else set()
+        dates_minute = [d for d in self.store.query_trade_dates(start_date, end_date, freq=self.MINUTE_FREQ)
+                        if d not in dates_daily]
+        if dates_minute:
+            df_bar = self.store.read(symbol, min(dates_minute), max(dates_minute), freq=self.MINUTE_FREQ)
+            df_bar = df_bar.loc[df_bar['trade_date'].isin(dates_minute)]
+            df = pd.concat([df, self._aggregate_daily(df_bar)], axis=0, ignore_index=True)
+        
+        if df.empty:
+            return df, '0,'
+        df = df.sort_values(['trade_date', 'symbol']).reset_index(drop=True)
+        if fields:
+            field_list = ['symbol', 'trade_date'] + [f for f in fields.split(',')
+                                                     if f in df.columns and f not in ['symbol', 'trade_date']]
+            df = df.loc[:, field_list]
+        return df, '0,'
+    
+    @staticmethod
+    def _aggregate_daily(df_bar):
+        """Aggregate minute bars to daily bars."""
+        if df_bar.empty:
+            return df_bar
+        gp = df_bar.groupby(by=['trade_date', 'symbol'], sort=True)
+        df = pd.DataFrame({'open': gp['open'].first(),
+                           'high': gp['high'].max(),
+                           'low': gp['low'].min(),
+                           'close': gp['close'].last(),
+                           'volume': gp['volume'].sum()})
+        if 'turnover' in df_bar.columns:
+            df['turnover'] = gp['turnover'].sum()
+            df['vwap'] = np.where(df['volume'] > 0, df['turnover'] / df['volume'].where(df['volume'] > 0),
+                                  df['close'])
+        if 'oi' in df_bar.columns:
+            df['oi'] = gp['oi'].last()
+        df = df.reset_index()
+        df['date'] = df['trade_date']
+        df['time'] = 0
+        return df
+    
+    def query_trade_dates(self, start_date, end_date):
+        """
+        Get array of trade dates within given range, which have data in the store.
+        Return zero size array if no trade dates within range.
+        
+        Parameters
+        ----------
+        start_date : int
+            YYmmdd
+        end_date : int
+
+        Returns
+        -------
+        trade_dates_arr : np.ndarray
+            dtype = int
+
+        """
+        dates_list = [self.store.query_trade_dates(start_date, end_date, freq=freq)
+                      for freq in self.store.query_freqs()]
+        if not dates_list:
+            return np.array([], dtype=int)
+        return reduce(np.union1d, dates_list).astype(int)
+    
+    def _raise_out_of_store(self, date, which):
+        dates = self.query_trade_dates(0, 99999999)
+        if len(dates):
+            store_range = "[{:d}, {:d}]".format(int(dates[0]), int(dates[-1]))
+        else:
+            store_range = "empty"
+        raise ValueError("No {} trade date of {} in local data store, whose date range is {}."
+                         .format(which, date, store_range))
+    
+    def query_last_trade_date(self, date):
+        dates = self.query_trade_dates(0, date)
+        dates = dates[dates < date]
+        if not len(dates):
+            self._raise_out_of_store(date, 'last')
+        return int(dates[-1])
+    
+    def is_trade_date(self, date):
+        return len(self.query_trade_dates(date, date)) > 0
+    
+    def query_next_trade_date(self, date, n=1):
+        dates = self.query_trade_dates(date, 99999999)
+        dates = dates[dates > date]
+        if len(dates) < n:
+            self._raise_out_of_store(date, 'next {:d}'.format(n) if n > 1 else 'next')
+        return int(dates[n - 1])
+    
+    def query_dividend(self, symbol, start_date, end_date):
+        """No dividend information is stored locally, return an empty DataFrame."""
+        df = pd.DataFrame(columns=['symbol', 'exdiv_date', 'share_ratio', 'share_trans_ratio', 'cash_tax'])
+        return df, '0,'
@@ -5,6 +5,7 @@
 """
 from __future__ import print_function
 import os
+import copy
 try:
     basestring
 except NameError:
@@ -1021,6 +1022,99 @@ class DataView(object):
             self.data_d = the_data
         self._add_field(field_name, is_quarterly)
 
+    def orthogonalize(self, fields, method='gram_schmidt', universe=None, suffix='_orth', overwrite=True):
+        """
+        Orthogonalize factors on the cross section of each date, and add results as new fields.
+        
+        Factor values of all dates are stacked into a (date, symbol, factor) array, and all dates
+        are decomposed in one batched call. Inner products use raw values, so standardize factors
+        first if they should be de-meaned.
+        
+        Parameters
+        ----------
+        fields : str or list of str
+            Factor fields. If str, separated by ','. Order matters for 'gram_schmidt'.
+        method : {'gram_schmidt', 'symmetric'}
+            'gram_schmidt': each factor minus its projections on the former ones (QR decomposition).
+            'symmetric': Lowdin orthogonalization F * (F'F / n)^(-1/2), which changes all factors as
+            little as possible. Each result has mean square 1.
+        universe : str or list of str, optional
+            Field of membership (e.g. 'index_member') or list of symbols. Other symbols are NaN.
+            Default all symbols.
+        suffix : str
+            Name of new field is field + suffix.
+        overwrite : bool
+            Whether overwrite existing fields.
+        
+        Notes
+        -----
+        On each date, symbols with any NaN factor are excluded. Dates with less valid symbols than
+        factors, or with linearly dependent factors ('symmetric'), are NaN.
+
+        """
+        if isinstance(fields, basestring):
+            fields = [f for f in fields.split(',') if f]
+        new_fields = [f + suffix for f in fields]
+        for field_name in new_fields:
+            if field_name in self.fields:
+                if overwrite:
+                    self.remove_field(field_name)
+                else:
+                    raise ValueError("Orthogonalize failed: name [{:s}] exist. Try another name.".format(field_name))
+        
+        dates = self.data_d.index
+        panels = [self.get_ts(f, start_date=dates[0], end_date=dates[-1]) for f in fields]
+        symbols = panels[0].columns
+        x = np.stack([df.reindex(columns=symbols).values.astype(float) for df in panels], axis=-1)
+        n_dates, n_symbols, k = x.shape
+        
+        valid = np.all(np.isfinite(x), axis=-1)
+        if universe is not None:
+            if isinstance(universe, basestring):
+                member = self.get_ts(universe, start_date=dates[0], end_date=dates[-1]).reindex(columns=symbols)
+                valid &= member.fillna(0).values.astype(bool)
+            else:
+                valid &= np.isin(symbols, universe)[np.newaxis, :]
+        x = np.where(valid[..., np.newaxis], x, 0.0)
+        n = valid.sum(axis=1)
+        ok = n >= k
+        
+        if method == 'gram_schmidt':
+            q, r = np.linalg.qr(x)
+            res = q * np.diagonal(r, axis1=1, axis2=2)[:, np.newaxis, :]
+        elif method == 'symmetric':
+            m = np.einsum('tnk,tnl->tkl', x, x) / np.maximum(n, 1)[:, np.newaxis, np.newaxis]
+            eig, vec = np.linalg.eigh(m)
+            ok &= eig[:, 0] > 1e-10 * np.maximum(eig[:, -1], 1e-300)
+            eig = np.where(ok[:, np.newaxis], eig, 1.0)
+            s = np.einsum('tij,tj,tkj->tik', vec, 1.0 / np.sqrt(eig), vec)
+            res = np.einsum('tnk,tkl->tnl', x, s)
+        else:
+            raise NotImplementedError("method = {}".format(method))
+        
+        res[~(valid & ok[:, np.newaxis])] = np.nan
+        
+        # all new fields are merged into data in one step
+        df_new = pd.DataFrame(res.reshape(n_dates, n_symbols * k), index=panels[0].index,
+                              columns=pd.MultiIndex.from_product([symbols, new_fields],
+                                                                 names=self.data_d.columns.names))
+        self._append_daily_fields(df_new, new_fields)
+
+    def _append_daily_fields(self, df, field_names):
+        """
+        Merge several daily fields into data_d in one step and add their field names.
+        
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Same index as data_d, columns are MultiIndex of (symbol, field).
+        field_names : list of str
+
+        """
+        self.data_d = pd.concat([self.data_d, df], axis=1).sort_index(axis=1)
+        for field_name in field_names:
+            self._add_field(field_name, is_quarterly=False)
+
     def remove_field(self, field_names):
         """
         Query and append new field to DataView.
@@ -1370,6 +1464,44 @@ class DataView(object):
             h5[key] = value
         h5.close()
 
+    def share(self, name):
+        """
+        Copy data of this dataview into shared memory, so that other processes can attach to it.
+        
+        Parameters
+        ----------
+        name : str
+            Name used by DataView.attach(name).
+
+        Returns
+        -------
+        DataViewHost
+            Data is shared until its close() is called.
+
+        """
+        from jaqs.data.sharedview import DataViewHost
+        return DataViewHost(self, name)
+
+    @staticmethod
+    def attach(name, timeout=0.0):
+        """
+        Attach to a dataview shared by another process (see DataView.share and serve_dataview).
+        Data is read-only and not copied; fields added by add_formula are private to this process.
+        
+        Parameters
+        ----------
+        name : str
+        timeout : float, optional
+            Seconds to wait for the host to share the dataview.
+
+        Returns
+        -------
+        SharedDataView
+
+        """
+        from jaqs.data.sharedview import SharedDataView
+        return SharedDataView.attach(name, timeout=timeout)
+
     def dup(self, symbols=None, remove_fields=None, start_date=None, end_date=None, fields=None):
         """
         Duplicate this dataview with less symbols, dates between start_date and end_date and less fields.
@@ -1429,6 +1561,46 @@ class DataView(object):
         dv2.__dict__.update(meta_data)
         return dv2
 
+    def view(self, start_date=None, end_date=None):
+        """
+        Return a view of this dataview whose date range is narrowed to [start_date, end_date].
+        Unlike dup, no data is copied: the view shares data_d, data_q, snapshots, etc. with this dataview,
+        so it is cheap to create one view for each window of a rolling backtest.
+
+        Parameters
+        ----------
+        start_date : int, optional
+            Default self.start_date.
+        end_date : int, optional
+            Default self.end_date.
+
+        Returns
+        -------
+        DataView
+
+        Notes
+        -----
+        Data before start_date and after end_date is still accessible through the view (e.g. get_ts
+        with explicit dates), only the default date range is changed.
+        Fields added to the view afterwards will not be visible to this dataview.
+
+        """
+        if not start_date:
+            start_date = self.start_date
+        if not end_date:
+            end_date = self.end_date
+        if start_date > end_date:
+            raise ValueError("start_date {} is later than end_date {}".format(start_date, end_date))
+
+        dv2 = copy.copy(self)
+        dv2.fields = list(self.fields)
+        dv2.custom_daily_fields = list(self.custom_daily_fields)
+        dv2.custom_quarterly_fields = list(self.custom_quarterly_fields)
+        dv2.start_date = start_date
+        dv2.end_date = end_date
+        return dv2
+
+
 class EventDataView(object):
     """
     Prepare data before research / trade. Support file I/O.
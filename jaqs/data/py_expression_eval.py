@@ -328,6 +328,7 @@ class Parser(object):
             'ConditionQuantile': self.cond_quantile,
             'Standardize': self.standardize,
             'Cutoff': self.cutoff,
+            'Neutralize': self.neutralize,
             # 'GroupApply': self.group_apply,
             # time series
             'CumToSingle': self.cum_to_single,
@@ -945,8 +946,68 @@ class Parser(object):
         
         return pd.DataFrame(index=df.index, columns=df.columns, data=x)
     
+    def neutralize(self, df, group, *exposures):
+        """
+        Residual of cross-section regression of df on group dummies and continuous exposures, on each date.
+        
+        By Frisch-Waugh, df and exposures are de-meaned within each (date, group) first,
+        then the de-meaned df is regressed on de-meaned exposures. Group sums of all dates
+        are calculated with one bincount, and regressions of all dates are solved in one batch.
+        
+        Parameters
+        ----------
+        df : pd.DataFrame
+            index date, column symbols
+        group : pd.DataFrame
+            Group label (e.g. industry) of each symbol on each date.
+        exposures : pd.DataFrame
+            Continuous exposures, e.g. log of market value.
+
+        Returns
+        -------
+        res : pd.DataFrame
+            NaN where df, group or any exposure is NaN, or not index member.
+
+        """
+        df = self._align_univariate(df)
+        df = self._mask_non_index_member(df.copy())
+        index, columns = df.index, df.columns
+        group = group.reindex(index=index, columns=columns)
+        exposures = [self._align_univariate(x).reindex(index=index, columns=columns).values.astype(float)
+                     for x in exposures]
+        
+        y = df.values.astype(float)
+        n_dates, n_symbols = y.shape
+        codes, _ = pd.factorize(group.values.ravel())
+        codes = codes.reshape(n_dates, n_symbols)
+        valid = np.isfinite(y) & (codes >= 0)
+        for x in exposures:
+            valid &= np.isfinite(x)
+        
+        # one bin for each (date, group); invalid cells go to an extra bin
+        n_groups = codes.max() + 1 if valid.any() else 1
+        bins = np.where(valid, np.arange(n_dates).reshape(-1, 1) * n_groups + codes, n_dates * n_groups).ravel()
+        count = np.bincount(bins, minlength=n_dates * n_groups + 1)
+        count = np.maximum(count, 1)
+        
+        def demean(x):
+            x = np.where(valid, x, 0.0).ravel()
+            group_mean = np.bincount(bins, weights=x, minlength=len(count)) / count
+            return (x - group_mean[bins]).reshape(n_dates, n_symbols) * valid
+        
+        resid = demean(y)
+        if exposures:
+            x = np.stack([demean(e) for e in exposures], axis=-1)  # (date, symbol, exposure)
+            xtx = np.einsum('tnp,tnq->tpq', x, x)
+            xty = np.einsum('tnp,tn->tp', x, resid)
+            beta = np.einsum('tpq,tq->tp', np.linalg.pinv(xtx), xty)
+            resid = resid - np.einsum('tnp,tp->tn', x, beta)
+        
+        res = np.where(valid, resid, np.nan)
+        return pd.DataFrame(index=index, columns=columns, data=res)
+    
     def industry_netural(self, x, group):
-        pass
+        return self.neutralize(x, group)
     
     # -----------------------------------------------------
     # align functions
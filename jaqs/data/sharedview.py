@@ -0,0 +1,362 @@
+# encoding: utf-8
+"""
+Share one loaded DataView among many processes on the same machine.
+
+A host process loads a dataview once and copies its data into POSIX shared memory
+(DataViewHost / serve_dataview). Other processes attach to it by name with
+DataView.attach(name) and read the data without copying it.
+
+"""
+from __future__ import print_function
+import struct
+import time
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+try:
+    basestring
+except NameError:
+    basestring = str
+
+import numpy as np
+import pandas as pd
+from pandas.core.internals import BlockManager, make_block
+
+from jaqs.data.dataview import DataView
+
+
+FRAME_NAMES = ['data_d', 'data_q', '_data_benchmark', '_data_inst']
+_ALIGN = 64
+_HEADER = struct.Struct('<Q')
+
+
+def _check_shared_memory():
+    if shared_memory is None:
+        raise ImportError("Shared DataView requires multiprocessing.shared_memory (Python 3.8+).")
+
+
+def _attach_segment(name):
+    """Attach to an existing segment without letting this process unlink it when it exits."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # track is only available since Python 3.13
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _split_blocks(df):
+    """
+    Split columns of df into one 2D array per numeric dtype and one object array.
+
+    Returns
+    -------
+    numeric : list of (locs, values)
+        values is C-contiguous with shape (len(locs), len(df)), the layout of a pandas block.
+    objects : (locs, values) or None
+
+    """
+    dtypes = df.dtypes.values
+    groups = dict()
+    for i, dtype in enumerate(dtypes):
+        key = dtype if dtype.kind in 'biuf' else np.dtype(object)
+        groups.setdefault(key, []).append(i)
+
+    numeric, objects = [], None
+    for dtype, locs in groups.items():
+        locs = np.array(locs, dtype=np.int64)
+        values = np.ascontiguousarray(df.iloc[:, locs].values.T, dtype=dtype)
+        if dtype == np.dtype(object):
+            objects = (locs, values)
+        else:
+            numeric.append((locs, values))
+    return numeric, objects
+
+
+class DataViewHost(object):
+    """
+    Copy data of a DataView into shared memory, so that other processes can attach to it.
+
+    Two segments are created: '{name}' holds numeric data and '{name}_meta' holds a pickle of
+    index, columns, object (e.g. str) columns, meta data and the layout of numeric blocks.
+    Segments exist until close() is called by the host.
+
+    Attributes
+    ----------
+    name : str
+    nbytes : int
+        Size of numeric data in shared memory.
+
+    """
+    def __init__(self, dataview, name):
+        _check_shared_memory()
+
+        self.name = name
+
+        layout = dict()
+        blocks = []
+        offset = 0
+        for frame_name in FRAME_NAMES:
+            df = getattr(dataview, frame_name, None)
+            if df is None:
+                continue
+            numeric, objects = _split_blocks(df)
+            numeric_layout = []
+            for locs, values in numeric:
+                numeric_layout.append((locs, values.dtype.str, values.shape, offset))
+                blocks.append((offset, values))
+                offset += (values.nbytes + _ALIGN - 1) // _ALIGN * _ALIGN
+            layout[frame_name] = {'index': df.index, 'columns': df.columns,
+                                  'numeric': numeric_layout, 'objects': objects}
+        self.nbytes = offset
+
+        meta = {'meta_data': {key: getattr(dataview, key) for key in dataview.meta_data_list},
+                'frames': layout}
+        meta_bytes = pickle.dumps(meta, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=max(offset, 1))
+        for offset, values in blocks:
+            dst = np.ndarray(values.shape, dtype=values.dtype, buffer=self._shm.buf, offset=offset)
+            dst[:] = values
+
+        self._shm_meta = shared_memory.SharedMemory(name=name + '_meta', create=True,
+                                                    size=_HEADER.size + len(meta_bytes))
+        self._shm_meta.buf[_HEADER.size: _HEADER.size + len(meta_bytes)] = meta_bytes
+        # written last: a non-zero length means the segments are ready
+        self._shm_meta.buf[:_HEADER.size] = _HEADER.pack(len(meta_bytes))
+
+    def close(self):
+        """Remove the segments. Attached processes keep their mapping until they exit."""
+        for shm in [self._shm, self._shm_meta]:
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def serve_dataview(folder_path, name, poll_interval=1.0):
+    """
+    Load a saved dataview and share it under name until the process is interrupted.
+
+    Parameters
+    ----------
+    folder_path : str
+        Folder of a dataview saved by DataView.save_dataview.
+    name : str
+        Name of the shared memory segments, used by DataView.attach(name).
+    poll_interval : float, optional
+
+    """
+    dv = DataView()
+    dv.load_dataview(folder_path, large_memory=False)
+    host = DataViewHost(dv, name)
+    del dv
+    print("Dataview [{:s}] is shared ({:.1f} MB). Press Ctrl+C to stop.".format(name, host.nbytes / 1e6))
+    try:
+        while True:
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        host.close()
+
+
+class SharedDataView(DataView):
+    """
+    Read-only DataView attached to a DataViewHost.
+
+    data_d, data_q, data_benchmark and data_inst are backed by shared memory: numeric
+    columns are not copied and can not be modified. Fields added by add_formula / append_df
+    are kept in private frames of this process and are merged into the results of get,
+    get_ts, get_snapshot and get_ts_quarter. Shared fields can not be removed.
+
+    """
+    def __init__(self):
+        super(SharedDataView, self).__init__()
+        self.name = ""
+        self._segments = []
+        self._local_d = None
+        self._local_q = None
+
+    @classmethod
+    def attach(cls, name, timeout=0.0):
+        """
+        Parameters
+        ----------
+        name : str
+        timeout : float, optional
+            Seconds to wait for the host to create the segments.
+
+        Returns
+        -------
+        SharedDataView
+
+        """
+        _check_shared_memory()
+
+        t0 = time.time()
+        while True:
+            try:
+                shm_meta = _attach_segment(name + '_meta')
+                size, = _HEADER.unpack(bytes(shm_meta.buf[:_HEADER.size]))
+                if size:
+                    break
+                shm_meta.close()
+            except (IOError, OSError):
+                pass
+            if time.time() - t0 >= timeout:
+                raise IOError("DataView [{}] is not shared.".format(name))
+            time.sleep(0.05)
+        meta = pickle.loads(bytes(shm_meta.buf[_HEADER.size: _HEADER.size + size]))
+        shm_meta.close()
+        shm = _attach_segment(name)
+
+        dv = cls()
+        dv.name = name
+        dv._segments = [shm]
+        for frame_name, layout in meta['frames'].items():
+            blocks = []
+            for locs, dtype, shape, offset in layout['numeric']:
+                values = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+                values.flags.writeable = False
+                blocks.append(make_block(values, placement=locs))
+            if layout['objects'] is not None:
+                locs, values = layout['objects']
+                blocks.append(make_block(values, placement=locs))
+            mgr = BlockManager(blocks, [layout['columns'], layout['index']])
+            setattr(dv, frame_name, pd.DataFrame(mgr))
+        dv.__dict__.update(meta['meta_data'])
+        dv.fields = list(dv.fields)
+        dv.custom_daily_fields = list(dv.custom_daily_fields)
+        dv.custom_quarterly_fields = list(dv.custom_quarterly_fields)
+        return dv
+
+    def detach(self):
+        """Drop shared data. This dataview can not be used afterwards."""
+        self.data_d = self.data_q = self._data_benchmark = self._data_inst = None
+        for shm in self._segments:
+            try:
+                shm.close()
+            except BufferError:
+                # arrays returned earlier still refer to the segment, it is unmapped when they are released
+                pass
+        self._segments = []
+
+    # --------------------------------------------------------------------------------------------------------
+    # Private fields
+    def _local_fields(self, is_quarterly):
+        local = self._local_q if is_quarterly else self._local_d
+        if local is None:
+            return []
+        return list(local.columns.get_level_values('field').unique())
+
+    def append_df(self, df, field_name, is_quarterly=False):
+        """Same as DataView.append_df, but the field is stored in a private frame of this process."""
+        if isinstance(df, pd.Series):
+            df = pd.DataFrame(df)
+        elif not isinstance(df, pd.DataFrame):
+            raise ValueError("Data to be appended must be pandas format. But we have {}".format(type(df)))
+
+        base = self.data_q if is_quarterly else self.data_d
+        exist_symbols = base.columns.levels[0]
+        df = df.reindex(index=base.index, columns=exist_symbols)
+        df.columns = pd.MultiIndex.from_product([exist_symbols, [field_name]], names=base.columns.names)
+
+        local = self._local_q if is_quarterly else self._local_d
+        if local is not None:
+            df = pd.concat([local, df], axis=1).sort_index(axis=1)
+        if is_quarterly:
+            self._local_q = df
+        else:
+            self._local_d = df
+        self._add_field(field_name, is_quarterly)
+
+    def _append_daily_fields(self, df, field_names):
+        """Same as DataView._append_daily_fields, but fields are stored in the private frame of this process."""
+        if self._local_d is not None:
+            df = pd.concat([self._local_d, df], axis=1)
+        self._local_d = df.sort_index(axis=1)
+        for field_name in field_names:
+            self._add_field(field_name, is_quarterly=False)
+
+    def remove_field(self, field_names):
+        """Remove private fields. Fields of the shared dataview can not be removed."""
+        if isinstance(field_names, basestring):
+            field_names = field_names.split(',')
+        else:
+            raise ValueError("field_names must be str separated by comma.")
+
+        for field_name in field_names:
+            if field_name not in self.fields:
+                print("Field name [{:s}] does not exist. Stop remove_field.".format(field_name))
+                return
+            if field_name not in self._local_fields(False) + self._local_fields(True):
+                raise ValueError("Field [{:s}] belongs to shared dataview [{:s}] and can not be removed."
+                                 .format(field_name, self.name))
+
+            for attr in ['_local_d', '_local_q']:
+                local = getattr(self, attr)
+                if local is not None and field_name in local.columns.get_level_values('field'):
+                    local = local.drop(field_name, axis=1, level=1)
+                    setattr(self, attr, local if len(local.columns) else None)
+
+            self.fields.remove(field_name)
+            for l in [self.custom_daily_fields, self.custom_quarterly_fields]:
+                if field_name in l:
+                    l.remove(field_name)
+
+    # --------------------------------------------------------------------------------------------------------
+    # Get Data API
+    def get(self, symbol="", start_date=0, end_date=0, fields=""):
+        if self._local_d is None:
+            return super(SharedDataView, self).get(symbol=symbol, start_date=start_date, end_date=end_date,
+                                                   fields=fields)
+
+        local_fields = self._local_fields(False)
+        if fields:
+            fields = fields.split(',')
+            base_fields = [f for f in fields if f not in local_fields]
+            local_fields = [f for f in fields if f in local_fields]
+        else:
+            base_fields = slice(None)
+
+        symbol = symbol.split(',') if symbol else slice(None)
+        if not start_date:
+            start_date = self.start_date
+        if not end_date:
+            end_date = self.end_date
+
+        res = []
+        for df, fields_ in [(self.data_d, base_fields), (self._local_d, local_fields)]:
+            if isinstance(fields_, list) and not fields_:
+                continue
+            res.append(df.loc[pd.IndexSlice[start_date: end_date], pd.IndexSlice[symbol, fields_]])
+        if len(res) == 1:
+            return res[0]
+        return pd.concat(res, axis=1).sort_index(axis=1)
+
+    def get_ts_quarter(self, field, symbol="", start_date=0, end_date=0):
+        if field not in self._local_fields(True):
+            return super(SharedDataView, self).get_ts_quarter(field, symbol=symbol, start_date=start_date,
+                                                              end_date=end_date)
+        symbol = symbol.split(',') if symbol else self.symbol
+        res = self._local_q.loc[:, pd.IndexSlice[symbol, field]]
+        res.columns = res.columns.droplevel(level='field')
+        return res
+
+
+if __name__ == "__main__":
+    # python -m jaqs.data.sharedview <dataview folder> <name>
+    import sys
+    serve_dataview(sys.argv[1], sys.argv[2])
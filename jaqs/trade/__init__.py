@@ -5,16 +5,19 @@ Basic data types, classes and models for trade.
 """
 
 from .tradeapi import TradeApi
-from .backtest import AlphaBacktestInstance, EventBacktestInstance
+from .backtest import AlphaBacktestInstance, MultiAlphaBacktestInstance, EventBacktestInstance
 from .portfoliomanager import PortfolioManager
 from .livetrade import EventLiveTradeInstance, AlphaLiveTradeInstance
-from .strategy import Strategy, AlphaStrategy, EventDrivenStrategy
+from .strategy import Strategy, AlphaStrategy, MultiAlphaStrategy, EventDrivenStrategy
 from .tradegateway import BaseTradeApi, RealTimeTradeApi, AlphaTradeApi, BacktestTradeApi
+from .walkforward import WalkForwardOptimizer
+from .sharding import ShardedEventBacktest
 
 
 __all__ = ['TradeApi',
-           'AlphaBacktestInstance', 'EventBacktestInstance',
+           'AlphaBacktestInstance', 'MultiAlphaBacktestInstance', 'EventBacktestInstance',
            'PortfolioManager',
            'EventLiveTradeInstance', 'AlphaLiveTradeInstance',
-           'Strategy', 'AlphaStrategy', 'EventDrivenStrategy',
-           'BaseTradeApi', 'RealTimeTradeApi', 'AlphaTradeApi', 'BacktestTradeApi']
+           'Strategy', 'AlphaStrategy', 'MultiAlphaStrategy', 'EventDrivenStrategy',
+           'BaseTradeApi', 'RealTimeTradeApi', 'AlphaTradeApi', 'BacktestTradeApi',
+           'WalkForwardOptimizer', 'ShardedEventBacktest']
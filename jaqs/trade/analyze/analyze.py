@@ -286,6 +286,7 @@ class BaseAnalyzer(object):
         self._closes = None
         self._closes_adj = None
         self.daily_position = None
+        self._recorded_position = None
         self.rebalance_positions = None
         self.returns = None
         self.position_change = None
@@ -388,6 +389,7 @@ class BaseAnalyzer(object):
         self._init_universe(trades.loc[:, 'symbol'].values)
         self._init_configs(self.file_folder)
         self._init_trades(trades)
+        self._init_recorded_position()
         self._init_symbol_price()
         self._init_inst_data()
     
@@ -426,6 +428,22 @@ class BaseAnalyzer(object):
         # self._trades = jutil.group_df_to_dict(df, by='symbol')
         self._trades = df
     
+    def _init_recorded_position(self):
+        """
+        Read end-of-day positions recorded during backtest (positions.csv), if they are stored in all folders.
+        Positions of different folders are added up.
+        
+        """
+        fp_list = [os.path.join(folder, 'positions.csv') for folder in self.file_folder]
+        if not all([os.path.exists(fp) for fp in fp_list]):
+            return
+        
+        df_position = None
+        for fp in fp_list:
+            df = pd.read_csv(fp, index_col=0)
+            df_position = df if df_position is None else df_position.add(df, fill_value=0.0)
+        self._recorded_position = df_position.fillna(0.0)
+    
     def _init_symbol_price(self):
         """
         Get close price of securities in the universe from DataService or DataView.
@@ -641,6 +659,22 @@ class BaseAnalyzer(object):
         - daily average holding price
         - daily trading, holding and total PnL
         
+        """
+        self._calc_daily()
+        self._build_holding_data()
+        self._build_portfolio_data()
+
+        self.save_data()
+
+        print(" finished! ")
+
+    def _calc_daily(self):
+        """
+        Calculate self.daily and self.daily_position.
+        Trading PnL comes from trades, holding PnL comes from daily positions.
+        If positions are recorded during backtest, they are used as daily positions,
+        so that position adjustments booked on later dates do not count twice.
+        
         """
         close = self.closes
         trade = self.trades
@@ -657,6 +691,9 @@ class BaseAnalyzer(object):
 
         # get daily position
         df_position = trade['position'].unstack('symbol').fillna(method='ffill').fillna(0.0)
+        if self._recorded_position is not None:
+            # positions recorded at the end of each day, no need to replay trades
+            df_position = self._recorded_position.reindex(columns=df_position.columns).fillna(0.0)
         daily_position = df_position.reindex(close.index)
         daily_position = daily_position.fillna(method='ffill').fillna(0)
         self.daily_position = daily_position
@@ -669,6 +706,11 @@ class BaseAnalyzer(object):
         adj_close.columns = ['close_adj']
         adj_close.index.names = ['symbol', 'trade_date']         
         merge = pd.concat([close, adj_close, trade], axis=1, join='outer')
+        if self._recorded_position is not None:
+            recorded = pd.DataFrame(daily_position.T.stack())
+            recorded.columns = ['recorded_position']
+            recorded.index.names = ['symbol', 'trade_date']
+            merge = pd.concat([merge, recorded], axis=1, join='outer')
         
         def _apply(gp_df,inst_map):
             symbol = gp_df.index.levels[0][0]
@@ -684,27 +726,23 @@ class BaseAnalyzer(object):
             mask = gp_df.loc[:, 'AvgPosPrice'] < 1e-5
             gp_df.loc[mask, 'AvgPosPrice'] = gp_df.loc[mask, 'close']
     
-            gp_df.loc[:, 'CumProfit'] = gp_df.loc[:, 'CumNetTurnOver'] + mult * gp_df.loc[:, 'position'] * gp_df.loc[:, 'close']
-            gp_df.loc[:, 'CumProfitComm'] = gp_df['CumProfit'] - gp_df['commission'].cumsum()
-    
             daily_net_turnover = gp_df['CumNetTurnOver'].diff(1).fillna(gp_df['CumNetTurnOver'].iat[0])
             daily_position_change = gp_df['position'].diff(1).fillna(gp_df['position'].iat[0])
             gp_df['trading_pnl'] = (daily_net_turnover + mult * gp_df['close'] * daily_position_change - gp_df['commission'])            
+            if 'recorded_position' in gp_df.columns:
+                gp_df.loc[:, 'position'] = gp_df['recorded_position'].fillna(method='ffill').fillna(0)
             gp_df['holding_pnl'] = (mult * gp_df['close'].diff(1) * gp_df['position'].shift(1)).fillna(0.0)
             gp_df.loc[:, 'total_pnl'] = gp_df['trading_pnl'] + gp_df['holding_pnl']
             gp_df['trade_shares'] = daily_position_change
+    
+            gp_df.loc[:, 'CumProfitComm'] = gp_df['total_pnl'].cumsum()
+            gp_df.loc[:, 'CumProfit'] = gp_df['CumProfitComm'] + gp_df['commission'].cumsum()
             
             return gp_df
 
         gp = merge.groupby(by='symbol')
         res = gp.apply(_apply,self.inst_map)        
         self.daily = res
-        self._build_holding_data()
-        self._build_portfolio_data()
-
-        self.save_data()
-
-        print(" finished! ")
 
     def save_data(self):
         file_path = self.file_folder[0] + "/analyze_data.h5"
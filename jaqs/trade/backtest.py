@@ -16,12 +16,27 @@ import pandas as pd
 import datetime as dt
 
 from jaqs.trade import common
-from jaqs.data.basic import Bar
+from jaqs.data.basic import BarBatch
+from jaqs.data.basic import Quote
 from jaqs.data.basic import Trade
+from jaqs.trade.event import SyncEventEngine, Event, EVENT_TYPE
 import jaqs.util as jutil
 from functools import reduce
 
 
+TRADE_TYPE_MAP = {'task_id': str,
+                  'entrust_no': str,
+                  'entrust_action': str,
+                  'symbol': str,
+                  'fill_price': float,
+                  'fill_size': float,
+                  'fill_date': np.integer,
+                  'fill_time': np.integer,
+                  'fill_no': str,
+                  'commission': float,
+                  'trade_date': np.integer}
+
+
 def generate_cash_trade_ind(symbol, amount, date, time=200000):
     trade_ind = Trade()
     trade_ind.symbol = symbol
@@ -114,6 +129,26 @@ class BacktestInstance(six.with_metaclass(abc.ABCMeta)):
             if obj is not None:
                 obj.init_from_config(props)
 
+    def get_trades_df(self):
+        """
+        Convert trades recorded by PortfolioManager to a DataFrame.
+
+        Returns
+        -------
+        df_trades : pd.DataFrame
+            Each row is a trade, columns are the same as trades.csv.
+
+        """
+        trades = self.ctx.pm.trades
+
+        ser_list = dict()
+        for key, dtype in TRADE_TYPE_MAP.items():
+            v = trades.column(key)
+            ser = pd.Series(data=v, index=None, dtype=dtype, name=key)
+            ser_list[key] = ser
+        df_trades = pd.DataFrame(ser_list)
+        df_trades.index.name = 'index'
+        return df_trades
 
 
 '''
@@ -395,7 +430,7 @@ class AlphaBacktestInstance(BacktestInstance):
     
         # step2. calculate market value and cash
         # market value does not include those suspended
-        market_value_float, market_value_frozen = self.ctx.pm.market_value(prices, all_list)
+        market_value_float, market_value_frozen = self.ctx.pm.market_value(self.ctx.snapshot['close'], all_list)
         #cash_available = self.ctx.pm.cash + market_value_float
         cash_available = self.ctx.strategy.cash + market_value_float
     
@@ -480,6 +515,7 @@ class AlphaBacktestInstance(BacktestInstance):
     
     def on_after_market_close(self):
         self.ctx.trade_api.on_after_market_close()
+        self.ctx.pm.on_after_market_close()
         
     '''
     def get_univ_prices(self, field_name='close'):
@@ -596,33 +632,15 @@ class AlphaBacktestInstance(BacktestInstance):
         import pandas as pd
         folder_path = os.path.abspath(folder_path)
     
-        trades = self.ctx.pm.trades
-    
-        type_map = {'task_id': str,
-                    'entrust_no': str,
-                    'entrust_action': str,
-                    'symbol': str,
-                    'fill_price': float,
-                    'fill_size': float,
-                    'fill_date': np.integer,
-                    'fill_time': np.integer,
-                    'fill_no': str,
-                    'commission': float,
-                    'trade_date': np.integer}
-        # keys = trades[0].__dict__.keys()
-        ser_list = dict()
-        for key in type_map.keys():
-            v = [t.__getattribute__(key) for t in trades]
-            ser = pd.Series(data=v, index=None, dtype=type_map[key], name=key)
-            ser_list[key] = ser
-        df_trades = pd.DataFrame(ser_list)
-        df_trades.index.name = 'index'
+        df_trades = self.get_trades_df()
     
         trades_fn = os.path.join(folder_path, 'trades.csv')
+        positions_fn = os.path.join(folder_path, 'positions.csv')
         configs_fn = os.path.join(folder_path, 'configs.json')
         jutil.create_dir(trades_fn)
     
         df_trades.to_csv(trades_fn)
+        self.ctx.pm.get_position_matrix().to_csv(positions_fn)
         jutil.save_json(self.props, configs_fn)
     
         print ("Backtest results has been successfully saved to:\n" + folder_path)
@@ -639,6 +657,62 @@ class AlphaBacktestInstance(BacktestInstance):
         print("float {:.2e}, frozen {:.2e}".format(market_value_float, market_value_frozen))
 
 
+
+class MultiAlphaBacktestInstance(AlphaBacktestInstance):
+    """
+    Backtest several alpha strategies in one account, using DataView.
+    
+    ctx.strategy must be a MultiAlphaStrategy. Snapshot is read and orders are matched once
+    per day for all sleeves, and PnL of the account is attributed to each sleeve.
+
+    """
+    def init_from_config(self, props):
+        if not hasattr(self.ctx.strategy, 'sleeves'):
+            raise ValueError("MultiAlphaBacktestInstance must be used with MultiAlphaStrategy.")
+        super(MultiAlphaBacktestInstance, self).init_from_config(props)
+    
+    def get_sleeve_pnl(self):
+        """
+        Daily PnL of each sleeve and of the account.
+        
+        PnL of a sleeve is its target sizes of last re-balance marked to close prices.
+        'residual' is the difference between account PnL and sum of sleeves, which comes from
+        lot rounding, suspensions, fill prices other than close, commissions and corporate actions.
+
+        Returns
+        -------
+        pd.DataFrame
+            Index is trade_date, columns are sleeve names, 'residual' and 'total'.
+            The first date is the base date, whose PnL is 0.
+
+        """
+        from jaqs.trade.walkforward import calc_daily_pnl
+        
+        dv = self.ctx.dataview
+        strategy = self.ctx.strategy
+        df_close = dv.get_ts('close', start_date=self.start_date, end_date=self.end_date)
+        df_close = df_close.reindex(columns=self.ctx.universe)
+        price_change = df_close.fillna(method='ffill').diff().fillna(0.0)
+        
+        df = pd.DataFrame(index=df_close.index)
+        for name in strategy.sleeves:
+            pos = strategy.get_sleeve_positions(name)
+            pos = pos.reindex(index=df_close.index, method='ffill').fillna(0.0)
+            df[name] = (pos.shift(1).fillna(0.0) * price_change).sum(axis=1)
+        
+        total = calc_daily_pnl(self.get_trades_df(), df_close, self.ctx.pm.init_balance)
+        df['residual'] = total - df.sum(axis=1)
+        df['total'] = total
+        return df
+    
+    def save_results(self, folder_path='.'):
+        import os
+        super(MultiAlphaBacktestInstance, self).save_results(folder_path)
+        
+        sleeve_pnl_fn = os.path.join(os.path.abspath(folder_path), 'sleeve_pnl.csv')
+        self.get_sleeve_pnl().to_csv(sleeve_pnl_fn)
+
+
 class EventBacktestInstance(BacktestInstance):
     """
     Backtest event-driven strategy using DataService.
@@ -646,19 +720,27 @@ class EventBacktestInstance(BacktestInstance):
     Attributes
     ----------
     bar_type : str
-        {'1d', '1M', '5M', etc.}
+        {'1d', '1M', '5M', etc.}. '0' means backtest on ticks.
+    n_prefetch : int
+        Number of trade dates whose intraday bars are loaded ahead in background. 0 means no prefetch.
+    event_engine : SyncEventEngine
+        Market data are put into it as MARKET_DATA events and dispatched in current thread,
+        so that more handlers can be registered on it, the same way as EventLiveTradeInstance.
     
     """
     def __init__(self):
         super(EventBacktestInstance, self).__init__()
         
         self.bar_type = ""
+        self.n_prefetch = 2
         self.df_dividend = None
+        self.event_engine = SyncEventEngine()
         
     def init_from_config(self, props):
         super(EventBacktestInstance, self).init_from_config(props)
         
         self.bar_type = props.get("bar_type", "1d")
+        self.n_prefetch = props.get("n_prefetch", 2)
     
     def _get_dividend_info(self):
         """
@@ -717,15 +799,15 @@ class EventBacktestInstance(BacktestInstance):
     def on_new_day(self, date):
         self.ctx.trade_date = date
         self.ctx.time = 0
-        if hasattr(self.ctx.trade_api, 'on_new_day'):
-            self.ctx.trade_api.on_new_day(self.ctx.trade_date)
         if hasattr(self.ctx.trade_api, 'on_new_day'):
             self.ctx.trade_api.on_new_day(self.ctx.trade_date)
         self.ctx.strategy.initialize()
         print('on_new_day in trade {}'.format(self.ctx.trade_date))
     
     def on_after_market_close(self):
-        pass
+        if hasattr(self.ctx.trade_api, 'on_after_market_close'):
+            self.ctx.trade_api.on_after_market_close()
+        self.ctx.pm.on_after_market_close()
         
     def _get_df_bar(self, symbols, date):
         """
@@ -767,40 +849,111 @@ class EventBacktestInstance(BacktestInstance):
         Returns
         -------
         res : list of tuples
-            Three-element tuple: (trade_date, time, dict of quote)
+            Two-element tuple: (time, BarBatch of quotes)
 
         """
         # query quotes data
         symbols_str = ','.join(self.ctx.universe)
         df_quotes = self._get_df_bar(symbols_str, date)
         if df_quotes is None or df_quotes.empty:
-            return dict()
+            return []
     
-        # create nested dict
+        # one record array per time, each BarBatch works as a dict of quotes
         df_quotes = df_quotes.sort_values(['date', 'time', 'symbol'])
-        res = []
-        for time, df in df_quotes.groupby(by=['time'], sort=False):
-            quotes_list = Bar.create_from_df(df)
-            dic = {quote.symbol: quote for quote in quotes_list}
-            res.append((time, dic))
-        return res
+        return BarBatch.create_from_df(df_quotes, by='time')
     
+    def _get_trade_dates(self):
+        if self.ctx.data_api is not None:
+            return self.ctx.data_api.query_trade_dates(self.start_date, self.end_date)
+        elif self.ctx.dataview is not None:
+            dates = self.ctx.dataview.dates
+            return dates[(dates >= self.start_date) & (dates <= self.end_date)]
+        else:
+            raise ValueError()
+
     def _run_bar(self):
-        """Quotes of different symbols will be aligned into one dictionary."""
-        trade_dates_arr = self.ctx.data_api.query_trade_dates(self.start_date, self.end_date)
+        """
+        Quotes of different symbols will be aligned into one dictionary.
+        
+        Bars of the next [n_prefetch] trade dates are loaded in a background thread
+        while the current day is being simulated. Events are processed in the same order
+        as loading synchronously (n_prefetch = 0).
+        
+        """
+        trade_dates_arr = self._get_trade_dates()
 
         last_trade_date = trade_dates_arr[0]
-        for trade_date in trade_dates_arr:
+        prefetcher = jutil.Prefetcher(self._create_time_symbol_bars, trade_dates_arr, maxsize=self.n_prefetch)
+        for trade_date, list_of_quotes_tuples in prefetcher:
             self.settle_for_stocks(last_trade_date, trade_date)
             self.on_new_day(trade_date)
             
-            list_of_quotes_tuples = self._create_time_symbol_bars(trade_date)
             for time, quotes_dic in list_of_quotes_tuples:
-                self._process_quote_bar(quotes_dic)
+                self.event_engine.put(Event(EVENT_TYPE.MARKET_DATA, dic={'quote': quotes_dic}))
             
             self.on_after_market_close()
             last_trade_date = trade_date
 
+    def _create_ticks(self, date):
+        """
+        Given a trade date, query ticks of all symbols on that day.
+        
+        Ticks are queried from DataService.bar with freq = '0', eg. ticks stored in LocalDataService.
+        
+        Parameters
+        ----------
+        date : int
+            Trade date.
+
+        Returns
+        -------
+        res : list of Quote
+            Sorted by date and time. Ticks of the same time keep their original order.
+
+        """
+        if self.ctx.data_api is None:
+            raise ValueError("data_api must be provided to backtest on ticks.")
+        symbols_str = ','.join(self.ctx.universe)
+        df_ticks, _ = self.ctx.data_api.bar(symbol=symbols_str,
+                                            start_time=200000, end_time=160000, trade_date=date,
+                                            freq=self.bar_type)
+        if df_ticks is None or df_ticks.empty:
+            return []
+        
+        df_ticks = df_ticks.sort_values(['date', 'time'], kind='mergesort')
+        return Quote.create_from_df(df_ticks)
+    
+    def _run_tick(self):
+        """
+        Ticks of all symbols are replayed one by one in time order.
+        
+        For each tick, resting orders of that symbol are matched first, then strategy.on_tick is called.
+        
+        """
+        trade_dates_arr = self._get_trade_dates()
+        
+        last_trade_date = trade_dates_arr[0]
+        prefetcher = jutil.Prefetcher(self._create_ticks, trade_dates_arr, maxsize=self.n_prefetch)
+        for trade_date, quotes in prefetcher:
+            self.settle_for_stocks(last_trade_date, trade_date)
+            self.on_new_day(trade_date)
+            
+            for quote in quotes:
+                self.event_engine.put(Event(EVENT_TYPE.MARKET_DATA, dic={'quote': quote}))
+            
+            self.on_after_market_close()
+            last_trade_date = trade_date
+    
+    def on_tick(self, event):
+        self._process_quote_tick(event.dic['quote'])
+    
+    def _process_quote_tick(self, quote):
+        self.ctx.time = quote.time
+        self.ctx.trade_api.match_and_callback({quote.symbol: quote}, freq=self.bar_type)
+        
+        # on_tick
+        self.ctx.strategy.on_tick(quote)
+
     def _get_df_daily(self, symbol, start_date, end_date):
         """
         Get bar DataFrame from DataApi or DataView.
@@ -844,25 +997,19 @@ class EventBacktestInstance(BacktestInstance):
         Returns
         -------
         res : list of tuples
-            Two-element tuple: (trade_date, dict of quotes)
+            Two-element tuple: (trade_date, BarBatch of quotes)
 
         """
         # query quotes data
         symbols_str = ','.join(self.ctx.universe)
         df_daily = self._get_df_daily(symbol=symbols_str, start_date=start_date, end_date=end_date)
-        df_daily['date'] = df_daily['trade_date']
         if df_daily is None or df_daily.empty:
-            return dict()
+            return []
+        df_daily['date'] = df_daily['trade_date']
 
-        # create nested dict
+        # one record array per trade date, each BarBatch works as a dict of quotes
         df_daily = df_daily.sort_values(['trade_date', 'symbol'])
-        res = []
-        for date, df in df_daily.groupby(by='trade_date'):
-            quotes_list = Bar.create_from_df(df)
-            dic = {quote.symbol: quote for quote in quotes_list}
-            res.append((date, dic))
-    
-        return res
+        return BarBatch.create_from_df(df_daily, by='trade_date')
 
     def _run_daily(self):
         """Quotes of different symbols will be aligned into one dictionary."""
@@ -874,19 +1021,24 @@ class EventBacktestInstance(BacktestInstance):
             date2, quotes_dic2 = list_of_quotes_tuples[i + 1]
             self.on_new_day(date2)
             
-            self._process_quote_daily(quotes_dic1, quotes_dic2)
+            self.event_engine.put(Event(EVENT_TYPE.MARKET_DATA, dic={'quote': quotes_dic1,
+                                                                     'quote_today': quotes_dic2}))
             
             self.on_after_market_close()
             self.settle_for_stocks(date1, date2)
     
+    def on_daily_bar(self, event):
+        self._process_quote_daily(event.dic['quote'], event.dic['quote_today'])
+    
     def _process_quote_daily(self, quote_yesterday, quote_today):
         # on_bar
         self.ctx.strategy.on_bar(quote_yesterday)
         
         self.ctx.trade_api.match_and_callback(quote_today, freq=self.bar_type)
-  
-        self.on_after_market_close()
 
+    def on_bar(self, event):
+        self._process_quote_bar(event.dic['quote'])
+    
     def _process_quote_bar(self, quotes_dic):
         results = self.ctx.trade_api.match_and_callback(quotes_dic, freq=self.bar_type)
     
@@ -894,19 +1046,36 @@ class EventBacktestInstance(BacktestInstance):
         self.ctx.strategy.on_bar(quotes_dic)
 
     def run(self):
+        """
+        Market data are dispatched by event_engine to on_daily_bar, on_bar or on_tick
+        according to bar_type. Trades and order status are called back by trade_api directly,
+        so that they arrive before on_bar / on_tick of the same quotes.
+        
+        """
         self._get_dividend_info()
         
         if self.bar_type == common.QUOTE_TYPE.DAILY:
-            self._run_daily()
+            handler, run_func = self.on_daily_bar, self._run_daily
         
         elif (self.bar_type == common.QUOTE_TYPE.MIN
               or self.bar_type == common.QUOTE_TYPE.FIVEMIN
               or self.bar_type == common.QUOTE_TYPE.QUARTERMIN):
-            self._run_bar()
+            handler, run_func = self.on_bar, self._run_bar
+        
+        elif self.bar_type == common.QUOTE_TYPE.TICK:
+            handler, run_func = self.on_tick, self._run_tick
         
         else:
             raise NotImplementedError("bar_type = {}".format(self.bar_type))
         
+        self.event_engine.register(EVENT_TYPE.MARKET_DATA, handler)
+        self.event_engine.start(timer=False)
+        try:
+            run_func()
+        finally:
+            self.event_engine.stop()
+            self.event_engine.unregister(EVENT_TYPE.MARKET_DATA, handler)
+        
         print("Backtest done.")
         
     def save_results(self, folder_path='.'):
@@ -914,33 +1083,15 @@ class EventBacktestInstance(BacktestInstance):
         import pandas as pd
         folder_path = os.path.abspath(folder_path)
     
-        trades = self.ctx.pm.trades
-    
-        type_map = {'task_id': str,
-                    'entrust_no': str,
-                    'entrust_action': str,
-                    'symbol': str,
-                    'fill_price': float,
-                    'fill_size': float,
-                    'fill_date': np.integer,
-                    'fill_time': np.integer,
-                    'fill_no': str,
-                    'commission': float,
-                    'trade_date': np.integer}
-        # keys = trades[0].__dict__.keys()
-        ser_list = dict()
-        for key in type_map.keys():
-            v = [t.__getattribute__(key) for t in trades]
-            ser = pd.Series(data=v, index=None, dtype=type_map[key], name=key)
-            ser_list[key] = ser
-        df_trades = pd.DataFrame(ser_list)
-        df_trades.index.name = 'index'
+        df_trades = self.get_trades_df()
     
         trades_fn = os.path.join(folder_path, 'trades.csv')
+        positions_fn = os.path.join(folder_path, 'positions.csv')
         configs_fn = os.path.join(folder_path, 'configs.json')
         jutil.create_dir(trades_fn)
     
         df_trades.to_csv(trades_fn)
+        self.ctx.pm.get_position_matrix().to_csv(positions_fn)
         jutil.save_json(self.props, configs_fn)
     
         print ("Backtest results has been successfully saved to:\n" + folder_path)
@@ -126,6 +126,8 @@ class ORDER_TIME_IN_FORCE(ReprStrEnum):
     FOK = 'fok'
     FAK = 'fak'
     IOC = 'ioc'
+    DAY = 'day'
+    GTC = 'gtc'
 
 
 @unique
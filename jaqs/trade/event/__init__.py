@@ -6,5 +6,5 @@ and the appropriate reaction is selected and executed.
 Our framework utilizes event engine to run in an efficient way.
 
 """
-from .engine import EventEngine, Event
+from .engine import EventEngine, SyncEventEngine, PartitionedEventEngine, Event
 from .eventtype import EVENT_TYPE
@@ -7,9 +7,13 @@ try:
     import queue
 except ImportError:
     import Queue as queue
-from threading import Thread
+from threading import Thread, Lock
 from time import sleep
-from collections import defaultdict
+import time
+from collections import defaultdict, deque
+from itertools import count
+
+import pandas as pd
 
 # 第三方模块
 # TODO: add timer
@@ -17,6 +21,7 @@ from collections import defaultdict
 
 # 自己开发的模块
 from .eventtype import EVENT_TYPE
+from jaqs.util.profile import latency_monitor
 
 
 ########################################################################
@@ -63,6 +68,9 @@ class EventEngine(object):
         """初始化事件引擎"""
         # 事件队列
         self.__queue = queue.Queue()
+        # 入队与出队事件计数，用于统计队列深度
+        self.__n_put = count()
+        self.__n_get = 0
         
         # 事件引擎开关
         self.__active = False
@@ -87,13 +95,18 @@ class EventEngine(object):
         while self.__active == True:
             try:
                 event = self.__queue.get(block = True, timeout = 1)  # 获取事件的阻塞时间设为1秒
+                self.__n_get += 1
                 self.__process(event)
             except queue.Empty:
                 pass
+            latency_monitor.maybe_log()
             
     #----------------------------------------------------------------------
     def __process(self, event):
         """处理事件"""
+        if event.ingress_time:
+            latency_monitor.record('event_dispatch', event.type_, event.ingress_time)
+        
         # 检查是否存在对该事件进行监听的处理函数
         if event.type_ in self.__handlers:
             # 若存在，则按顺序将事件传递给处理函数执行
@@ -106,6 +119,9 @@ class EventEngine(object):
         # 调用通用处理函数进行处理
         if self.__generalHandlers:
             [handler(event) for handler in self.__generalHandlers]
+        
+        if event.ingress_time:
+            latency_monitor.record('event_done', event.type_, event.ingress_time)
             
     #----------------------------------------------------------------------
     def __onTimer(self):
@@ -172,6 +188,12 @@ class EventEngine(object):
     #----------------------------------------------------------------------
     def put(self, event):
         """向事件队列中存入事件"""
+        n_put = next(self.__n_put)
+        if event.ingress_time is None:
+            event.ingress_time = latency_monitor.stamp()
+        if event.ingress_time:
+            # counters instead of qsize(), which takes the lock of queue
+            latency_monitor.record_depth(event.type_, n_put - self.__n_get)
         self.__queue.put(event)
         
     #----------------------------------------------------------------------
@@ -199,6 +221,9 @@ class EventEngine2(object):
         """初始化事件引擎"""
         # 事件队列
         self.__queue = queue.Queue()
+        # 入队与出队事件计数，用于统计队列深度
+        self.__n_put = count()
+        self.__n_get = 0
         
         # 事件引擎开关
         self.__active = False
@@ -224,13 +249,18 @@ class EventEngine2(object):
         while self.__active == True:
             try:
                 event = self.__queue.get(block = True, timeout = 1)  # 获取事件的阻塞时间设为1秒
+                self.__n_get += 1
                 self.__process(event)
             except queue.Empty:
                 pass
+            latency_monitor.maybe_log()
             
     #----------------------------------------------------------------------
     def __process(self, event):
         """处理事件"""
+        if event.ingress_time:
+            latency_monitor.record('event_dispatch', event.type_, event.ingress_time)
+        
         # 检查是否存在对该事件进行监听的处理函数
         if event.type_ in self.__handlers:
             # 若存在，则按顺序将事件传递给处理函数执行
@@ -243,6 +273,9 @@ class EventEngine2(object):
         # 调用通用处理函数进行处理
         if self.__generalHandlers:
             [handler(event) for handler in self.__generalHandlers]
+        
+        if event.ingress_time:
+            latency_monitor.record('event_done', event.type_, event.ingress_time)
             
     #----------------------------------------------------------------------
     def __runTimer(self):
@@ -314,6 +347,12 @@ class EventEngine2(object):
     #----------------------------------------------------------------------
     def put(self, event):
         """向事件队列中存入事件"""
+        n_put = next(self.__n_put)
+        if event.ingress_time is None:
+            event.ingress_time = latency_monitor.stamp()
+        if event.ingress_time:
+            # counters instead of qsize(), which takes the lock of queue
+            latency_monitor.record_depth(event.type_, n_put - self.__n_get)
         self.__queue.put(event)
 
     #----------------------------------------------------------------------
@@ -330,7 +369,330 @@ class EventEngine2(object):
 
 
 ########################################################################
-class Event:
+class SyncEventEngine(object):
+    """
+    Event engine for backtest. There is no queue and no thread: an event is
+    dispatched to its handlers in the caller's thread when it is put.
+    
+    Handlers are registered in the same way as EventEngine. For each event type,
+    handlers and general handlers are pre-bound into one tuple when registering,
+    so dispatching an event is a dict lookup and a loop of function calls.
+    
+    Events put by a handler are dispatched after the current event is finished,
+    which keeps the first-in-first-out order of EventEngine.
+    
+    """
+    def __init__(self):
+        super(SyncEventEngine, self).__init__()
+        
+        self._handlers = defaultdict(list)
+        self._general_handlers = []
+        
+        # {type_: tuple of handlers}, general handlers included
+        self._dispatch_table = dict()
+        self._general_tuple = ()
+        
+        self._dispatching = False
+        self._pending = deque()
+    
+    def _bind_handlers(self):
+        self._general_tuple = tuple(self._general_handlers)
+        self._dispatch_table = {type_: tuple(handlers) + self._general_tuple
+                                for type_, handlers in self._handlers.items()}
+    
+    def put(self, event):
+        """Dispatch the event to its handlers immediately."""
+        if self._dispatching:
+            self._pending.append(event)
+            return
+        
+        self._dispatching = True
+        try:
+            for handler in self._dispatch_table.get(event.type_, self._general_tuple):
+                handler(event)
+            while self._pending:
+                event = self._pending.popleft()
+                for handler in self._dispatch_table.get(event.type_, self._general_tuple):
+                    handler(event)
+        finally:
+            self._dispatching = False
+            self._pending.clear()
+    
+    def start(self, timer=True):
+        """Nothing to start: events are dispatched by put. Timer events are not generated in backtest."""
+        pass
+    
+    def stop(self):
+        pass
+    
+    def register(self, type_, handler):
+        handler_list = self._handlers[type_]
+        if handler not in handler_list:
+            handler_list.append(handler)
+        self._bind_handlers()
+    
+    def unregister(self, type_, handler):
+        handler_list = self._handlers.get(type_, [])
+        if handler in handler_list:
+            handler_list.remove(handler)
+        if not handler_list:
+            self._handlers.pop(type_, None)
+        self._bind_handlers()
+    
+    def registerGeneralHandler(self, handler):
+        if handler not in self._general_handlers:
+            self._general_handlers.append(handler)
+        self._bind_handlers()
+    
+    def unregisterGeneralHandler(self, handler):
+        if handler in self._general_handlers:
+            self._general_handlers.remove(handler)
+        self._bind_handlers()
+
+
+########################################################################
+def get_event_key(event):
+    """
+    Default partition key of an event: symbol of the quote / indication it carries.
+    
+    Returns
+    -------
+    str or None
+    
+    """
+    dic = event.dic
+    obj = dic.get('quote', None)
+    if obj is None:
+        obj = dic.get('ind', None)
+    if obj is None:
+        return dic.get('symbol', None)
+    if isinstance(obj, dict):
+        return obj.get('symbol', None)
+    return getattr(obj, 'symbol', None)
+
+
+class _HandlerStat(object):
+    """Number of calls, total and max time (seconds) of one handler."""
+    __slots__ = ['count', 'total', 'max']
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class _Worker(object):
+    """One thread with its own queue. Events of the queue are processed in order."""
+    def __init__(self, name, process):
+        self.name = name
+        self.queue = queue.Queue()
+        self.thread = Thread(target=self._run, args=(process,), name=name)
+        self.thread.daemon = True
+        
+        self.n_events = 0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._n_put = count(1)
+    
+    def put(self, event):
+        self.queue.put((time.time(), event))
+        # counters instead of qsize(), which takes the lock of queue
+        depth = next(self._n_put) - self.n_events
+        if depth > self.max_depth:
+            self.max_depth = depth
+    
+    def _run(self, process):
+        q = self.queue
+        while True:
+            t_put, event = q.get()
+            try:
+                if event is None:
+                    break
+                wait = time.time() - t_put
+                self.n_events += 1
+                self.wait_total += wait
+                if wait > self.wait_max:
+                    self.wait_max = wait
+                process(event)
+            finally:
+                q.task_done()
+
+
+class PartitionedEventEngine(object):
+    """
+    Event engine for live trading with several worker threads.
+    
+    Events are partitioned by a key (symbol by default, see get_event_key) into
+    n_workers normal lanes: events with the same key are always processed by the same
+    worker, in the order they are put. A slow handler of one symbol therefore only delays
+    events of symbols on the same lane.
+    
+    Events of priority_types (trade and order status indications, responses) go to a
+    separate priority lane, which is processed in put order and never waits for market data.
+    Timer events go to the priority lane as well.
+    
+    Handlers are registered in the same way as EventEngine. Handlers of different lanes
+    run concurrently, they must not rely on a global order of events of different keys
+    and must guard state they share (see EventLiveTradeInstance.lock).
+    
+    Attributes
+    ----------
+    n_workers : int
+        Number of normal lanes.
+    key_func : callable
+        key_func(event) returns the partition key of an event.
+    priority_types : set
+    
+    """
+    PRIORITY_TYPES = {EVENT_TYPE.TRADE_IND, EVENT_TYPE.ORDER_STATUS_IND, EVENT_TYPE.ORDER_RSP,
+                      EVENT_TYPE.TASK_RSP, EVENT_TYPE.TASK_STATUS_IND, EVENT_TYPE.TIMER}
+    
+    def __init__(self, n_workers=4, key_func=None, priority_types=None):
+        super(PartitionedEventEngine, self).__init__()
+        
+        self.n_workers = n_workers
+        self.key_func = get_event_key if key_func is None else key_func
+        self.priority_types = set(self.PRIORITY_TYPES if priority_types is None else priority_types)
+        
+        self._handlers = defaultdict(list)
+        self._general_handlers = []
+        self._dispatch_table = dict()
+        self._general_tuple = ()
+        
+        self._priority_worker = _Worker('priority', self._process)
+        self._workers = [_Worker('worker{:d}'.format(i), self._process) for i in range(n_workers)]
+        self._key_lanes = dict()
+        
+        self._handler_stats = defaultdict(_HandlerStat)
+        self._stats_lock = Lock()
+        
+        self._active = False
+        self._timer = None
+        self._timer_sleep = 1
+    
+    # -------------------------------------------------------------------------------------------
+    # Handlers
+    def _bind_handlers(self):
+        self._general_tuple = tuple(self._general_handlers)
+        self._dispatch_table = {type_: tuple(handlers) + self._general_tuple
+                                for type_, handlers in self._handlers.items()}
+    
+    def register(self, type_, handler):
+        handler_list = self._handlers[type_]
+        if handler not in handler_list:
+            handler_list.append(handler)
+        self._bind_handlers()
+    
+    def unregister(self, type_, handler):
+        handler_list = self._handlers.get(type_, [])
+        if handler in handler_list:
+            handler_list.remove(handler)
+        if not handler_list:
+            self._handlers.pop(type_, None)
+        self._bind_handlers()
+    
+    def registerGeneralHandler(self, handler):
+        if handler not in self._general_handlers:
+            self._general_handlers.append(handler)
+        self._bind_handlers()
+    
+    def unregisterGeneralHandler(self, handler):
+        if handler in self._general_handlers:
+            self._general_handlers.remove(handler)
+        self._bind_handlers()
+    
+    def _process(self, event):
+        for handler in self._dispatch_table.get(event.type_, self._general_tuple):
+            t0 = time.time()
+            handler(event)
+            used = time.time() - t0
+            
+            with self._stats_lock:
+                stat = self._handler_stats[handler]
+                stat.count += 1
+                stat.total += used
+                if used > stat.max:
+                    stat.max = used
+    
+    # -------------------------------------------------------------------------------------------
+    # Run
+    def _get_worker(self, event):
+        if event.type_ in self.priority_types:
+            return self._priority_worker
+        key = self.key_func(event)
+        lane = self._key_lanes.get(key, None)
+        if lane is None:
+            lane = hash(key) % self.n_workers
+            self._key_lanes[key] = lane
+        return self._workers[lane]
+    
+    def put(self, event):
+        """Put the event into the queue of its lane."""
+        self._get_worker(event).put(event)
+    
+    def _run_timer(self):
+        while self._active:
+            self.put(Event(type_=EVENT_TYPE.TIMER))
+            sleep(self._timer_sleep)
+    
+    def start(self, timer=True):
+        self._active = True
+        for worker in [self._priority_worker] + self._workers:
+            worker.thread.start()
+        if timer:
+            self._timer = Thread(target=self._run_timer)
+            self._timer.daemon = True
+            self._timer.start()
+    
+    def join(self):
+        """Block until all events put so far are processed."""
+        for worker in [self._priority_worker] + self._workers:
+            worker.queue.join()
+    
+    def stop(self):
+        """Process remaining events, then stop all workers."""
+        self._active = False
+        if self._timer is not None:
+            self._timer.join()
+            self._timer = None
+        for worker in [self._priority_worker] + self._workers:
+            worker.queue.put((time.time(), None))
+        for worker in [self._priority_worker] + self._workers:
+            worker.thread.join()
+    
+    # -------------------------------------------------------------------------------------------
+    # Metrics
+    def get_metrics(self):
+        """
+        Latency and queue metrics since the engine is created.
+        
+        Returns
+        -------
+        dict
+            'handlers' : pd.DataFrame
+                Index is handler name, columns: count, mean_us, max_us (time spent in the handler).
+            'lanes' : pd.DataFrame
+                Index is lane name, columns: n_events, depth (current queue size), max_depth,
+                mean_wait_us, max_wait_us (time from put to dispatch).
+        
+        """
+        with self._stats_lock:
+            rows = [(getattr(handler, '__name__', repr(handler)), stat.count,
+                     stat.total / stat.count * 1e6 if stat.count else 0.0, stat.max * 1e6)
+                    for handler, stat in self._handler_stats.items()]
+        df_handlers = pd.DataFrame(rows, columns=['handler', 'count', 'mean_us', 'max_us']).set_index('handler')
+        
+        rows = [(w.name, w.n_events, w.queue.qsize(), w.max_depth,
+                 w.wait_total / w.n_events * 1e6 if w.n_events else 0.0, w.wait_max * 1e6)
+                for w in [self._priority_worker] + self._workers]
+        df_lanes = pd.DataFrame(rows, columns=['lane', 'n_events', 'depth', 'max_depth',
+                                               'mean_wait_us', 'max_wait_us']).set_index('lane')
+        return {'handlers': df_handlers, 'lanes': df_lanes}
+
+
+########################################################################
+class Event(object):
     """
     Event is a class used to represent an event happended.
     
@@ -338,15 +700,21 @@ class Event:
     ----------
     type_ : str
     dic : dict
+    ingress_time : float, False or None
+        latency_monitor.stamp() when the data of the event arrived, used for latency statistics.
+        False if the event is not sampled, None if it has not been stamped.
     
     """
-    def __init__(self, type_=None):
+    __slots__ = ['type_', 'dic', 'ingress_time']
+    
+    def __init__(self, type_=None, dic=None):
         """Constructor"""
         self.type_ = type_      # 事件类型
-        self.dic = {}         # 字典用于保存具体的事件数据
+        self.dic = {} if dic is None else dic         # 字典用于保存具体的事件数据
+        self.ingress_time = None
         
     def __repr__(self):
-        "Event [{0:s}] with data {1:}".format(self.type_, list(self.dic.keys())[:10])
+        return "Event [{0:s}] with data {1:}".format(self.type_, list(self.dic.keys())[:10])
 
     def __str__(self):
         return self.__repr__()
@@ -0,0 +1,539 @@
+# encoding: utf-8
+"""
+Module ledger defines append-only columnar ledgers used by PortfolioManager
+to store trades and end-of-day positions.
+
+Each column is a pre-allocated NumPy array whose capacity doubles when it is full,
+so appending a record is O(1) amortized and exporting to DataFrame or file does not
+walk Python objects. Columns with few distinct values (symbol, entrust_action) are
+stored as int32 codes.
+
+If spill_dir is given, rows are written to columnar .npz blocks in that folder
+whenever chunk_size rows are held in memory, so memory usage stays bounded in long
+backtests. Spilled rows are read back transparently on export or iteration.
+Object columns (eg. task_id) are pickled in blocks, so values keep their types.
+
+ArchiveDict is a dict whose finished entries are moved to an append-only pickle log
+after a given number of trade days. It is used for orders, tasks and trade stats.
+
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+import os
+import tempfile
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+import numpy as np
+import pandas as pd
+
+import jaqs.util as jutil
+from jaqs.data.basic import Trade
+
+CATEGORY = 'category'
+
+
+class ColumnarLedger(object):
+    """
+    Append-only table of records, one growing NumPy array per column.
+
+    Attributes
+    ----------
+    columns : list of str
+    dtypes : dict
+        {column: numpy dtype or 'category'}
+    spill_dir : str or None
+        Folder to write full blocks to. None means all rows are kept in memory.
+    chunk_size : int
+        Maximum number of rows kept in memory when spill_dir is set.
+    name : str
+        Prefix of spilled block files.
+
+    """
+    def __init__(self, dtypes, capacity=1024, spill_dir=None, chunk_size=100000, name='ledger'):
+        """
+        Parameters
+        ----------
+        dtypes : list of tuple
+            [(column, dtype)], column order is kept in exports.
+        capacity : int
+            Number of rows pre-allocated.
+
+        """
+        self.columns = [col for col, _ in dtypes]
+        self.dtypes = dict(dtypes)
+        self.spill_dir = None if spill_dir is None else os.path.abspath(spill_dir)
+        self.chunk_size = chunk_size
+        self.name = name
+
+        if self.spill_dir is not None:
+            capacity = min(capacity, chunk_size)
+        self._capacity = max(int(capacity), 1)
+        self._data = {col: np.empty(self._capacity, dtype=self._get_storage_dtype(col))
+                      for col in self.columns}
+        self._n = 0
+
+        self._categories = {col: ([], dict()) for col in self.columns if self.dtypes[col] == CATEGORY}
+
+        self._block_files = []
+        self._n_spilled = 0
+
+    def _get_storage_dtype(self, col):
+        dtype = self.dtypes[col]
+        if dtype == CATEGORY:
+            return np.int32
+        return dtype
+
+    def __len__(self):
+        return self._n_spilled + self._n
+
+    @property
+    def nbytes(self):
+        """Memory used by in-memory column arrays."""
+        return sum(arr.nbytes for arr in self._data.values())
+
+    # -----------------------------------------------------------------------------------
+    # Write
+    def _encode(self, col, value):
+        values, codes = self._categories[col]
+        code = codes.get(value)
+        if code is None:
+            code = len(values)
+            values.append(value)
+            codes[value] = code
+        return code
+
+    def _grow(self):
+        capacity = self._capacity * 2
+        if self.spill_dir is not None:
+            capacity = min(capacity, self.chunk_size)
+        for col, arr in self._data.items():
+            new_arr = np.empty(capacity, dtype=arr.dtype)
+            new_arr[:self._n] = arr[:self._n]
+            self._data[col] = new_arr
+        self._capacity = capacity
+
+    def append_row(self, values):
+        """
+        Append one record.
+
+        Parameters
+        ----------
+        values : tuple
+            Values in the same order as self.columns.
+
+        """
+        if self._n == self._capacity:
+            self._grow()
+        i = self._n
+        for col, value in zip(self.columns, values):
+            if col in self._categories:
+                value = self._encode(col, value)
+            self._data[col][i] = value
+        self._n += 1
+
+        if self.spill_dir is not None and self._n >= self.chunk_size:
+            self.flush()
+
+    def append_columns(self, values):
+        """
+        Append many records at once.
+
+        Parameters
+        ----------
+        values : tuple of array-like
+            One array for each column, in the same order as self.columns. Scalars are broadcast.
+
+        """
+        n_new = max([np.size(v) for v in values if np.ndim(v) > 0] or [1])
+        start = 0
+        while start < n_new:
+            if self._n == self._capacity:
+                self._grow()
+            size = min(n_new - start, self._capacity - self._n)
+            for col, value in zip(self.columns, values):
+                if np.ndim(value) > 0:
+                    value = value[start:start + size]
+                    if col in self._categories:
+                        value = [self._encode(col, v) for v in value]
+                elif col in self._categories:
+                    value = self._encode(col, value)
+                self._data[col][self._n:self._n + size] = value
+            self._n += size
+            start += size
+
+            if self.spill_dir is not None and self._n >= self.chunk_size:
+                self.flush()
+
+    def truncate(self, n):
+        """
+        Drop records after the first n records. Spilled records can not be dropped.
+
+        Parameters
+        ----------
+        n : int
+
+        """
+        if n < self._n_spilled:
+            raise ValueError("Can not truncate records already spilled to disk.")
+        self._n = min(self._n, n - self._n_spilled)
+
+    def flush(self):
+        """Write records in memory to a block file in spill_dir and release them."""
+        if self.spill_dir is None or self._n == 0:
+            return
+        fp = os.path.join(self.spill_dir, '{:s}_{:05d}.npz'.format(self.name, len(self._block_files)))
+        jutil.create_dir(fp)
+
+        # object arrays are pickled, so that values read back have the same types as in memory
+        arrays = {col: self._data[col][:self._n] for col in self.columns}
+        np.savez(fp, **arrays)
+
+        self._block_files.append(fp)
+        self._n_spilled += self._n
+        self._n = 0
+
+    # -----------------------------------------------------------------------------------
+    # Read
+    def _iter_blocks(self):
+        """Yield dict of raw column arrays: spilled blocks first, then rows in memory."""
+        for fp in self._block_files:
+            with np.load(fp, allow_pickle=True) as npz:
+                block = {col: npz[col] for col in self.columns}
+            yield block
+        yield {col: arr[:self._n] for col, arr in self._data.items()}
+
+    def _decode(self, col, codes):
+        if col not in self._categories:
+            return codes
+        values = np.empty(len(self._categories[col][0]), dtype=object)
+        values[:] = self._categories[col][0]
+        return values[codes]
+
+    def column(self, col):
+        """
+        Values of one column of all records.
+
+        Parameters
+        ----------
+        col : str
+
+        Returns
+        -------
+        np.ndarray
+            A new array, changing it does not affect the ledger.
+
+        """
+        if not self._block_files:
+            return self._decode(col, self._data[col][:self._n].copy())
+        arr = np.concatenate([block[col] for block in self._iter_blocks()])
+        return self._decode(col, arr)
+
+    def get_row(self, i):
+        """
+        Return values of the i-th record as a tuple in the order of self.columns.
+
+        """
+        n = len(self)
+        if i < 0:
+            i += n
+        if i < 0 or i >= n:
+            raise IndexError("ledger index out of range")
+
+        if i >= self._n_spilled:
+            block, j = self._data, i - self._n_spilled
+        else:
+            start = 0
+            for block in self._iter_blocks():
+                size = len(block[self.columns[0]])
+                if i < start + size:
+                    break
+                start += size
+            j = i - start
+        return tuple(self._decode_value(col, block[col][j]) for col in self.columns)
+
+    def _decode_value(self, col, value):
+        if col in self._categories:
+            return self._categories[col][0][value]
+        return value.item() if isinstance(value, np.generic) else value
+
+    def iter_rows(self):
+        """Yield values of each record as a tuple."""
+        for block in self._iter_blocks():
+            block = [block[col] for col in self.columns]
+            for j in range(len(block[0])):
+                yield tuple(self._decode_value(col, arr[j]) for col, arr in zip(self.columns, block))
+
+    def to_dict(self):
+        """
+        Returns
+        -------
+        dict
+            {column: np.ndarray}
+
+        """
+        if not self._block_files:
+            return {col: self.column(col) for col in self.columns}
+        blocks = list(self._iter_blocks())
+        return {col: self._decode(col, np.concatenate([block[col] for block in blocks]))
+                for col in self.columns}
+
+    def to_dataframe(self):
+        """
+        Returns
+        -------
+        pd.DataFrame
+            Each row is a record, columns are the same as self.columns.
+
+        """
+        df = pd.DataFrame(self.to_dict(), columns=self.columns)
+        df.index.name = 'index'
+        return df
+
+    def save(self, fp):
+        """
+        Export all records to a single file. Format is decided by file extension:
+        .csv, .npz, .parquet (needs pyarrow or fastparquet) or .hd5/.h5 (needs PyTables).
+        Object columns of .npz are pickled to keep the types of values, load it with allow_pickle=True.
+
+        Parameters
+        ----------
+        fp : str
+
+        """
+        fp = os.path.abspath(fp)
+        jutil.create_dir(fp)
+        ext = os.path.splitext(fp)[1].lower()
+        if ext == '.npz':
+            np.savez(fp, **self.to_dict())
+        elif ext == '.csv':
+            self.to_dataframe().to_csv(fp)
+        elif ext == '.parquet':
+            self.to_dataframe().to_parquet(fp)
+        elif ext in ('.hd5', '.h5'):
+            self.to_dataframe().to_hdf(fp, key=self.name)
+        else:
+            raise ValueError("Unsupported file type: {}".format(ext))
+
+
+class TradeLedger(ColumnarLedger):
+    """
+    Ledger of trades. It works as a read-only list of jaqs.data.basic.Trade objects:
+    len, iteration and indexing are supported, Trade objects are created from the stored
+    columns when accessed.
+
+    """
+    DTYPES = [('task_id', object),
+              ('entrust_no', object),
+              ('entrust_action', CATEGORY),
+              ('symbol', CATEGORY),
+              ('fill_price', np.float64),
+              ('fill_size', np.float64),
+              ('fill_date', np.int64),
+              ('fill_time', np.int64),
+              ('fill_no', object),
+              ('commission', np.float64),
+              ('trade_date', np.int64)]
+
+    def __init__(self, capacity=1024, spill_dir=None, chunk_size=100000):
+        super(TradeLedger, self).__init__(self.DTYPES, capacity=capacity,
+                                          spill_dir=spill_dir, chunk_size=chunk_size, name='trades')
+
+    def append(self, trade):
+        """
+        Parameters
+        ----------
+        trade : Trade
+
+        """
+        self.append_row((trade.task_id, trade.entrust_no, trade.entrust_action, trade.symbol,
+                         trade.fill_price, trade.fill_size, trade.fill_date, trade.fill_time, trade.fill_no,
+                         trade.commission, getattr(trade, 'trade_date', 0)))
+
+    def _make_trade(self, row):
+        trade = Trade()
+        for col, value in zip(self.columns, row):
+            setattr(trade, col, value)
+        return trade
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._make_trade(self.get_row(i))
+
+    def __iter__(self):
+        for row in self.iter_rows():
+            yield self._make_trade(row)
+
+
+class PositionLedger(ColumnarLedger):
+    """
+    Ledger of end-of-day positions, one record per (trade_date, symbol) with non-zero position.
+
+    """
+    DTYPES = [('trade_date', np.int64),
+              ('symbol', CATEGORY),
+              ('current_size', np.float64)]
+
+    def __init__(self, capacity=1024, spill_dir=None, chunk_size=100000):
+        super(PositionLedger, self).__init__(self.DTYPES, capacity=capacity,
+                                             spill_dir=spill_dir, chunk_size=chunk_size, name='positions')
+        self.dates = []
+        self.last_date = 0
+        self._last_start = 0
+
+    def record(self, trade_date, symbols, sizes):
+        """
+        Record positions at the end of a trade date. Recording the same date again
+        replaces the records of that date, unless they are already spilled to disk.
+
+        Parameters
+        ----------
+        trade_date : int
+        symbols : np.ndarray
+        sizes : np.ndarray
+            Current sizes of symbols.
+
+        """
+        if trade_date == self.last_date:
+            if self._last_start < self._n_spilled:
+                return
+            self.truncate(self._last_start)
+        else:
+            self.dates.append(trade_date)
+        self.last_date = trade_date
+        self._last_start = len(self)
+        if len(symbols) > 0:
+            self.append_columns((trade_date, symbols, sizes))
+
+    def to_matrix(self):
+        """
+        Returns
+        -------
+        pd.DataFrame
+            Index is trade_date of all recorded dates, columns are symbols, values are current_size.
+            Symbols not held on a date have size 0.
+
+        """
+        df = self.to_dataframe()
+        df_mat = df.pivot(index='trade_date', columns='symbol', values='current_size')
+        df_mat = df_mat.reindex(self.dates).fillna(0.0)
+        df_mat.index.name = 'trade_date'
+        df_mat.columns.name = 'symbol'
+        return df_mat
+
+
+class ArchiveDict(MutableMapping):
+    """
+    A dict whose finished entries can be archived to an append-only log file.
+    
+    Archived entries are removed from memory, only their offsets in the log are kept.
+    They are still returned by lookup and iteration, which read them back from the log.
+    Objects read from the archive are copies: to change an archived entry, assign it again,
+    which moves it back to memory.
+
+    Attributes
+    ----------
+    fp : str or None
+        Path of the log file. None means an anonymous temporary file.
+    n_archived : int
+
+    """
+    def __init__(self, fp=None):
+        self.fp = None if fp is None else os.path.abspath(fp)
+        
+        self._hot = dict()
+        self._offsets = dict()
+        self._finished_day = dict()
+        self._day = 0
+        self._file = None
+
+    @property
+    def n_archived(self):
+        return len(self._offsets)
+
+    def _get_file(self):
+        if self._file is None:
+            if self.fp is None:
+                self._file = tempfile.TemporaryFile()
+            else:
+                jutil.create_dir(self.fp)
+                self._file = open(self.fp, 'w+b')
+        return self._file
+
+    def __getitem__(self, key):
+        try:
+            return self._hot[key]
+        except KeyError:
+            offset = self._offsets[key]
+        f = self._get_file()
+        f.seek(offset)
+        return pickle.load(f)
+
+    def __setitem__(self, key, value):
+        self._offsets.pop(key, None)
+        self._hot[key] = value
+
+    def __delitem__(self, key):
+        if key in self._hot:
+            del self._hot[key]
+            self._finished_day.pop(key, None)
+        else:
+            del self._offsets[key]
+
+    def __contains__(self, key):
+        return key in self._hot or key in self._offsets
+
+    def __iter__(self):
+        for key in list(self._hot.keys()):
+            yield key
+        for key in list(self._offsets.keys()):
+            yield key
+
+    def __len__(self):
+        return len(self._hot) + len(self._offsets)
+
+    def archive(self, key):
+        """Move one entry from memory to the log."""
+        value = self._hot.pop(key)
+        self._finished_day.pop(key, None)
+        f = self._get_file()
+        f.seek(0, os.SEEK_END)
+        self._offsets[key] = f.tell()
+        pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+
+    def retire(self, is_finished, max_age):
+        """
+        Archive entries finished for more than max_age days. Should be called once a day.
+
+        Parameters
+        ----------
+        is_finished : callable
+            is_finished(key, value) returns whether the entry will no longer change.
+        max_age : int
+            Number of days a finished entry is kept in memory. 0 means archived at the end of the day it finished.
+
+        Returns
+        -------
+        int
+            Number of entries archived.
+
+        """
+        self._day += 1
+        for key, value in self._hot.items():
+            if key not in self._finished_day and is_finished(key, value):
+                self._finished_day[key] = self._day
+        
+        keys = [key for key, day in self._finished_day.items() if self._day - day >= max_age]
+        for key in keys:
+            self.archive(key)
+        if keys:
+            self._get_file().flush()
+        return len(keys)
@@ -2,13 +2,15 @@
 
 from __future__ import absolute_import, print_function, unicode_literals, division
 import datetime
+from threading import RLock
 
 import numpy as np
 import pandas as pd
 
-from jaqs.trade.event import EventEngine, Event, EVENT_TYPE
+from jaqs.trade.event import EventEngine, PartitionedEventEngine, Event, EVENT_TYPE
 from jaqs.data.basic import Quote
 import jaqs.util as jutil
+from jaqs.util.profile import latency_monitor
 from functools import reduce
 
 
@@ -247,6 +249,12 @@ class EventLiveTradeInstance(EventEngine):
     ----------
     start_date : int
     end_date : int
+    event_engine : PartitionedEventEngine or None
+        If not None, events are put into and dispatched by it instead of the single thread
+        EventEngine this instance derives from. Set by init_from_config according to props.
+    lock : threading.RLock
+        Held by callbacks of trades, orders and tasks, which update pm. With event_engine,
+        market data handlers hold it as well unless the strategy is lane_safe.
     
     """
     def __init__(self):
@@ -258,6 +266,9 @@ class EventLiveTradeInstance(EventEngine):
         self.props = None
         
         self.ctx = None
+        self.event_engine = None
+        self.lock = RLock()
+        self._lock_market_data = False
     
     def init_from_config(self, props):
         """
@@ -275,6 +286,16 @@ class EventLiveTradeInstance(EventEngine):
         self.props = props
         self.start_date = props.get("start_date")
         self.end_date = props.get("end_date")
+        latency_monitor.log_interval = props.get("latency_log_interval", latency_monitor.log_interval)
+        latency_monitor.sample_interval = props.get("latency_sample_interval", latency_monitor.sample_interval)
+        
+        engine_type = props.get("event_engine", "single")
+        if engine_type == "partitioned":
+            self.event_engine = PartitionedEventEngine(n_workers=props.get("n_event_workers", 4))
+        elif engine_type == "single":
+            self.event_engine = None
+        else:
+            raise ValueError("event_engine must be 'single' or 'partitioned', got {}".format(engine_type))
 
         for obj in ['data_api', 'trade_api', 'pm', 'strategy']:
             if hasattr(self.ctx, obj):
@@ -283,17 +304,54 @@ class EventLiveTradeInstance(EventEngine):
     def register_context(self, context=None):
         self.ctx = context
 
+    # -------------------------------------------------------------------------------------------
+    # Event engine
+    def put(self, event):
+        if self.event_engine is None:
+            super(EventLiveTradeInstance, self).put(event)
+        else:
+            self.event_engine.put(event)
+    
+    def register(self, type_, handler):
+        if self.event_engine is None:
+            super(EventLiveTradeInstance, self).register(type_, handler)
+        else:
+            self.event_engine.register(type_, handler)
+    
+    def unregister(self, type_, handler):
+        if self.event_engine is None:
+            super(EventLiveTradeInstance, self).unregister(type_, handler)
+        else:
+            self.event_engine.unregister(type_, handler)
+    
+    def start(self, timer=True):
+        if self.event_engine is None:
+            super(EventLiveTradeInstance, self).start(timer=timer)
+        else:
+            self.event_engine.start(timer=timer)
+    
+    def stop(self):
+        if self.event_engine is None:
+            super(EventLiveTradeInstance, self).stop()
+        else:
+            self.event_engine.stop()
+
     # -------------------------------------------------------------------------------------------
     # Run
     def run(self):
         """
-        Listen to certain events and run the EventEngine.
+        Listen to certain events and run the EventEngine, or event_engine if it is set.
+        With PartitionedEventEngine, market data of different symbols are processed concurrently,
+        trade and order indications are processed in a priority lane.
         Events include:
             1. market_data are from DataService
             2. trades & orders indications are from TradeApi.
             3. etc.
 
         """
+        # handlers of different lanes run concurrently, serialize them unless the strategy declares it is safe
+        self._lock_market_data = (self.event_engine is not None
+                                  and not getattr(self.ctx.strategy, 'lane_safe', False))
 
         self.register(EVENT_TYPE.MARKET_DATA, self.on_bar)
         
@@ -308,27 +366,36 @@ class EventLiveTradeInstance(EventEngine):
     def on_bar(self, event):
         quote_dic = event.dic['quote']
         quote = Quote.create_from_dict(quote_dic)
-        self.ctx.strategy.on_tick(quote)
+        if self._lock_market_data:
+            with self.lock:
+                self.ctx.strategy.on_tick(quote)
+        else:
+            self.ctx.strategy.on_tick(quote)
     
     def on_order_rsp(self, event):
         rsp = event.dic['rsp']
-        self.ctx.strategy.on_order_rsp(rsp)
+        with self.lock:
+            self.ctx.strategy.on_order_rsp(rsp)
 
     def on_task_rsp(self, event):
         rsp = event.dic['rsp']
-        self.ctx.strategy.on_task_rsp(rsp)
+        with self.lock:
+            self.ctx.strategy.on_task_rsp(rsp)
     
     def on_trade(self, event):
         ind = event.dic['ind']
-        self.ctx.strategy.on_trade(ind)
+        with self.lock:
+            self.ctx.strategy.on_trade(ind)
 
     def on_order_status(self, event):
         ind = event.dic['ind']
-        self.ctx.strategy.on_order_status(ind)
+        with self.lock:
+            self.ctx.strategy.on_order_status(ind)
 
     def on_task_status(self, event):
         ind = event.dic['ind']
-        self.ctx.strategy.on_task_status(ind)
+        with self.lock:
+            self.ctx.strategy.on_task_status(ind)
     
     # ---------------------------------------------------------
     # Save Results
@@ -349,10 +416,9 @@ class EventLiveTradeInstance(EventEngine):
                     'fill_time': np.integer,
                     'fill_no': str,
                     'commission': float}
-        # keys = trades[0].__dict__.keys()
         ser_list = dict()
         for key in type_map.keys():
-            v = [t.__getattribute__(key) for t in trades]
+            v = trades.column(key)
             ser = pd.Series(data=v, index=None, dtype=type_map[key], name=key)
             ser_list[key] = ser
         df_trades = pd.DataFrame(ser_list)
@@ -10,6 +10,7 @@ from collections import defaultdict
 import numpy as np
 import pandas as pd
 import jaqs.util as jutil
+from jaqs.trade.optimizer import FactorCovariance
 
 
 class RegisteredFunction(object):
@@ -21,6 +22,74 @@ class RegisteredFunction(object):
         self.options = options
 
 
+class ModelCache(object):
+    """
+    Cache of model outputs during one re-balance.
+    
+    Entries are keyed by (owner, name, date, hash of universe). All entries are dropped when
+    a different date is queried or clear() is called, while hit/miss statistics are kept.
+    
+    Attributes
+    ----------
+    hits : dict of {str: int}
+    misses : dict of {str: int}
+    
+    """
+    def __init__(self):
+        self.date = None
+        self.data = dict()
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+    
+    @staticmethod
+    def hash_universe(symbols):
+        return hash(tuple(symbols))
+    
+    def clear(self):
+        self.data.clear()
+    
+    def get(self, owner, name, date, symbols, func):
+        """
+        Return cached output of owner.name for date and symbols, call func() to get it if not cached.
+        
+        Parameters
+        ----------
+        owner : object
+            The model.
+        name : str
+        date : int
+        symbols : list of str
+        func : callable
+
+        """
+        if date != self.date:
+            self.clear()
+            self.date = date
+        
+        key = (id(owner), name, date, self.hash_universe(symbols))
+        if key in self.data:
+            self.hits[name] += 1
+            return self.data[key]
+        
+        self.misses[name] += 1
+        res = func()
+        self.data[key] = res
+        return res
+    
+    def get_stats(self):
+        """
+        Returns
+        -------
+        res : pd.DataFrame
+            Index is name, columns are ['hits', 'misses'].
+
+        """
+        names = sorted(set(self.hits) | set(self.misses))
+        return pd.DataFrame({'hits': [self.hits[n] for n in names],
+                             'misses': [self.misses[n] for n in names]},
+                            index=names, columns=['hits', 'misses'])
+
+
 class Context(object):
     """
     Used to store relevant context of the strategy.
@@ -38,6 +107,8 @@ class Context(object):
         A certain calendar that the strategy refers to.
     snapshot : pd.DataFrame
         Current snapshot of data.
+    cache : ModelCache
+        Outputs of models during current re-balance.
 
     Methods
     -------
@@ -69,6 +140,7 @@ class Context(object):
         
         self.storage = dict()
         self.records = defaultdict(list)
+        self.cache = ModelCache()
         
         for member, obj in self.__dict__.items():
             if hasattr(obj, 'ctx'):
@@ -210,6 +282,13 @@ class FuncRegisterable(object):
     
     def register_context(self, context):
         self.ctx = context
+    
+    def _cached(self, name, symbols, func):
+        """Get output of func for current date and symbols from context cache, if there is one."""
+        cache = getattr(self.ctx, 'cache', None)
+        if cache is None:
+            return func()
+        return cache.get(self, name, self.ctx.trade_date, symbols, func)
     '''
     def activate_func(self, f_dict):
         """
@@ -230,30 +309,100 @@ class FuncRegisterable(object):
 
 
 class StockSelector(FuncRegisterable):
+    """
+    Select stocks with filters. A stock is selected only if it passes all filters.
+    
+    Filters declared as DataView fields or formulas (add_filter_field, add_filter_formula)
+    are evaluated for all dates in one pass into a (date x symbol) selection matrix,
+    and each re-balance reads one row of it. Python functions (add_filter) are called
+    on each re-balance.
+    
+    Attributes
+    ----------
+    filter_fields : dict of {str: str}
+        {filter name: DataView field}
+    selection_matrix : pd.DataFrame or None
+        Index is date, columns are symbols, values are bool. Combination of all field and formula filters.
+    
+    """
     def __init__(self, context=None):
         super(StockSelector, self).__init__(context=context)
-        pass
+        
+        self.filter_fields = dict()
+        self._filter_formulas = dict()
+        self.selection_matrix = None
 
     def add_filter(self, name, func, options=None):
         self._register_func(name, func, options)
+    
+    def add_filter_field(self, name, field):
+        """
+        Parameters
+        ----------
+        name : str
+        field : str
+            Field of DataView. Non-zero values mean selected; NaN means not selected.
+
+        """
+        self.filter_fields[name] = field
+        self.selection_matrix = None
+    
+    def add_filter_formula(self, name, formula, is_quarterly=False):
+        """
+        Parameters
+        ----------
+        name : str
+        formula : str
+            Formula of DataView, e.g. '(pe_ttm > 0) && (pe_ttm < 30)'.
+            It is added to DataView as field '_selector_' + name when the selection matrix is built.
+        is_quarterly : bool
 
+        """
+        self._filter_formulas[name] = (formula, is_quarterly)
+        self.filter_fields[name] = '_selector_' + name
+        self.selection_matrix = None
+    
+    def prepare_selection(self):
+        """Evaluate field and formula filters of all dates of DataView into selection_matrix."""
+        dv = self.ctx.dataview
+        for name, (formula, is_quarterly) in self._filter_formulas.items():
+            dv.add_formula(self.filter_fields[name], formula, is_quarterly=is_quarterly)
+        
+        dates = dv.dates
+        mask = None
+        for field in self.filter_fields.values():
+            df = dv.get_ts(field, start_date=dates[0], end_date=dates[-1])
+            df = df.fillna(0.0).astype(bool)
+            mask = df if mask is None else mask & df
+        self.selection_matrix = mask
+    
     def get_selection(self):
         """
-        Return a list of stocks that are not selected.
+        Return a list of stocks that are selected.
         
         Returns
         -------
         selected : list
 
         """
-        mask_selected = dict()
+        return list(self._cached('selection', self.ctx.universe, self._get_selection))
+    
+    def _get_selection(self):
+        masks = []
+        if self.filter_fields:
+            if self.selection_matrix is None:
+                self.prepare_selection()
+            row = self.selection_matrix.reindex([self.ctx.trade_date]).fillna(False).astype(bool)
+            masks.append(row.T)
+        
+        # slow path: user functions
         for factor in self.active_funcs:
             rf = self.func_table[factor]
             res = rf.func(context=self.ctx, user_options=rf.options)
             res = convert_to_df(res)
-            mask_selected[factor] = res
+            masks.append(res)
         
-        merge = pd.concat(mask_selected.values(), axis=1).astype(float).astype(bool).fillna(False)
+        merge = pd.concat(masks, axis=1).astype(float).astype(bool).fillna(False)
         symbol_arr = merge.index.values
         mask_arr = np.all(merge.values, axis=1)
         selected = symbol_arr[mask_arr].tolist()
@@ -365,11 +514,18 @@ class FactorSignalModel(BaseSignalModel):
     
     output: dict
     
+    Attributes
+    ----------
+    forecast_weights : pd.DataFrame or None
+        Weights of signals on each date, e.g. ICSignalCombiner.weights. Index is date,
+        columns are signal names. If None, signals are summed up with equal weights.
+    
     """
-    def __init__(self, context=None):
+    def __init__(self, context=None, forecast_weights=None):
         super(FactorSignalModel, self).__init__(context=context)
     
         self.total_forecast = None
+        self.forecast_weights = forecast_weights
 
     @staticmethod
     def order2z(order_arr):
@@ -380,21 +536,27 @@ class FactorSignalModel(BaseSignalModel):
 
     def combine_using_corr(self, forecasts):
         """
-        Combine forecasts into one single forecast.
+        Combine forecasts into one single forecast, weighted by forecast_weights of current date.
+        If there are no weights for current date (e.g. during warm-up), forecasts are summed up.
         
         Parameters
         ----------
         forecasts : dict
+            {str: pd.DataFrame}
+            DataFrame index is symbol, column is field.
 
         Returns
         -------
-        res : float
+        res : dict
 
         """
-        n = len(forecasts)
-        forecast_corr = np.random.randn(n, n)
-        forecasts_arr = np.asarray(list(forecasts.values()), dtype=float).reshape(-1, 1)
-        return np.dot(forecast_corr, forecasts_arr).sum()
+        weights = self.forecast_weights.reindex(index=[self.ctx.trade_date], columns=list(forecasts.keys())).iloc[0]
+        if weights.isnull().all():
+            return self.combine_sum(forecasts)
+        weights = weights.fillna(0.0)
+        merge = pd.concat(forecasts.values(), axis=1)
+        res = merge.values.dot(weights.values)
+        return dict(zip(merge.index, res))
 
     def get_forecasts(self):
         """
@@ -406,6 +568,9 @@ class FactorSignalModel(BaseSignalModel):
             DataFrame index is symbol, column is field.
 
         """
+        return self._cached('forecasts', self.ctx.universe, self._get_forecasts)
+    
+    def _get_forecasts(self):
         forecasts = dict()
         for factor in self.active_funcs:
             rf = self.func_table[factor]
@@ -446,7 +611,10 @@ class FactorSignalModel(BaseSignalModel):
         forecasts = self.get_forecasts()  # {str: pd.DataFrame}
         # TODO NaN
         forecasts = {key: value.fillna(0) for key, value in forecasts.items()}
-        forecast = self.combine_sum(forecasts)
+        if self.forecast_weights is not None:
+            forecast = self.combine_using_corr(forecasts)
+        else:
+            forecast = self.combine_sum(forecasts)
         return forecast
         
     def forecast_signal(self, weights):
@@ -462,11 +630,10 @@ class FactorSignalModel(BaseSignalModel):
         res : float
 
         """
-        total_signal = 0.0
-        forecast_dic = self.make_forecast()
-        
-        weighted_signal = {key: value * forecast_dic[key] for key, value in weights.items()}
-        total_signal = np.sum(list(weighted_signal.values()))
+        forecast = pd.Series(self.make_forecast())
+        symbols = list(weights.keys())
+        weights_arr = np.fromiter(weights.values(), dtype=float, count=len(symbols))
+        total_signal = np.sum(weights_arr * forecast.loc[symbols].values)
         
         return total_signal
 
@@ -615,6 +782,127 @@ class SimpleCostModel(BaseCostModel):
         return total_cost
 
 
+class TradeCostModel(BaseCostModel):
+    """
+    Transaction cost of trades, calculated on arrays of trades in one call.
+    
+    For a trade of size shares (positive for buy, negative for sell) at price:
+        commission = commission_rate * turnover
+        stamp_tax  = stamp_tax_rate * turnover (sell side only)
+        slippage   = slippage_rate * turnover
+        impact     = impact_coef * volatility * sqrt(|size| / adv) * turnover (square-root law)
+    where turnover = |price * size|.
+    
+    The same model is used by the backtest gateway to charge filled trades and by AlphaStrategy
+    to estimate cost of a re-balance, so that both price trades the same way.
+    
+    Attributes
+    ----------
+    commission_rate : float
+    stamp_tax_rate : float
+    slippage_rate : float
+    impact_coef : float
+    adv_field : str
+        Field in context snapshot used as average daily volume (shares) if adv is not given.
+    volatility_field : str
+        Field in context snapshot used as daily volatility if volatility is not given.
+    
+    """
+    COST_NAMES = ['commission', 'stamp_tax', 'slippage', 'impact']
+    
+    def __init__(self, context=None, commission_rate=0.0, stamp_tax_rate=0.0, slippage_rate=0.0,
+                 impact_coef=0.0, adv_field="", volatility_field=""):
+        super(TradeCostModel, self).__init__(context=context)
+        
+        self.commission_rate = commission_rate
+        self.stamp_tax_rate = stamp_tax_rate
+        self.slippage_rate = slippage_rate
+        self.impact_coef = impact_coef
+        self.adv_field = adv_field
+        self.volatility_field = volatility_field
+    
+    def _get_snapshot_field(self, field, symbol):
+        snapshot = getattr(self.ctx, 'snapshot', None) if self.ctx is not None else None
+        if not field or snapshot is None or field not in snapshot.columns:
+            return np.full(len(symbol), np.nan)
+        return self._cached('snapshot_' + field, symbol,
+                            lambda: snapshot[field].reindex(symbol).values.astype(float))
+    
+    def calc_trade_cost(self, symbol, price, size, adv=None, volatility=None):
+        """
+        Calculate cost of each trade.
+        
+        Parameters
+        ----------
+        symbol : array-like of str
+        price : array-like of float
+        size : array-like of float
+            Positive for buy, negative for sell.
+        adv : array-like of float, optional
+            Average daily volume. Fetched from context snapshot (adv_field) if None.
+        volatility : array-like of float, optional
+            Daily volatility of return. Fetched from context snapshot (volatility_field) if None.
+
+        Returns
+        -------
+        res : dict of {str: np.ndarray}
+            Keys are COST_NAMES and 'total'. Impact is 0 where adv or volatility is not available.
+
+        """
+        symbol = np.asarray(symbol)
+        price = np.asarray(price, dtype=float)
+        size = np.asarray(size, dtype=float)
+        turnover = np.abs(price * size)
+        
+        res = dict()
+        res['commission'] = self.commission_rate * turnover
+        res['stamp_tax'] = np.where(size < 0, self.stamp_tax_rate * turnover, 0.0)
+        res['slippage'] = self.slippage_rate * turnover
+        
+        if self.impact_coef:
+            if adv is None:
+                adv = self._get_snapshot_field(self.adv_field, symbol)
+            if volatility is None:
+                volatility = self._get_snapshot_field(self.volatility_field, symbol)
+            adv = np.asarray(adv, dtype=float)
+            volatility = np.asarray(volatility, dtype=float)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                impact = self.impact_coef * volatility * np.sqrt(np.abs(size) / adv) * turnover
+            res['impact'] = np.where(np.isfinite(impact), impact, 0.0)
+        else:
+            res['impact'] = np.zeros(len(size))
+        
+        res['total'] = res['commission'] + res['stamp_tax'] + res['slippage'] + res['impact']
+        return res
+    
+    def calc_cost(self, weights_last, weights_now):
+        """
+        Calculate transaction cost from current position to target position.
+        
+        Both positions are market values (not shares), which are converted to shares at close
+        price of context snapshot. A symbol missing from one of them has market value 0 there.
+        
+        Parameters
+        ----------
+        weights_last : dict
+            Current positions, {symbol: market value}.
+        weights_now : dict
+            Target positions, {symbol: market value}.
+
+        Returns
+        -------
+        total_cost : float
+
+        """
+        symbol = list(weights_now.keys())
+        symbol.extend(s for s in weights_last if s not in weights_now)
+        value_diff = np.array([weights_now.get(s, 0.0) - weights_last.get(s, 0.0) for s in symbol], dtype=float)
+        price = self._get_snapshot_field('close', symbol)
+        price = np.where(np.isnan(price), 1.0, price)
+        res = self.calc_trade_cost(symbol, price, value_diff / price)
+        return res['total'].sum()
+
+
 class BaseRiskModel(FuncRegisterable):
     def __init__(self, context=None):
         super(BaseRiskModel, self).__init__(context=context)
@@ -623,53 +911,291 @@ class BaseRiskModel(FuncRegisterable):
     def consider_risk(self, name, func, options=None):
         self._register_func(name, func, options=options)
 
+    def calc_covariance(self, symbols):
+        """
+        Covariance matrix of returns of symbols, used by portfolio optimisation.
+
+        Parameters
+        ----------
+        symbols : list of str
+
+        Returns
+        -------
+        cov : np.ndarray or optimizer.FactorCovariance or None
+            None means risk is not estimated by this model.
+
+        """
+        return None
+
 
 class FactorRiskModel(BaseRiskModel):
-    def __init__(self, context=None):
+    """
+    Structured risk model: r = X f + e, so that Cov(r) = X F X' + diag(d).
+    
+    On each date, returns are regressed cross-sectionally on exposures of the previous date:
+    z-scored style fields and industry dummies (or a market factor if there is no industry).
+    Factor covariance F is the exponentially weighted covariance of factor returns, with
+    optional Newey-West adjustment and shrinkage towards its diagonal. Specific variance d
+    is the exponentially weighted mean of squared residuals.
+    
+    Estimates are updated incrementally: each call only processes dates after the last
+    processed date, up to ctx.trade_date.
+    
+    Attributes
+    ----------
+    style_fields : list of str
+        Fields of DataView used as style factors.
+    industry_field : str
+        Field of DataView containing industry labels.
+    return_field : str
+        Field of DataView of adjusted prices, used to calculate daily returns.
+    halflife : float
+        Half life (days) of weights of factor covariance.
+    specific_halflife : float
+        Half life (days) of weights of specific variance. Default the same as halflife.
+    newey_west_lags : int
+        Number of lags of Newey-West adjustment. 0 means no adjustment.
+    shrinkage : float
+        Intensity in [0, 1] of shrinkage of factor covariance towards its diagonal.
+    min_periods : int
+        Minimum number of dates before covariance is available.
+    
+    """
+    def __init__(self, context=None, style_fields=None, industry_field="", return_field='close_adj',
+                 halflife=90, specific_halflife=None, newey_west_lags=0, shrinkage=0.0, min_periods=20):
         super(FactorRiskModel, self).__init__(context=context)
         
         self.benchmark = ""
+        
+        self.style_fields = list(style_fields) if style_fields else []
+        self.industry_field = industry_field
+        self.return_field = return_field
+        self.halflife = halflife
+        self.specific_halflife = specific_halflife if specific_halflife else halflife
+        self.newey_west_lags = newey_west_lags
+        self.shrinkage = shrinkage
+        self.min_periods = min_periods
+        
+        self.factor_names = []
+        self.symbols = []
+        self.last_date = 0
+        self.n_periods = 0
+        self._industries = None
+        self._last_exposure = None
+        self._last_price = None
+        # exponentially weighted sums of factor return products (lag 0..L), residual squares and weights
+        self._factor_sums = None
+        self._factor_weight = 0.0
+        self._factor_lags = []
+        self._specific_sum = None
+        self._specific_weight = None
+        self._cov = None
     
     def set_benchmark(self, benchmark):
         self.benchmark = benchmark
     
+    def _init_state(self, dv):
+        self.symbols = list(dv.symbol)
+        if self.industry_field:
+            labels = dv.get_ts(self.industry_field, start_date=dv.dates[0], end_date=dv.dates[-1]).values.ravel()
+            labels = pd.Series(labels).dropna()
+            self._industries = np.unique(labels.astype(str).values)
+            industry_names = ['industry_' + ind for ind in self._industries]
+        else:
+            industry_names = ['market']
+        self.factor_names = self.style_fields + industry_names
+        
+        k, n = len(self.factor_names), len(self.symbols)
+        self._factor_sums = np.zeros((self.newey_west_lags + 1, k, k))
+        self._specific_sum = np.zeros(n)
+        self._specific_weight = np.zeros(n)
+    
+    def _calc_exposure(self, style, industry):
+        """
+        Parameters
+        ----------
+        style : np.ndarray
+            Shape (n_style, n_symbols).
+        industry : np.ndarray or None
+            Industry labels, shape (n_symbols,).
+
+        Returns
+        -------
+        exposure : np.ndarray
+            Shape (n_symbols, n_factors). NaN where style values are missing.
+
+        """
+        n = len(self.symbols)
+        parts = []
+        if len(style):
+            mean = np.nanmean(style, axis=1, keepdims=True)
+            std = np.nanstd(style, axis=1, keepdims=True)
+            std[~(std > 0)] = 1.0
+            parts.append(((style - mean) / std).T)
+        if self._industries is not None:
+            labels = pd.Series(industry).astype(str).values
+            dummy = (labels[:, None] == self._industries[None, :]).astype(float)
+            dummy[pd.isnull(industry)] = np.nan
+            parts.append(dummy)
+        else:
+            parts.append(np.ones((n, 1)))
+        return np.hstack(parts)
+    
+    def _add_period(self, exposure, ret):
+        mask = np.isfinite(ret) & np.all(np.isfinite(exposure), axis=1)
+        if mask.sum() <= exposure.shape[1]:
+            return
+        X, r = exposure[mask], ret[mask]
+        f = np.linalg.lstsq(X, r, rcond=None)[0]
+        resid = r - X.dot(f)
+        
+        decay = 0.5 ** (1.0 / self.halflife)
+        self._factor_lags.insert(0, f)
+        del self._factor_lags[self.newey_west_lags + 1:]
+        self._factor_sums *= decay
+        for lag, f_lag in enumerate(self._factor_lags):
+            self._factor_sums[lag] += np.outer(f, f_lag)
+        self._factor_weight = self._factor_weight * decay + 1.0
+        
+        decay_s = 0.5 ** (1.0 / self.specific_halflife)
+        self._specific_sum *= decay_s
+        self._specific_weight *= decay_s
+        self._specific_sum[mask] += resid ** 2
+        self._specific_weight[mask] += 1.0
+        self.n_periods += 1
+    
+    def update(self, date):
+        """
+        Process all dates of DataView after the last processed date, up to date (included).
+        
+        Parameters
+        ----------
+        date : int
+
+        """
+        if date <= self.last_date:
+            return
+        dv = self.ctx.dataview
+        if self._factor_sums is None:
+            self._init_state(dv)
+        
+        dates = dv.dates
+        dates = dates[(dates > self.last_date) & (dates <= date)]
+        if not len(dates):
+            return
+        
+        start, end = dates[0], dates[-1]
+        price = dv.get_ts(self.return_field, start_date=start, end_date=end)[self.symbols].values.astype(float)
+        styles = [dv.get_ts(field, start_date=start, end_date=end)[self.symbols].values.astype(float)
+                  for field in self.style_fields]
+        if self.industry_field:
+            industry = dv.get_ts(self.industry_field, start_date=start, end_date=end)[self.symbols].values
+        
+        for i in range(len(dates)):
+            if self._last_price is not None:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    ret = price[i] / self._last_price - 1.0
+                self._add_period(self._last_exposure, ret)
+            self._last_price = price[i]
+            style = np.array([s[i] for s in styles]).reshape(len(styles), -1)
+            self._last_exposure = self._calc_exposure(style, industry[i] if self.industry_field else None)
+        
+        self.last_date = end
+        self._cov = None
+    
+    def get_factor_covariance(self):
+        """
+        Returns
+        -------
+        res : np.ndarray
+            Covariance of daily factor returns, shape (n_factors, n_factors).
+
+        """
+        weight = max(self._factor_weight, 1e-12)
+        cov = self._factor_sums[0] / weight
+        n_lags = len(self._factor_lags) - 1
+        for lag in range(1, min(self.newey_west_lags, n_lags) + 1):
+            gamma = self._factor_sums[lag] / weight
+            cov = cov + (1.0 - lag / (self.newey_west_lags + 1.0)) * (gamma + gamma.T)
+        if self.shrinkage:
+            cov = (1.0 - self.shrinkage) * cov + self.shrinkage * np.diag(np.diag(cov))
+        return cov
+    
+    def get_specific_variance(self):
+        """
+        Returns
+        -------
+        res : np.ndarray
+            Specific variance of daily returns of all symbols.
+            Median of other symbols is used for symbols without observation.
+
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            res = self._specific_sum / self._specific_weight
+        valid = np.isfinite(res)
+        res[~valid] = np.median(res[valid]) if valid.any() else 0.0
+        return res
+    
+    def calc_covariance(self, symbols):
+        """
+        Covariance of daily returns of symbols at ctx.trade_date.
+        
+        Parameters
+        ----------
+        symbols : list of str
+
+        Returns
+        -------
+        cov : FactorCovariance or None
+            None if there are less than min_periods dates.
+
+        """
+        return self._cached('covariance', symbols, lambda: self._calc_covariance(symbols))
+    
+    def _calc_covariance(self, symbols):
+        self.update(self.ctx.trade_date)
+        if self.n_periods < self.min_periods:
+            return None
+        if self._cov is None:
+            exposure = np.nan_to_num(self._last_exposure)
+            self._cov = FactorCovariance(exposure, self.get_factor_covariance(), self.get_specific_variance())
+        
+        idx = pd.Index(self.symbols).get_indexer(symbols)
+        if np.any(idx < 0):
+            raise ValueError("Symbols not in DataView: {}".format(np.asarray(symbols)[idx < 0]))
+        return FactorCovariance(self._cov.exposure[idx], self._cov.factor_cov, self._cov.specific_var[idx])
+    
     def calc_risk(self, weights):
         """
-        Calculate total risk of portfolio.
+        Calculate total risk (variance of daily return) of portfolio.
         
         Parameters
         ----------
         weights : dict
-            {int: str}
+            {str: float}
 
         Returns
         -------
         total_risk : float
 
         """
-        idiosyncratic_risk = self.calc_idiosyncratic_risk(weights)
-        n = len(weights)
-        corr_mat = np.random.randn(n, n)
-        weights_arr = np.asarray(list(weights.values()), dtype=float)
-        factor_risk = weights_arr.dot(corr_mat).dot(weights_arr)
-        total_risk = factor_risk + idiosyncratic_risk
-        return total_risk
-    
-    """
-    def calc_factor_risk(weight):
-        risk_factors = [10000.0, -20000.0]
-        risk_factor = 100000.0  # beta risk
-        return risk_factors, risk_factor
-    """
+        symbols = list(weights.keys())
+        cov = self.calc_covariance(symbols)
+        if cov is None:
+            return 0.0
+        weights_arr = np.asarray([weights[s] for s in symbols], dtype=float)
+        return weights_arr.dot(cov.dot(weights_arr))
     
     def _get_idiosyncratic_risk(self, sec):
-        return 0.0
+        if self._cov is None:
+            return 0.0
+        return self._cov.specific_var[self.symbols.index(sec)]
     
     def calc_idiosyncratic_risk(self, weights):
-        """Calculate weighted sum of idiosyncratic risks of all securities."""
+        """Calculate specific variance of portfolio."""
         res = 0.0
         for sec, w in weights.items():
-            res += w * self._get_idiosyncratic_risk(sec)
+            res += w * w * self._get_idiosyncratic_risk(sec)
         return res
 
 
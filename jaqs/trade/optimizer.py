@@ -0,0 +1,439 @@
+# encoding: utf-8
+"""
+Constrained mean-variance portfolio optimisation without external solvers.
+
+The problem solved by PortfolioOptimizer is
+
+    maximize    alpha' w - risk_aversion / 2 * w' S w - cost' |w - w0|
+    subject to  sum(w) = net_exposure,  min_weight <= w <= max_weight
+                sum(|w|) <= gross_limit                               (optional)
+                sum(|w - w0|) <= turnover_limit                       (optional)
+                |sum(w[g]) - sum(b[g])| <= industry_limit, each g     (optional)
+                sqrt((w - b)' S (w - b)) <= te_limit                  (optional)
+
+with over-relaxed consensus ADMM: the quadratic part is solved exactly (Cholesky for a dense
+covariance, Woodbury identity for a FactorCovariance), every other constraint is a set with a
+cheap exact projection. The penalty is adapted to balance primal and dual residuals.
+The tracking error constraint is handled by its Lagrange multiplier, which is found by bisection.
+
+The returned weights always satisfy the constraints up to tol: if ADMM stops before convergence,
+its iterate is moved into the intersection of the constraint sets by alternating projections.
+
+"""
+from __future__ import print_function, division
+
+import numpy as np
+from scipy import linalg
+
+
+class FactorCovariance(object):
+    """
+    Covariance matrix of a factor model: S = X F X' + diag(d).
+
+    Products and linear solves cost O(n * k), so it should be used for large universes.
+
+    Parameters
+    ----------
+    exposure : np.ndarray
+        Factor exposure X, shape (n, k).
+    factor_cov : np.ndarray
+        Factor covariance F, shape (k, k).
+    specific_var : np.ndarray
+        Specific (idiosyncratic) variance d, shape (n,).
+
+    """
+    def __init__(self, exposure, factor_cov, specific_var):
+        self.exposure = np.asarray(exposure, dtype=float)
+        self.factor_cov = np.asarray(factor_cov, dtype=float)
+        self.specific_var = np.asarray(specific_var, dtype=float)
+
+    @property
+    def shape(self):
+        n = len(self.specific_var)
+        return n, n
+
+    def dot(self, x):
+        return self.exposure.dot(self.factor_cov.dot(self.exposure.T.dot(x))) + self.specific_var * x
+
+    def diagonal(self):
+        return np.einsum('ij,jk,ik->i', self.exposure, self.factor_cov, self.exposure) + self.specific_var
+
+    def to_dense(self):
+        return self.exposure.dot(self.factor_cov).dot(self.exposure.T) + np.diag(self.specific_var)
+
+    def get_solver(self, scale, shift):
+        """Return function solving (scale * S + shift * I) x = r."""
+        X = self.exposure
+        d_inv = 1.0 / (scale * self.specific_var + shift)
+        G = scale * self.factor_cov
+        # (D + X G X')^-1 = D^-1 - D^-1 X G (I + X' D^-1 X G)^-1 X' D^-1
+        lu = linalg.lu_factor(np.eye(len(G)) + (X.T * d_inv).dot(X).dot(G))
+
+        def solve(r):
+            y = d_inv * r
+            return y - d_inv * X.dot(G.dot(linalg.lu_solve(lu, X.T.dot(y))))
+        return solve
+
+
+class _DenseCovariance(object):
+    def __init__(self, mat):
+        self.mat = np.asarray(mat, dtype=float)
+        self.shape = self.mat.shape
+
+    def dot(self, x):
+        return self.mat.dot(x)
+
+    def diagonal(self):
+        return np.diag(self.mat)
+
+    def get_solver(self, scale, shift):
+        cf = linalg.cho_factor(scale * self.mat + shift * np.eye(len(self.mat)))
+        return lambda r: linalg.cho_solve(cf, r)
+
+
+class _ZeroCovariance(object):
+    def __init__(self, n):
+        self.shape = (n, n)
+
+    def dot(self, x):
+        return np.zeros_like(x)
+
+    def diagonal(self):
+        return np.zeros(self.shape[0])
+
+    def get_solver(self, scale, shift):
+        return lambda r: r / shift
+
+
+# -------------------------------------------------------------------------------------------
+# Projections
+def project_box_sum(v, lower, upper, total):
+    """
+    Euclidean projection of v onto {w: lower <= w <= upper, sum(w) = total}.
+
+    The solution is clip(v - tau, lower, upper), where the scalar tau is found exactly
+    from the sorted break points of the piecewise linear sum.
+
+    """
+    if total is None:
+        return np.clip(v, lower, upper)
+    # g(tau) = sum(clip(v - tau, lower, upper)) is decreasing, with slope changes at v - upper and v - lower
+    points = np.concatenate([v - upper, v - lower])
+    dslope = np.concatenate([-np.ones(len(v)), np.ones(len(v))])
+    order = np.argsort(points, kind='mergesort')
+    points, dslope = points[order], dslope[order]
+    slope = np.cumsum(dslope)[:-1]
+    g = np.sum(upper) + np.concatenate([[0.0], np.cumsum(slope * np.diff(points))])
+    if total >= g[0]:
+        tau = points[0]
+    elif total <= g[-1]:
+        tau = points[-1]
+    else:
+        j = np.searchsorted(-g, -total)  # g[j - 1] > total >= g[j]
+        tau = points[j - 1] + (total - g[j - 1]) / slope[j - 1]
+    return np.clip(v - tau, lower, upper)
+
+
+def _l1_threshold(a, radius):
+    """theta >= 0 such that sum(max(a - theta, 0)) = radius, a >= 0 and sum(a) > radius."""
+    s = np.sort(a)[::-1]
+    cum = np.cumsum(s) - radius
+    idx = np.arange(1, len(s) + 1)
+    rho = np.nonzero(s * idx > cum)[0][-1]
+    return cum[rho] / (rho + 1.0)
+
+
+def prox_l1(v, center, threshold, radius):
+    """
+    Proximal operator of threshold' |w - center| restricted to the ball sum(|w - center|) <= radius.
+
+    Parameters
+    ----------
+    threshold : float or np.ndarray
+        Non-negative, per element.
+    radius : float or None
+        None means no ball constraint.
+
+    """
+    diff = v - center
+    a = np.maximum(np.abs(diff) - threshold, 0.0)
+    if radius is not None and a.sum() > radius:
+        a = np.maximum(a - _l1_threshold(a, radius), 0.0)
+    return center + np.sign(diff) * a
+
+
+def project_group_sum(v, groups, n_groups, lower, upper):
+    """
+    Projection onto {w: lower[g] <= sum(w[groups == g]) <= upper[g]} for disjoint groups.
+    Elements with group -1 are not constrained.
+
+    """
+    mask = groups >= 0
+    g = groups[mask]
+    s = np.bincount(g, weights=v[mask], minlength=n_groups)
+    cnt = np.bincount(g, minlength=n_groups)
+    excess = s - np.clip(s, lower, upper)
+    res = v.copy()
+    res[mask] -= (excess / np.maximum(cnt, 1))[g]
+    return res
+
+
+# -------------------------------------------------------------------------------------------
+class PortfolioOptimizer(object):
+    """
+    Mean-variance optimiser with position, turnover, industry and tracking error constraints.
+
+    Parameters
+    ----------
+    risk_aversion : float
+    long_only : bool
+    net_exposure : float or None
+        Sum of weights. None means not constrained.
+    max_weight : float or np.ndarray
+    min_weight : float or np.ndarray, optional
+        Default 0 if long_only else -max_weight.
+    gross_limit : float, optional
+        Limit of sum(|w|), for long-short portfolios.
+    turnover_limit : float, optional
+        Limit of sum(|w - w0|).
+    cost : float or np.ndarray
+        Linear transaction cost per unit of weight traded.
+    industry_limit : float, optional
+        Limit of absolute active exposure of each industry. 0 means industry neutral.
+    te_limit : float, optional
+        Limit of ex-ante tracking error against the benchmark, in units of sqrt(w' S w).
+    rho : float, optional
+        Initial ADMM penalty relative to the mean variance. Default 1.0.
+    relaxation : float, optional
+        Over-relaxation parameter of ADMM, in (0, 2). Default 1.6.
+    max_iter : int
+    tol : float
+        Tolerance of primal and dual residuals (max norm), and of constraint violations.
+
+    Attributes
+    ----------
+    info : dict
+        Diagnostics of the last run: n_iter, converged, rho, te, te_multiplier.
+
+    """
+    # residual balancing: every RHO_UPDATE_INTERVAL iterations, rho is rescaled if one residual
+    # exceeds the other by RHO_UPDATE_RATIO
+    RHO_UPDATE_INTERVAL = 10
+    RHO_UPDATE_RATIO = 10.0
+    RHO_RANGE = (1e-4, 1e4)
+    # passes of alternating projections used to restore feasibility, independent of max_iter
+    PROJECTION_MAX_ITER = 10000
+
+    def __init__(self, risk_aversion=1.0, long_only=True, net_exposure=1.0, max_weight=1.0, min_weight=None,
+                 gross_limit=None, turnover_limit=None, cost=0.0, industry_limit=None, te_limit=None,
+                 rho=1.0, relaxation=1.6, max_iter=2000, tol=1e-7):
+        self.risk_aversion = risk_aversion
+        self.long_only = long_only
+        self.net_exposure = net_exposure
+        self.max_weight = max_weight
+        self.min_weight = min_weight
+        self.gross_limit = gross_limit
+        self.turnover_limit = turnover_limit
+        self.cost = cost
+        self.industry_limit = industry_limit
+        self.te_limit = te_limit
+        self.rho = rho
+        self.relaxation = relaxation
+        self.max_iter = max_iter
+        self.tol = tol
+
+        self.info = dict()
+
+    @staticmethod
+    def _get_cov(cov, n):
+        if cov is None:
+            return _ZeroCovariance(n)
+        if isinstance(cov, (FactorCovariance, _DenseCovariance)):
+            return cov
+        return _DenseCovariance(cov)
+
+    def optimize(self, alpha, cov=None, w0=None, benchmark=None, industry=None, initial_value=None):
+        """
+        Parameters
+        ----------
+        alpha : np.ndarray
+            Expected return of each asset, shape (n,).
+        cov : np.ndarray or FactorCovariance, optional
+            Covariance of returns. None means risk is not considered.
+        w0 : np.ndarray, optional
+            Current weights, used by turnover and cost. Default 0.
+        benchmark : np.ndarray, optional
+            Benchmark weights, used by industry and tracking error constraints. Default 0.
+        industry : np.ndarray, optional
+            Industry label of each asset. Required by industry_limit.
+        initial_value : np.ndarray, optional
+            Starting point.
+
+        Returns
+        -------
+        w : np.ndarray
+
+        Raises
+        ------
+        ValueError
+            If no weights satisfying all constraints are found.
+
+        """
+        alpha = np.asarray(alpha, dtype=float)
+        n = len(alpha)
+        cov = self._get_cov(cov, n)
+        w0 = np.zeros(n) if w0 is None else np.asarray(w0, dtype=float)
+        bench = np.zeros(n) if benchmark is None else np.asarray(benchmark, dtype=float)
+
+        upper = np.broadcast_to(np.asarray(self.max_weight, dtype=float), (n,))
+        if self.min_weight is not None:
+            lower = np.broadcast_to(np.asarray(self.min_weight, dtype=float), (n,))
+        else:
+            lower = np.zeros(n) if self.long_only else -upper
+        if self.long_only:
+            lower = np.maximum(lower, 0.0)
+        if self.net_exposure is not None and not (lower.sum() <= self.net_exposure <= upper.sum()):
+            raise ValueError("Bounds of weights can not reach net exposure {}.".format(self.net_exposure))
+
+        # sets of consensus ADMM, each is a function z = prox(v, rho)
+        # constraints are (projection, violation) pairs, the box is the last one to be projected on
+        def project_box(v):
+            return project_box_sum(v, lower, upper, self.net_exposure)
+
+        def box_violation(w):
+            res = max(np.max(lower - w), np.max(w - upper), 0.0)
+            if self.net_exposure is not None:
+                res = max(res, abs(w.sum() - self.net_exposure))
+            return res
+
+        proxes = [lambda v, rho: project_box(v)]
+        constraints = []
+        cost = np.broadcast_to(np.asarray(self.cost, dtype=float), (n,))
+        if self.turnover_limit is not None or np.any(cost > 0):
+            proxes.append(lambda v, rho: prox_l1(v, w0, cost / rho, self.turnover_limit))
+        if self.turnover_limit is not None:
+            constraints.append((lambda v: prox_l1(v, w0, 0.0, self.turnover_limit),
+                                lambda w: np.abs(w - w0).sum() - self.turnover_limit))
+        if self.gross_limit is not None and not self.long_only:
+            zeros = np.zeros(n)
+            proxes.append(lambda v, rho: prox_l1(v, zeros, 0.0, self.gross_limit))
+            constraints.append((lambda v: prox_l1(v, zeros, 0.0, self.gross_limit),
+                                lambda w: np.abs(w).sum() - self.gross_limit))
+        if self.industry_limit is not None:
+            if industry is None:
+                raise ValueError("industry must be provided when industry_limit is set.")
+            _, codes = np.unique(np.asarray(industry), return_inverse=True)
+            n_groups = codes.max() + 1
+            bench_expo = np.bincount(codes, weights=bench, minlength=n_groups)
+            expo_lo, expo_hi = bench_expo - self.industry_limit, bench_expo + self.industry_limit
+            proxes.append(lambda v, rho: project_group_sum(v, codes, n_groups, expo_lo, expo_hi))
+
+            def industry_violation(w):
+                expo = np.bincount(codes, weights=w, minlength=n_groups)
+                return np.max(np.maximum(expo_lo - expo, expo - expo_hi))
+            constraints.append((lambda v: project_group_sum(v, codes, n_groups, expo_lo, expo_hi),
+                                industry_violation))
+        constraints.append((project_box, box_violation))
+
+        var_scale = max(np.mean(cov.diagonal()), 1e-12)
+        if initial_value is None:
+            initial_value = project_box(w0 if np.any(w0) else np.full(n, 1.0 / n))
+        state = [np.asarray(initial_value, dtype=float).copy(), None]
+
+        def run(mu):
+            scale = self.risk_aversion + mu
+            rho = self.rho * max(scale, 1e-3) * var_scale
+            q = alpha + mu * cov.dot(bench)
+            w = self._admm(q, cov, scale, rho, proxes, state)
+            return self._restore_feasibility(w, constraints)
+
+        def tracking_error(w):
+            active = w - bench
+            return np.sqrt(max(active.dot(cov.dot(active)), 0.0))
+
+        w = run(0.0)
+        mu = 0.0
+        if self.te_limit is not None and tracking_error(w) > self.te_limit:
+            # TE decreases as its multiplier grows: bracket, then bisect on log scale
+            lo, hi = 0.0, max(self.risk_aversion, 1.0)
+            w_hi = run(hi)
+            while tracking_error(w_hi) > self.te_limit:
+                if hi >= 1e8:
+                    raise ValueError("Tracking error limit {} can not be reached, "
+                                     "the lowest is {:.3e}.".format(self.te_limit, tracking_error(w_hi)))
+                lo, hi = hi, hi * 10
+                w_hi = run(hi)
+            for _ in range(30):
+                mid = np.sqrt(lo * hi) if lo > 0 else hi / 10
+                w_mid = run(mid)
+                if tracking_error(w_mid) > self.te_limit:
+                    lo = mid
+                else:
+                    hi, w_hi = mid, w_mid
+                if hi - lo < 1e-3 * hi:
+                    break
+            w, mu = w_hi, hi
+
+        self.info.update({'te': tracking_error(w), 'te_multiplier': mu})
+        return w
+
+    def _admm(self, q, cov, scale, rho, proxes, state):
+        """Minimize scale / 2 * w' S w - q' w over the intersection of sets given by proxes."""
+        k = len(proxes)
+        x, ys = state
+        rho_min, rho_max = rho * self.RHO_RANGE[0], rho * self.RHO_RANGE[1]
+        solve = cov.get_solver(scale, k * rho)
+        zs = [x.copy() for _ in range(k)]
+        if ys is None or len(ys) != k:
+            us = [np.zeros_like(x) for _ in range(k)]
+        else:
+            us = [y / rho for y in ys]
+        alpha = self.relaxation
+
+        converged = False
+        for it in range(self.max_iter):
+            x = solve(q + rho * np.sum([z - u for z, u in zip(zs, us)], axis=0))
+            r_prim, r_dual = 0.0, 0.0
+            for i, prox in enumerate(proxes):
+                x_relax = alpha * x + (1.0 - alpha) * zs[i]
+                z_new = prox(x_relax + us[i], rho)
+                r_dual = max(r_dual, np.max(np.abs(z_new - zs[i])))
+                zs[i] = z_new
+                us[i] += x_relax - z_new
+                r_prim = max(r_prim, np.max(np.abs(x - z_new)))
+            if r_prim < self.tol and r_dual < self.tol:
+                converged = True
+                break
+
+            if it % self.RHO_UPDATE_INTERVAL == self.RHO_UPDATE_INTERVAL - 1:
+                ratio = r_prim / max(r_dual, 1e-300)
+                if ratio > self.RHO_UPDATE_RATIO or ratio < 1.0 / self.RHO_UPDATE_RATIO:
+                    factor = min(max(np.sqrt(ratio), 0.1), 10.0)
+                    factor = min(max(rho * factor, rho_min), rho_max) / rho
+                    if factor != 1.0:
+                        rho *= factor
+                        us = [u / factor for u in us]
+                        solve = cov.get_solver(scale, k * rho)
+
+        # warm start of the next run, duals are stored unscaled since rho changes
+        state[0], state[1] = zs[0], [rho * u for u in us]
+        self.info.update({'n_iter': it + 1, 'converged': converged, 'rho': rho})
+        # the first set (bounds and net exposure) is satisfied exactly, others up to tol if converged
+        return zs[0].copy()
+
+    def _restore_feasibility(self, w, constraints):
+        """
+        Move w into the intersection of constraints by alternating projections, if any of them
+        is violated by more than tol. Raise ValueError if the projections do not converge.
+
+        """
+        if max(violation(w) for _, violation in constraints) <= self.tol:
+            return w
+        for _ in range(self.PROJECTION_MAX_ITER):
+            for project, _ in constraints:
+                w = project(w)
+            if max(violation(w) for _, violation in constraints) <= self.tol:
+                return w
+        raise ValueError("Constraints can not be satisfied in {:d} iterations, "
+                         "the largest violation is {:.3e}.".format(
+                             self.PROJECTION_MAX_ITER, max(violation(w) for _, violation in constraints)))
@@ -11,9 +11,13 @@ from __future__ import print_function
 
 import copy
 
+import numpy as np
+import pandas as pd
+
 import jaqs.trade
 from jaqs.data.basic import OrderStatusInd, Trade, Task, Order, Position, TradeStat
 from jaqs.trade import common
+from jaqs.trade.ledger import TradeLedger, PositionLedger, ArchiveDict
 import jaqs.util as jutil
 
 class PortfolioManager(object):
@@ -23,8 +27,16 @@ class PortfolioManager(object):
     Attributes
     ----------
     orders : list of jaqs.data.basic.Order objects
-    trades : list of jaqs.data.basic.Trade objects
+    trades : TradeLedger
+        Columnar ledger of all trades, works as a read-only list of jaqs.data.basic.Trade objects.
     positions : dict of {symbol + trade_date : jaqs.data.basic.Position}
+    symbols : list of str
+        All symbols ever held. Current sizes are stored in an array aligned with this list.
+    daily_positions : PositionLedger
+        Columnar ledger of positions at the end of each trade date.
+    archive_after_days : int or None
+        If not None, orders, tasks and trade stats finished for this number of trade days
+        are moved from memory to log files. They can still be queried as usual.
     strategy : Strategy
     holding_securities : set of securities
 
@@ -45,7 +57,8 @@ class PortfolioManager(object):
         
         self.orders = dict()
         self.tasks = dict()
-        self.trades = []
+        self.trades = TradeLedger()
+        self.daily_positions = PositionLedger()
         self._cum_net_turnover = 0.0
         self.cash = 0.0
         self.init_balance = 0.0
@@ -53,12 +66,40 @@ class PortfolioManager(object):
         self.positions = dict()
         self.tradestat = dict()
         
+        # current size of each symbol, aligned with self.symbols
+        self.symbols = []
+        self._symbol_codes = dict()
+        self._symbol_index = None
+        self._sizes = np.zeros(64)
+        
         self.holding_securities = set()
+        
+        self.archive_after_days = None
     
     def init_from_config(self, props):
         self.init_balance = props.get("init_balance", 0.0)
         self.cash = self.init_balance
         
+        # with ledger_dir, ledgers keep at most ledger_chunk_size rows in memory and spill the rest to disk
+        ledger_dir = props.get("ledger_dir", None)
+        if ledger_dir is not None:
+            import os
+            chunk_size = props.get("ledger_chunk_size", 100000)
+            self.trades = TradeLedger(spill_dir=os.path.join(ledger_dir, 'trades'), chunk_size=chunk_size)
+            self.daily_positions = PositionLedger(spill_dir=os.path.join(ledger_dir, 'positions'),
+                                                  chunk_size=chunk_size)
+        
+        # with archive_after_days, finished orders/tasks/trade stats are archived to archive_dir (or temporary files)
+        self.archive_after_days = props.get("archive_after_days", None)
+        if self.archive_after_days is not None:
+            import os
+            archive_dir = props.get("archive_dir", None)
+            fp_dic = {name: None if archive_dir is None else os.path.join(archive_dir, name + '.log')
+                      for name in ['orders', 'tasks', 'tradestat']}
+            self.orders = ArchiveDict(fp_dic['orders'])
+            self.tasks = ArchiveDict(fp_dic['tasks'])
+            self.tradestat = ArchiveDict(fp_dic['tradestat'])
+        
         self._hook_strategy()
         if isinstance(self.ctx.trade_api, jaqs.trade.RealTimeTradeApi):
             self.init_positions()
@@ -170,6 +211,8 @@ class PortfolioManager(object):
         pos_list = Position.create_from_df(df_pos)
         pos_dic = {p.symbol: p for p in pos_list}
         self.positions.update(pos_dic)
+        for pos in pos_list:
+            self._set_size(pos.symbol, pos.current_size)
         
     # ----------------------------------------------------------------------------
     # On Task Change
@@ -624,6 +667,7 @@ class PortfolioManager(object):
             pos.current_size -= ind.fill_size
         
         self.positions[pos_key] = pos
+        self._set_size(ind.symbol, pos.current_size)
         
         # if no holding, remove the position from the dict
         if pos.current_size == 0:
@@ -633,6 +677,111 @@ class PortfolioManager(object):
         else:
             self.holding_securities.add(ind.symbol)
     
+    # ----------------------------------------------------------------------------
+    # Position Arrays
+    
+    def _get_symbol_code(self, symbol):
+        code = self._symbol_codes.get(symbol)
+        if code is None:
+            code = len(self.symbols)
+            self.symbols.append(symbol)
+            self._symbol_codes[symbol] = code
+            self._symbol_index = None
+            if code == len(self._sizes):
+                self._sizes = np.concatenate([self._sizes, np.zeros(len(self._sizes))])
+        return code
+    
+    def _set_size(self, symbol, size):
+        code = self._get_symbol_code(symbol)
+        self._sizes[code] = size
+    
+    def _get_symbol_index(self):
+        if self._symbol_index is None:
+            self._symbol_index = pd.Index(self.symbols)
+        return self._symbol_index
+    
+    def get_sizes(self, symbols=None):
+        """
+        Current sizes of given symbols.
+        
+        Parameters
+        ----------
+        symbols : list of str or None
+            If None, sizes of self.symbols are returned.
+
+        Returns
+        -------
+        np.ndarray
+            Sizes aligned with symbols, 0 for symbols never held.
+
+        """
+        sizes = self._sizes[:len(self.symbols)]
+        if symbols is None:
+            return sizes.copy()
+        codes = self._get_symbol_index().get_indexer(symbols)
+        return np.where(codes >= 0, sizes[codes], 0.0)
+    
+    def _get_holdings(self):
+        """Return (symbols, sizes) of non-zero positions as arrays."""
+        sizes = self._sizes[:len(self.symbols)]
+        held = np.flatnonzero(sizes)
+        return self._get_symbol_index().values[held], sizes[held]
+    
+    # ----------------------------------------------------------------------------
+    # Ledgers
+    
+    def on_after_market_close(self):
+        """Record positions at the end of current trade date, archive finished orders, tasks and trade stats."""
+        symbols, sizes = self._get_holdings()
+        self.daily_positions.record(self.ctx.trade_date, symbols, sizes)
+        
+        if self.archive_after_days is not None:
+            self.archive_finished()
+    
+    def archive_finished(self):
+        """
+        Move orders and tasks finished for more than archive_after_days trade days,
+        and trade stats of those earlier trade dates, to the archive.
+        
+        """
+        stat_suffix = '@{}'.format(self.ctx.trade_date)
+        self.orders.retire(lambda key, order: order.is_finished, self.archive_after_days)
+        self.tasks.retire(lambda key, task: task.is_finished, self.archive_after_days)
+        self.tradestat.retire(lambda key, stat: not key.endswith(stat_suffix), self.archive_after_days)
+    
+    def get_trades_df(self):
+        """
+        
+        Returns
+        -------
+        pd.DataFrame
+            Each row is a trade, columns are the same as TradeLedger.columns.
+
+        """
+        return self.trades.to_dataframe()
+    
+    def get_daily_positions_df(self):
+        """
+        
+        Returns
+        -------
+        pd.DataFrame
+            Columns: trade_date, symbol, current_size. One row for each non-zero position at the end of a trade date.
+
+        """
+        return self.daily_positions.to_dataframe()
+    
+    def get_position_matrix(self):
+        """
+        
+        Returns
+        -------
+        pd.DataFrame
+            Position at the end of each recorded trade date. Index is trade_date, columns are symbols.
+
+        """
+        return self.daily_positions.to_matrix()
+    
     # ----------------------------------------------------------------------------
     # For Alpha Strategy
     
@@ -643,8 +792,9 @@ class PortfolioManager(object):
 
         Parameters
         ----------
-        ref_prices : dict of {symbol: price}
-            The prices we refer to to get symbol price.
+        ref_prices : dict of {symbol: price} or pd.Series
+            The prices we refer to to get symbol price. A Series indexed by symbol (eg. a column of snapshot)
+            is looked up without Python loops.
         suspensions : list of securities
             Securities that are suspended.
 
@@ -653,22 +803,26 @@ class PortfolioManager(object):
         market_value : float
 
         """
-        # TODO some securities could not be able to be traded
-        if suspensions is None:
-            suspensions = []
+        symbols, sizes = self._get_holdings()
+        
+        # TODO PortfolioManager object should not access price
+        if isinstance(ref_prices, pd.Series):
+            idx = ref_prices.index.get_indexer(symbols)
+            if (idx < 0).any():
+                raise KeyError(symbols[idx < 0][0])
+            prices = ref_prices.values[idx]
+        else:
+            prices = np.array([ref_prices[sec] for sec in symbols], dtype=float)
         
-        market_value_float = 0.0
-        market_value_frozen = 0.0  # suspended or high/low limit
-        for sec in self.holding_securities:
-            size = self.get_position(sec).current_size
-            # TODO PortfolioManager object should not access price
-            price = ref_prices[sec]
-            mv_sec = price * size
-            if sec in suspensions:
-                market_value_frozen += mv_sec
-            else:
-                market_value_float += mv_sec
+        # suspended or high/low limit
+        if suspensions is None or len(suspensions) == 0:
+            mask_frozen = np.zeros(len(symbols), dtype=bool)
+        else:
+            mask_frozen = pd.Index(symbols).isin(list(suspensions))
+        mask_float = ~mask_frozen
         
+        market_value_float = float(np.dot(sizes[mask_float], prices[mask_float]))
+        market_value_frozen = float(np.dot(sizes[mask_frozen], prices[mask_frozen]))
         return market_value_float, market_value_frozen
 
 
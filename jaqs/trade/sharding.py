@@ -0,0 +1,295 @@
+# encoding: utf-8
+"""
+Symbol-sharded event-driven backtest.
+
+A strategy declared symbol_independent processes each symbol on its own, so its
+backtest over a universe is the same as backtests over disjoint slices of it.
+The universe is split into shards, each shard is back-tested with its own event loop
+in a worker process, and trades, positions and daily PnL of all shards are merged
+into one result which can be analyzed by EventAnalyzer just like a single backtest.
+
+"""
+
+from __future__ import print_function, unicode_literals
+import os
+import multiprocessing
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from jaqs.trade import model
+from jaqs.trade.backtest import EventBacktestInstance
+from jaqs.trade.tradegateway import BacktestTradeApi
+from jaqs.trade.portfoliomanager import PortfolioManager
+from jaqs.trade.walkforward import calc_daily_pnl
+import jaqs.util as jutil
+
+
+def split_symbols(symbols, n_shards):
+    """
+    Split symbols into at most n_shards contiguous slices of nearly equal size.
+
+    Parameters
+    ----------
+    symbols : list of str
+    n_shards : int
+
+    Returns
+    -------
+    list of list of str
+        Empty slices are dropped.
+
+    """
+    if n_shards <= 0:
+        raise ValueError("n_shards must be positive.")
+    return [list(s) for s in np.array_split(np.asarray(symbols, dtype=object), n_shards) if len(s)]
+
+
+def _add_series(series_list):
+    """Add up Series aligned on the union of their indexes."""
+    res = None
+    for ser in series_list:
+        res = ser if res is None else res.add(ser, fill_value=0.0)
+    return res
+
+
+# Shared by worker processes. With fork it is inherited from the parent process without pickling.
+_worker_backtest = None
+
+
+def _init_worker(backtest):
+    global _worker_backtest
+    _worker_backtest = backtest
+
+
+def _run_shard(i_shard):
+    return _worker_backtest._run_shard(i_shard)
+
+
+class ShardedEventBacktest(object):
+    """
+    Run an event-driven backtest of a symbol-independent strategy in several processes.
+
+    Attributes
+    ----------
+    strategy_factory : callable
+        strategy_factory() returns a new EventDrivenStrategy whose symbol_independent is True.
+    data_api : DataService or callable
+        A callable is called in each worker to create its own DataService,
+        which is required by services holding a connection, e.g. RemoteDataService.
+    dataview : DataView
+    props : dict
+        Configurations of EventBacktestInstance. 'symbol' of each shard is replaced by its slice.
+    n_jobs : int
+        Number of processes. 1 means running all shards in current process.
+    n_shards : int
+        Number of slices of symbols. Default n_jobs.
+    shards : list of list of str
+    shard_results : pd.DataFrame
+        Symbols, number of trades and timing of each shard.
+
+    Notes
+    -----
+    Each shard starts with the whole init_balance, the same as the single process backtest
+    where cash does not limit orders. Order ids are generated in each shard, so they are
+    unique for each symbol but not across symbols.
+
+    """
+    def __init__(self, strategy_factory, data_api=None, dataview=None):
+        self.strategy_factory = strategy_factory
+        self.data_api = data_api
+        self.dataview = dataview
+
+        self.props = None
+        self.n_jobs = 1
+        self.n_shards = 1
+        self.shards = []
+        self.shard_results = None
+        self.used_time = 0.0
+
+        self._df_trades = None
+        self._df_positions = None
+        self._daily_pnl = None
+
+    def init_from_config(self, props):
+        """
+        Parameters
+        ----------
+        props : dict
+            Besides configurations of EventBacktestInstance, following keys are used:
+            n_jobs (optional), n_shards (optional).
+
+        """
+        for name in ['start_date', 'end_date', 'init_balance', 'symbol']:
+            if name not in props:
+                raise ValueError("{} must be provided in props.".format(name))
+
+        strategy = self.strategy_factory()
+        if not getattr(strategy, 'symbol_independent', False):
+            raise ValueError("{} is not declared symbol_independent, it can not be back-tested "
+                             "in shards.".format(type(strategy).__name__))
+
+        self.props = props
+        self.n_jobs = int(props.get('n_jobs', 1))
+        self.n_shards = int(props.get('n_shards', self.n_jobs))
+
+        symbols = props['symbol']
+        if not isinstance(symbols, list):
+            symbols = [s for s in symbols.split(',') if s]
+        self.shards = split_symbols(symbols, self.n_shards)
+
+    def _get_data_api(self):
+        if callable(self.data_api):
+            return self.data_api()
+        return self.data_api
+
+    def _get_df_close(self, data_api, symbols):
+        """Daily close prices of symbols, index is trade_date, columns are symbols."""
+        start_date, end_date = self.props['start_date'], self.props['end_date']
+        if self.dataview is not None:
+            df_close = self.dataview.get_ts('close', start_date=start_date, end_date=end_date)
+            return df_close.reindex(columns=symbols)
+
+        df, msg = data_api.daily(symbol=','.join(symbols), start_date=start_date, end_date=end_date,
+                                 fields='trade_date,symbol,close', adjust_mode=None)
+        df_close = df.pivot(index='trade_date', columns='symbol', values='close')
+        return df_close.reindex(columns=symbols)
+
+    def _run_shard(self, i_shard):
+        symbols = self.shards[i_shard]
+        begin_time = dt.datetime.now()
+
+        props = dict(self.props)
+        props['symbol'] = ','.join(symbols)
+        data_api = self._get_data_api()
+        bt = EventBacktestInstance()
+        model.Context(data_api=data_api, dataview=self.dataview, trade_api=BacktestTradeApi(),
+                      instance=bt, strategy=self.strategy_factory(), pm=PortfolioManager())
+        bt.init_from_config(props)
+        bt.run()
+
+        df_trades = bt.get_trades_df()
+        df_close = self._get_df_close(data_api, symbols)
+        daily_pnl = calc_daily_pnl(df_trades, df_close, self.props['init_balance'])
+
+        used_time = (dt.datetime.now() - begin_time).total_seconds()
+        return {'shard': i_shard, 'trades': df_trades, 'positions': bt.ctx.pm.get_position_matrix(),
+                'daily_pnl': daily_pnl, 'used_time': used_time}
+
+    def _map(self, func, args_list):
+        if self.n_jobs <= 1 or len(args_list) <= 1:
+            _init_worker(self)
+            return [func(args) for args in args_list]
+
+        pool = multiprocessing.Pool(processes=min(self.n_jobs, len(args_list)),
+                                    initializer=_init_worker, initargs=(self,))
+        try:
+            return pool.map(func, args_list, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    def run(self):
+        """
+        Back-test all shards and merge their results.
+
+        Returns
+        -------
+        pd.DataFrame
+            Same as self.shard_results.
+
+        """
+        if self.props is None:
+            raise ValueError("Call init_from_config before run.")
+        print("Run sharded backtest: {0:d} shards, {1:d} processes.".format(len(self.shards), self.n_jobs))
+        begin_time = dt.datetime.now()
+
+        results = self._map(_run_shard, list(range(len(self.shards))))
+
+        # trades of all shards are sorted by time, trades of the same time keep their order in shards
+        df_trades = pd.concat([res['trades'] for res in results], axis=0, ignore_index=True)
+        df_trades = df_trades.sort_values(['fill_date', 'fill_time'], kind='mergesort').reset_index(drop=True)
+        df_trades.index.name = 'index'
+        self._df_trades = df_trades
+
+        df_positions = pd.concat([res['positions'] for res in results], axis=1).sort_index()
+        self._df_positions = df_positions.fillna(0.0)
+
+        self._daily_pnl = _add_series([res['daily_pnl'] for res in results])
+
+        self.shard_results = pd.DataFrame([{'shard': res['shard'],
+                                            'symbol': ','.join(self.shards[res['shard']]),
+                                            'n_trades': len(res['trades']),
+                                            'used_time': res['used_time']}
+                                           for res in results]).set_index('shard')
+
+        self.used_time = (dt.datetime.now() - begin_time).total_seconds()
+        print("Sharded backtest done. {0:d} trades in total. used time: {1}s".format(
+            len(self._df_trades), self.used_time))
+        return self.shard_results
+
+    def get_trades_df(self):
+        """
+        Merged trades of all shards.
+
+        Returns
+        -------
+        pd.DataFrame
+            Same format as trades.csv.
+
+        """
+        return self._df_trades
+
+    def get_position_matrix(self):
+        """
+        Merged positions at the end of each trade date.
+
+        Returns
+        -------
+        pd.DataFrame
+            Index is trade_date, columns are symbols.
+
+        """
+        return self._df_positions
+
+    def get_daily_pnl(self):
+        """
+        Daily PnL of all shards added up, marked to close prices.
+
+        Returns
+        -------
+        pd.Series
+            Index is trade_date.
+
+        """
+        return self._daily_pnl
+
+    def save_results(self, folder_path='.'):
+        """
+        Save merged results in the same format as EventBacktestInstance.save_results,
+        together with daily PnL and a summary of shards.
+
+        Parameters
+        ----------
+        folder_path : str
+
+        """
+        folder_path = os.path.abspath(folder_path)
+
+        trades_fn = os.path.join(folder_path, 'trades.csv')
+        positions_fn = os.path.join(folder_path, 'positions.csv')
+        configs_fn = os.path.join(folder_path, 'configs.json')
+        daily_pnl_fn = os.path.join(folder_path, 'daily_pnl.csv')
+        shards_fn = os.path.join(folder_path, 'shards.csv')
+        jutil.create_dir(trades_fn)
+
+        self._df_trades.to_csv(trades_fn)
+        self._df_positions.to_csv(positions_fn)
+        self._daily_pnl.to_frame('pnl').rename_axis('trade_date').to_csv(daily_pnl_fn)
+        self.shard_results.to_csv(shards_fn)
+
+        configs = {k: v for k, v in self.props.items() if not callable(v)}
+        jutil.save_json(configs, configs_fn)
+
+        print("Sharded backtest results has been successfully saved to:\n" + folder_path)
@@ -0,0 +1,210 @@
+# encoding: utf-8
+"""
+Combine signals (factors) by their rank IC.
+
+For K factors, rank IC of all dates is calculated in one pass on a (K, date, symbol) array.
+On each date, weights maximizing IC-IR are solved from the rolling mean and covariance
+of ICs known by that date:
+
+    w = inv(Cov(IC)) * mean(IC),  scaled so that sum(|w|) = 1
+
+"""
+from __future__ import print_function, division
+
+import numpy as np
+import pandas as pd
+
+
+def _rank_rows(mat):
+    """Average rank of each row of a 2-D array, NaN kept."""
+    return pd.DataFrame(mat).rank(axis=1).values
+
+
+def calc_rank_ic(factors, forward_return):
+    """
+    Rank IC (Spearman correlation between factor and forward return) of each date.
+
+    Parameters
+    ----------
+    factors : list of np.ndarray
+        K arrays of shape (n_dates, n_symbols).
+    forward_return : np.ndarray
+        Shape (n_dates, n_symbols).
+
+    Returns
+    -------
+    ic : np.ndarray
+        Shape (n_dates, K). NaN where less than 3 symbols are valid.
+
+    """
+    f = np.array(factors, dtype=float)
+    k, n_dates, n_symbols = f.shape
+    r = np.broadcast_to(np.asarray(forward_return, dtype=float), f.shape)
+    mask = np.isfinite(f) & np.isfinite(r)
+    f = np.where(mask, f, np.nan).reshape(-1, n_symbols)
+    r = np.where(mask, r, np.nan).reshape(-1, n_symbols)
+
+    rank_f = _rank_rows(f)
+    rank_r = _rank_rows(r)
+    count = mask.reshape(-1, n_symbols).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # means from sums and counts, so that rows without valid values do not warn
+        rank_f -= (np.nansum(rank_f, axis=1) / count)[:, None]
+        rank_r -= (np.nansum(rank_r, axis=1) / count)[:, None]
+        cov = np.nansum(rank_f * rank_r, axis=1)
+        ic = cov / np.sqrt(np.nansum(rank_f ** 2, axis=1) * np.nansum(rank_r ** 2, axis=1))
+    ic[count < 3] = np.nan
+    return ic.reshape(k, n_dates).T
+
+
+def calc_ic_weights(ic, window, period=1, min_periods=None, shrinkage=0.0):
+    """
+    IC-IR optimal weights of each date, from rolling mean and covariance of IC.
+
+    IC of date t uses return from t to t + period, so it is known at date t + period.
+    Weights of date t only use ICs of dates [t - period - window + 1, t - period].
+
+    Parameters
+    ----------
+    ic : np.ndarray
+        Shape (n_dates, K). Dates with any NaN are skipped.
+    window : int
+        Number of dates of the rolling window.
+    period : int
+    min_periods : int, optional
+        Minimum number of valid ICs in window. Default window. At least K + 1,
+        otherwise the covariance of ICs is singular.
+    shrinkage : float
+        Intensity in [0, 1] of shrinkage of IC covariance towards its diagonal.
+
+    Returns
+    -------
+    weights : np.ndarray
+        Shape (n_dates, K). NaN where there are not enough ICs.
+
+    """
+    ic = np.asarray(ic, dtype=float)
+    n_dates, k = ic.shape
+    if min_periods is None:
+        min_periods = window
+    min_periods = max(min_periods, k + 1)
+
+    valid = np.all(np.isfinite(ic), axis=1)
+    x = np.where(valid[:, None], ic, 0.0)
+    # cumulative sums with a leading zero, so that the sum of rows [a, b) is cum[b] - cum[a]
+    cum_n = np.concatenate([[0], np.cumsum(valid)])
+    cum_x = np.concatenate([np.zeros((1, k)), np.cumsum(x, axis=0)])
+    cum_xx = np.concatenate([np.zeros((1, k, k)), np.cumsum(x[:, :, None] * x[:, None, :], axis=0)])
+
+    end = np.clip(np.arange(n_dates) - period + 1, 0, n_dates)
+    start = np.clip(end - window, 0, n_dates)
+    n = (cum_n[end] - cum_n[start]).astype(float)
+    ok = n >= min_periods
+
+    weights = np.full((n_dates, k), np.nan)
+    if not ok.any():
+        return weights
+    n = n[ok]
+    s = cum_x[end[ok]] - cum_x[start[ok]]
+    ss = cum_xx[end[ok]] - cum_xx[start[ok]]
+    mean = s / n[:, None]
+    cov = (ss - n[:, None, None] * mean[:, :, None] * mean[:, None, :]) / (n[:, None, None] - 1)
+    if shrinkage:
+        diag = cov * np.eye(k)
+        cov = (1.0 - shrinkage) * cov + shrinkage * diag
+
+    # pseudo-inverse, so that singular covariance of one date (e.g. two factors with the same ranks)
+    # does not fail the whole batch
+    w = np.matmul(np.linalg.pinv(cov), mean[:, :, None])[:, :, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w /= np.sum(np.abs(w), axis=1, keepdims=True)
+    weights[ok] = w
+    return weights
+
+
+class ICSignalCombiner(object):
+    """
+    Combine factors of a DataView into one factor field, weighted by rolling IC-IR.
+
+    Parameters
+    ----------
+    dataview : DataView
+    factor_names : list of str
+        Fields of factors.
+    price_field : str
+        Field of adjusted price, used to calculate forward return.
+    period : int
+        Number of days of forward return.
+    window : int
+        Number of dates of the rolling window of IC.
+    min_periods : int, optional
+    shrinkage : float
+
+    Attributes
+    ----------
+    ic : pd.DataFrame
+        Rank IC. Index is date, columns are factor names.
+    weights : pd.DataFrame
+        Weights of factors used on each date. Index is date, columns are factor names.
+
+    """
+    def __init__(self, dataview, factor_names, price_field='close_adj', period=1, window=60,
+                 min_periods=None, shrinkage=0.0):
+        self.dataview = dataview
+        self.factor_names = list(factor_names)
+        self.price_field = price_field
+        self.period = period
+        self.window = window
+        self.min_periods = min_periods
+        self.shrinkage = shrinkage
+
+        self.ic = None
+        self.weights = None
+
+    def _get_ts(self, field):
+        dv = self.dataview
+        return dv.get_ts(field, start_date=dv.extended_start_date_d, end_date=dv.end_date)
+
+    def calc_weights(self):
+        """
+        Calculate IC and weights of all dates.
+
+        Returns
+        -------
+        weights : pd.DataFrame
+
+        """
+        price = self._get_ts(self.price_field)
+        dates, symbols = price.index, price.columns
+        factors = [self._get_ts(name).reindex(index=dates, columns=symbols).values
+                   for name in self.factor_names]
+        price = price.values.astype(float)
+        forward_return = np.full_like(price, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            forward_return[:-self.period] = price[self.period:] / price[:-self.period] - 1.0
+
+        ic = calc_rank_ic(factors, forward_return)
+        weights = calc_ic_weights(ic, self.window, period=self.period, min_periods=self.min_periods,
+                                  shrinkage=self.shrinkage)
+        self.ic = pd.DataFrame(ic, index=dates, columns=self.factor_names)
+        self.weights = pd.DataFrame(weights, index=dates, columns=self.factor_names)
+        return self.weights
+
+    def add_combined_field(self, field_name):
+        """
+        Add the combined factor, sum of factors weighted by weights of each date, to DataView.
+
+        Parameters
+        ----------
+        field_name : str
+
+        """
+        if self.weights is None:
+            self.calc_weights()
+        dates = self.weights.index
+        combined = None
+        for name in self.factor_names:
+            df = self._get_ts(name).reindex(index=dates)
+            df = df.mul(self.weights[name], axis=0)
+            combined = df if combined is None else combined + df
+        self.dataview.append_df(combined, field_name, is_quarterly=False)
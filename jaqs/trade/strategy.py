@@ -6,9 +6,11 @@ Classes defined in strategy module
 from __future__ import print_function
 import abc
 from abc import abstractmethod
+from collections import OrderedDict
 from six import with_metaclass
 
 import numpy as np
+import pandas as pd
 
 from jaqs.data.basic import GoalPosition
 from jaqs.util.sequence import SequenceGenerator
@@ -17,6 +19,7 @@ from jaqs.data.basic import Bar, Quote
 
 from jaqs.trade import model
 from jaqs.trade import common
+from jaqs.trade.optimizer import PortfolioOptimizer
 
 
 class Strategy(with_metaclass(abc.ABCMeta)):
@@ -360,6 +363,8 @@ class AlphaStrategy(Strategy, model.FuncRegisterable):
     weights : np.array with the same shape with self.context.universe
     benchmark : str
         The benchmark symbol.
+    lot_rounding : str
+        How target sizes are rounded to lots. {'round', 'greedy'}
     risk_model : model.RiskModel
     signal_model : model.ReturnModel
     cost_model : model.CostModel
@@ -382,6 +387,7 @@ class AlphaStrategy(Strategy, model.FuncRegisterable):
         self.cash = 0
         self.position_ratio = 0.98
         self.single_symbol_weight_limit = 1.0
+        self.lot_rounding = 'round'
         
         self.risk_model = risk_model
         self.signal_model = signal_model
@@ -404,10 +410,10 @@ class AlphaStrategy(Strategy, model.FuncRegisterable):
         self.n_periods = props.get('n_periods', 1)
         self.position_ratio = props.get('position_ratio', 0.98)
         self.single_symbol_weight_limit = props.get('single_symbol_weight_limit', 1.0)
+        self.lot_rounding = props.get('lot_rounding', 'round')
 
         self.use_pc_method(name='equal_weight', func=self.equal_weight, options=None)
-        self.use_pc_method(name='mc', func=self.optimize_mc, options={'util_func': self.util_net_signal,
-                                                                           'constraints': None,
+        self.use_pc_method(name='mc', func=self.optimize_mc, options={'constraints': props.get('pc_constraints'),
                                                                            'initial_value': None})
         self.use_pc_method(name='factor_value_weight', func=self.factor_value_weight, options=None)
         self.use_pc_method(name='index_weight', func=self.index_weight, options=None)
@@ -451,6 +457,9 @@ class AlphaStrategy(Strategy, model.FuncRegisterable):
         self._register_func(name, func, options)
     
     def _get_weights_last(self):
+        return self._cached('weights_last', self.ctx.universe, self._query_weights_last)
+    
+    def _query_weights_last(self):
         current_positions = self.query_portfolio()
         univ_pos_dic = {p.symbol: p.current_size for p in current_positions}
         for sec in self.ctx.universe:
@@ -467,10 +476,8 @@ class AlphaStrategy(Strategy, model.FuncRegisterable):
         weights_target : dict
         
         """
-        weights_last = self._get_weights_last()
-    
         signal = self.signal_model.forecast_signal(weights_target)
-        cost = self.cost_model.calc_cost(weights_last, weights_target)
+        cost = self.calc_rebalance_cost(weights_target)
         # liquid = self.liquid_model.calc_liquid(weight_now)
         risk = self.risk_model.calc_risk(weights_target)
     
@@ -479,6 +486,43 @@ class AlphaStrategy(Strategy, model.FuncRegisterable):
         net_signal = signal - risk_coef * risk - cost_coef * cost  # - liquid * liq_factor
         return net_signal
     
+    def calc_rebalance_cost(self, weights_target):
+        """
+        Estimate cost of trading from current positions to weights_target.
+        
+        If cost_model is a TradeCostModel, target weights are converted to shares at close price
+        and costs of all trades are calculated in one call, the same way as the backtest gateway
+        charges filled trades. Current holdings not in weights_target are sold out.
+        The result is a ratio to total portfolio value.
+        
+        Parameters
+        ----------
+        weights_target : dict of {symbol: weight}
+
+        Returns
+        -------
+        cost : float
+
+        """
+        weights_last = self._get_weights_last()
+        if not isinstance(self.cost_model, model.TradeCostModel):
+            return self.cost_model.calc_cost(weights_last, weights_target)
+        
+        # weights_last are current sizes (shares) of holdings
+        symbols = list(weights_target.keys())
+        symbols.extend(s for s, size in weights_last.items() if size and s not in weights_target)
+        price = self.ctx.snapshot['close'].reindex(symbols).values.astype(float)
+        size_last = np.array([weights_last.get(s, 0.0) for s in symbols], dtype=float)
+        total_value = self.cash + np.nansum(size_last * price)
+        if total_value <= 0:
+            return 0.0
+        
+        weights_arr = np.array([weights_target.get(s, 0.0) for s in symbols], dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            size_target = weights_arr * total_value / price
+        res = self.cost_model.calc_trade_cost(symbols, price, size_target - size_last)
+        return np.nansum(res['total']) / total_value
+    
     def portfolio_construction(self, universe_list=None):
         """
         Calculate target weights of each symbol in the strategy universe.
@@ -495,6 +539,9 @@ class AlphaStrategy(Strategy, model.FuncRegisterable):
             Weights of each symbol.
 
         """
+        # outputs of models cached during last re-balance are out of date
+        self.ctx.cache.clear()
+        
         # Step.1 filter and narrow down universe to sub-universe
         if self.stock_selector is not None:
             selected_list = self.stock_selector.get_selection()
@@ -508,29 +555,29 @@ class AlphaStrategy(Strategy, model.FuncRegisterable):
         func, options = rf.func, rf.options
 
         # Step.3 use the registered method to calculate weights and get weights for all symbols in universe
+        # built-in methods return pd.Series indexed by symbol, user functions may also return a dict
         weights_sub_universe, msg = func(**options)
-        weights_all_universe = {symbol: weights_sub_universe.get(symbol, 0.0) for symbol in self.ctx.universe}
         if msg:
             print(msg)
-
+        weights_arr = pd.Series(weights_sub_universe, dtype=float).reindex(self.ctx.universe).values
+        
         # if nan assign zero
-        weights_all_universe = {k: 0.0 if np.isnan(v) else v for k, v in weights_all_universe.items()}
+        weights_arr[np.isnan(weights_arr)] = 0.0
         
         # normalize
-        w_sum = np.sum(np.abs(list(weights_all_universe.values())))
+        w_sum = np.sum(np.abs(weights_arr))
         if w_sum > 1e-8:  # else all zeros weights
-            weights_all_universe = {k: v / w_sum for k, v in weights_all_universe.items()}
+            weights_arr = weights_arr / w_sum
         
         # single symbol weight limit process
         if self.single_symbol_weight_limit < 1:
-            weights_all_universe = {k: v if v < self.single_symbol_weight_limit else self.single_symbol_weight_limit
-                                    for k, v in weights_all_universe.items()}
+            weights_arr = np.minimum(weights_arr, self.single_symbol_weight_limit)
 
-        self.weights = weights_all_universe
+        self.weights = dict(zip(self.ctx.universe, weights_arr))
 
     def equal_weight(self):
         # discrete
-        weights = {k: 1.0 for k in self.ctx.snapshot_sub.index.values}
+        weights = pd.Series(1.0, index=self.ctx.snapshot_sub.index)
         return weights, ''
 
     def market_value_weight(self, sqrt=False):
@@ -543,11 +590,10 @@ class AlphaStrategy(Strategy, model.FuncRegisterable):
         else:
             raise ValueError("market_value_weight is chosen,"
                              "while no [float_mv] or [total_mv] field found in dataview.")
-        mv = mv.fillna(0.0)
+        weights = mv.fillna(0.0)
         if sqrt:
             print('sqrt')
-            mv = np.sqrt(mv)
-        weights = mv.to_dict()
+            weights = np.sqrt(weights)
         return weights, ""
 
     def index_weight(self):
@@ -555,89 +601,122 @@ class AlphaStrategy(Strategy, model.FuncRegisterable):
         if 'index_weight' not in snap.columns:
             raise ValueError("index_weight is chosen,"
                              "while no [index_weight] field found in dataview.")
-        ser_index_weight = snap['index_weight']
-        ser_index_weight.fillna(0.0, inplace=True)
-        weights = ser_index_weight.to_dict()
+        weights = snap['index_weight'].fillna(0.0)
         return weights, ""
 
     def equal_index_weight(self):
         snap = self.ctx.snapshot_sub
-        snap.fillna(0.0, inplace=True)
+        member = snap['index_member'].fillna(0.0)
+        index_weight = snap['index_weight'].fillna(0.0)
 
-        wt_equal = snap['index_member'] / sum(snap['index_member'])
-        wt_index = snap['index_weight'] / sum(snap['index_weight'])
+        wt_equal = member / member.sum()
+        wt_index = index_weight / index_weight.sum()
 
         wt_final = (wt_equal + wt_index) / 2
 
-        return wt_final.to_dict(), ""
+        return wt_final, ""
 
     def factor_value_weight(self):
-        def long_only_weight_adjust(w):
-            """
-            Adjust weights for long only constraints.
-            
-            Parameters
-            ----------
-            w : dict
-    
-            Returns
-            -------
-            res : dict
-    
-            """
-            # TODO: we should not add a const
-            if not len(w):
-                return w
-            w_min = np.min(list(w.values()))
-            if w_min < 0:
-                delta = 2 * abs(w_min)
-            # if nan assign zero; else add const
-                w = {k: v + delta for k, v in w.items()}
-            return w
-        
         dic_forecasts = self.signal_model.make_forecast()
-        weights = {k: 0.0 if (np.isnan(v) or np.isinf(v)) else v for k, v in dic_forecasts.items()}
-        weights = long_only_weight_adjust(weights)
+        weights = pd.Series(dic_forecasts, dtype=float)
+        # if nan or inf assign zero
+        weights[~np.isfinite(weights.values)] = 0.0
+        
+        # adjust weights for long only constraints
+        # TODO: we should not add a const
+        if len(weights):
+            w_min = weights.min()
+            if w_min < 0:
+                weights = weights + 2 * abs(w_min)
         return weights, ""
         
-    def optimize_mc(self, util_func):
+    def _get_current_weights(self, symbols):
+        """Weights of current positions of symbols, as ratios to total portfolio value (cash included)."""
+        weights_last = self._get_weights_last()
+        price = self.ctx.snapshot['close'].reindex(symbols).values.astype(float)
+        size_last = np.array([weights_last.get(s, 0.0) for s in symbols], dtype=float)
+        value = np.where(np.isnan(price), 0.0, size_last * price)
+        total_value = self.cash + value.sum()
+        if total_value <= 0:
+            return np.zeros(len(symbols))
+        return value / total_value
+    
+    def _get_unit_cost(self):
+        """Linear cost per unit of weight traded. Stamp tax is charged on sells only, so half of it is used."""
+        if isinstance(self.cost_model, model.TradeCostModel):
+            return (self.cost_model.commission_rate + self.cost_model.slippage_rate
+                    + self.cost_model.stamp_tax_rate / 2.0)
+        return 0.0
+    
+    def optimize_mc(self, constraints=None, initial_value=None):
         """
-        Use naive search (Monte Carol) to find variable that maximize util_func.
+        Solve a constrained mean-variance problem to get weights, using PortfolioOptimizer.
+        
+        Expected return is the forecast of signal_model, covariance comes from
+        risk_model.calc_covariance and linear cost per unit of turnover from cost_model.
+        Models that are not provided are not considered.
         
         Parameters
         ----------
-        util_func : callable
-            Input variables, output the value of util function.
+        constraints : dict, optional
+            Keyword arguments of PortfolioOptimizer, e.g. {'risk_aversion': 5.0, 'turnover_limit': 0.3}.
+            max_weight is single_symbol_weight_limit by default.
+            Two more keys are read from ctx.snapshot_sub:
+            'industry_field' : field of industry labels, required by industry_limit.
+            'benchmark_field' : field of benchmark weights, used by industry_limit and te_limit.
+        initial_value : dict of {symbol: weight}, optional
+            Starting point of the optimiser.
 
         Returns
         -------
-        min_weights : dict
-            best weights.
+        weights : dict
+            {symbol: weight}
         msg : str
             error message.
 
         """
-        n_exp = 5  # number of experiments of Monte Carol
-        sub_univ = self.ctx.snapshot_sub.index.values
-        n_var = len(sub_univ)
-    
-        weights_mat = np.random.rand(n_exp, n_var)
-        weights_mat = weights_mat / weights_mat.sum(axis=1).reshape(-1, 1)
-    
-        min_f = 1e30
-        min_weights = None
-        for i in range(n_exp):
-            weights = {sub_univ[j]: weights_mat[i, j] for j in range(n_var)}
-            f = -util_func(weights)
-            if f < min_f:
-                min_weights = weights
-                min_f = f
-    
-        if min_weights is None:
-            msg = "No weights can make f > {:.2e} found in this search".format(min_f)
+        constraints = dict(constraints) if constraints else dict()
+        industry_field = constraints.pop('industry_field', '')
+        benchmark_field = constraints.pop('benchmark_field', '')
+        constraints.setdefault('max_weight', self.single_symbol_weight_limit)
+        if 'cost' not in constraints:
+            constraints['cost'] = self._get_unit_cost()
+        
+        snap = self.ctx.snapshot_sub
+        sub_univ = list(snap.index.values)
+        n = len(sub_univ)
+        if not n:
+            return dict(), ""
+        
+        if self.signal_model is not None:
+            forecast = self.signal_model.make_forecast()
+            alpha = np.array([forecast.get(s, 0.0) for s in sub_univ], dtype=float)
+            alpha[~np.isfinite(alpha)] = 0.0
         else:
+            alpha = np.zeros(n)
+        
+        cov = self.risk_model.calc_covariance(sub_univ) if self.risk_model is not None else None
+        w0 = self._get_current_weights(sub_univ)
+        
+        industry = snap[industry_field].values if industry_field else None
+        benchmark = None
+        if benchmark_field:
+            benchmark = snap[benchmark_field].fillna(0.0).values.astype(float)
+            if benchmark.sum() > 0:
+                benchmark = benchmark / benchmark.sum()
+        if initial_value is not None:
+            initial_value = np.array([initial_value.get(s, 0.0) for s in sub_univ], dtype=float)
+        
+        optimizer = PortfolioOptimizer(**constraints)
+        w = optimizer.optimize(alpha, cov=cov, w0=w0, benchmark=benchmark, industry=industry,
+                               initial_value=initial_value)
+        
+        if optimizer.info.get('converged', True):
             msg = ""
-        return min_weights, msg
+        else:
+            msg = ("Optimizer did not converge in {:d} iterations, "
+                   "weights are projected onto the constraints.".format(optimizer.info['n_iter']))
+        return dict(zip(sub_univ, w)), msg
 
     def re_weight_suspension(self, suspensions=None):
         """
@@ -656,12 +735,14 @@ class AlphaStrategy(Strategy, model.FuncRegisterable):
         if len(suspensions) == len(self.ctx.universe):
             raise ValueError("All suspended")  # TODO custom error
         
-        weights = {sec: w if sec not in suspensions else 0.0 for sec, w in self.weights.items()}
-        weights_sum = np.sum(np.abs(list(weights.values())))
+        symbols = list(self.weights.keys())
+        weights = np.fromiter(self.weights.values(), dtype=float, count=len(symbols))
+        weights[np.isin(symbols, list(suspensions))] = 0.0
+        weights_sum = np.sum(np.abs(weights))
         if weights_sum > 0.0:
-            weights = {sec: w / weights_sum for sec, w in weights.items()}
+            weights = weights / weights_sum
         
-        self.weights = weights
+        self.weights = dict(zip(symbols, weights))
     
     def on_after_rebalance(self, total):
         print("Before {} re-balance: available cash all = {:9.4e}".format(self.ctx.trade_date, total))  # DEBUG
@@ -691,38 +772,78 @@ class AlphaStrategy(Strategy, model.FuncRegisterable):
         cash_left : float
 
         """
-        # cash_left = 0.0
-        cash_used = 0.0
-        goals = []
-        for sec, w in weights_dic.items():
-            goal_pos = dict()
-            goal_pos['symbol'] = sec
-            
-            if sec in suspensions:
-                current_pos = self.ctx.pm.get_position(sec)
-                goal_pos['size'] = current_pos.current_size if current_pos is not None else 0
-            elif abs(w) < 1e-8:
-                # order.entrust_size = 0
-                goal_pos['size'] = 0
-            else:
-                price = prices[sec]
-                if not (np.isfinite(price) and np.isfinite(w)):
-                    raise ValueError("NaN or Inf encountered! \n"
-                                     "trade_date={}, symbol={}, price={}, weight={}".format(self.ctx.trade_date,
-                                                                                            sec, price, w))
-                shares_raw = w * turnover / price
-                # shares unit 100
-                shares = int(round(shares_raw / 100., 0)) * 100  # TODO cash may be not enough
-                # shares_left = shares_raw - shares * 100  # may be negative
-                # cash_left += shares_left * price
-                cash_used += shares * price
-                goal_pos['size'] = shares
-            
-            goals.append(goal_pos)
+        if suspensions is None:
+            suspensions = []
+        symbols = list(weights_dic.keys())
+        weights = np.fromiter(weights_dic.values(), dtype=float, count=len(symbols))
+        is_suspended = np.isin(symbols, list(suspensions))
+        to_trade = ~is_suspended & ~(np.abs(weights) < 1e-8)
+        
+        price = np.ones(len(symbols))
+        price[to_trade] = [prices[sec] for sec in np.asarray(symbols)[to_trade]]
+        invalid = to_trade & ~(np.isfinite(price) & np.isfinite(weights))
+        if invalid.any():
+            i = np.argmax(invalid)
+            raise ValueError("NaN or Inf encountered! \n"
+                             "trade_date={}, symbol={}, price={}, weight={}".format(self.ctx.trade_date,
+                                                                                    symbols[i], price[i], weights[i]))
+        
+        shares_raw = np.where(to_trade, weights * turnover / price, 0.0)
+        shares = self._round_lots(shares_raw, price, turnover)
+        
+        sizes = shares.astype(int).tolist()
+        for i in np.nonzero(is_suspended)[0]:
+            current_pos = self.ctx.pm.get_position(symbols[i])
+            sizes[i] = current_pos.current_size if current_pos is not None else 0
+        goals = [{'symbol': sec, 'size': size} for sec, size in zip(symbols, sizes)]
         
+        # accumulate in order of symbols, the same as adding trade by trade
+        cash_used = np.cumsum(shares * price)[-1] if len(symbols) else 0.0
         cash_left = turnover - cash_used
         return goals, cash_left
     
+    def _round_lots(self, shares_raw, price, turnover):
+        """
+        Round shares to lots of 100.
+        
+        If lot_rounding is 'round', each size is rounded to the nearest lot.
+        If lot_rounding is 'greedy', long sizes are rounded down first, then cash left is used to buy
+        one more lot of symbols in descending order of remainders, skipping those can not be afforded.
+        Short sizes are always rounded to the nearest lot.
+        
+        Parameters
+        ----------
+        shares_raw : np.ndarray
+        price : np.ndarray
+        turnover : float
+
+        Returns
+        -------
+        shares : np.ndarray
+
+        """
+        lots_raw = shares_raw / 100.
+        if self.lot_rounding == 'round':
+            return np.round(lots_raw, 0) * 100
+        elif self.lot_rounding != 'greedy':
+            raise NotImplementedError("lot_rounding = {:s}".format(self.lot_rounding))
+        
+        is_long = lots_raw > 0
+        lots = np.where(is_long, np.floor(lots_raw), np.round(lots_raw, 0))
+        cash_left = turnover - np.sum(lots * 100 * price)
+        
+        remainder = np.where(is_long, lots_raw - lots, -1.0)
+        candidates = np.argsort(-remainder, kind='mergesort')[:is_long.sum()]
+        # buy the longest affordable prefix, skip the first lot that can not be afforded, and go on
+        while len(candidates):
+            cost = np.cumsum(100 * price[candidates])
+            k = np.searchsorted(cost, cash_left, side='right')
+            lots[candidates[:k]] += 1
+            if k:
+                cash_left -= cost[k - 1]
+            candidates = candidates[k + 1:]
+        return lots * 100
+    
     def query_portfolio(self):
         positions = []
         for sec in self.ctx.pm.holding_securities:
@@ -730,7 +851,147 @@ class AlphaStrategy(Strategy, model.FuncRegisterable):
         return positions
 
 
+
+class MultiAlphaStrategy(AlphaStrategy):
+    """
+    Several alpha strategies (sleeves) sharing one data feed and one account.
+    
+    On each re-balance every sleeve constructs its weights from the same snapshot, then
+    weights are netted into one target portfolio: w = sum_k allocation_k * w_k.
+    Only the netted portfolio is traded, so opposite trades of different sleeves cancel
+    before they reach the gateway.
+    
+    Attributes
+    ----------
+    sleeves : OrderedDict of {str: AlphaStrategy}
+    allocations : dict of {str: float}
+        Ratio of capital of each sleeve. Equal by default. Capital not allocated is kept as cash.
+    sleeve_weights : dict of {str: np.ndarray}
+        Weights of each sleeve on last re-balance, aligned with ctx.universe.
+    sleeve_positions : dict of {str: dict of {int: np.ndarray}}
+        Target sizes of each sleeve on each re-balance date, as if the sleeve were traded alone
+        with its capital at close price, without lot rounding. They are used for PnL attribution.
+
+    Notes
+    -----
+    All sleeves re-balance on the schedule of this strategy (period, n_periods, days_delay).
+    Sleeves share the context, so models that read current positions (e.g. pc_method 'mc')
+    see the netted account.
+
+    """
+    def __init__(self, sleeves, allocations=None, match_method="vwap"):
+        super(MultiAlphaStrategy, self).__init__(pc_method="equal_weight", match_method=match_method)
+        
+        self.sleeves = OrderedDict(sleeves)
+        if not self.sleeves:
+            raise ValueError("At least one sleeve must be provided.")
+        if allocations is None:
+            allocations = {name: 1.0 / len(self.sleeves) for name in self.sleeves}
+        if set(allocations.keys()) != set(self.sleeves.keys()):
+            raise ValueError("allocations must have the same keys as sleeves.")
+        if min(allocations.values()) < 0 or sum(allocations.values()) > 1.0 + 1e-8:
+            raise ValueError("allocations must be non-negative and sum up to no more than 1.")
+        self.allocations = dict(allocations)
+        
+        self.sleeve_weights = dict()
+        self.sleeve_positions = {name: dict() for name in self.sleeves}
+    
+    def init_from_config(self, props):
+        super(MultiAlphaStrategy, self).init_from_config(props)
+        
+        for sleeve in self.sleeves.values():
+            sleeve.ctx = self.ctx
+            for name in ['stock_selector', 'signal_model', 'cost_model', 'risk_model']:
+                obj = getattr(sleeve, name, None)
+                if obj is not None and obj.ctx is None:
+                    obj.register_context(self.ctx)
+            sleeve.init_from_config(props)
+    
+    def portfolio_construction(self, universe_list=None):
+        """
+        Construct weights of each sleeve and net them into self.weights.
+        
+        Parameters
+        ----------
+        universe_list : list of str
+
+        """
+        weights_arr = np.zeros(len(self.ctx.universe))
+        for name, sleeve in self.sleeves.items():
+            sleeve.cash = self.cash
+            sleeve.portfolio_construction(universe_list)
+            w = np.fromiter((sleeve.weights[s] for s in self.ctx.universe), dtype=float,
+                            count=len(self.ctx.universe))
+            self.sleeve_weights[name] = w
+            weights_arr += self.allocations[name] * w
+        
+        self.weights = dict(zip(self.ctx.universe, weights_arr))
+    
+    def re_weight_suspension(self, suspensions=None):
+        """
+        Remove weights of suspended symbols and scale up others, keeping the gross weight,
+        so that cash of sleeves without positions is not invested by others.
+
+        """
+        if not suspensions:
+            return
+        
+        gross = np.sum(np.abs(list(self.weights.values())))
+        super(MultiAlphaStrategy, self).re_weight_suspension(suspensions)
+        symbols = list(self.weights.keys())
+        weights = np.fromiter(self.weights.values(), dtype=float, count=len(symbols))
+        self.weights = dict(zip(symbols, weights * gross))
+    
+    def on_after_rebalance(self, total):
+        super(MultiAlphaStrategy, self).on_after_rebalance(total)
+        
+        price = self.ctx.snapshot['close'].reindex(self.ctx.universe).values.astype(float)
+        capital = total * self.position_ratio
+        for name, w in self.sleeve_weights.items():
+            with np.errstate(divide='ignore', invalid='ignore'):
+                sizes = self.allocations[name] * capital * w / price
+            sizes[~np.isfinite(sizes)] = 0.0
+            self.sleeve_positions[name][self.ctx.trade_date] = sizes
+    
+    def get_sleeve_positions(self, name):
+        """
+        Target sizes of a sleeve on each re-balance date.
+        
+        Parameters
+        ----------
+        name : str
+
+        Returns
+        -------
+        pd.DataFrame
+            Index is trade_date, columns are symbols.
+
+        """
+        dic = self.sleeve_positions[name]
+        dates = sorted(dic.keys())
+        return pd.DataFrame(data=np.array([dic[d] for d in dates]).reshape(len(dates), len(self.ctx.universe)),
+                            index=dates, columns=self.ctx.universe)
+
+
 class EventDrivenStrategy(Strategy):
+    """
+    Event-driven strategy class.
+    
+    Attributes
+    ----------
+    symbol_independent : bool
+        Declare True in subclasses whose decisions on a symbol only depend on data and positions
+        of that symbol. Such strategies can be back-tested in symbol shards by ShardedEventBacktest.
+    lane_safe : bool
+        Declare True in subclasses whose on_tick can run concurrently for symbols of different lanes
+        of PartitionedEventEngine. Otherwise EventLiveTradeInstance serializes on_tick with all
+        other callbacks. Callbacks which update pm are always serialized by ctx.instance.lock,
+        lane-safe strategies should hold it when reading pm.
+
+    """
+    symbol_independent = False
+    lane_safe = False
+    
     def __init__(self):
         
         super(EventDrivenStrategy, self).__init__()
@@ -2,14 +2,19 @@
 
 from __future__ import print_function, unicode_literals
 
+import os
 import copy
 import time
+import heapq
+from collections import deque, defaultdict
 
 import numpy as np
 
 from jaqs.data.basic import *
 from jaqs.data.basic import OrderStatusInd, Trade, TaskInd, Task
 from jaqs.trade.tradeapi import TradeApi
+from jaqs.trade.model import TradeCostModel
+from jaqs.trade.ledger import ArchiveDict
 from jaqs.util.sequence import SequenceGenerator
 import jaqs.util as jutil
 
@@ -37,6 +42,113 @@ def calc_commission(trade_ind, commission_rate):
     return res
 
 
+def get_cost_model(ctx, commission_rate):
+    """
+    Use cost model of the strategy if it is a TradeCostModel,
+    otherwise charge commission_rate * turnover for each trade.
+    
+    """
+    strategy = getattr(ctx, 'strategy', None)
+    cost_model = getattr(strategy, 'cost_model', None)
+    if isinstance(cost_model, TradeCostModel):
+        return cost_model
+    return TradeCostModel(context=ctx, commission_rate=commission_rate)
+
+
+def add_trade_costs(trade_inds, cost_model):
+    """Calculate costs of trades in one call and store them in trade_ind.commission."""
+    if not trade_inds:
+        return
+    sizes = [ind.fill_size if common.ORDER_ACTION.is_positive(ind.entrust_action) else -ind.fill_size
+             for ind in trade_inds]
+    res = cost_model.calc_trade_cost([ind.symbol for ind in trade_inds],
+                                     [ind.fill_price for ind in trade_inds],
+                                     sizes)
+    for ind, cost in zip(trade_inds, res['total'].tolist()):
+        ind.commission = cost
+
+
+def allocate_capacity(group, size, capacity):
+    """
+    Allocate limited capacity of each group to its members in order of appearance.
+    
+    Parameters
+    ----------
+    group : np.ndarray
+        Group id of each member, eg. index of symbol and side.
+    size : np.ndarray
+        Size wanted by each member, non-negative.
+    capacity : np.ndarray
+        Capacity of the group of each member. Members of the same group must have the same capacity.
+
+    Returns
+    -------
+    res : np.ndarray
+        Size allocated to each member.
+
+    """
+    idx = np.argsort(group, kind='mergesort')
+    group_sorted = group[idx]
+    size_sorted = size[idx]
+    
+    cum_size = np.cumsum(size_sorted)
+    is_start = np.ones(len(idx), dtype=bool)
+    is_start[1:] = group_sorted[1:] != group_sorted[:-1]
+    # total size of groups before the group of each member
+    offset = np.maximum.accumulate(np.where(is_start, cum_size - size_sorted, 0))
+    size_before = cum_size - size_sorted - offset
+    
+    res = np.empty(len(idx), dtype=float)
+    res[idx] = np.clip(capacity[idx] - size_before, 0, size_sorted)
+    return res.astype(size.dtype)
+
+
+def get_capacity(participation_rate, volume):
+    """
+    Max size filled on each side of a symbol in one match.
+    
+    Parameters
+    ----------
+    participation_rate : float
+    volume : float
+        Non-finite volume (eg. NaN of a suspended symbol) means zero capacity.
+
+    Returns
+    -------
+    float
+
+    """
+    if not np.isfinite(volume):
+        return 0.0
+    return np.floor(participation_rate * volume)
+
+
+def get_time_in_force(order, default):
+    """Return time in force of an order. Empty value means default. FAK is the same as IOC."""
+    tif = order.time_in_force or default
+    if tif == common.ORDER_TIME_IN_FORCE.FAK:
+        tif = common.ORDER_TIME_IN_FORCE.IOC
+    if tif not in (common.ORDER_TIME_IN_FORCE.IOC,
+                   common.ORDER_TIME_IN_FORCE.DAY,
+                   common.ORDER_TIME_IN_FORCE.GTC):
+        raise NotImplementedError("time_in_force = {}".format(tif))
+    return tif
+
+
+def get_entrust_no_map(props):
+    """
+    Create the dict of {entrust_no: task_id} of a trade api.
+    
+    If props has 'archive_after_days', entries of finished orders will be archived
+    to archive_dir (or a temporary file), see PortfolioManager.
+
+    """
+    if props.get('archive_after_days', None) is None:
+        return dict()
+    archive_dir = props.get('archive_dir', None)
+    return ArchiveDict(None if archive_dir is None else os.path.join(archive_dir, 'entrust_no_task_id.log'))
+
+
 class BaseTradeApi(object):
     def __init__(self):
         super(BaseTradeApi, self).__init__()
@@ -642,6 +754,8 @@ class AlphaTradeApi(BaseTradeApi):
         self.seq_gen = SequenceGenerator()
 
         self.commission_rate = 0.0
+        self.cost_model = TradeCostModel()
+        self.archive_after_days = None
         
         self.MATCH_TIME = 143000
 
@@ -656,6 +770,10 @@ class AlphaTradeApi(BaseTradeApi):
 
     def init_from_config(self, props):
         self.commission_rate = props.get('commission_rate', 0.0)
+        self.cost_model = get_cost_model(self.ctx, self.commission_rate)
+        self._simulator.participation_rate = props.get('participation_rate', None)
+        self.archive_after_days = props.get('archive_after_days', None)
+        self.entrust_no_task_id_map = get_entrust_no_map(props)
         
         self.set_order_status_callback(lambda ind: self.ctx.strategy.on_order_status(ind))
         self.set_trade_callback(lambda ind: self.ctx.strategy.on_trade(ind))
@@ -668,7 +786,21 @@ class AlphaTradeApi(BaseTradeApi):
         self._simulator.on_new_day(trade_date)
 
     def on_after_market_close(self):
-        self._simulator.on_after_market_close()
+        self._expire_and_callback(self._simulator.on_after_market_close())
+        if self.archive_after_days is not None:
+            self.entrust_no_task_id_map.retire(lambda no, task_id: not self._simulator.has_order(no),
+                                               self.archive_after_days)
+    
+    def _expire_and_callback(self, order_status_inds):
+        for order_status_ind in order_status_inds:
+            self._add_task_id(order_status_ind)
+            self._order_status_callback(order_status_ind)
+            
+            task = self.ctx.pm.get_task(order_status_ind.task_id)
+            if task.is_finished:
+                task_ind = TaskInd(task.task_id, task_status=task.task_status,
+                                   task_algo='', task_msg="")
+                self._task_status_callback(task_ind)
 
     def place_order(self, security, action, price, size, algo="", algo_param={}, userdata=""):
         if size <= 0:
@@ -678,6 +810,8 @@ class AlphaTradeApi(BaseTradeApi):
         # Generate Task
         order = Order.new_order(security, action, price, size, self.ctx.trade_date, self.ctx.time,
                                 order_type=common.ORDER_TYPE.LIMIT)
+        if algo_param:
+            order.time_in_force = algo_param.get('time_in_force', "")
     
         task_id = self._get_next_task_id()
         order.task_id = task_id
@@ -738,6 +872,8 @@ class AlphaTradeApi(BaseTradeApi):
                 else:
                     raise NotImplementedError("goal_portfolio algo = {}".format(algo))
 
+                if algo_param:
+                    order.time_in_force = algo_param.get('time_in_force', "")
                 order.task_id = task_id
                 order.entrust_no = self._simulator.add_order(order)
                 orders[order.entrust_no] = order
@@ -805,16 +941,11 @@ class AlphaTradeApi(BaseTradeApi):
         return self._simulator.match(price_dict, date=self.ctx.trade_date, time=time)
 
     '''
-    def _add_commission(self, ind):
-        comm = calc_commission(ind, self.commission_rate)
-        ind.commission = comm
-        
     def match_and_callback(self, price_dict):
         results = self._simulator.match(price_dict, date=self.ctx.trade_date, time=self.MATCH_TIME)
+        add_trade_costs([trade_ind for trade_ind, _ in results], self.cost_model)
 
         for trade_ind, order_status_ind in results:
-            self._add_commission(trade_ind)
-        
             task_id = self.entrust_no_task_id_map[trade_ind.entrust_no]
             self._add_task_id(trade_ind)
             self._add_task_id(order_status_ind)
@@ -827,24 +958,37 @@ class AlphaTradeApi(BaseTradeApi):
                 task_ind = TaskInd(task_id, task_status=task.task_status,
                                    task_algo='', task_msg="")
                 self._task_status_callback(task_ind)
+        
+        self._expire_and_callback(self._simulator.expire_orders(common.ORDER_TIME_IN_FORCE.IOC))
 
         return results
 
 
 class DailyStockSimulator(object):
     """This is not event driven!
+    
+    Orders are matched against daily prices. Un-filled orders are carried to the next match
+    until they are filled, cancelled or expired according to time in force:
+    GTC (default) never expires, DAY expires after market close, IOC expires after one match.
 
     Attributes
     ----------
-    __orders : list of Order
+    __orders : dict of {entrust_no: Order}
         Store orders that have not been filled.
+    _symbol_orders : dict of {symbol: dict of {entrust_no: Order}}
+        The same orders indexed by symbol, so that prices of a symbol are looked up once per match.
+    participation_rate : float or None
+        If not None, filled size of each symbol on each side in one match is capped at
+        participation_rate * volume. None means no limit.
 
     """
     
     def __init__(self):
-        # TODO heap is better for insertion and deletion. We only need implement search of heapq module.
         self.__orders = dict()
+        self._symbol_orders = dict()
+        self._tif_orders = defaultdict(list)
         self.seq_gen = SequenceGenerator()
+        self.participation_rate = None
         
         self.date = 0
         self.time = 0
@@ -853,11 +997,46 @@ class DailyStockSimulator(object):
         self.date = trade_date
     
     def on_after_market_close(self):
+        """
+        Expire orders of time in force DAY.
+        
+        Returns
+        -------
+        res : list of OrderStatusInd
+
+        """
         # self._refresh_orders() #TODO sometimes we do not want to refresh (multi-days match)
-        pass
+        res = self.expire_orders(common.ORDER_TIME_IN_FORCE.DAY)
+        
+        # drop finished orders from the list of GTC orders
+        gtc = common.ORDER_TIME_IN_FORCE.GTC
+        self._tif_orders[gtc] = [no for no in self._tif_orders[gtc] if no in self.__orders]
+        return res
+    
+    def has_order(self, entrust_no):
+        """Whether an order is still open in the simulator."""
+        return entrust_no in self.__orders
     
     def _refresh_orders(self):
         self.__orders.clear()
+        self._symbol_orders.clear()
+        self._tif_orders.clear()
+    
+    def expire_orders(self, time_in_force):
+        """
+        Cancel all remaining orders of a given time in force.
+        
+        Returns
+        -------
+        res : list of OrderStatusInd
+
+        """
+        res = []
+        for entrust_no in self._tif_orders.pop(time_in_force, []):
+            if entrust_no in self.__orders:
+                order_status_ind, _ = self.cancel_order(entrust_no)
+                res.append(order_status_ind)
+        return res
     
     def _next_fill_no(self):
         return str(np.int64(self.date) * 10000 + self.seq_gen.get_next('fill_no'))
@@ -901,6 +1080,8 @@ class DailyStockSimulator(object):
         neworder.entrust_no = entrust_no
 
         self.__orders[entrust_no] = neworder
+        self._symbol_orders.setdefault(neworder.symbol, dict())[entrust_no] = neworder
+        self._tif_orders[get_time_in_force(neworder, common.ORDER_TIME_IN_FORCE.GTC)].append(entrust_no)
         return entrust_no
     
     def cancel_order(self, entrust_no):
@@ -922,6 +1103,7 @@ class DailyStockSimulator(object):
             err_msg = "No order with entrust_no {} in simulator.".format(entrust_no)
             order_status_ind = None
         else:
+            self._remove_from_symbol_orders(order)
             order.cancel_size = order.entrust_size - order.fill_size
             order.order_status = common.ORDER_STATUS.CANCELLED
             
@@ -929,30 +1111,70 @@ class DailyStockSimulator(object):
             order_status_ind = OrderStatusInd(order)
         return order_status_ind, err_msg
     
+    def _remove_from_symbol_orders(self, order):
+        symbol_orders = self._symbol_orders[order.symbol]
+        symbol_orders.pop(order.entrust_no, None)
+        if not symbol_orders:
+            self._symbol_orders.pop(order.symbol)
+    
+    @staticmethod
+    def _get_fill_price(order, symbol_dic):
+        if isinstance(order, FixedPriceTypeOrder):
+            price_target = order.price_target
+            return symbol_dic[price_target]
+        elif isinstance(order, VwapOrder):
+            if order.start != -1:
+                raise NotImplementedError("Vwap of a certain time range")
+            return symbol_dic['vwap']
+        elif isinstance(order, Order):
+            # TODO
+            return symbol_dic['close']
+        else:
+            raise NotImplementedError("order class {} not support!".format(order.__class__))
+    
     def match(self, price_dic, date=19700101, time=150000):
+        """
+        Match all orders. If participation_rate is set, orders of the same symbol and side
+        share the capacity in order of arrival; the rest is left for the next match.
+        
+        Returns
+        -------
+        results : list of tuple
+            (Trade, OrderStatusInd) of orders that are (partially) filled.
+
+        """
         self._validate_price(price_dic)
         
-        results = []
-        for order in self.__orders.values():
-            symbol = order.symbol
+        orders = []
+        fill_price_list = []
+        group_list = []
+        capacity_list = []
+        for i, (symbol, symbol_orders) in enumerate(self._symbol_orders.items()):
             symbol_dic = price_dic[symbol]
-            
-            # get fill price
-            if isinstance(order, FixedPriceTypeOrder):
-                price_target = order.price_target
-                fill_price = symbol_dic[price_target]
-            elif isinstance(order, VwapOrder):
-                if order.start != -1:
-                    raise NotImplementedError("Vwap of a certain time range")
-                fill_price = symbol_dic['vwap']
-            elif isinstance(order, Order):
-                # TODO
-                fill_price = symbol_dic['close']
+            if self.participation_rate is None:
+                capacity = np.inf
             else:
-                raise NotImplementedError("order class {} not support!".format(order.__class__))
+                capacity = get_capacity(self.participation_rate, symbol_dic['volume'])
             
-            # get fill size
-            fill_size = order.entrust_size - order.fill_size
+            for order in symbol_orders.values():
+                orders.append(order)
+                fill_price_list.append(self._get_fill_price(order, symbol_dic))
+                group_list.append(2 * i + common.ORDER_ACTION.is_positive(order.entrust_action))
+                capacity_list.append(capacity)
+        if not orders:
+            return []
+        
+        # get fill size
+        fill_size_list = [order.entrust_size - order.fill_size for order in orders]
+        if self.participation_rate is not None:
+            fill_size_list = allocate_capacity(np.array(group_list), np.array(fill_size_list),
+                                               np.array(capacity_list)).tolist()
+        
+        results = []
+        finished = []
+        for order, fill_price, fill_size in zip(orders, fill_price_list, fill_size_list):
+            if fill_size <= 0:
+                continue
             
             # create trade indication
             trade_ind = Trade(order)
@@ -967,13 +1189,15 @@ class DailyStockSimulator(object):
             order.fill_size += fill_size
             if order.fill_size == order.entrust_size:
                 order.order_status = common.ORDER_STATUS.FILLED
+                finished.append(order)
                 
             order_status_ind = OrderStatusInd(order)
             
             results.append((trade_ind, order_status_ind))
         
-        self.__orders = {k: v for k, v in self.__orders.items() if not v.is_finished}
-        # self.cancel_order(order.entrust_no)  # TODO DEBUG
+        for order in finished:
+            self.__orders.pop(order.entrust_no)
+            self._remove_from_symbol_orders(order)
         
         return results
 
@@ -981,12 +1205,185 @@ class DailyStockSimulator(object):
 # ---------------------------------------------
 # For Event-driven Strategy
 
+class RestingOrder(object):
+    """
+    An order waiting in SymbolOrderBook.
+    
+    Attributes
+    ----------
+    order : Order
+    seq : int
+        Arrival sequence, used for time priority.
+    queue_ahead : float or None
+        Estimated market volume queued before this order at the same price.
+        None means unknown (the price level has not been at top of book since the order arrived).
+    
+    """
+    __slots__ = ['order', 'seq', 'queue_ahead']
+    
+    def __init__(self, order, seq):
+        self.order = order
+        self.seq = seq
+        self.queue_ahead = None
+    
+    @property
+    def remaining(self):
+        return self.order.entrust_size - self.order.fill_size
+
+
+class BookSide(object):
+    """
+    Resting orders on one side (bid or ask) of a symbol.
+    
+    Price levels are kept in a heap whose key is -price for bids and price for asks,
+    so the best level is always on top. Orders of the same level are kept in arrival order.
+    Finished (filled or cancelled) orders are removed lazily when their level is visited.
+    
+    """
+    def __init__(self, is_bid):
+        self.is_bid = is_bid
+        self._heap = []
+        self._levels = dict()
+    
+    def _key(self, price):
+        return -price if self.is_bid else price
+    
+    def price_of_key(self, key):
+        return -key if self.is_bid else key
+    
+    def add(self, resting, price):
+        key = self._key(price)
+        level = self._levels.get(key, None)
+        if level is None:
+            level = deque()
+            self._levels[key] = level
+            heapq.heappush(self._heap, key)
+        level.append(resting)
+    
+    def get_level(self, price):
+        return self._levels.get(self._key(price), None)
+    
+    def _clean_level(self, key):
+        """Remove finished orders in front of a level. Return the level, or None if it is empty."""
+        level = self._levels.get(key, None)
+        while level and level[0].order.is_finished:
+            level.popleft()
+        if not level:
+            self._levels.pop(key, None)
+            return None
+        return level
+    
+    def best_key(self):
+        """Key of the best level with unfinished orders, None if this side is empty."""
+        while self._heap:
+            key = self._heap[0]
+            if self._clean_level(key) is not None:
+                return key
+            heapq.heappop(self._heap)
+        return None
+    
+    def iter_crossing_levels(self, limit_price):
+        """
+        Iterate (price, level) from the best level while price is not worse than limit_price.
+        Only crossing levels are visited: cost is O(k log n) for k crossing levels.
+        
+        """
+        popped = []
+        try:
+            while True:
+                key = self.best_key()
+                if key is None or key > self._key(limit_price):
+                    break
+                popped.append(heapq.heappop(self._heap))
+                yield self.price_of_key(key), self._levels[key]
+        finally:
+            for key in popped:
+                if self._clean_level(key) is not None:
+                    heapq.heappush(self._heap, key)
+
+
+class SymbolOrderBook(object):
+    """
+    Resting orders of a single symbol, indexed by price level on bid and ask side.
+    
+    Market orders rest at price +inf (bid) or -inf (ask) so they always have the highest priority.
+    Stop orders wait in separate trigger queues: buy stops ordered by ascending stop price,
+    sell stops by descending stop price. VWAP orders are not priced and are kept in arrival order.
+    
+    Attributes
+    ----------
+    n_open : int
+        Number of unfinished orders of this symbol.
+    
+    """
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = BookSide(is_bid=True)
+        self.asks = BookSide(is_bid=False)
+        self.stop_buys = BookSide(is_bid=False)
+        self.stop_sells = BookSide(is_bid=True)
+        self.vwaps = deque()
+        self.last_volume = None
+        self.n_open = 0
+    
+    def add(self, resting):
+        order = resting.order
+        self.n_open += 1
+        
+        is_buy = common.ORDER_ACTION.is_positive(order.entrust_action)
+        if order.order_type == common.ORDER_TYPE.VWAP:
+            self.vwaps.append(resting)
+            return
+        elif order.order_type == common.ORDER_TYPE.STOP:
+            side = self.stop_buys if is_buy else self.stop_sells
+            price = order.entrust_price
+        elif order.order_type == common.ORDER_TYPE.MARKET:
+            side = self.bids if is_buy else self.asks
+            price = np.inf if is_buy else -np.inf
+        else:
+            side = self.bids if is_buy else self.asks
+            price = order.entrust_price
+        side.add(resting, price)
+    
+    def trigger_stops(self, last):
+        """Move stop orders triggered by price last to the book as market orders."""
+        for _, level in self.stop_buys.iter_crossing_levels(last):
+            for resting in level:
+                if not resting.order.is_finished:
+                    self.bids.add(resting, np.inf)
+            level.clear()
+        for _, level in self.stop_sells.iter_crossing_levels(last):
+            for resting in level:
+                if not resting.order.is_finished:
+                    self.asks.add(resting, -np.inf)
+            level.clear()
+
+
 class OrderBook(object):
+    """
+    Simulated exchange for event-driven backtest.
+    
+    Besides the dict of all resting orders, orders are also indexed per symbol by price level
+    (SymbolOrderBook), so that a bar or tick only visits symbols with orders and price levels
+    that can be matched: cost scales with number of fills, not with size of the book.
+    
+    Un-filled orders are kept until they are filled, cancelled or expired according to time in force:
+    DAY (default) expires after market close, GTC never expires, IOC expires after one match.
+    
+    Attributes
+    ----------
+    participation_rate : float or None
+        If not None, filled size of each symbol on each side in one bar is capped at
+        participation_rate * bar volume. None means no limit.
+    
+    """
     def __init__(self):
         self.orders = dict()
+        self._books = dict()
+        self._tif_orders = defaultdict(list)
         
         self.seq_gen = SequenceGenerator()
-        self.participation_rate = 1.0
+        self.participation_rate = None
     
     def _next_fill_no(self):
         return str(self.seq_gen.get_next('trade_id'))
@@ -994,6 +1391,13 @@ class OrderBook(object):
     def _next_order_entrust_no(self):
         return str(self.seq_gen.get_next('order_id'))
     
+    def _get_book(self, symbol):
+        book = self._books.get(symbol, None)
+        if book is None:
+            book = SymbolOrderBook(symbol)
+            self._books[symbol] = book
+        return book
+    
     def add_order(self, order):
         neworder = copy.copy(order)
         
@@ -1001,16 +1405,166 @@ class OrderBook(object):
         neworder.entrust_no = entrust_no
         
         self.orders[entrust_no] = neworder
+        self._get_book(neworder.symbol).add(RestingOrder(neworder, self.seq_gen.get_next('resting_seq')))
+        self._tif_orders[get_time_in_force(neworder, common.ORDER_TIME_IN_FORCE.DAY)].append(entrust_no)
         
         return entrust_no
     
-    def _make_tick_trade(self, quote):
-        raise NotImplementedError()
+    def on_new_day(self, trade_date):
+        # cumulative volume of ticks starts from 0 every day
+        for book in self._books.values():
+            book.last_volume = None
+        
+        # drop finished orders from the lists of orders by time in force
+        for tif, entrust_nos in self._tif_orders.items():
+            self._tif_orders[tif] = [no for no in entrust_nos if no in self.orders]
+    
+    def expire_orders(self, time_in_force):
+        """
+        Cancel all remaining orders of a given time in force.
+        
+        Returns
+        -------
+        res : list of OrderStatusInd
+
+        """
+        return [self.cancel_order(entrust_no) for entrust_no in self._tif_orders.pop(time_in_force, [])
+                if entrust_no in self.orders]
+    
+    def _fill_order(self, order, fill_price, fill_size, quote):
+        """Fill (part of) an order, return trade indication and order status indication."""
+        trade_ind = Trade(order)
+        trade_ind.set_fill_info(fill_price, fill_size,
+                                quote.date, quote.time,
+                                self._next_fill_no(),
+                                trade_date=quote.trade_date)
+        
+        order.fill_price = ((order.fill_price * order.fill_size + fill_size * fill_price)
+                            / (order.fill_size + fill_size))
+        order.fill_size += fill_size
+        if order.fill_size == order.entrust_size:
+            order.order_status = common.ORDER_STATUS.FILLED
+            self.orders.pop(order.entrust_no, None)
+            self._books[order.symbol].n_open -= 1
+        
+        order_status_ind = OrderStatusInd(order)
+        return trade_ind, order_status_ind
+    
+    @staticmethod
+    def _update_queue_ahead(side, top_price, top_volume):
+        """Estimate queue position of orders whose price level just reached (or is better than) top of book."""
+        key = side.best_key()
+        if key is None:
+            return
+        best_price = side.price_of_key(key)
+        if best_price != top_price and (best_price > top_price) != side.is_bid:
+            # our best order is worse than top of book, no order can be at top
+            return
+        
+        # orders better than market top have nothing ahead
+        for price, level in side.iter_crossing_levels(top_price):
+            queue_ahead = top_volume if price == top_price else 0.0
+            for resting in level:
+                if resting.queue_ahead is None:
+                    resting.queue_ahead = queue_ahead
+    
+    def _match_aggressive(self, side, price, volume, quote, result):
+        """Match orders of side whose price crosses price, against at most volume of the opposite top of book."""
+        if not (price > 0 and volume > 0):
+            return
+        for _, level in side.iter_crossing_levels(price):
+            for resting in level:
+                order = resting.order
+                if order.is_finished:
+                    continue
+                fill_size = min(resting.remaining, volume)
+                result.append(self._fill_order(order, price, fill_size, quote))
+                volume -= fill_size
+                if volume <= 0:
+                    return
+    
+    def _match_passive(self, side, last, volume, quote, result):
+        """Allocate traded volume at price last to resting limit orders of side, in price-time priority."""
+        if not (last > 0 and volume > 0):
+            return
+        for price, level in side.iter_crossing_levels(last):
+            if np.isinf(price):
+                # market orders only match against the opposite top of book
+                continue
+            for resting in level:
+                order = resting.order
+                if order.is_finished:
+                    continue
+                if price == last:
+                    if resting.queue_ahead is None:
+                        # queue position is unknown until a quote shows our price level at top of book
+                        continue
+                    queue_ahead = resting.queue_ahead
+                    resting.queue_ahead = max(queue_ahead - volume, 0.0)
+                    available = volume - queue_ahead
+                else:
+                    # market traded through our price
+                    available = volume
+                if available <= 0:
+                    continue
+                fill_size = min(resting.remaining, available)
+                result.append(self._fill_order(order, order.entrust_price, fill_size, quote))
+                volume -= fill_size
+                if volume <= 0:
+                    return
+    
+    def _make_tick_trade(self, quote_dic):
+        """
+        Match resting orders against ticks.
+        
+        For each tick (Quote) of a symbol that has resting orders:
+            0. Stop orders triggered by last price become market orders.
+            1. Buy orders with price >= ask price are filled at ask price, up to ask volume.
+               Sell orders are matched against bid price/volume in the same way.
+            2. Volume traded since last tick (at last price) is allocated to remaining limit orders
+               whose price is equal to or better than last price. Orders at last price must first wait
+               for the market volume queued before them, which is estimated from top of book volume
+               when their price level reaches top of book.
+        Orders are visited in price-time priority and may be partially filled.
+        
+        Parameters
+        ----------
+        quote_dic : dict of {symbol: Quote}
+
+        Returns
+        -------
+        result : list of tuple
+            (Trade, OrderStatusInd)
+
+        """
+        result = []
+        for symbol, quote in quote_dic.items():
+            book = self._books.get(symbol, None)
+            if book is None:
+                continue
+            
+            last_volume = book.last_volume
+            book.last_volume = quote.volume
+            traded_volume = quote.volume - last_volume if last_volume is not None else 0.0
+            
+            if book.n_open == 0:
+                continue
+            
+            book.trigger_stops(quote.last)
+            self._match_aggressive(book.bids, quote.askprice1, quote.askvolume1, quote, result)
+            self._match_aggressive(book.asks, quote.bidprice1, quote.bidvolume1, quote, result)
+            
+            self._update_queue_ahead(book.bids, quote.bidprice1, quote.bidvolume1)
+            self._update_queue_ahead(book.asks, quote.askprice1, quote.askvolume1)
+            
+            self._match_passive(book.bids, quote.last, traded_volume, quote, result)
+            self._match_passive(book.asks, quote.last, traded_volume, quote, result)
+        
+        return result
     
     def make_trade(self, quote, freq):
         
         if freq == common.QUOTE_TYPE.TICK:
-            # TODO
             return self._make_tick_trade(quote)
         
         elif (freq == common.QUOTE_TYPE.MIN
@@ -1023,137 +1577,85 @@ class OrderBook(object):
             return self._make_trade_bar(quote)
     
     def _make_trade_bar(self, quote_dic):
+        """
+        Match resting orders against bars.
         
-        result = []
+        Limit buy orders with price >= low are filled at min(price, high),
+        limit sell orders with price <= high are filled at max(price, low).
+        Buy stop orders with price <= high are filled at max(price, low),
+        sell stop orders with price >= low are filled at min(price, high).
+        Market orders are filled at high (buy) or low (sell). VWAP orders are filled at vwap.
+        If participation_rate is set, orders of one side share the capacity of the bar
+        in price-time priority and the rest is left for the following bars.
         
-        for entrust_no, order in self.orders.items():
-            quote = quote_dic[order.symbol]
-            low = quote.low
-            high = quote.high
-            #quote_date = quote.trade_date
-            quote_date = quote.date
-            quote_time = quote.time
-            volume = quote.volume
-            
-            '''
-            if order.order_type == common.ORDER_TYPE.LIMIT:
-                if order.entrust_action == common.ORDER_ACTION.BUY and order.entrust_price >= low:
-                    trade = Trade()
-                    trade.init_from_order(order)
-                    trade.send_fill_info(order.entrust_price, order.entrust_size,
-                                         quote_date, quote_time,
-                                         self._next_fill_no())
-                    
-                    order.order_status = common.ORDER_STATUS.FILLED
-                    order.fill_size = trade.fill_size
-                    order.fill_price = trade.fill_price
-                    
-                    orderstatus_ind = OrderStatusInd()
-                    orderstatus_ind.init_from_order(order)
-                    
-                    result.append((trade, orderstatus_ind))
-                    
-                elif order.entrust_action == common.ORDER_ACTION.SELL and order.entrust_price <= high:
-                    trade = Trade()
-                    trade.init_from_order(order)
-                    trade.send_fill_info(order.entrust_price, order.entrust_size,
-                                         quote_date, quote_time,
-                                         self._next_fill_no())
-                    
-                    order.order_status = common.ORDER_STATUS.FILLED
-                    order.fill_size = trade.fill_size
-                    order.fill_price = trade.fill_price
-                    
-                    orderstatus_ind = OrderStatusInd()
-                    orderstatus_ind.init_from_order(order)
-
-                    result.append((trade, orderstatus_ind))
-            
-            elif order.order_type == common.ORDER_TYPE.STOP:
-                if order.entrust_action == common.ORDER_ACTION.BUY and order.entrust_price <= high:
-                    trade = Trade()
-                    trade.init_from_order(order)
-                    trade.send_fill_info(order.entrust_price, order.entrust_size,
-                                         quote_date, quote_time,
-                                         self._next_fill_no())
-                    
-                    order.order_status = common.ORDER_STATUS.FILLED
-                    order.fill_size = trade.fill_size
-                    order.fill_price = trade.fill_price
-                    orderstatus_ind = OrderStatusInd()
-                    orderstatus_ind.init_from_order(order)
-                    result.append((trade, orderstatus_ind))
-                
-                if order.entrust_action == common.ORDER_ACTION.SELL and order.entrust_price >= low:
-                    trade = Trade()
-                    trade.init_from_order(order)
-                    trade.send_fill_info(order.entrust_price, order.entrust_size,
-                                         quote_date, quote_time,
-                                         self._next_fill_no())
-                    
-                    order.order_status = common.ORDER_STATUS.FILLED
-                    order.fill_size = trade.fill_size
-                    order.fill_price = trade.fill_price
-                    orderstatus_ind = OrderStatusInd()
-                    orderstatus_ind.init_from_order(order)
-                    result.append((trade, orderstatus_ind))
-            '''
-            
-            entrust_price = order.entrust_price
-            entrust_size = order.entrust_size
-            
-            fill_size = 0
-            if order.order_type == common.ORDER_TYPE.LIMIT:
-                if common.ORDER_ACTION.is_positive(order.entrust_action) and entrust_price >= low:
-                    fill_price = min(entrust_price, high)
-                    # fill_size = min(entrust_size, self.participation_rate * volume)
-                    fill_size = entrust_size
-                    
-                elif common.ORDER_ACTION.is_negative(order.entrust_action) and order.entrust_price <= high:
-                    fill_price = max(entrust_price, low)
-                    # fill_size = min(entrust_size, self.participation_rate * volume)
-                    fill_size = entrust_size
-
-            elif order.order_type == common.ORDER_TYPE.STOP:
-                if common.ORDER_ACTION.is_positive(order.entrust_action) and order.entrust_price <= high:
-                    fill_price = max(entrust_price, low)
-                    # fill_size = min(entrust_size, self.participation_rate * volume)
-                    fill_size = entrust_size
-
-                if common.ORDER_ACTION.is_negative(order.entrust_action) and order.entrust_price >= low:
-                    fill_price = min(entrust_price, high)
-                    # fill_size = min(entrust_size, self.participation_rate * volume)
-                    fill_size = entrust_size
-            
-            elif order.order_type == common.ORDER_TYPE.VWAP:
-                fill_price = quote.vwap
-                fill_size = entrust_size
+        Parameters
+        ----------
+        quote_dic : dict of {symbol: Bar}
+
+        Returns
+        -------
+        result : list of tuple
+            (Trade, OrderStatusInd)
 
-            if not fill_size:
+        """
+        result = []
+        
+        for symbol, book in self._books.items():
+            if book.n_open == 0 or symbol not in quote_dic:
                 continue
-                
-            trade_ind = Trade(order)
-            trade_ind.set_fill_info(fill_price, fill_size,
-                                    quote_date, quote_time,
-                                    self._next_fill_no(),
-                                    trade_date=quote.trade_date)
-            
-            order.fill_price = ((order.fill_price * order.fill_size + fill_size * fill_price)
-                                / (order.fill_size + fill_size))
-            order.fill_size += fill_size
-            if order.fill_size == order.entrust_size:
-                order.order_status = common.ORDER_STATUS.FILLED
+            quote = quote_dic[symbol]
+            low, high = quote.low, quote.high
+            if self.participation_rate is None:
+                capacity = np.inf
+            else:
+                capacity = get_capacity(self.participation_rate, quote.volume)
+            # capacity left of buy side (True) and sell side (False)
+            capacity_dic = {True: capacity, False: capacity}
             
-            order_status_ind = OrderStatusInd(order)
+            for price, level in book.bids.iter_crossing_levels(low):
+                self._fill_level(level, min(price, high), capacity_dic, quote, result)
+                if capacity_dic[True] <= 0:
+                    break
+            for price, level in book.asks.iter_crossing_levels(high):
+                self._fill_level(level, max(price, low), capacity_dic, quote, result)
+                if capacity_dic[False] <= 0:
+                    break
             
-            result.append((trade_ind, order_status_ind))
+            for price, level in book.stop_buys.iter_crossing_levels(high):
+                self._fill_level(level, max(price, low), capacity_dic, quote, result)
+                if capacity_dic[True] <= 0:
+                    break
+            for price, level in book.stop_sells.iter_crossing_levels(low):
+                self._fill_level(level, min(price, high), capacity_dic, quote, result)
+                if capacity_dic[False] <= 0:
+                    break
             
-        self.orders = {k: v for k, v in self.orders.items() if not v.is_finished}
-
+            if book.vwaps:
+                self._fill_level(book.vwaps, quote.vwap, capacity_dic, quote, result)
+                book.vwaps = deque(resting for resting in book.vwaps if not resting.order.is_finished)
+        
         return result
     
+    def _fill_level(self, level, fill_price, capacity_dic, quote, result):
+        """
+        Fill unfinished orders of a price level at fill_price, in arrival order, within capacity.
+        
+        """
+        for resting in level:
+            order = resting.order
+            if order.is_finished:
+                continue
+            is_buy = common.ORDER_ACTION.is_positive(order.entrust_action)
+            capacity = capacity_dic[is_buy]
+            if capacity <= 0:
+                continue
+            fill_size = min(resting.remaining, capacity)
+            capacity_dic[is_buy] = capacity - fill_size
+            result.append(self._fill_order(order, fill_price, fill_size, quote))
+    
     def cancel_order(self, entrust_no):
         order = self.orders.pop(entrust_no)
+        self._books[order.symbol].n_open -= 1
         order.cancel_size = order.entrust_size - order.fill_size
         order.order_status = common.ORDER_STATUS.CANCELLED
         
@@ -1209,6 +1711,8 @@ class BacktestTradeApi(BaseTradeApi):
         self.entrust_no_task_id_map = dict()
         
         self.commission_rate = 0.0
+        self.cost_model = TradeCostModel()
+        self.archive_after_days = None
         
     def _get_next_num(self, key):
         """used to generate id for orders and trades."""
@@ -1219,13 +1723,35 @@ class BacktestTradeApi(BaseTradeApi):
     
     def init_from_config(self, props):
         self.commission_rate = props.get('commission_rate', 0.0)
+        self.cost_model = get_cost_model(self.ctx, self.commission_rate)
+        self._orderbook.participation_rate = props.get('participation_rate', None)
+        self.archive_after_days = props.get('archive_after_days', None)
+        self.entrust_no_task_id_map = get_entrust_no_map(props)
         
         self.set_order_status_callback(lambda ind: self.ctx.strategy.on_order_status(ind))
         self.set_trade_callback(lambda ind: self.ctx.strategy.on_trade(ind))
         self.set_task_status_callback(lambda ind: self.ctx.strategy.on_task_status(ind))
 
     def on_new_day(self, trade_date):
-        self._orderbook = OrderBook()
+        self._orderbook.on_new_day(trade_date)
+    
+    def on_after_market_close(self):
+        self._expire_and_callback(self._orderbook.expire_orders(common.ORDER_TIME_IN_FORCE.DAY))
+        if self.archive_after_days is not None:
+            self.entrust_no_task_id_map.retire(lambda no, task_id: no not in self._orderbook.orders,
+                                               self.archive_after_days)
+    
+    def _expire_and_callback(self, order_status_inds):
+        for order_status_ind in order_status_inds:
+            task_id = self.entrust_no_task_id_map[order_status_ind.entrust_no]
+            order_status_ind.task_id = task_id
+            self._order_status_callback(order_status_ind)
+            
+            task = self.ctx.pm.get_task(task_id)
+            if task.is_finished:
+                task_ind = TaskInd(task_id, task_status=task.task_status,
+                                   task_algo='', task_msg="")
+                self._task_status_callback(task_ind)
     
     def use_strategy(self, strategy_id):
         pass
@@ -1238,10 +1764,14 @@ class BacktestTradeApi(BaseTradeApi):
         # Generate Order
         if algo == 'vwap':
             order_type = common.ORDER_TYPE.VWAP
+        elif algo == 'market':
+            order_type = common.ORDER_TYPE.MARKET
         else:
             order_type = common.ORDER_TYPE.LIMIT
         order = Order.new_order(security, action, price, size, self.ctx.trade_date, self.ctx.time,
                                 order_type=order_type)
+        if algo_param:
+            order.time_in_force = algo_param.get('time_in_force', "")
 
         # Generate Task
         task_id = self._get_next_task_id()
@@ -1301,16 +1831,11 @@ class BacktestTradeApi(BaseTradeApi):
         ind.task_id = task_id
         # ind.task_no = task_id
     
-    def _add_commission(self, ind):
-        comm = calc_commission(ind, self.commission_rate)
-        ind.commission = comm
-        
     def match_and_callback(self, quote, freq):
         results = self._process_quote(quote, freq)
+        add_trade_costs([trade_ind for trade_ind, _ in results], self.cost_model)
         
         for trade_ind, order_status_ind in results:
-            self._add_commission(trade_ind)
-            
             # self._add_task_id(trade_ind)
             # self._add_task_id(order_status_ind)
             task_id = self.entrust_no_task_id_map[trade_ind.entrust_no]
@@ -1324,5 +1849,7 @@ class BacktestTradeApi(BaseTradeApi):
                                    task_algo='', task_msg="")
                 self._task_status_callback(task_ind)
         
+        self._expire_and_callback(self._orderbook.expire_orders(common.ORDER_TIME_IN_FORCE.IOC))
+        
         return results
 
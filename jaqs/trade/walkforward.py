@@ -0,0 +1,504 @@
+# encoding: utf-8
+"""
+Walk-forward (rolling window) optimization of alpha strategies.
+
+The date range of a DataView is split into consecutive (train, test) windows.
+On each train window every parameter set of a grid is back-tested and scored,
+the best one is then applied on the following test window. Out-of-sample
+trades of all test windows are stitched into one result which can be
+analyzed by AlphaAnalyzer just like the result of a single backtest.
+
+"""
+
+from __future__ import print_function, unicode_literals
+import os
+import itertools
+import multiprocessing
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from jaqs.trade import common
+from jaqs.trade import model
+from jaqs.trade.backtest import AlphaBacktestInstance
+from jaqs.trade.tradegateway import AlphaTradeApi, get_cost_model
+from jaqs.trade.portfoliomanager import PortfolioManager
+import jaqs.util as jutil
+
+
+WALK_FORWARD_LIQUIDATE_NO = 303030
+WALK_FORWARD_LIQUIDATE_TIME = 150000
+
+
+def expand_param_grid(param_grid):
+    """
+    Expand a parameter grid to a list of parameter sets.
+
+    Parameters
+    ----------
+    param_grid : dict
+        {param_name: list of candidate values}
+
+    Returns
+    -------
+    list of dict
+        Cartesian product of candidate values, keys are iterated in sorted order.
+
+    """
+    if not param_grid:
+        return [dict()]
+
+    keys = sorted(param_grid.keys())
+    values_list = [list(param_grid[k]) for k in keys]
+    return [dict(zip(keys, values)) for values in itertools.product(*values_list)]
+
+
+def split_windows(dates, train_days, test_days, step_days=None):
+    """
+    Split trade dates into rolling (train, test) windows.
+
+    Backtest starts trading on the trade date after props['start_date'], so
+    the start date of each window is the last trade date before its first trading day.
+
+    Parameters
+    ----------
+    dates : array-like of int
+        Sorted trade dates.
+    train_days : int
+        Number of trading days of each train window.
+    test_days : int
+        Number of trading days of each test window.
+    step_days : int, optional
+        Number of trading days between two windows. Default test_days,
+        which means test windows are consecutive and do not overlap.
+        Must not be less than test_days, otherwise test windows overlap and
+        out-of-sample PnL of the overlapping dates would be counted twice.
+
+    Returns
+    -------
+    list of dict
+        Keys: train_start, train_end, test_start, test_end.
+
+    """
+    if step_days is None:
+        step_days = test_days
+    if train_days <= 0 or test_days <= 0 or step_days <= 0:
+        raise ValueError("train_days, test_days and step_days must be positive.")
+    if step_days < test_days:
+        raise ValueError("step_days ({:d}) must not be less than test_days ({:d}).".format(step_days, test_days))
+
+    dates = np.asarray(dates)
+    res = []
+    i = 0
+    while i + train_days + test_days < len(dates):
+        res.append({'train_start': int(dates[i]),
+                    'train_end': int(dates[i + train_days]),
+                    'test_start': int(dates[i + train_days]),
+                    'test_end': int(dates[i + train_days + test_days])})
+        i += step_days
+    return res
+
+
+def calc_daily_pnl(df_trades, df_close, init_balance):
+    """
+    Calculate daily PnL of a backtest from its trades, marked to close prices.
+
+    Parameters
+    ----------
+    df_trades : pd.DataFrame
+        Same format as trades.csv.
+    df_close : pd.DataFrame
+        Index is trade_date, columns are symbols.
+    init_balance : float
+
+    Returns
+    -------
+    pd.Series
+        Daily PnL, index is trade_date. The first date is the base date, whose PnL is 0.
+
+    """
+    dates = df_close.index
+    df_close = df_close.fillna(method='ffill').fillna(0.0)
+    if df_trades is None or df_trades.empty:
+        return pd.Series(data=0.0, index=dates)
+
+    df = df_trades.loc[df_trades['symbol'].isin(df_close.columns)]
+    sign = np.where(df['entrust_action'].map(common.ORDER_ACTION.is_positive), 1.0, -1.0)
+    df = pd.DataFrame({'trade_date': df['fill_date'].values,
+                       'symbol': df['symbol'].values,
+                       'size': sign * df['fill_size'].values,
+                       'turnover': sign * df['fill_size'].values * df['fill_price'].values,
+                       'commission': df['commission'].values})
+
+    pos_change = df.pivot_table(index='trade_date', columns='symbol', values='size', aggfunc=np.sum)
+    pos_change = pos_change.reindex(index=dates, columns=df_close.columns).fillna(0.0)
+    pos = pos_change.cumsum()
+
+    cash_flow = df.groupby('trade_date')[['turnover', 'commission']].sum()
+    cash_flow = cash_flow.reindex(index=dates).fillna(0.0)
+    cash = init_balance - (cash_flow['turnover'] + cash_flow['commission']).cumsum()
+
+    equity = (pos.values * df_close.values).sum(axis=1) + cash.values
+    pnl = np.diff(np.concatenate([[init_balance], equity]))
+    return pd.Series(data=pnl, index=dates)
+
+
+def calc_objective(daily_return, objective='sharpe'):
+    """
+    Score daily returns of a backtest.
+
+    Parameters
+    ----------
+    daily_return : pd.Series
+    objective : str or callable
+        {'sharpe', 'total_return'} or a function which takes daily returns and returns a float.
+
+    Returns
+    -------
+    float
+
+    """
+    if callable(objective):
+        return float(objective(daily_return))
+
+    if objective == 'total_return':
+        return float(daily_return.sum())
+    elif objective == 'sharpe':
+        std = daily_return.std()
+        if not std > 0:
+            return np.nan
+        return float(daily_return.mean() / std * np.sqrt(common.CALENDAR_CONST.TRADE_DAYS_PER_YEAR))
+    else:
+        raise NotImplementedError("objective = {}".format(objective))
+
+
+def run_backtest(dataview, strategy_factory, props, params, start_date, end_date):
+    """
+    Run one alpha backtest of given parameters on [start_date, end_date].
+
+    Parameters
+    ----------
+    dataview : DataView
+    strategy_factory : callable
+        strategy_factory(params) returns an AlphaStrategy.
+    props : dict
+        Base configurations of the backtest.
+    params : dict
+        Parameters to be tested. They are passed to strategy_factory and also update props,
+        so props-level parameters such as 'period' or 'n_periods' can be optimized as well.
+    start_date : int
+    end_date : int
+
+    Returns
+    -------
+    bt : AlphaBacktestInstance
+
+    """
+    props = dict(props)
+    props.update(params)
+    props['start_date'] = start_date
+    props['end_date'] = end_date
+
+    dv = dataview.view(start_date, end_date)
+    strategy = strategy_factory(params)
+    bt = AlphaBacktestInstance()
+    context = model.Context(dataview=dv, instance=bt, strategy=strategy,
+                            trade_api=AlphaTradeApi(), pm=PortfolioManager())
+    for name in ['stock_selector', 'signal_model', 'cost_model', 'risk_model']:
+        obj = getattr(strategy, name, None)
+        if obj is not None:
+            obj.register_context(context)
+
+    bt.init_from_config(props)
+    bt.run_alpha()
+    return bt
+
+
+# Shared by worker processes. With fork they are inherited from the parent process without pickling.
+_worker_optimizer = None
+
+
+def _init_worker(optimizer):
+    global _worker_optimizer
+    _worker_optimizer = optimizer
+
+
+def _run_train_trial(args):
+    return _worker_optimizer._run_train_trial(*args)
+
+
+def _run_test(args):
+    return _worker_optimizer._run_test(*args)
+
+
+class WalkForwardOptimizer(object):
+    """
+    Walk-forward optimization of an alpha strategy.
+
+    Attributes
+    ----------
+    dataview : DataView
+        Data of the whole period. Each backtest uses a view of it, nothing is copied.
+    strategy_factory : callable
+        strategy_factory(params) returns a new AlphaStrategy using params.
+    param_grid : dict
+        {param_name: list of candidate values}
+    props : dict
+        Base configurations shared by all backtests.
+    train_days : int
+    test_days : int
+    step_days : int
+    objective : str or callable
+        Used to select best parameters on train windows. See calc_objective.
+    n_jobs : int
+        Number of processes. 1 means running in current process.
+    windows : list of dict
+    trials : pd.DataFrame
+        Score of each parameter set on each train window.
+    window_results : pd.DataFrame
+        Best parameters, in/out-of-sample scores and timing of each window.
+
+    Notes
+    -----
+    Each test window starts with init_balance and is liquidated at close of its last date,
+    so stitched trades can be analyzed as one backtest with a single init_balance.
+
+    """
+    def __init__(self, dataview, strategy_factory, param_grid=None):
+        self.dataview = dataview
+        self.strategy_factory = strategy_factory
+        self.param_grid = param_grid if param_grid is not None else dict()
+        self.param_list = expand_param_grid(self.param_grid)
+
+        self.props = None
+        self.train_days = 0
+        self.test_days = 0
+        self.step_days = 0
+        self.objective = 'sharpe'
+        self.n_jobs = 1
+
+        self.windows = []
+        self.trials = None
+        self.window_results = None
+        self.used_time = 0.0
+
+        self._df_trades = None
+        self._df_close = None
+
+    def init_from_config(self, props):
+        """
+        Parameters
+        ----------
+        props : dict
+            Besides configurations of AlphaBacktestInstance, following keys are used:
+            train_days, test_days, step_days (optional), objective (optional), n_jobs (optional).
+
+        """
+        for name in ['start_date', 'end_date', 'init_balance', 'train_days', 'test_days']:
+            if name not in props:
+                raise ValueError("{} must be provided in props.".format(name))
+
+        self.props = props
+        self.train_days = int(props['train_days'])
+        self.test_days = int(props['test_days'])
+        self.step_days = int(props.get('step_days', self.test_days))
+        self.objective = props.get('objective', 'sharpe')
+        self.n_jobs = int(props.get('n_jobs', 1))
+
+        dates = self.dataview.dates
+        dates = dates[(dates >= props['start_date']) & (dates <= props['end_date'])]
+        self.windows = split_windows(dates, self.train_days, self.test_days, self.step_days)
+        if not self.windows:
+            raise ValueError("Date range [{}, {}] is too short for train_days={} and test_days={}".format(
+                props['start_date'], props['end_date'], self.train_days, self.test_days))
+
+        self._df_close = self.dataview.get_ts('close', start_date=dates[0], end_date=dates[-1])
+
+    def _score(self, bt, start_date, end_date):
+        df_trades = bt.get_trades_df()
+        df_close = self._df_close.loc[start_date: end_date]
+        init_balance = self.props['init_balance']
+        daily_return = calc_daily_pnl(df_trades, df_close, init_balance).iloc[1:] / init_balance
+        return calc_objective(daily_return, self.objective), df_trades
+
+    def _run_train_trial(self, i_window, i_param):
+        w = self.windows[i_window]
+        params = self.param_list[i_param]
+        begin_time = dt.datetime.now()
+
+        bt = run_backtest(self.dataview, self.strategy_factory, self.props, params,
+                          w['train_start'], w['train_end'])
+        score, _ = self._score(bt, w['train_start'], w['train_end'])
+
+        used_time = (dt.datetime.now() - begin_time).total_seconds()
+        return {'window': i_window, 'param_no': i_param, 'score': score, 'used_time': used_time}
+
+    def _run_test(self, i_window, i_param):
+        w = self.windows[i_window]
+        params = self.param_list[i_param]
+        begin_time = dt.datetime.now()
+
+        bt = run_backtest(self.dataview, self.strategy_factory, self.props, params,
+                          w['test_start'], w['test_end'])
+        score, df_trades = self._score(bt, w['test_start'], w['test_end'])
+        df_trades = self._liquidate(df_trades, w['test_end'], get_cost_model(bt.ctx, bt.commission_rate))
+
+        used_time = (dt.datetime.now() - begin_time).total_seconds()
+        return {'window': i_window, 'score': score, 'used_time': used_time, 'trades': df_trades}
+
+    def _liquidate(self, df_trades, date, cost_model):
+        """
+        Append trades which close all positions at close price of date.
+        Suspended symbols are closed at their last valid close, costs are charged by cost_model.
+        
+        """
+        if df_trades.empty:
+            return df_trades
+
+        sign = np.where(df_trades['entrust_action'].map(common.ORDER_ACTION.is_positive), 1.0, -1.0)
+        pos = pd.Series(sign * df_trades['fill_size'].values, index=df_trades['symbol'].values)
+        pos = pos.groupby(level=0).sum()
+        pos = pos.loc[pos.abs() > 1e-8]
+        if pos.empty:
+            return df_trades
+
+        price = self._df_close.loc[: date].ffill().iloc[-1].reindex(pos.index).values
+        commission = cost_model.calc_trade_cost(pos.index.values, price, -pos.values)['total']
+        df_liq = pd.DataFrame({'task_id': str(WALK_FORWARD_LIQUIDATE_NO),
+                               'entrust_no': str(WALK_FORWARD_LIQUIDATE_NO),
+                               'entrust_action': np.where(pos.values > 0,
+                                                          common.ORDER_ACTION.SELL.value,
+                                                          common.ORDER_ACTION.BUY.value),
+                               'symbol': pos.index.values,
+                               'fill_price': price,
+                               'fill_size': pos.abs().values,
+                               'fill_date': date,
+                               'fill_time': WALK_FORWARD_LIQUIDATE_TIME,
+                               'fill_no': str(WALK_FORWARD_LIQUIDATE_NO),
+                               'commission': np.asarray(commission, dtype=float),
+                               'trade_date': date})
+        return pd.concat([df_trades, df_liq.loc[:, df_trades.columns]], axis=0, ignore_index=True)
+
+    def _map(self, func, args_list):
+        if self.n_jobs <= 1 or len(args_list) <= 1:
+            _init_worker(self)
+            return [func(args) for args in args_list]
+
+        pool = multiprocessing.Pool(processes=min(self.n_jobs, len(args_list)),
+                                    initializer=_init_worker, initargs=(self,))
+        try:
+            return pool.map(func, args_list, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    def run(self):
+        """
+        Select best parameters on each train window and apply them on the next test window.
+
+        Returns
+        -------
+        pd.DataFrame
+            Same as self.window_results.
+
+        """
+        if self.props is None:
+            raise ValueError("Call init_from_config before run.")
+        print("Run walk-forward optimization: {0:d} windows, {1:d} parameter sets.".format(
+            len(self.windows), len(self.param_list)))
+        begin_time = dt.datetime.now()
+
+        # Step1. all (window, params) pairs on train windows are independent, run them together
+        train_args = [(i_window, i_param) for i_window in range(len(self.windows))
+                      for i_param in range(len(self.param_list))]
+        df_trials = pd.DataFrame(self._map(_run_train_trial, train_args))
+
+        # Step2. select best parameters of each window, the first one wins if there is a tie
+        best = []
+        for i_window in range(len(self.windows)):
+            df = df_trials.loc[df_trials['window'] == i_window].sort_values('param_no')
+            scores = df['score'].fillna(-np.inf).values
+            best.append(int(df['param_no'].values[np.argmax(scores)]))
+
+        # Step3. out-of-sample backtest
+        test_args = [(i_window, best[i_window]) for i_window in range(len(self.windows))]
+        test_results = self._map(_run_test, test_args)
+
+        # summary
+        records = []
+        for i_window, w in enumerate(self.windows):
+            df = df_trials.loc[df_trials['window'] == i_window]
+            res = test_results[i_window]
+            rec = dict(w)
+            rec['window'] = i_window
+            rec['params'] = self.param_list[best[i_window]]
+            rec['train_score'] = df.loc[df['param_no'] == best[i_window], 'score'].values[0]
+            rec['test_score'] = res['score']
+            rec['train_time'] = df['used_time'].sum()
+            rec['test_time'] = res['used_time']
+            records.append(rec)
+        self.window_results = pd.DataFrame(records).set_index('window')
+
+        df_trials['params'] = [self.param_list[i] for i in df_trials['param_no']]
+        self.trials = df_trials
+
+        self._df_trades = pd.concat([res['trades'] for res in test_results], axis=0, ignore_index=True)
+        self._df_trades.index.name = 'index'
+
+        self.used_time = (dt.datetime.now() - begin_time).total_seconds()
+        print("Walk-forward optimization done. {0:d} out-of-sample trades in total. used time: {1}s".format(
+            len(self._df_trades), self.used_time))
+        return self.window_results
+
+    def get_trades_df(self):
+        """
+        Stitched out-of-sample trades of all test windows.
+
+        Returns
+        -------
+        pd.DataFrame
+            Same format as trades.csv.
+
+        """
+        return self._df_trades
+
+    def get_daily_pnl(self):
+        """
+        Stitched out-of-sample daily PnL.
+
+        Returns
+        -------
+        pd.Series
+            Index is trade_date.
+
+        """
+        start, end = self.windows[0]['test_start'], self.windows[-1]['test_end']
+        return calc_daily_pnl(self._df_trades, self._df_close.loc[start: end], self.props['init_balance'])
+
+    def save_results(self, folder_path='.'):
+        """
+        Save stitched trades and configs which can be read by AlphaAnalyzer,
+        together with a summary of all windows.
+
+        Parameters
+        ----------
+        folder_path : str
+
+        """
+        folder_path = os.path.abspath(folder_path)
+
+        trades_fn = os.path.join(folder_path, 'trades.csv')
+        configs_fn = os.path.join(folder_path, 'configs.json')
+        windows_fn = os.path.join(folder_path, 'walk_forward.csv')
+        jutil.create_dir(trades_fn)
+
+        self._df_trades.to_csv(trades_fn)
+        self.window_results.to_csv(windows_fn)
+
+        configs = {k: v for k, v in self.props.items() if not callable(v)}
+        configs['start_date'] = self.windows[0]['test_start']
+        configs['end_date'] = self.windows[-1]['test_end']
+        jutil.save_json(configs, configs_fn)
+
+        print("Walk-forward results has been successfully saved to:\n" + folder_path)
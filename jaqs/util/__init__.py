@@ -4,5 +4,6 @@ from .dtutil import *
 from .fileio import *
 from .numeric import *
 from .pdutil import *
+from .prefetch import *
 from .profile import *
 from .sequence import *
@@ -0,0 +1,97 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import sys
+import threading
+import six
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+__all__ = ['Prefetcher']
+
+
+class Prefetcher(object):
+    """
+    Call func on each item of args_list in a background thread and yield results in order.
+
+    At most maxsize results are loaded ahead of the consumer, so IO of the next items
+    overlaps with processing of the current one while memory stays bounded.
+    Exception raised by func is re-raised in the consumer thread at the position of that item.
+
+    Parameters
+    ----------
+    func : callable
+        func(args) returns the result of one item.
+    args_list : list
+    maxsize : int
+        Number of results loaded ahead. 0 means no background thread: func is called
+        in the consumer thread when an item is needed.
+
+    Examples
+    --------
+    >>> for date, bars in Prefetcher(load_bars, dates, maxsize=2):
+    ...     process(bars)
+
+    """
+    _DONE = object()
+
+    def __init__(self, func, args_list, maxsize=2):
+        self.func = func
+        self.args_list = list(args_list)
+        self.maxsize = maxsize
+
+        self._queue = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _run(self):
+        for args in self.args_list:
+            try:
+                res = self.func(args)
+                item = (args, res, None)
+            except Exception:
+                item = (args, None, sys.exc_info())
+            if not self._put(item) or item[2] is not None:
+                return
+        self._put((None, self._DONE, None))
+
+    def _put(self, item):
+        """Put item into queue unless consumer has stopped. Return whether item is put."""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __iter__(self):
+        if self.maxsize <= 0:
+            for args in self.args_list:
+                yield args, self.func(args)
+            return
+
+        self._queue = queue.Queue(maxsize=self.maxsize)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        try:
+            while True:
+                args, res, exc_info = self._queue.get()
+                if res is self._DONE:
+                    break
+                if exc_info is not None:
+                    six.reraise(*exc_info)
+                yield args, res
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop background thread. Results not yet consumed are discarded."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
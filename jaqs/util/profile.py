@@ -1,6 +1,7 @@
 # encoding: utf-8
 
 from __future__ import print_function
+import math
 import time
 
 
@@ -85,3 +86,202 @@ def prof_print():
                .format(d['name'], d['count'], d['total'], d['min'], d['max'], d['avg']))
 
 
+
+
+# -------------------------------------------------------------------------------------------
+# Latency instrumentation
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class LatencyHistogram(object):
+    """
+    HDR-style histogram of non-negative integer values (e.g. nanoseconds).
+    
+    Values below 2**SUB_BITS are counted exactly, larger values are counted in
+    log-linear buckets with a relative error below 2**(1 - SUB_BITS) (~6%).
+    Recording is O(1) and the memory is fixed.
+    
+    """
+    SUB_BITS = 5
+    MAX_BITS = 40
+    N_BUCKETS = ((MAX_BITS - SUB_BITS) << (SUB_BITS - 1)) + (1 << SUB_BITS)
+    
+    def __init__(self):
+        self.counts = [0] * self.N_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+    
+    def record(self, value):
+        if value < 0:
+            value = 0
+        # SUB_BITS == 5 inlined for speed
+        e = value.bit_length()
+        if e <= 5:
+            idx = value
+        else:
+            shift = e - 5
+            idx = (shift << 4) + (value >> shift)
+            if idx >= 592:
+                idx = 591
+        self.counts[idx] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+    
+    @classmethod
+    def bucket_value(cls, idx):
+        """Highest value counted in bucket idx."""
+        half = 1 << (cls.SUB_BITS - 1)
+        if idx < 2 * half:
+            return idx
+        shift = idx // half - 1
+        m = idx - half * shift
+        return ((m + 1) << shift) - 1
+    
+    def percentile(self, q):
+        """
+        Parameters
+        ----------
+        q : float
+            In [0, 100].
+
+        Returns
+        -------
+        int
+            Highest value equivalent to the q-th percentile, 0 if empty.
+
+        """
+        if not self.count:
+            return 0
+        # nearest rank
+        target = max(1, int(math.ceil(q / 100.0 * self.count)))
+        cum = 0
+        for idx, n in enumerate(self.counts):
+            cum += n
+            if cum >= target:
+                return min(self.bucket_value(idx), self.max)
+        return self.max
+    
+    @property
+    def mean(self):
+        return self.total / float(self.count) if self.count else 0.0
+
+
+class LatencyMonitor(object):
+    """
+    Always-on latency and queue depth statistics of the live market data / event path.
+    
+    Producers stamp an event by stamp() when it arrives (ingress). Only one of every
+    sample_interval events gets clock() as its stamp, others get False. Stages of sampled
+    events then call record(stage, type_, ingress_time), so every stage records the time
+    elapsed since ingress. Queue depth is recorded per event type when a sampled event is
+    put into a queue. Callers check the stamp before calling record, so an event which is
+    not sampled costs one stamp() call and a few truth tests.
+    
+    Counters are updated without a lock: a concurrent update may rarely be lost, which is
+    acceptable for monitoring.
+    
+    Attributes
+    ----------
+    enabled : bool
+    sample_interval : int
+        One of every sample_interval events is measured.
+    log_interval : float
+        Seconds between two log lines printed by maybe_log. 0 means never.
+    
+    """
+    def __init__(self, log_interval=60.0, sample_interval=32):
+        self.enabled = True
+        self.sample_interval = sample_interval
+        self.log_interval = log_interval
+        self._latency = dict()
+        self._depth = dict()
+        self._n_stamps = 0
+        self._last_log = clock()
+    
+    def stamp(self):
+        """
+        Returns
+        -------
+        float or False
+            clock() if this event is sampled, otherwise False.
+
+        """
+        if not self.enabled:
+            return False
+        self._n_stamps += 1
+        if self._n_stamps % self.sample_interval:
+            return False
+        return clock()
+    
+    def record(self, stage, type_, ingress_time):
+        """Record time elapsed since ingress_time (given by stamp()) at stage, for events of type_."""
+        if not ingress_time:
+            return
+        value = int((clock() - ingress_time) * 1e9)
+        key = (stage, type_)
+        hist = self._latency.get(key)
+        if hist is None:
+            hist = self._latency[key] = LatencyHistogram()
+        hist.record(value)
+    
+    def record_depth(self, type_, depth):
+        """Record queue depth when an event of type_ is put into a queue."""
+        hist = self._depth.get(type_)
+        if hist is None:
+            hist = self._depth[type_] = LatencyHistogram()
+        hist.record(depth)
+    
+    def reset(self):
+        self._latency = dict()
+        self._depth = dict()
+        self._n_stamps = 0
+    
+    def get_stats(self):
+        """
+        Returns
+        -------
+        dict
+            'latency' : pd.DataFrame
+                Index is (stage, event_type), columns: count, mean_us, p50_us, p90_us, p99_us, max_us.
+            'queue_depth' : pd.DataFrame
+                Index is event_type, columns: count, mean, p50, p99, max.
+
+        """
+        import pandas as pd
+        
+        rows = [(stage, str(type_), h.count, h.mean / 1e3, h.percentile(50) / 1e3, h.percentile(90) / 1e3,
+                 h.percentile(99) / 1e3, h.max / 1e3)
+                for (stage, type_), h in list(self._latency.items())]
+        df_latency = pd.DataFrame(rows, columns=['stage', 'event_type', 'count', 'mean_us', 'p50_us',
+                                                 'p90_us', 'p99_us', 'max_us'])
+        df_latency = df_latency.set_index(['stage', 'event_type']).sort_index()
+        
+        rows = [(str(type_), h.count, h.mean, h.percentile(50), h.percentile(99), h.max)
+                for type_, h in list(self._depth.items())]
+        df_depth = pd.DataFrame(rows, columns=['event_type', 'count', 'mean', 'p50', 'p99', 'max'])
+        df_depth = df_depth.set_index('event_type').sort_index()
+        return {'latency': df_latency, 'queue_depth': df_depth}
+    
+    def log_line(self):
+        """One line summary: p50/p99 (us) of each stage and max queue depth of each event type."""
+        items = ["{}[{}] n={:d} p50={:.1f}us p99={:.1f}us".format(stage, type_, h.count, h.percentile(50) / 1e3,
+                                                                 h.percentile(99) / 1e3)
+                 for (stage, type_), h in sorted(self._latency.items(), key=lambda x: (x[0][0], str(x[0][1])))]
+        items.extend(["depth[{}] p99={:d} max={:d}".format(type_, h.percentile(99), h.max)
+                      for type_, h in sorted(self._depth.items(), key=lambda x: str(x[0]))])
+        return "latency: " + " | ".join(items)
+    
+    def maybe_log(self):
+        """Print log_line() if log_interval seconds have passed since last time."""
+        if not self.log_interval:
+            return
+        now = clock()
+        if now - self._last_log >= self.log_interval:
+            self._last_log = now
+            print(self.log_line())
+
+
+latency_monitor = LatencyMonitor()
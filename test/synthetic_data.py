@@ -0,0 +1,158 @@
+# encoding: UTF-8
+"""
+Build small DataViews from random data, so that backtest tests can run without a data server.
+
+"""
+
+from __future__ import print_function
+import numpy as np
+import pandas as pd
+
+from jaqs.data import DataView, DataService
+
+
+def make_dataview(n_dates=120, n_symbols=8, seed=0, start=20170103, ret=None, extra_fields=None):
+    """
+    ret : np.ndarray, optional
+        Daily returns of shape (n_dates, n_symbols). Random if None.
+    extra_fields : dict of {str: np.ndarray}, optional
+        More fields of shape (n_dates, n_symbols).
+    
+    """
+    rng = np.random.RandomState(seed)
+    dates = pd.bdate_range(pd.Timestamp(str(start)), periods=n_dates)
+    dates = np.array([int(d.strftime('%Y%m%d')) for d in dates])
+    symbols = ['{:06d}.SZ'.format(i + 1) for i in range(n_symbols)]
+    
+    if ret is None:
+        ret = rng.normal(0.0005, 0.02, size=(n_dates, n_symbols))
+    close = 10 * np.exp(np.cumsum(ret, axis=0))
+    fields = {'close': close,
+              'open': close * (1 + rng.normal(0, 0.003, close.shape)),
+              'vwap': close * (1 + rng.normal(0, 0.002, close.shape)),
+              'high': close * 1.01,
+              'low': close * 0.99,
+              'volume': rng.uniform(1e5, 1e6, close.shape),
+              'total_mv': close * rng.uniform(1e8, 1e9, (1, n_symbols)),
+              'close_adj': close,
+              'adjust_factor': np.ones_like(close),
+              '_daily_adjust_factor': np.ones_like(close),
+              '_limit': np.zeros_like(close),
+              'index_member': np.ones_like(close),
+              'momentum': rng.normal(size=close.shape)}
+    if extra_fields:
+        fields.update(extra_fields)
+    frames = {k: pd.DataFrame(v, index=dates, columns=symbols) for k, v in fields.items()}
+    frames['trade_status'] = pd.DataFrame('交易', index=dates, columns=symbols)
+    
+    data_d = pd.concat(frames, axis=1)
+    data_d.columns = data_d.columns.swaplevel()
+    data_d.columns.names = ['symbol', 'field']
+    data_d.index.name = 'trade_date'
+    data_d = data_d.sort_index(axis=1)
+    
+    dv = DataView()
+    dv.data_d = data_d
+    dv.data_q = pd.DataFrame(index=dates,
+                             columns=pd.MultiIndex.from_product([symbols, ['ann_date']], names=['symbol', 'field']))
+    dv._data_benchmark = pd.DataFrame({'close': close.mean(axis=1)}, index=dates)
+    dv._data_inst = pd.DataFrame({'list_date': 19900101, 'delist_date': 99999999, 'multiplier': 1.0}, index=symbols)
+    dv.symbol = symbols
+    dv.start_date = int(dates[1])
+    dv.end_date = int(dates[-1])
+    dv.extended_start_date_d = int(dates[0])
+    dv.fields = sorted(frames.keys())
+    return dv
+
+
+def make_df_bar(n_symbols=100, n_times=240, dates=(20170104,), seed=0):
+    """Minute bars of random prices, in the same format as DataService.bar."""
+    rng = np.random.RandomState(seed)
+    symbols = ['{:06d}.SZ'.format(i + 1) for i in range(n_symbols)]
+    minutes = list(range(9 * 60 + 31, 11 * 60 + 31)) + list(range(13 * 60 + 1, 15 * 60 + 1))
+    times = [(m // 60) * 10000 + (m % 60) * 100 for m in minutes][:n_times]
+    idx = pd.MultiIndex.from_product([list(dates), times, symbols], names=['trade_date', 'time', 'symbol'])
+    df = idx.to_frame(index=False)
+    n = len(df)
+    
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 1e-3, (len(dates) * n_times, n_symbols)), axis=0)).ravel()
+    df['open'] = close * (1 + rng.normal(0, 2e-4, n))
+    df['high'] = np.maximum(close, df['open']) * 1.001
+    df['low'] = np.minimum(close, df['open']) * 0.999
+    df['close'] = close
+    df['vwap'] = (df['high'] + df['low'] + close) / 3.0
+    df['volume'] = rng.randint(100, 10000, n).astype(float)
+    df['turnover'] = df['volume'] * df['vwap']
+    df['oi'] = 0
+    df['date'] = df['trade_date']
+    df['freq'] = '1M'
+    return df.sort_values(['trade_date', 'time', 'symbol']).reset_index(drop=True)
+
+
+def make_df_tick(n_symbols=10, n_ticks=4800, dates=(20170104,), seed=0):
+    """Ticks (one every 3 seconds from 09:30:00) with bid/ask on a 0.01 price grid and cumulative volume."""
+    rng = np.random.RandomState(seed)
+    symbols = ['{:06d}.SZ'.format(i + 1) for i in range(n_symbols)]
+    seconds = np.arange(n_ticks) * 3 + 9 * 3600 + 30 * 60
+    times = (seconds // 3600) * 10000 + (seconds % 3600 // 60) * 100 + seconds % 60
+    idx = pd.MultiIndex.from_product([list(dates), symbols, times], names=['trade_date', 'symbol', 'time'])
+    df = idx.to_frame(index=False)
+    n = len(df)
+    shape = (len(dates) * n_symbols, n_ticks)
+    
+    bid_ticks = 1000 + np.cumsum(rng.randint(-1, 2, shape), axis=1)
+    bid = (bid_ticks * 0.01).ravel()
+    ask = bid + 0.01
+    df['bidprice1'] = bid
+    df['askprice1'] = ask
+    df['bidvolume1'] = rng.randint(1, 50, n) * 100.0
+    df['askvolume1'] = rng.randint(1, 50, n) * 100.0
+    df['last'] = np.where(rng.rand(n) > 0.5, ask, bid)
+    df['volume'] = np.cumsum(rng.randint(0, 20, shape) * 100.0, axis=1).ravel()
+    df['turnover'] = df['volume'] * df['last']
+    df['date'] = df['trade_date']
+    df['freq'] = '0'
+    return df.sort_values(['trade_date', 'time', 'symbol']).reset_index(drop=True)
+
+
+class MemoryDataService(DataService):
+    """Serve bars (or ticks) from a DataFrame, to run event-driven backtests without a data server."""
+    def __init__(self, df_bar, delay=0.0):
+        super(MemoryDataService, self).__init__()
+        self.df_bar = df_bar
+        self.delay = delay
+        self.bar_calls = []
+    
+    def init_from_config(self, props):
+        pass
+    
+    def bar(self, symbol, start_time=200000, end_time=160000, trade_date=None, freq='1M', fields=""):
+        import time
+        time.sleep(self.delay)
+        self.bar_calls.append(trade_date)
+        df = self.df_bar
+        mask = (df['trade_date'] == trade_date) & df['symbol'].isin(symbol.split(','))
+        return df.loc[mask].copy(), '0,'
+    
+    def daily(self, symbol, start_date, end_date, fields="", adjust_mode=None):
+        """Daily bars made of the last bar (or tick) of each trade date."""
+        df = self.df_bar
+        mask = (df['trade_date'] >= start_date) & (df['trade_date'] <= end_date) & df['symbol'].isin(symbol.split(','))
+        df = df.loc[mask].groupby(['trade_date', 'symbol'], as_index=False).last()
+        if 'close' not in df.columns:
+            df['close'] = df['last']
+        return df, '0,'
+    
+    def query_inst_info(self, symbol, fields="", inst_type=""):
+        symbols = [s for s in symbol.split(',') if s]
+        df = pd.DataFrame({'symbol': symbols, 'inst_type': 1, 'multiplier': 1.0,
+                           'list_date': 19900101, 'delist_date': 99999999,
+                           'pricetick': 0.01, 'buylot': 100, 'selllot': 1})
+        return df.set_index('symbol')
+    
+    def query_trade_dates(self, start_date, end_date):
+        dates = np.unique(self.df_bar['trade_date'].values)
+        return dates[(dates >= start_date) & (dates <= end_date)]
+    
+    def query_dividend(self, symbol, start_date, end_date):
+        return pd.DataFrame(columns=['symbol', 'exdiv_date', 'share_ratio', 'share_trans_ratio', 'cash_tax']), '0,'
@@ -0,0 +1,150 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import os
+import tempfile
+
+import pandas as pd
+
+from jaqs.trade import common
+from jaqs.trade import model
+from jaqs.trade import EventDrivenStrategy, EventBacktestInstance, BacktestTradeApi, PortfolioManager
+from jaqs.trade.ledger import ArchiveDict
+from jaqs.data.basic import Order
+
+from synthetic_data import make_df_bar, MemoryDataService
+
+
+def test_archive_dict():
+    fp = os.path.join(tempfile.mkdtemp(), 'orders.log')
+    dic = ArchiveDict(fp)
+    for i in range(10):
+        order = Order.new_order('000001.SZ', common.ORDER_ACTION.BUY, 10.0 + i, 100, 20170104, 93000)
+        order.order_status = common.ORDER_STATUS.FILLED if i % 2 else common.ORDER_STATUS.ACCEPTED
+        dic[str(i)] = order
+
+    def is_finished(key, order):
+        return order.is_finished
+
+    # finished on day 1, archived after 1 more day
+    assert dic.retire(is_finished, 1) == 0
+    assert dic.retire(is_finished, 1) == 5
+    assert dic.n_archived == 5 and len(dic) == 10 and os.path.exists(fp)
+
+    # queries are served from the archive
+    assert '3' in dic and '10' not in dic
+    assert dic['3'].entrust_price == 13.0
+    assert dic.get('10') is None
+    assert sorted(dic.keys(), key=int) == [str(i) for i in range(10)]
+    assert sorted(o.entrust_price for o in dic.values()) == [10.0 + i for i in range(10)]
+
+    # assigning an archived entry moves it back to memory
+    order = dic['3']
+    order.fill_size = 100
+    dic['3'] = order
+    assert dic.n_archived == 4 and dic['3'].fill_size == 100
+
+    del dic['5']
+    del dic['4']
+    assert len(dic) == 8
+
+    # max_age = 0: archived on the day it finished
+    dic['0'].order_status = common.ORDER_STATUS.CANCELLED
+    assert dic.retire(is_finished, 0) == 2
+    assert dic.n_archived == 5
+
+
+class DailyOrderStrategy(EventDrivenStrategy):
+    """Send a buy order far below market (cancelled at day end) and a marketable one every day."""
+    def __init__(self):
+        super(DailyOrderStrategy, self).__init__()
+        self.last_date = 0
+        self.task_ids = []
+
+    def on_bar(self, quote_dic):
+        if self.ctx.trade_date != self.last_date:
+            self.last_date = self.ctx.trade_date
+            for symbol, quote in sorted(quote_dic.items()):
+                for price in [quote.close * 0.5, quote.close * 1.1]:
+                    task_id, _ = self.ctx.trade_api.place_order(symbol, common.ORDER_ACTION.BUY, price, 100)
+                    self.task_ids.append(task_id)
+
+
+def _run(dates, bar_type='1M', **kwargs):
+    df_bar = make_df_bar(n_symbols=5, n_times=10, dates=dates)
+    props = {'symbol': ','.join(sorted(df_bar['symbol'].unique())),
+             'start_date': dates[0], 'end_date': dates[-1],
+             'bar_type': bar_type, 'init_balance': 1e7}
+    props.update(kwargs)
+
+    bt = EventBacktestInstance()
+    strategy = DailyOrderStrategy()
+    model.Context(data_api=MemoryDataService(df_bar), trade_api=BacktestTradeApi(), instance=bt,
+                  strategy=strategy, pm=PortfolioManager())
+    bt.init_from_config(props)
+    bt.run()
+    return bt, strategy
+
+
+def test_backtest_archive():
+    dates = [int(d.strftime('%Y%m%d')) for d in pd.bdate_range('20170103', periods=20)]
+    bt_ref, _ = _run(dates)
+    folder = tempfile.mkdtemp()
+    bt, strategy = _run(dates, archive_after_days=2, archive_dir=folder)
+    pm, pm_ref = bt.ctx.pm, bt_ref.ctx.pm
+
+    pd.testing.assert_frame_equal(bt.get_trades_df(), bt_ref.get_trades_df())
+    assert len(pm.tasks) == len(pm_ref.tasks) == 200
+    assert len(pm.orders) == len(pm_ref.orders)
+    assert len(pm.tradestat) == len(pm_ref.tradestat)
+
+    # only orders/tasks of the last days are kept in memory
+    assert pm.tasks.n_archived == 200 - 2 * 10
+    assert pm.tradestat.n_archived == 5 * (20 - 3)
+    assert bt.ctx.trade_api.entrust_no_task_id_map.n_archived == 200 - 2 * 10
+    assert sorted(os.listdir(folder)) == ['entrust_no_task_id.log', 'orders.log', 'tasks.log', 'tradestat.log']
+
+    for task_id in strategy.task_ids:
+        task, task_ref = pm.get_task(task_id), pm_ref.get_task(task_id)
+        assert task.task_status == task_ref.task_status == common.TASK_STATUS.DONE
+        assert task.data.order_status == task_ref.data.order_status
+        assert task.data.fill_size == task_ref.data.fill_size
+    for key, stat in pm_ref.tradestat.items():
+        assert pm.tradestat[key].buy_filled_size == stat.buy_filled_size
+
+    # lists of orders by time in force only keep open orders
+    assert all(len(v) == 0 for v in bt.ctx.trade_api._orderbook._tif_orders.values())
+
+
+def test_backtest_archive_daily():
+    dates = [int(d.strftime('%Y%m%d')) for d in pd.bdate_range('20170103', periods=10)]
+    bt_ref, _ = _run(dates, bar_type='1d')
+    bt, strategy = _run(dates, bar_type='1d', archive_after_days=2, archive_dir=tempfile.mkdtemp())
+    pm, pm_ref = bt.ctx.pm, bt_ref.ctx.pm
+
+    # archive is aged once per trade date: the first date only provides bars of the day before
+    assert pm.tasks._day == pm.orders._day == bt.ctx.trade_api.entrust_no_task_id_map._day == len(dates) - 1
+    assert list(pm.daily_positions.dates) == dates[1:]
+
+    pd.testing.assert_frame_equal(bt.get_trades_df(), bt_ref.get_trades_df())
+    assert len(pm.tasks) == len(pm_ref.tasks) == 2 * 5 * (len(dates) - 1)
+    # only tasks of the last 2 days are kept in memory, the same as intraday bars
+    assert pm.tasks.n_archived == 2 * 5 * (len(dates) - 1 - 2)
+    for task_id in strategy.task_ids:
+        assert pm.get_task(task_id).task_status == pm_ref.get_task(task_id).task_status
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
@@ -0,0 +1,102 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import time
+import copy
+
+import numpy as np
+
+from jaqs.data.basic import Bar, BarBatch, Trade, Order, Position
+
+from synthetic_data import make_df_bar
+
+
+def _create_bars_iterrows(df):
+    """Bar creation before BarBatch: one dict-updated Bar per row, grouped into dicts."""
+    res = []
+    for t, df_time in df.groupby(by='time', sort=False):
+        dic = dict()
+        for _, row in df_time.iterrows():
+            bar = Bar.create_from_dict(row.to_dict())
+            dic[bar.symbol] = bar
+        res.append((t, dic))
+    return res
+
+
+def test_bar_batch():
+    df = make_df_bar(n_symbols=5, n_times=3)
+    batches = BarBatch.create_from_df(df, by='time')
+    old = _create_bars_iterrows(df)
+    
+    assert [t for t, _ in batches] == [t for t, _ in old]
+    for (_, batch), (_, dic) in zip(batches, old):
+        assert len(batch) == len(dic)
+        assert sorted(batch.keys()) == sorted(dic.keys())
+        for symbol, bar_old in dic.items():
+            bar = batch[symbol]
+            assert isinstance(bar, Bar)
+            assert batch[symbol] is bar
+            for key in Bar._bar_keys + ['symbol', 'date', 'turnover']:
+                assert getattr(bar, key) == getattr(bar_old, key)
+    
+    batch = batches[0][1]
+    assert batch.get('no.such.symbol') is None
+    assert '000001.SZ' in batch
+    assert 'no.such.symbol' not in batch
+    assert BarBatch.create_from_df(df.iloc[:0]) == []
+    assert len(Bar.create_from_df(df)) == len(df)
+
+
+def test_slots():
+    for cls in [Bar, Trade, Order, Position]:
+        obj = cls()
+        assert not obj.__dict__
+        # attributes not declared are still allowed
+        obj.some_extra_field = 1
+        assert obj.__dict__ == {'some_extra_field': 1}
+    
+    order = Order.new_order('000001.SZ', 'Buy', 10.0, 100, 20170104, 93000)
+    order2 = copy.copy(order)
+    assert order2.entrust_price == 10.0 and order2.symbol == '000001.SZ'
+    trade = Trade.create_from_dict({'symbol': '000001.SZ', 'fill_size': 100, 'ba_id': 1})
+    assert trade.fill_size == 100 and trade.ba_id == 1
+
+
+def test_bar_batch_speed():
+    df = make_df_bar(n_symbols=100, n_times=240)
+    symbols = df['symbol'].unique()
+    
+    def replay(list_of_quotes):
+        s = 0.0
+        for _, quotes_dic in list_of_quotes:
+            for symbol in symbols:
+                s += quotes_dic[symbol].close
+        return s
+    
+    t0 = time.time()
+    res_old = replay(_create_bars_iterrows(df))
+    t1 = time.time()
+    res_new = replay(BarBatch.create_from_df(df, by='time'))
+    t2 = time.time()
+    
+    speedup = (t1 - t0) / (t2 - t1)
+    print("100 symbols x 240 minute bars: iterrows {:.3f}s, BarBatch {:.3f}s, speedup {:.1f}x".format(
+        t1 - t0, t2 - t1, speedup))
+    assert np.isclose(res_old, res_new)
+    assert speedup > 5
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+    
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+    
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+    
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
@@ -0,0 +1,125 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import time
+import threading
+
+from jaqs.trade import common
+from jaqs.trade import model
+from jaqs.trade import EventDrivenStrategy, EventBacktestInstance, BacktestTradeApi, PortfolioManager
+import jaqs.util as jutil
+
+from synthetic_data import make_df_bar, MemoryDataService
+
+
+def test_prefetcher():
+    main_thread = threading.current_thread()
+    threads = []
+    
+    def load(x):
+        threads.append(threading.current_thread())
+        return x * 10
+    
+    res = list(jutil.Prefetcher(load, range(20), maxsize=3))
+    assert res == [(x, x * 10) for x in range(20)]
+    assert all(t is not main_thread for t in threads)
+    
+    # no background thread
+    del threads[:]
+    res = list(jutil.Prefetcher(load, range(5), maxsize=0))
+    assert res == [(x, x * 10) for x in range(5)]
+    assert all(t is main_thread for t in threads)
+    
+    # exception is raised at the position of the item
+    def load_error(x):
+        if x == 3:
+            raise KeyError(x)
+        return x
+    got = []
+    try:
+        for x, _ in jutil.Prefetcher(load_error, range(10), maxsize=2):
+            got.append(x)
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("KeyError should have been raised.")
+    assert got == [0, 1, 2]
+    
+    # stop early, background thread exits
+    prefetcher = jutil.Prefetcher(load, range(1000), maxsize=2)
+    for x, _ in prefetcher:
+        if x == 5:
+            break
+    assert prefetcher._thread is None
+    
+    # only Prefetcher is exported to jaqs.util
+    assert not hasattr(jutil, 'threading') and not hasattr(jutil, 'queue')
+
+
+class RecordStrategy(EventDrivenStrategy):
+    """Trade on every 10th bar and record every event it sees."""
+    def __init__(self, bar_delay=0.0):
+        super(RecordStrategy, self).__init__()
+        self.events = []
+        self.n_bars = 0
+        self.bar_delay = bar_delay
+    
+    def on_bar(self, quote_dic):
+        time.sleep(self.bar_delay)
+        self.n_bars += 1
+        symbols = sorted(quote_dic.keys())
+        bar = quote_dic[symbols[0]]
+        self.events.append(('bar', bar.trade_date, bar.time, len(symbols)))
+        if self.n_bars % 10 == 0:
+            action = common.ORDER_ACTION.BUY if self.n_bars % 20 else common.ORDER_ACTION.SELL
+            for symbol in symbols[:3]:
+                self.ctx.trade_api.place_order(symbol, action, quote_dic[symbol].close, 100)
+    
+    def on_trade(self, ind):
+        self.events.append(('trade', ind.symbol, ind.fill_date, ind.fill_time, ind.fill_price))
+
+
+def _run(n_prefetch, delay, bar_delay):
+    dates = [20170103, 20170104, 20170105, 20170106, 20170109]
+    ds = MemoryDataService(make_df_bar(n_symbols=20, n_times=60, dates=dates), delay=delay)
+    props = {'symbol': ','.join(sorted(ds.df_bar['symbol'].unique())),
+             'start_date': dates[0], 'end_date': dates[-1],
+             'bar_type': '1M', 'init_balance': 1e7,
+             'n_prefetch': n_prefetch}
+    
+    strategy = RecordStrategy(bar_delay)
+    bt = EventBacktestInstance()
+    model.Context(data_api=ds, trade_api=BacktestTradeApi(), instance=bt, strategy=strategy, pm=PortfolioManager())
+    bt.init_from_config(props)
+    
+    t0 = time.time()
+    bt.run()
+    return strategy.events, time.time() - t0
+
+
+def test_backtest_prefetch():
+    # loading bars of a day takes 0.2s, strategy spends about 0.2s on a day
+    events_sync, t_sync = _run(n_prefetch=0, delay=0.2, bar_delay=0.003)
+    events_prefetch, t_prefetch = _run(n_prefetch=2, delay=0.2, bar_delay=0.003)
+    print("sync {:.2f}s, prefetch {:.2f}s".format(t_sync, t_prefetch))
+    assert t_prefetch < 0.8 * t_sync
+    
+    assert len(events_sync) > 5 * 60
+    assert any(e[0] == 'trade' for e in events_sync)
+    assert events_sync == events_prefetch
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+    
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+    
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+    
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
@@ -0,0 +1,113 @@
+# encoding: utf-8
+
+from __future__ import print_function
+
+import numpy as np
+import pandas as pd
+
+from jaqs.trade import common
+from jaqs.trade import model
+from jaqs.trade import AlphaStrategy
+from jaqs.trade.tradegateway import calc_commission, add_trade_costs, get_cost_model
+from jaqs.data.basic import Trade
+
+
+def _make_trades(n, seed=0):
+    rng = np.random.RandomState(seed)
+    trades = []
+    for i in range(n):
+        trade = Trade()
+        trade.symbol = '{:06d}.SZ'.format(i % 50)
+        trade.entrust_action = common.ORDER_ACTION.BUY if rng.rand() > 0.5 else common.ORDER_ACTION.SELL
+        trade.set_fill_info(10 + rng.rand(), 100 * rng.randint(1, 100), 20170104, 143000, str(i))
+        trades.append(trade)
+    return trades
+
+
+def test_trade_cost():
+    cm = model.TradeCostModel(commission_rate=3e-4, stamp_tax_rate=1e-3, slippage_rate=5e-4, impact_coef=0.5)
+    res = cm.calc_trade_cost(['a', 'b', 'c'], [10.0, 20.0, 5.0], [1000, -500, 2000],
+                             adv=[1e5, 4e4, np.nan], volatility=[0.02, 0.03, 0.02])
+
+    turnover = np.array([10000.0, 10000.0, 10000.0])
+    assert np.allclose(res['commission'], 3e-4 * turnover)
+    assert np.allclose(res['stamp_tax'], [0.0, 10.0, 0.0])
+    assert np.allclose(res['slippage'], 5e-4 * turnover)
+    assert np.allclose(res['impact'], [0.5 * 0.02 * np.sqrt(0.01) * 1e4, 0.5 * 0.03 * np.sqrt(500 / 4e4) * 1e4, 0.0])
+    total = sum(res[name] for name in model.TradeCostModel.COST_NAMES)
+    assert np.allclose(res['total'], total)
+
+
+def test_trade_cost_from_snapshot():
+    ctx = model.AlphaContext()
+    ctx.snapshot = pd.DataFrame({'adv': [1e5, 4e4], 'vol20': [0.02, 0.03], 'close': [10.0, 20.0]},
+                                index=['a', 'b'])
+    cm = model.TradeCostModel(context=ctx, impact_coef=1.0, adv_field='adv', volatility_field='vol20')
+    res = cm.calc_trade_cost(['b', 'a', 'x'], [20.0, 10.0, 1.0], [400, -1000, 100])
+    assert np.allclose(res['impact'], [0.03 * 0.1 * 8000, 0.02 * 0.1 * 10000, 0.0])
+
+    # dict interface: market values converted to shares at close price
+    cost = cm.calc_cost({'a': 0.0, 'b': 8000.0}, {'a': 10000.0, 'b': 0.0})
+    assert np.isclose(cost, 0.02 * 0.1 * 10000 + 0.03 * np.sqrt(400 / 4e4) * 8000)
+    # symbols missing from target positions are sold out
+    assert np.isclose(cm.calc_cost({'b': 8000.0}, {'a': 10000.0}), cost)
+
+
+def test_gateway_cost_same_as_commission():
+    trades = _make_trades(1000)
+    cm = get_cost_model(model.Context(), 2e-4)
+    add_trade_costs(trades, cm)
+    for trade in trades:
+        assert trade.commission == calc_commission(trade, 2e-4)
+
+    # cost model of strategy is shared with the gateway
+    strategy = AlphaStrategy(cost_model=model.TradeCostModel(commission_rate=1e-3, stamp_tax_rate=1e-3))
+    ctx = model.AlphaContext(strategy=strategy)
+    assert get_cost_model(ctx, 2e-4) is strategy.cost_model
+    add_trade_costs(trades, strategy.cost_model)
+    for trade in trades:
+        turnover = trade.fill_price * trade.fill_size
+        expected = turnover * (1e-3 if trade.entrust_action == common.ORDER_ACTION.BUY else 2e-3)
+        assert np.isclose(trade.commission, expected)
+
+
+def test_strategy_rebalance_cost():
+    symbols = ['a', 'b', 'c']
+    cm = model.TradeCostModel(commission_rate=3e-4, stamp_tax_rate=1e-3, impact_coef=0.1)
+    strategy = AlphaStrategy(cost_model=cm)
+    ctx = model.AlphaContext(strategy=strategy)
+    ctx.snapshot = pd.DataFrame({'close': [10.0, 20.0, 50.0]}, index=symbols)
+    ctx.universe = symbols
+    cm.register_context(ctx)
+    strategy.cash = 1e5
+    strategy._get_weights_last = lambda: {'a': 1000, 'b': 0, 'c': 2000}
+
+    weights = {'a': 0.2, 'b': 0.5, 'c': 0.3}
+    cost = strategy.calc_rebalance_cost(weights)
+
+    total_value = 1e5 + 1000 * 10.0 + 2000 * 50.0
+    size_diff = np.array([0.2 * total_value / 10.0 - 1000, 0.5 * total_value / 20.0, 0.3 * total_value / 50.0 - 2000])
+    res = cm.calc_trade_cost(symbols, [10.0, 20.0, 50.0], size_diff, adv=[1e6] * 3, volatility=[0.0] * 3)
+    assert np.isclose(cost * total_value, res['total'].sum())
+
+    # holdings not in target weights are sold, and they count in total value
+    cost = strategy.calc_rebalance_cost({'a': 0.4, 'b': 0.6})
+    size_diff = np.array([0.4 * total_value / 10.0 - 1000, 0.6 * total_value / 20.0, -2000])
+    res = cm.calc_trade_cost(symbols, [10.0, 20.0, 50.0], size_diff, adv=[1e6] * 3, volatility=[0.0] * 3)
+    assert np.isclose(cost * total_value, res['total'].sum())
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
@@ -0,0 +1,464 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import time
+
+import numpy as np
+
+from jaqs.trade.event import EventEngine, SyncEventEngine, PartitionedEventEngine, Event, EVENT_TYPE
+from jaqs.trade import common
+from jaqs.trade import model
+from jaqs.trade import EventDrivenStrategy, EventBacktestInstance, BacktestTradeApi, PortfolioManager
+from jaqs.trade.livetrade import EventLiveTradeInstance
+from jaqs.data import RemoteDataService
+from jaqs.data.basic import Trade
+
+from synthetic_data import make_df_bar, MemoryDataService
+
+
+EVENT_TYPES = [EVENT_TYPE.MARKET_DATA, EVENT_TYPE.TRADE_IND, EVENT_TYPE.ORDER_STATUS_IND, EVENT_TYPE.TIMER]
+
+
+def _make_events(n, seed=0):
+    rng = np.random.RandomState(seed)
+    return [Event(EVENT_TYPES[i], dic={'no': no}) for no, i in enumerate(rng.randint(len(EVENT_TYPES), size=n))]
+
+
+def _register_log_handlers(ee, log):
+    def on_quote(event):
+        log.append(('quote', event.dic['no']))
+
+    def on_trade(event):
+        log.append(('trade', event.dic['no']))
+
+    def on_general(event):
+        log.append(('general', event.type_, event.dic['no']))
+
+    ee.register(EVENT_TYPE.MARKET_DATA, on_quote)
+    ee.register(EVENT_TYPE.TRADE_IND, on_trade)
+    ee.register(EVENT_TYPE.TRADE_IND, on_quote)
+    ee.registerGeneralHandler(on_general)
+    return on_quote, on_trade, on_general
+
+
+def _wait(log, n, timeout=10.0):
+    t0 = time.time()
+    while len(log) < n and time.time() - t0 < timeout:
+        time.sleep(1e-3)
+
+
+def test_sync_engine_same_as_queue():
+    events = _make_events(2000)
+
+    log_sync = []
+    ee = SyncEventEngine()
+    _register_log_handlers(ee, log_sync)
+    ee.start(timer=False)
+    for event in events:
+        ee.put(event)
+    ee.stop()
+
+    log_queue = []
+    ee = EventEngine()
+    _register_log_handlers(ee, log_queue)
+    ee.start(timer=False)
+    for event in events:
+        ee.put(event)
+    _wait(log_queue, len(log_sync))
+    ee.stop()
+
+    assert log_sync == log_queue
+
+
+def test_sync_engine_register():
+    log = []
+    ee = SyncEventEngine()
+    on_quote, on_trade, on_general = _register_log_handlers(ee, log)
+
+    # duplicate registration is ignored
+    ee.register(EVENT_TYPE.MARKET_DATA, on_quote)
+    ee.put(Event(EVENT_TYPE.MARKET_DATA, dic={'no': 0}))
+    assert log == [('quote', 0), ('general', EVENT_TYPE.MARKET_DATA, 0)]
+
+    del log[:]
+    ee.unregister(EVENT_TYPE.TRADE_IND, on_quote)
+    ee.unregisterGeneralHandler(on_general)
+    ee.put(Event(EVENT_TYPE.TRADE_IND, dic={'no': 1}))
+    ee.put(Event(EVENT_TYPE.TIMER, dic={'no': 2}))
+    assert log == [('trade', 1)]
+
+
+def _run_nested(ee):
+    """Handlers put new events while dispatching."""
+    log = []
+
+    def on_quote(event):
+        log.append(('quote', event.dic['no']))
+        if event.dic['no'] < 3:
+            ee.put(Event(EVENT_TYPE.ORDER_STATUS_IND, dic={'no': event.dic['no']}))
+            ee.put(Event(EVENT_TYPE.MARKET_DATA, dic={'no': event.dic['no'] + 1}))
+
+    def on_order_status(event):
+        log.append(('order_status', event.dic['no']))
+        ee.put(Event(EVENT_TYPE.TRADE_IND, dic={'no': event.dic['no']}))
+
+    def on_trade(event):
+        log.append(('trade', event.dic['no']))
+
+    ee.register(EVENT_TYPE.MARKET_DATA, on_quote)
+    ee.register(EVENT_TYPE.ORDER_STATUS_IND, on_order_status)
+    ee.register(EVENT_TYPE.TRADE_IND, on_trade)
+    ee.start(timer=False)
+    ee.put(Event(EVENT_TYPE.MARKET_DATA, dic={'no': 0}))
+    _wait(log, 10)
+    ee.stop()
+    return log
+
+
+def test_sync_engine_fifo():
+    # events put by handlers are dispatched after the current event, in the same order as a queue
+    log = _run_nested(SyncEventEngine())
+    assert log[:4] == [('quote', 0), ('order_status', 0), ('quote', 1), ('trade', 0)]
+    assert len(log) == 10
+    assert log == _run_nested(EventEngine())
+
+
+def test_dispatch_overhead():
+    n = 50000
+    events = [Event(EVENT_TYPE.MARKET_DATA, dic={'no': i}) for i in range(n)]
+    counter = [0]
+
+    def handler(event):
+        counter[0] += 1
+
+    ee = EventEngine()
+    ee.register(EVENT_TYPE.MARKET_DATA, handler)
+    ee.start(timer=False)
+    t0 = time.time()
+    for event in events:
+        ee.put(event)
+    while counter[0] < n:
+        time.sleep(1e-4)
+    t_queue = time.time() - t0
+    ee.stop()
+
+    counter[0] = 0
+    ee = SyncEventEngine()
+    ee.register(EVENT_TYPE.MARKET_DATA, handler)
+    t0 = time.time()
+    for event in events:
+        ee.put(event)
+    t_sync = time.time() - t0
+    assert counter[0] == n
+
+    t0 = time.time()
+    for event in events:
+        handler(event)
+    t_call = time.time() - t0
+
+    print("per event: queue {:.2f}us, sync {:.2f}us, function call {:.2f}us".format(
+        t_queue / n * 1e6, t_sync / n * 1e6, t_call / n * 1e6))
+    assert t_sync < t_queue
+
+
+class LogStrategy(EventDrivenStrategy):
+    def __init__(self):
+        super(LogStrategy, self).__init__()
+        self.log = []
+
+    def on_bar(self, quote_dic):
+        symbol = sorted(quote_dic.keys())[0]
+        self.log.append(('bar', quote_dic[symbol].time))
+        self.ctx.trade_api.place_order(symbol, common.ORDER_ACTION.BUY, quote_dic[symbol].close, 100)
+
+    def on_trade(self, ind):
+        self.log.append(('trade', ind.fill_time))
+
+
+def test_backtest_event_engine():
+    dates = [20170103, 20170104]
+    ds = MemoryDataService(make_df_bar(n_symbols=5, n_times=30, dates=dates))
+    props = {'symbol': ','.join(sorted(ds.df_bar['symbol'].unique())),
+             'start_date': dates[0], 'end_date': dates[-1], 'init_balance': 1e7, 'n_prefetch': 0}
+
+    for bar_type in ['1M', '1d']:
+        strategy = LogStrategy()
+        bt = EventBacktestInstance()
+        model.Context(data_api=ds, trade_api=BacktestTradeApi(), instance=bt, strategy=strategy,
+                      pm=PortfolioManager())
+        bt.init_from_config(dict(props, bar_type=bar_type))
+        assert isinstance(bt.event_engine, SyncEventEngine)
+
+        # market data of the backtest go through event_engine
+        log = []
+        bt.event_engine.register(EVENT_TYPE.MARKET_DATA, lambda event: log.append(event.dic['quote']))
+        bt.run()
+        n_bars = len([e for e in strategy.log if e[0] == 'bar'])
+        assert n_bars == len(log) > 0
+        assert len(bt.get_trades_df()) > 0
+
+        if bar_type == '1M':
+            # orders placed on a bar are filled by the next bar, before on_bar of that bar
+            i = strategy.log.index(('bar', 93100))
+            assert strategy.log[i + 1] == ('trade', 93200)
+            assert strategy.log[i + 2][0] == 'bar'
+
+
+def _make_symbol_events(n, n_symbols=20, seed=0):
+    rng = np.random.RandomState(seed)
+    events = []
+    for no in range(n):
+        type_ = EVENT_TYPES[rng.randint(3)]
+        symbol = '{:06d}.SZ'.format(rng.randint(n_symbols))
+        if type_ == EVENT_TYPE.MARKET_DATA:
+            dic = {'quote': {'symbol': symbol}, 'no': no}
+        else:
+            dic = {'ind': Event(dic={'symbol': symbol}), 'symbol': symbol, 'no': no}
+        events.append(Event(type_, dic=dic))
+    return events
+
+
+def _group_log(log):
+    """Split a log of (type, symbol, no) into per-symbol market data and priority event sequences."""
+    res = dict()
+    for type_, symbol, no in log:
+        lane = 'md' if type_ == EVENT_TYPE.MARKET_DATA else 'priority'
+        res.setdefault((lane, symbol), []).append((type_, no))
+    return res
+
+
+def test_partitioned_engine_same_as_single_thread():
+    events = _make_symbol_events(5000)
+
+    def run(ee):
+        log = []
+
+        def handler(event):
+            symbol = event.dic['quote']['symbol'] if 'quote' in event.dic else event.dic['symbol']
+            log.append((event.type_, symbol, event.dic['no']))
+
+        for type_ in EVENT_TYPES[:3]:
+            ee.register(type_, handler)
+        ee.start(timer=False)
+        for event in events:
+            ee.put(event)
+        if isinstance(ee, PartitionedEventEngine):
+            ee.join()
+        else:
+            _wait(log, len(events))
+        ee.stop()
+        return log
+
+    log_single = run(EventEngine())
+    ee = PartitionedEventEngine(n_workers=4)
+    log_multi = run(ee)
+
+    assert len(log_multi) == len(log_single) == len(events)
+    assert sorted(log_multi) == sorted(log_single)
+    # order is kept within each symbol, and among priority events
+    assert _group_log(log_multi) == _group_log(log_single)
+    priority = [x for x in log_multi if x[0] != EVENT_TYPE.MARKET_DATA]
+    assert priority == [x for x in log_single if x[0] != EVENT_TYPE.MARKET_DATA]
+
+    df_lanes = ee.get_metrics()['lanes']
+    n_md = sum(1 for e in events if e.type_ == EVENT_TYPE.MARKET_DATA)
+    assert df_lanes.loc['priority', 'n_events'] == len(events) - n_md
+    assert df_lanes['n_events'].sum() == len(events)
+    assert (df_lanes['depth'] == 0).all()
+    assert df_lanes['max_depth'].max() >= 1
+    df_handlers = ee.get_metrics()['handlers']
+    assert df_handlers.loc['handler', 'count'] == len(events)
+
+
+def test_partitioned_engine_priority_lane():
+    # a slow quote handler of one symbol does not delay trade indications or other symbols
+    log = []
+
+    def on_quote(event):
+        symbol = event.dic['quote']['symbol']
+        if symbol == 'slow':
+            time.sleep(0.5)
+        log.append(('quote', symbol))
+
+    def on_trade(event):
+        log.append(('trade', event.dic['symbol']))
+
+    ee = PartitionedEventEngine(n_workers=2, key_func=lambda e: e.dic['quote']['symbol'])
+    ee.register(EVENT_TYPE.MARKET_DATA, on_quote)
+    ee.register(EVENT_TYPE.TRADE_IND, on_trade)
+    ee.start(timer=False)
+    ee._key_lanes.update({'slow': 0, 'fast': 1})
+    ee.put(Event(EVENT_TYPE.MARKET_DATA, dic={'quote': {'symbol': 'slow'}}))
+    ee.put(Event(EVENT_TYPE.MARKET_DATA, dic={'quote': {'symbol': 'slow'}}))
+    ee.put(Event(EVENT_TYPE.TRADE_IND, dic={'symbol': 'slow'}))
+    ee.put(Event(EVENT_TYPE.MARKET_DATA, dic={'quote': {'symbol': 'fast'}}))
+    _wait(log, 2)
+    assert sorted(log) == [('quote', 'fast'), ('trade', 'slow')]
+    ee.stop()
+    assert log[2:] == [('quote', 'slow'), ('quote', 'slow')]
+
+    df_handlers = ee.get_metrics()['handlers']
+    assert df_handlers.loc['on_quote', 'max_us'] >= 0.5e6
+    assert ee.get_metrics()['lanes'].loc['worker0', 'max_depth'] >= 1
+
+
+class TickLogStrategy(EventDrivenStrategy):
+    def __init__(self):
+        super(TickLogStrategy, self).__init__()
+        self.log = []
+
+    def on_tick(self, quote):
+        if quote.symbol == 'slow':
+            time.sleep(0.2)
+        self.log.append(('tick', quote.symbol, quote.last))
+
+    def on_trade(self, ind):
+        self.log.append(('trade', ind.symbol, ind.fill_price))
+
+
+class LaneSafeTickLogStrategy(TickLogStrategy):
+    lane_safe = True
+
+
+def _run_live(props, n=300):
+    strategy = TickLogStrategy()
+    instance = EventLiveTradeInstance()
+    instance.init_from_config(props)
+    ds = RemoteDataService()
+    model.Context(data_api=ds, instance=instance, strategy=strategy)
+
+    instance.run()
+    symbols = ['{:06d}.SZ'.format(i) for i in range(10)]
+    for i in range(n):
+        symbol = symbols[i % len(symbols)]
+        if i % 7:
+            ds.mkt_data_callback('quote', {'symbol': symbol, 'last': float(i)})
+        else:
+            trade = Trade()
+            trade.symbol = symbol
+            trade.fill_price = float(i)
+            instance.put(Event(EVENT_TYPE.TRADE_IND, dic={'ind': trade}))
+    _wait(strategy.log, n)
+    instance.stop()
+    return instance, strategy.log
+
+
+def test_live_trade_partitioned_engine():
+    instance, log_single = _run_live({})
+    assert instance.event_engine is None
+
+    instance, log_multi = _run_live({'event_engine': 'partitioned', 'n_event_workers': 3})
+    assert isinstance(instance.event_engine, PartitionedEventEngine)
+    assert instance.event_engine.n_workers == 3
+
+    assert len(log_multi) == len(log_single) == 300
+    # order is kept within each symbol for ticks, and among trades which go to the priority lane
+    for symbol in set(x[1] for x in log_single):
+        assert ([x for x in log_multi if x[:2] == ('tick', symbol)]
+                == [x for x in log_single if x[:2] == ('tick', symbol)])
+    assert [x for x in log_multi if x[0] == 'trade'] == [x for x in log_single if x[0] == 'trade']
+
+    df_handlers = instance.event_engine.get_metrics()['handlers']
+    assert df_handlers.loc['on_bar', 'count'] + df_handlers.loc['on_trade', 'count'] == 300
+
+    # a slow symbol does not delay trade indications of a lane-safe strategy
+    strategy = LaneSafeTickLogStrategy()
+    instance = EventLiveTradeInstance()
+    instance.init_from_config({'event_engine': 'partitioned', 'n_event_workers': 2})
+    ds = RemoteDataService()
+    model.Context(data_api=ds, instance=instance, strategy=strategy)
+    instance.run()
+    ds.mkt_data_callback('quote', {'symbol': 'slow', 'last': 1.0})
+    trade = Trade()
+    trade.symbol = 'slow'
+    instance.put(Event(EVENT_TYPE.TRADE_IND, dic={'ind': trade}))
+    _wait(strategy.log, 1)
+    assert strategy.log[0][0] == 'trade'
+    instance.stop()
+    assert len(strategy.log) == 2
+
+    try:
+        EventLiveTradeInstance().init_from_config({'event_engine': 'unknown'})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("ValueError should have been raised.")
+
+
+class PositionReadStrategy(EventDrivenStrategy):
+    def __init__(self):
+        super(PositionReadStrategy, self).__init__()
+        self.log = []
+        self.errors = []
+        self.n_active = 0
+        self.max_active = 0
+
+    def on_tick(self, quote):
+        self.n_active += 1
+        self.max_active = max(self.max_active, self.n_active)
+        pm = self.ctx.pm
+        size = sum(pos.current_size for pos in list(pm.positions.values()))
+        time.sleep(1e-3)
+        if sum(pos.current_size for pos in list(pm.positions.values())) != size:
+            self.errors.append(quote.symbol)
+        self.n_active -= 1
+        self.log.append(quote.symbol)
+
+
+class LaneSafeStrategy(PositionReadStrategy):
+    lane_safe = True
+
+
+def _run_live_trades(strategy, n=200):
+    instance = EventLiveTradeInstance()
+    pm = PortfolioManager()
+    ds = RemoteDataService()
+    model.Context(data_api=ds, trade_api=BacktestTradeApi(), instance=instance, strategy=strategy, pm=pm)
+    instance.init_from_config({'event_engine': 'partitioned', 'n_event_workers': 4, 'init_balance': 1e7})
+    instance.run()
+
+    symbols = ['{:06d}.SZ'.format(i) for i in range(8)]
+    n_trades = 0
+    for i in range(n):
+        symbol = symbols[i % len(symbols)]
+        ds.mkt_data_callback('quote', {'symbol': symbol, 'last': 10.0})
+        trade = Trade()
+        trade.symbol = symbol
+        trade.entrust_action = common.ORDER_ACTION.BUY
+        trade.set_fill_info(price=10.0, size=100, date=20170104, time=93000, no=str(i), trade_date=20170104)
+        instance.put(Event(EVENT_TYPE.TRADE_IND, dic={'ind': trade}))
+        n_trades += 1
+    _wait(strategy.log, n)
+    _wait(pm.trades, n_trades)
+    instance.stop()
+
+    assert len(strategy.log) == n and len(pm.trades) == n_trades
+    for symbol in symbols:
+        assert pm.get_position(symbol).current_size == 100 * n // len(symbols)
+    return strategy
+
+
+def test_live_trade_lanes_share_pm():
+    # trade callbacks update pm while quotes of other lanes read it
+    strategy = _run_live_trades(PositionReadStrategy())
+    assert strategy.max_active == 1
+    assert not strategy.errors
+
+    strategy = _run_live_trades(LaneSafeStrategy())
+    assert strategy.max_active > 1
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
@@ -0,0 +1,187 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import gc
+import time
+
+import numpy as np
+
+from jaqs.trade import model
+from jaqs.trade import EventDrivenStrategy
+from jaqs.trade.livetrade import EventLiveTradeInstance
+from jaqs.trade.event import EVENT_TYPE
+from jaqs.data import DataApi, RemoteDataService
+from jaqs.util.profile import LatencyHistogram, latency_monitor, clock
+
+
+def test_latency_histogram():
+    rng = np.random.RandomState(0)
+    values = np.concatenate([rng.randint(0, 30, size=1000), rng.lognormal(10, 2, size=20000).astype(int)])
+    hist = LatencyHistogram()
+    for v in values:
+        hist.record(int(v))
+
+    assert hist.count == len(values)
+    assert hist.max == values.max()
+    assert np.isclose(hist.mean, values.mean())
+    for q in [1, 50, 90, 99, 99.9]:
+        lower = np.percentile(values, q, interpolation='lower')
+        higher = np.percentile(values, q, interpolation='higher')
+        assert lower <= hist.percentile(q) <= higher * (1 + 1. / 16) + 1
+    assert hist.percentile(100) == values.max()
+    assert LatencyHistogram().percentile(50) == 0
+
+
+class TickStrategy(EventDrivenStrategy):
+    def __init__(self):
+        super(TickStrategy, self).__init__()
+        self.quotes = []
+
+    def on_tick(self, quote):
+        self.quotes.append(quote)
+
+
+def _make_quote_path():
+    # DataApi without connection
+    api = DataApi.__new__(DataApi)
+    api._schema_id = 1
+    api._schema = [{'id': 0, 'name': 'symbol'}, {'id': 1, 'name': 'last'}]
+    api._make_schema_map()
+    ds = RemoteDataService()
+    instance = EventLiveTradeInstance()
+    strategy = TickStrategy()
+    model.Context(data_api=ds, instance=instance, strategy=strategy)
+    api._on_jsq_callback = ds.mkt_data_callback
+    return api, instance, strategy
+
+
+def _make_quote_ind(i):
+    # as stamped by JRpcClient._on_data_arrived
+    return {'schema_id': 1, 'indicators': [0, 1], 'values': ['000001.SZ', 10.0 + i],
+            '_recv_time': latency_monitor.stamp()}
+
+
+def test_quote_path_latency():
+    latency_monitor.reset()
+    sample_interval = latency_monitor.sample_interval
+    latency_monitor.sample_interval = 1
+    n = 200
+
+    api, instance, strategy = _make_quote_path()
+    instance.run()
+    try:
+        for i in range(n):
+            api._on_rpc_callback('jsq.quote_ind', _make_quote_ind(i))
+        t0 = time.time()
+        while len(strategy.quotes) < n and time.time() - t0 < 10:
+            time.sleep(1e-3)
+    finally:
+        instance.stop()
+        latency_monitor.sample_interval = sample_interval
+
+    assert [q.last for q in strategy.quotes] == [10.0 + i for i in range(n)]
+    assert not hasattr(strategy.quotes[0], '_recv_time')
+
+    stats = latency_monitor.get_stats()
+    df_latency = stats['latency']
+    md = str(EVENT_TYPE.MARKET_DATA)
+    stages = [('quote_converted', 'jsq.quote_ind'), ('event_dispatch', md), ('event_done', md)]
+    assert (df_latency.loc[stages, 'count'] == n).all()
+    # latencies are counted from ingress, so later stages take longer
+    p50 = df_latency.loc[stages, 'mean_us'].values
+    assert (np.diff(p50) >= 0).all()
+    assert stats['queue_depth'].loc[md, 'count'] == n
+
+    line = latency_monitor.log_line()
+    assert line.startswith('latency: ') and 'event_done[{}]'.format(md) in line
+
+
+def test_sampling():
+    latency_monitor.reset()
+    n = 3200
+    api, instance, strategy = _make_quote_path()
+    # events are processed in current thread
+    instance.register(EVENT_TYPE.MARKET_DATA, instance.on_bar)
+    for i in range(n):
+        api._on_rpc_callback('jsq.quote_ind', _make_quote_ind(i))
+    for _ in range(n):
+        instance._EventEngine__process(instance._EventEngine__queue.get_nowait())
+
+    assert len(strategy.quotes) == n
+    stats = latency_monitor.get_stats()
+    n_sampled = n // latency_monitor.sample_interval
+    assert stats['latency'].loc[('event_done', str(EVENT_TYPE.MARKET_DATA)), 'count'] == n_sampled
+    assert stats['queue_depth'].loc[str(EVENT_TYPE.MARKET_DATA), 'count'] == n_sampled
+    # queue depth is counted by put and get, n events are put before the first get
+    assert stats['queue_depth'].loc[str(EVENT_TYPE.MARKET_DATA), 'max'] == n - 1
+
+
+def test_event_overhead():
+    n = 1000
+    api, instance, strategy = _make_quote_path()
+    instance.register(EVENT_TYPE.MARKET_DATA, instance.on_bar)
+    queue_ = instance._EventEngine__queue
+    process = instance._EventEngine__process
+
+    def run_quote_path():
+        # from JRpcClient stamping a notification to the end of its handlers
+        del strategy.quotes[:]
+        t0 = clock()
+        for i in range(n):
+            api._on_rpc_callback('jsq.quote_ind', _make_quote_ind(i))
+            process(queue_.get_nowait())
+        return (clock() - t0) / n
+
+    latency_monitor.reset()
+    t_disabled, t_enabled = [], []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(50):
+            latency_monitor.enabled = False
+            t_disabled.append(run_quote_path())
+            latency_monitor.enabled = True
+            t_enabled.append(run_quote_path())
+    finally:
+        latency_monitor.enabled = True
+        gc.enable()
+
+    assert len(strategy.quotes) == n
+    # runs are interleaved, so that the median of their differences is robust to noise
+    overhead = np.median(np.array(t_enabled) - np.array(t_disabled))
+    print("per event: {:.2f}us, overhead: {:.2f}us".format(min(t_disabled) * 1e6, overhead * 1e6))
+    assert overhead < 1e-6
+
+
+def test_record_overhead():
+    latency_monitor.reset()
+    n = 100000
+    t0 = clock()
+    for _ in range(n):
+        latency_monitor.record('stage', 'type', t0)
+    t_record = (clock() - t0) / n
+
+    t0 = clock()
+    for _ in range(n):
+        pass
+    t_loop = (clock() - t0) / n
+
+    print("per record: {:.2f}us".format((t_record - t_loop) * 1e6))
+    assert latency_monitor.get_stats()['latency'].loc[('stage', 'type'), 'count'] == n
+    assert t_record - t_loop < 2e-6
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
@@ -0,0 +1,271 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from jaqs.trade import common
+from jaqs.trade import model
+from jaqs.trade import EventDrivenStrategy, EventBacktestInstance, BacktestTradeApi, PortfolioManager
+from jaqs.trade import AlphaStrategy, AlphaBacktestInstance, AlphaTradeApi
+from jaqs.trade.walkforward import calc_daily_pnl
+from jaqs.trade.analyze import AlphaAnalyzer
+from jaqs.trade.backtest import TRADE_TYPE_MAP
+from jaqs.trade.ledger import TradeLedger, PositionLedger
+from jaqs.data.basic import Trade, Position
+
+from synthetic_data import make_df_bar, make_dataview, MemoryDataService
+
+
+def _make_trades(n, seed=0):
+    rng = np.random.RandomState(seed)
+    trades = []
+    for i in range(n):
+        trade = Trade()
+        trade.symbol = '{:06d}.SZ'.format(i % 50)
+        trade.task_id = i // 3
+        trade.entrust_no = str(i // 2)
+        trade.entrust_action = common.ORDER_ACTION.BUY if rng.rand() > 0.5 else common.ORDER_ACTION.SELL
+        trade.set_fill_info(10 + rng.rand(), 100 * rng.randint(1, 100), 20170104 + i // 100, 93000 + i, str(i),
+                            trade_date=20170104 + i // 100)
+        trade.commission = rng.rand()
+        trades.append(trade)
+    return trades
+
+
+def _objects_to_df(trades):
+    """DataFrame built attribute by attribute from Trade objects, as BacktestInstance.get_trades_df did."""
+    ser_list = dict()
+    for key, dtype in TRADE_TYPE_MAP.items():
+        v = [t.__getattribute__(key) for t in trades]
+        ser_list[key] = pd.Series(data=v, index=None, dtype=dtype, name=key)
+    return pd.DataFrame(ser_list)
+
+
+def _ledger_to_df(ledger):
+    ser_list = dict()
+    for key, dtype in TRADE_TYPE_MAP.items():
+        ser_list[key] = pd.Series(data=ledger.column(key), index=None, dtype=dtype, name=key)
+    return pd.DataFrame(ser_list)
+
+
+def test_trade_ledger():
+    trades = _make_trades(3000)
+    ledger = TradeLedger(capacity=16)
+    for trade in trades:
+        ledger.append(trade)
+
+    assert len(ledger) == len(trades)
+    pd.testing.assert_frame_equal(_ledger_to_df(ledger), _objects_to_df(trades))
+
+    # list-like view of Trade objects
+    for i in [0, 17, -1]:
+        trade, expected = ledger[i], trades[i]
+        for key in TRADE_TYPE_MAP.keys():
+            assert getattr(trade, key) == getattr(expected, key)
+    assert [t.fill_no for t in ledger] == [t.fill_no for t in trades]
+    assert [t.fill_no for t in ledger[2:5]] == ['2', '3', '4']
+
+    df = ledger.to_dataframe()
+    assert list(df.columns) == ledger.columns
+    assert df['symbol'].tolist() == [t.symbol for t in trades]
+
+
+def test_trade_ledger_spill():
+    trades = _make_trades(2500)
+    folder = tempfile.mkdtemp()
+    ledger = TradeLedger(spill_dir=folder, chunk_size=1000)
+    for trade in trades:
+        ledger.append(trade)
+        assert ledger.nbytes <= TradeLedger(capacity=1000).nbytes
+
+    assert len(ledger) == len(trades)
+    assert len(os.listdir(folder)) == 2
+    pd.testing.assert_frame_equal(_ledger_to_df(ledger), _objects_to_df(trades))
+    assert ledger[1500].fill_no == '1500' and ledger[-1].fill_no == '2499'
+    assert sum(1 for _ in ledger) == len(trades)
+
+    # export
+    for ext in ['csv', 'npz']:
+        fp = os.path.join(folder, 'export', 'trades.' + ext)
+        ledger.save(fp)
+        assert os.path.exists(fp)
+    df = pd.read_csv(os.path.join(folder, 'export', 'trades.csv'), index_col=0)
+    assert np.allclose(df['fill_price'].values, [t.fill_price for t in trades])
+    with np.load(os.path.join(folder, 'export', 'trades.npz'), allow_pickle=True) as npz:
+        assert npz['entrust_no'].tolist() == [t.entrust_no for t in trades]
+        assert npz['task_id'].tolist() == [t.task_id for t in trades]
+
+    # spilled rows keep the types of values, eg. int task_id
+    ledger_mem = TradeLedger()
+    for trade in trades:
+        ledger_mem.append(trade)
+    pd.testing.assert_frame_equal(ledger.to_dataframe(), ledger_mem.to_dataframe())
+    assert [type(t.task_id) for t in ledger] == [int] * len(trades)
+
+
+def test_position_ledger():
+    ledger = PositionLedger()
+    ledger.record(20170104, np.array(['b', 'a']), np.array([200.0, 100.0]))
+
+    # recording the same date twice replaces the records
+    ledger.record(20170105, np.array(['a']), np.array([100.0]))
+    ledger.record(20170105, np.array(['a']), np.array([300.0]))
+    ledger.record(20170106, np.array([]), np.array([]))
+
+    df = ledger.to_dataframe()
+    assert df[['trade_date', 'symbol', 'current_size']].values.tolist() == \
+        [[20170104, 'b', 200.0], [20170104, 'a', 100.0], [20170105, 'a', 300.0]]
+
+    df_mat = ledger.to_matrix()
+    assert df_mat.index.tolist() == [20170104, 20170105, 20170106]
+    assert df_mat.loc[:, ['a', 'b']].values.tolist() == [[100.0, 200.0], [300.0, 0.0], [0.0, 0.0]]
+
+
+def test_market_value():
+    rng = np.random.RandomState(0)
+    pm = PortfolioManager()
+    pm.ctx = model.Context()
+    pm.original_on_trade = lambda ind: None
+    symbols = ['{:06d}.SZ'.format(i) for i in range(300)]
+    for trade in _make_trades(2000):
+        trade.symbol = symbols[rng.randint(len(symbols))]
+        pm._on_trade(trade)
+
+    prices = pd.Series(10 + rng.rand(len(symbols)), index=symbols)
+    suspensions = symbols[::7]
+
+    # original loop over holdings
+    mv_float, mv_frozen = 0.0, 0.0
+    for sec in pm.holding_securities:
+        mv_sec = prices[sec] * pm.get_position(sec).current_size
+        if sec in suspensions:
+            mv_frozen += mv_sec
+        else:
+            mv_float += mv_sec
+
+    for ref_prices in [prices, prices.to_dict()]:
+        res = pm.market_value(ref_prices, suspensions)
+        assert np.allclose(res, (mv_float, mv_frozen))
+    assert np.isclose(sum(pm.market_value(prices)), mv_float + mv_frozen)
+
+    sizes = pm.get_sizes(symbols + ['not_held'])
+    assert sizes[-1] == 0
+    assert sizes[:-1].tolist() == [pm.get_pos(sec) for sec in symbols]
+
+    # price of a holding is missing
+    try:
+        pm.market_value(prices.drop(list(pm.holding_securities)[0]))
+        assert False
+    except KeyError:
+        pass
+
+
+class DailyBuyStrategy(EventDrivenStrategy):
+    """Buy 100 shares of each symbol on the first bar of every day."""
+    def __init__(self):
+        super(DailyBuyStrategy, self).__init__()
+        self.last_date = 0
+
+    def on_bar(self, quote_dic):
+        if self.ctx.trade_date != self.last_date:
+            self.last_date = self.ctx.trade_date
+            for symbol, quote in quote_dic.items():
+                self.ctx.trade_api.place_order(symbol, common.ORDER_ACTION.BUY, quote.close * 1.1, 100)
+
+
+def test_backtest_ledger():
+    dates = [20170103, 20170104, 20170105]
+    df_bar = make_df_bar(n_symbols=3, n_times=30, dates=dates)
+    symbols = sorted(df_bar['symbol'].unique())
+    props = {'symbol': ','.join(symbols),
+             'start_date': dates[0], 'end_date': dates[-1],
+             'bar_type': '1M', 'init_balance': 1e7,
+             'ledger_dir': tempfile.mkdtemp(), 'ledger_chunk_size': 4}
+
+    bt = EventBacktestInstance()
+    pm = PortfolioManager()
+    model.Context(data_api=MemoryDataService(df_bar), trade_api=BacktestTradeApi(), instance=bt,
+                  strategy=DailyBuyStrategy(), pm=pm)
+    bt.init_from_config(props)
+    bt.run()
+
+    assert len(pm.trades) == 9
+    df_trades = bt.get_trades_df()
+    assert df_trades['fill_size'].sum() == 900
+    assert sorted(set(df_trades['trade_date'])) == dates
+
+    df_pos = pm.get_daily_positions_df()
+    assert len(df_pos) == 9
+    assert df_pos.groupby('trade_date')['current_size'].sum().tolist() == [300, 600, 900]
+    assert set(df_pos['symbol']) == set(symbols)
+
+    # end-of-day positions are the same as replaying trades
+    df_trades['signed_size'] = df_trades['fill_size'] * np.where(df_trades['entrust_action'] == 'Buy', 1, -1)
+    df_replay = df_trades.pivot_table(index='trade_date', columns='symbol', values='signed_size', aggfunc=np.sum)
+    df_replay = df_replay.fillna(0.0).cumsum()
+    pd.testing.assert_frame_equal(pm.get_position_matrix(), df_replay, check_names=False)
+
+    folder = tempfile.mkdtemp()
+    bt.save_results(folder)
+    df_saved = pd.read_csv(os.path.join(folder, 'positions.csv'), index_col=0)
+    assert np.allclose(df_saved.values, df_replay.values)
+
+
+def test_recorded_position_pnl():
+    dv = make_dataview(n_dates=30, n_symbols=4)
+    dates = dv.dates
+    split_symbol, delist_symbol = dv.symbol[0], dv.symbol[1]
+    # 1:1 stock split of one symbol and delisting of another
+    dv.data_d.loc[dates[10]:, (split_symbol, 'close')] /= 2.0
+    dv.data_d.loc[dates[10], (split_symbol, '_daily_adjust_factor')] = 2.0
+    dv.data_d.loc[dates[20]:, (delist_symbol, 'close')] = np.nan
+    dv._data_inst.loc[delist_symbol, 'delist_date'] = dates[20]
+    
+    props = {'start_date': dv.start_date, 'end_date': dv.end_date,
+             'period': 'day', 'n_periods': 1,
+             'init_balance': 1e7, 'position_ratio': 1.0}
+    bt = AlphaBacktestInstance()
+    model.Context(dataview=dv, instance=bt, strategy=AlphaStrategy(pc_method='equal_weight'),
+                  trade_api=AlphaTradeApi(), pm=PortfolioManager())
+    bt.init_from_config(props)
+    bt.run_alpha()
+    df_trades = bt.get_trades_df()
+    assert (df_trades['task_id'].astype(int) == bt.POSITION_ADJUST_NO).any()
+    assert (df_trades['task_id'].astype(int) == bt.DELIST_ADJUST_NO).any()
+    
+    folder = tempfile.mkdtemp()
+    bt.save_results(folder)
+    ta = AlphaAnalyzer()
+    ta.initialize(dataview=dv, file_folder=folder)
+    ta.process_trades()
+    ta._calc_daily()
+    
+    # daily positions and PnL come from the same recorded positions
+    df_position = ta.daily['position'].unstack('symbol')
+    pd.testing.assert_frame_equal(df_position, ta.daily_position.loc[:, df_position.columns], check_names=False)
+    
+    # the delisting trade is booked once, PnL equals marking trades to close
+    pnl = ta.daily['total_pnl'].groupby(level='trade_date').sum()
+    df_close = dv.get_ts('close', start_date=pnl.index[0], end_date=pnl.index[-1])
+    pnl_replay = calc_daily_pnl(df_trades, df_close, 1e7)
+    assert np.allclose(pnl.values, pnl_replay.values)
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
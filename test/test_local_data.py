@@ -0,0 +1,161 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from jaqs.data import LocalBarStore, LocalDataService
+from jaqs.trade import model
+from jaqs.trade import EventDrivenStrategy, EventBacktestInstance, BacktestTradeApi, PortfolioManager
+
+from synthetic_data import make_df_bar, MemoryDataService
+
+
+DATES = [20170103, 20170104, 20170105]
+
+
+def test_bar_store():
+    folder = tempfile.mkdtemp()
+    try:
+        df_bar = make_df_bar(n_symbols=10, n_times=240, dates=DATES)
+        store = LocalBarStore(folder)
+        
+        # ingest from API
+        n = store.ingest_from_api(MemoryDataService(df_bar), ','.join(df_bar['symbol'].unique()), 20170101, 20170131)
+        assert n == len(df_bar)
+        assert os.path.exists(os.path.join(folder, '1M', '20170104.npz'))
+        assert list(store.query_trade_dates(20170101, 20170131)) == DATES
+        assert list(store.query_trade_dates(20170104, 20170104)) == [20170104]
+        
+        # read selected symbols
+        df = store.read('000003.SZ,000007.SZ', 20170104, 20170105, fields='close,volume')
+        df_expected = df_bar.loc[df_bar['symbol'].isin(['000003.SZ', '000007.SZ'])
+                                 & (df_bar['trade_date'] >= 20170104)]
+        df_expected = df_expected.sort_values(['trade_date', 'symbol', 'date', 'time'])
+        assert len(df) == len(df_expected)
+        assert set(df.columns) == {'symbol', 'trade_date', 'date', 'time', 'close', 'volume'}
+        assert np.allclose(df['close'].values, df_expected['close'].values)
+        assert list(df['symbol'].values) == list(df_expected['symbol'].values)
+        
+        df = store.read('000003.SZ', 20170104, 20170104, start_time=100000, end_time=103000)
+        assert df['time'].min() >= 100000 and df['time'].max() <= 103000
+        assert store.read('no.such.symbol', 20170104, 20170104).empty
+        
+        # overwrite some symbols of a day, other symbols are kept
+        df_new = df_bar.loc[(df_bar['trade_date'] == 20170104) & (df_bar['symbol'] == '000001.SZ')].copy()
+        df_new['close'] = 1.0
+        store.write(df_new)
+        df = store.read('', 20170104, 20170104)
+        assert len(df) == 10 * 240
+        assert (df.loc[df['symbol'] == '000001.SZ', 'close'] == 1.0).all()
+        
+        # ingest from CSV
+        fp = os.path.join(folder, 'bars.csv')
+        df_bar.loc[df_bar['trade_date'] == 20170103].to_csv(fp, index=False)
+        store2 = LocalBarStore(os.path.join(folder, 'store2'))
+        assert store2.ingest_from_csv(fp, freq='5M') == 10 * 240
+        assert list(store2.query_trade_dates(0, 99999999, freq='5M')) == [20170103]
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_local_data_service():
+    folder = tempfile.mkdtemp()
+    try:
+        df_bar = make_df_bar(n_symbols=5, n_times=240, dates=DATES)
+        ds = LocalDataService()
+        ds.init_from_config({'local.data.path': folder})
+        ds.store.write(df_bar)
+        
+        df, msg = ds.bar('000002.SZ', trade_date=20170105)
+        assert msg == '0,'
+        assert len(df) == 240 and (df['trade_date'] == 20170105).all()
+        
+        assert list(ds.query_trade_dates(20170101, 20170104)) == DATES[:2]
+        assert ds.query_next_trade_date(20170103) == 20170104
+        assert ds.query_last_trade_date(20170104) == 20170103
+        assert ds.is_trade_date(20170105) and not ds.is_trade_date(20170106)
+        for func, date in [(ds.query_last_trade_date, 20170103), (ds.query_next_trade_date, 20170105)]:
+            try:
+                func(date)
+            except ValueError as e:
+                assert '[20170103, 20170105]' in str(e)
+            else:
+                raise AssertionError("ValueError should have been raised.")
+        
+        # daily bars aggregated from minute bars
+        df, msg = ds.daily('000002.SZ,000004.SZ', 20170101, 20170131)
+        assert len(df) == 2 * 3
+        df_sym = df_bar.loc[(df_bar['symbol'] == '000004.SZ') & (df_bar['trade_date'] == 20170104)]
+        row = df.loc[(df['symbol'] == '000004.SZ') & (df['trade_date'] == 20170104)].iloc[0]
+        assert np.isclose(row['open'], df_sym['open'].iloc[0])
+        assert np.isclose(row['close'], df_sym['close'].iloc[-1])
+        assert np.isclose(row['high'], df_sym['high'].max())
+        assert np.isclose(row['volume'], df_sym['volume'].sum())
+        
+        # daily bars stored explicitly take precedence
+        df_daily = df.loc[df['trade_date'] == 20170103].copy()
+        df_daily['close'] = 100.0
+        ds.store.write(df_daily, freq='1d')
+        df, _ = ds.daily('000002.SZ', 20170103, 20170104, fields='close')
+        assert list(df.columns) == ['symbol', 'trade_date', 'close']
+        assert list(df['close'] == 100.0) == [True, False]
+    finally:
+        shutil.rmtree(folder)
+
+
+class BuyAndHoldStrategy(EventDrivenStrategy):
+    def __init__(self):
+        super(BuyAndHoldStrategy, self).__init__()
+        self.n_bars = 0
+    
+    def on_bar(self, quote_dic):
+        self.n_bars += 1
+        if self.n_bars == 1:
+            for symbol in quote_dic:
+                self.buy(quote_dic[symbol], 100, slippage=0.1)
+
+
+def test_backtest_offline():
+    folder = tempfile.mkdtemp()
+    try:
+        df_bar = make_df_bar(n_symbols=5, n_times=240, dates=DATES)
+        LocalBarStore(folder).write(df_bar)
+        
+        for bar_type in ['1M', '1d']:
+            props = {'symbol': ','.join(df_bar['symbol'].unique()),
+                     'start_date': DATES[0], 'end_date': DATES[-1],
+                     'bar_type': bar_type, 'init_balance': 1e6,
+                     'local.data.path': folder}
+            strategy = BuyAndHoldStrategy()
+            bt = EventBacktestInstance()
+            pm = PortfolioManager()
+            model.Context(data_api=LocalDataService(), trade_api=BacktestTradeApi(), instance=bt,
+                          strategy=strategy, pm=pm)
+            bt.init_from_config(props)
+            bt.run()
+            
+            assert strategy.n_bars == (3 * 240 if bar_type == '1M' else 2)
+            assert len(pm.trades) == 5
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+    
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+    
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+    
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
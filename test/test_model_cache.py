@@ -0,0 +1,93 @@
+# encoding: utf-8
+
+from __future__ import print_function
+
+import numpy as np
+import pandas as pd
+
+from jaqs.trade import model
+from jaqs.trade import AlphaStrategy
+
+
+def _make_context(symbols, n_calls):
+    def momentum(context, user_options=None):
+        n_calls['momentum'] += 1
+        return context.snapshot['momentum']
+
+    def not_st(context, user_options=None):
+        n_calls['not_st'] += 1
+        return context.snapshot['momentum'] > -10
+
+    signal_model = model.FactorSignalModel()
+    signal_model.add_signal(name='momentum', func=momentum)
+    stock_selector = model.StockSelector()
+    stock_selector.add_filter(name='not_st', func=not_st)
+    strategy = AlphaStrategy(signal_model=signal_model, stock_selector=stock_selector,
+                             pc_method='factor_value_weight')
+    ctx = model.AlphaContext(strategy=strategy)
+    for obj in [signal_model, stock_selector]:
+        obj.register_context(ctx)
+    strategy.init_from_config({})
+    ctx.universe = symbols
+    ctx.trade_date = 20170104
+    ctx.snapshot = pd.DataFrame({'momentum': np.arange(len(symbols), dtype=float)}, index=symbols)
+    return ctx
+
+
+def test_model_cache():
+    cache = model.ModelCache()
+    n_calls = []
+    func = lambda: n_calls.append(1) or np.arange(3)
+
+    res = cache.get('owner', 'f', 20170104, ['a', 'b'], func)
+    assert cache.get('owner', 'f', 20170104, ['a', 'b'], func) is res
+    cache.get('owner', 'f', 20170104, ['a', 'c'], func)
+    cache.get('owner', 'f', 20170105, ['a', 'b'], func)
+    assert len(n_calls) == 3
+    assert len(cache.data) == 1
+
+    stats = cache.get_stats()
+    assert stats.loc['f', 'hits'] == 1 and stats.loc['f', 'misses'] == 3
+
+
+def test_rebalance_cache():
+    symbols = ['a', 'b', 'c']
+    n_calls = {'momentum': 0, 'not_st': 0}
+    ctx = _make_context(symbols, n_calls)
+    strategy = ctx.strategy
+
+    strategy.portfolio_construction(symbols)
+    weights = dict(strategy.weights)
+    for _ in range(3):
+        strategy.signal_model.forecast_signal(weights)
+    assert np.isclose(strategy.signal_model.forecast_signal(weights), np.dot([0, 1. / 3, 2. / 3], [0, 1, 2]))
+    assert n_calls == {'momentum': 1, 'not_st': 1}
+
+    stats = ctx.cache.get_stats()
+    assert stats.loc['forecasts', 'misses'] == 1
+    assert stats.loc['forecasts', 'hits'] == 4
+
+    # next re-balance on the same date runs models again
+    strategy.portfolio_construction(symbols)
+    assert n_calls == {'momentum': 2, 'not_st': 2}
+
+    # so does a new date
+    ctx.trade_date = 20170105
+    strategy.signal_model.make_forecast()
+    assert n_calls['momentum'] == 3
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
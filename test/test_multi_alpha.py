@@ -0,0 +1,99 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import os
+import random
+
+import numpy as np
+import pandas as pd
+
+from jaqs.trade import AlphaStrategy, MultiAlphaStrategy, AlphaBacktestInstance, MultiAlphaBacktestInstance
+from jaqs.trade import AlphaTradeApi, PortfolioManager
+from jaqs.trade import model
+
+from synthetic_data import make_dataview
+
+
+def top_momentum(context, user_options=None):
+    momentum = context.snapshot['momentum']
+    return momentum.rank(ascending=user_options['ascending']) <= 3
+
+
+def _make_sleeve(ascending):
+    stock_selector = model.StockSelector()
+    stock_selector.add_filter(name='momentum', func=top_momentum, options={'ascending': ascending})
+    return AlphaStrategy(stock_selector=stock_selector, pc_method='equal_weight')
+
+
+def _run(dv, strategy, instance, init_balance=1e8):
+    props = {'start_date': dv.start_date, 'end_date': dv.end_date,
+             'period': 'day', 'n_periods': 2,
+             'init_balance': init_balance, 'position_ratio': 1.0}
+    context = model.Context(dataview=dv, instance=instance, strategy=strategy,
+                            trade_api=AlphaTradeApi(), pm=PortfolioManager())
+    if not isinstance(strategy, MultiAlphaStrategy):
+        strategy.stock_selector.register_context(context)
+    instance.init_from_config(props)
+    instance.run_alpha()
+    return instance
+
+
+def test_netting():
+    dv = make_dataview(n_dates=40, n_symbols=10)
+    strategy = MultiAlphaStrategy({'high': _make_sleeve(False), 'low': _make_sleeve(True)},
+                                  allocations={'high': 0.7, 'low': 0.3})
+    bt = _run(dv, strategy, MultiAlphaBacktestInstance())
+
+    # netted weights are weighted sum of sleeve weights
+    w = np.array([strategy.weights[s] for s in dv.symbol])
+    expected = 0.7 * strategy.sleeve_weights['high'] + 0.3 * strategy.sleeve_weights['low']
+    assert np.allclose(w, expected)
+    assert np.isclose(np.abs(strategy.sleeve_weights['high']).sum(), 1.0)
+
+    # one account: trades of both sleeves are netted into one order per symbol and date
+    trades = bt.get_trades_df()
+    assert not trades.duplicated(['symbol', 'fill_date']).any()
+
+    df_pnl = bt.get_sleeve_pnl()
+    assert list(df_pnl.columns) == ['high', 'low', 'residual', 'total']
+    assert np.allclose(df_pnl[['high', 'low', 'residual']].sum(axis=1), df_pnl['total'])
+    assert df_pnl['high'].abs().sum() > 0 and df_pnl['low'].abs().sum() > 0
+
+    folder = '../output/tests/multi_alpha{:.6f}'.format(random.random())
+    bt.save_results(folder)
+    assert os.path.exists(os.path.join(folder, 'sleeve_pnl.csv'))
+
+
+def test_same_as_single():
+    dv = make_dataview(n_dates=40, n_symbols=10)
+    bt_single = _run(dv, _make_sleeve(False), AlphaBacktestInstance())
+
+    # two identical sleeves give the same trades as one strategy, and the same PnL each
+    strategy = MultiAlphaStrategy([('a', _make_sleeve(False)), ('b', _make_sleeve(False))])
+    bt = _run(dv, strategy, MultiAlphaBacktestInstance())
+
+    df1 = bt_single.get_trades_df()
+    df2 = bt.get_trades_df()
+    assert len(df1) == len(df2)
+    assert np.allclose(df1['fill_size'].values, df2['fill_size'].values)
+    assert np.allclose(df1['fill_price'].values, df2['fill_price'].values)
+
+    df_pnl = bt.get_sleeve_pnl()
+    assert np.allclose(df_pnl['a'], df_pnl['b'])
+    assert np.allclose(df_pnl['a'] + df_pnl['b'] + df_pnl['residual'], df_pnl['total'])
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
@@ -0,0 +1,70 @@
+# encoding: UTF-8
+
+from __future__ import print_function
+import time
+
+import numpy as np
+import pandas as pd
+
+from jaqs.data import Parser
+
+
+def _make_data(n_dates, n_symbols, seed=0):
+    rng = np.random.RandomState(seed)
+    group = pd.DataFrame(rng.choice(['bank', 'steel', 'tech', 'food'], size=(n_dates, n_symbols)))
+    size = pd.DataFrame(rng.randn(n_dates, n_symbols))
+    beta = pd.DataFrame(rng.randn(n_dates, n_symbols))
+    val = pd.DataFrame(rng.randn(n_dates, n_symbols)) + 0.5 * size - 0.3 * beta + (group == 'tech') * 2.0
+    val.iloc[rng.rand(n_dates, n_symbols) < 0.05] = np.nan
+    group.iloc[rng.rand(n_dates, n_symbols) < 0.05] = np.nan
+    return val, group, size, beta
+
+
+def test_neutralize():
+    val, group, size, beta = _make_data(10, 200)
+    index_member = pd.DataFrame(np.random.RandomState(1).rand(10, 200) < 0.9)
+
+    parser = Parser()
+    parser.parse('Neutralize(val, g, size, beta)')
+    res = parser.evaluate({'val': val, 'g': group, 'size': size, 'beta': beta}, index_member=index_member)
+
+    for t in range(10):
+        valid = (val.iloc[t].notnull() & group.iloc[t].notnull() & index_member.iloc[t]).values
+        dummy = pd.get_dummies(group.iloc[t][valid]).values.astype(float)
+        x = np.hstack([dummy, size.iloc[t][valid].values[:, None], beta.iloc[t][valid].values[:, None]])
+        y = val.iloc[t][valid].values
+        coef = np.linalg.lstsq(x, y, rcond=None)[0]
+        assert np.allclose(res.iloc[t][valid].values, y - x.dot(coef))
+        assert res.iloc[t][~valid].isnull().all()
+
+    # group only: residual is de-meaned within each group
+    parser.parse('Neutralize(val, g)')
+    res = parser.evaluate({'val': val, 'g': group})
+    group_mean = res.stack().groupby([res.stack().index.get_level_values(0), group.stack()]).mean()
+    assert np.abs(group_mean).max() < 1e-10
+
+
+def test_neutralize_speed():
+    val, group, size, beta = _make_data(2500, 3000)
+    parser = Parser()
+    parser.parse('Neutralize(val, g, size, beta)')
+    t = time.time()
+    res = parser.evaluate({'val': val, 'g': group, 'size': size, 'beta': beta})
+    print("Neutralize of 2500 x 3000: {:.2f}s".format(time.time() - t))
+    assert time.time() - t < 20.0
+    assert res.shape == val.shape
+
+
+if __name__ == "__main__":
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
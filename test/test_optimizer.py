@@ -0,0 +1,233 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import time
+
+import numpy as np
+import pandas as pd
+
+from jaqs.trade import model
+from jaqs.trade import AlphaStrategy
+from jaqs.trade.optimizer import PortfolioOptimizer, FactorCovariance, project_box_sum, prox_l1
+
+
+def _make_problem(n, k=10, seed=0):
+    rng = np.random.RandomState(seed)
+    exposure = rng.randn(n, k)
+    factor_cov = np.diag(rng.rand(k) * 1e-2)
+    specific_var = rng.rand(n) * 2e-2 + 1e-2
+    alpha = rng.randn(n) * 1e-2
+    return alpha, FactorCovariance(exposure, factor_cov, specific_var)
+
+
+def test_projections():
+    rng = np.random.RandomState(1)
+    v = rng.randn(50)
+    w = project_box_sum(v, np.zeros(50), np.full(50, 0.1), 1.0)
+    assert np.isclose(w.sum(), 1.0)
+    assert w.min() >= 0 and w.max() <= 0.1
+    # optimality: w = clip(v - tau) for one scalar tau
+    free = (w > 1e-12) & (w < 0.1 - 1e-12)
+    assert np.allclose((v - w)[free], (v - w)[free][0])
+
+    center = rng.randn(50)
+    w = prox_l1(v, center, 0.0, 2.0)
+    assert np.isclose(np.abs(w - center).sum(), 2.0)
+    assert np.allclose(prox_l1(v, center, 0.0, None), v)
+
+
+def test_equality_constrained_closed_form():
+    n = 30
+    alpha, fcov = _make_problem(n)
+    cov = fcov.to_dense()
+    lam = 2.0
+    # max alpha'w - lam/2 w'Sw s.t. sum(w) = 1, without bounds
+    s_inv_a = np.linalg.solve(cov, alpha)
+    s_inv_1 = np.linalg.solve(cov, np.ones(n))
+    nu = (s_inv_a.sum() - lam) / s_inv_1.sum()
+    expected = (s_inv_a - nu * s_inv_1) / lam
+
+    opt = PortfolioOptimizer(risk_aversion=lam, long_only=False, max_weight=100.0, tol=1e-10, max_iter=10000)
+    w = opt.optimize(alpha, cov)
+    assert opt.info['converged']
+    assert np.allclose(w, expected, atol=1e-6)
+
+    # factor covariance gives the same solution as the dense matrix
+    w_factor = opt.optimize(alpha, fcov)
+    assert np.allclose(w_factor, w, atol=1e-6)
+
+
+def test_long_only_constraints():
+    n = 200
+    alpha, cov = _make_problem(n)
+    rng = np.random.RandomState(2)
+    w0 = rng.rand(n)
+    w0 /= w0.sum()
+    industry = rng.randint(0, 8, n)
+
+    opt = PortfolioOptimizer(risk_aversion=5.0, max_weight=0.02, turnover_limit=0.3, cost=1e-3,
+                             industry_limit=0.01, tol=1e-9, max_iter=20000)
+    w = opt.optimize(alpha, cov, w0=w0, benchmark=w0, industry=industry)
+    assert opt.info['converged']
+    assert np.isclose(w.sum(), 1.0)
+    assert w.min() >= 0 and w.max() <= 0.02 + 1e-12
+    assert np.abs(w - w0).sum() <= 0.3 + 1e-6
+    active = np.bincount(industry, weights=w - w0)
+    assert np.all(np.abs(active) <= 0.01 + 1e-6)
+
+    # deterministic
+    w2 = PortfolioOptimizer(risk_aversion=5.0, max_weight=0.02, turnover_limit=0.3, cost=1e-3,
+                            industry_limit=0.01, tol=1e-9, max_iter=20000).optimize(
+        alpha, cov, w0=w0, benchmark=w0, industry=industry)
+    assert np.array_equal(w, w2)
+
+    # the solution is better than any random feasible portfolio
+    def util(x):
+        return alpha.dot(x) - 2.5 * x.dot(cov.dot(x)) - 1e-3 * np.abs(x - w0).sum()
+    opt_free = PortfolioOptimizer(risk_aversion=5.0, max_weight=0.02, cost=1e-3, tol=1e-9, max_iter=20000)
+    w_free = opt_free.optimize(alpha, cov, w0=w0)
+    for _ in range(20):
+        x = project_box_sum(rng.rand(n) * 0.02, np.zeros(n), np.full(n, 0.02), 1.0)
+        assert util(w_free) >= util(x)
+
+
+def test_long_short_and_tracking_error():
+    n = 300
+    alpha, cov = _make_problem(n, seed=3)
+    opt = PortfolioOptimizer(risk_aversion=1.0, long_only=False, net_exposure=0.0, max_weight=0.05,
+                             gross_limit=2.0, tol=1e-9, max_iter=20000)
+    w = opt.optimize(alpha, cov)
+    assert abs(w.sum()) < 1e-8
+    assert np.abs(w).sum() <= 2.0 + 1e-6
+    assert w.min() >= -0.05 - 1e-12
+
+    bench = np.full(n, 1.0 / n)
+    opt = PortfolioOptimizer(risk_aversion=1.0, max_weight=0.05, te_limit=0.02)
+    w = opt.optimize(alpha, cov, benchmark=bench)
+    active = w - bench
+    te = np.sqrt(active.dot(cov.dot(active)))
+    assert opt.info['te_multiplier'] > 0
+    assert te <= 0.02 + 1e-4
+    assert te > 0.019
+
+
+def test_large_universe_speed():
+    n = 2000
+    alpha, cov = _make_problem(n, k=20, seed=4)
+    industry = np.random.RandomState(4).randint(0, 30, n)
+    bench = np.full(n, 1.0 / n)
+    opt = PortfolioOptimizer(risk_aversion=10.0, max_weight=0.02, turnover_limit=0.5, cost=1e-3,
+                             industry_limit=0.02)
+    t = time.time()
+    w = opt.optimize(alpha, cov, w0=bench, benchmark=bench, industry=industry)
+    assert time.time() - t < 1.0
+    assert opt.info['converged']
+    assert np.isclose(w.sum(), 1.0)
+
+
+def test_large_universe_turnover_and_cost():
+    n = 2000
+    alpha, cov = _make_problem(n, k=20, seed=4)
+    rng = np.random.RandomState(5)
+    w0 = rng.rand(n)
+    w0 /= w0.sum()
+    for constraints in [{'turnover_limit': 0.3}, {'cost': 2e-3}]:
+        opt = PortfolioOptimizer(risk_aversion=10.0, max_weight=0.02, **constraints)
+        t = time.time()
+        w = opt.optimize(alpha, cov, w0=w0)
+        assert time.time() - t < 1.0
+        assert opt.info['converged']
+        assert np.isclose(w.sum(), 1.0)
+        assert w.min() >= 0 and w.max() <= 0.02 + 1e-12
+        if 'turnover_limit' in constraints:
+            assert np.abs(w - w0).sum() <= 0.3 + opt.tol
+
+
+def test_constraints_without_convergence():
+    n = 300
+    alpha, cov = _make_problem(n, seed=6)
+    rng = np.random.RandomState(6)
+    w0 = rng.rand(n)
+    w0 /= w0.sum()
+    industry = rng.randint(0, 8, n)
+    bench = np.full(n, 1.0 / n)
+    
+    # weights satisfy all constraints even if ADMM stops early
+    opt = PortfolioOptimizer(risk_aversion=5.0, max_weight=0.01, turnover_limit=0.2, cost=1e-3,
+                             industry_limit=0.01, max_iter=30)
+    w = opt.optimize(alpha, cov, w0=w0, benchmark=bench, industry=industry)
+    assert not opt.info['converged']
+    assert np.isclose(w.sum(), 1.0)
+    assert w.min() >= 0 and w.max() <= 0.01 + 1e-12
+    assert np.abs(w - w0).sum() <= 0.2 + opt.tol
+    assert np.all(np.abs(np.bincount(industry, weights=w - bench)) <= 0.01 + opt.tol)
+    
+    # industry limit holds when tracking error limit is binding
+    opt = PortfolioOptimizer(risk_aversion=1.0, max_weight=0.05, industry_limit=0.01, te_limit=0.02)
+    w = opt.optimize(alpha, cov, benchmark=bench, industry=industry)
+    assert opt.info['te_multiplier'] > 0
+    assert np.all(np.abs(np.bincount(industry, weights=w - bench)) <= 0.01 + opt.tol)
+    
+    # a net exposure of 1 can not be reached from zero weights with turnover 0.5
+    try:
+        PortfolioOptimizer(max_weight=0.01, turnover_limit=0.5).optimize(alpha, cov)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("ValueError should have been raised.")
+
+
+class _CovRiskModel(model.FactorRiskModel):
+    def __init__(self, cov):
+        super(_CovRiskModel, self).__init__()
+        self.cov = cov
+
+    def calc_covariance(self, symbols):
+        return self.cov
+
+
+def test_strategy_optimize_mc():
+    symbols = ['a', 'b', 'c', 'd']
+    alpha = np.array([0.03, 0.01, 0.02, -0.01])
+
+    signal_model = model.FactorSignalModel()
+    signal_model.make_forecast = lambda: dict(zip(symbols, alpha))
+    cov = np.diag([0.04, 0.02, 0.03, 0.01])
+    strategy = AlphaStrategy(signal_model=signal_model, risk_model=_CovRiskModel(cov),
+                             cost_model=model.TradeCostModel(commission_rate=1e-3), pc_method='mc')
+    ctx = model.AlphaContext(strategy=strategy)
+    ctx.snapshot = pd.DataFrame({'close': [10.0, 20.0, 5.0, 8.0], 'sw1': ['x', 'x', 'y', 'y']}, index=symbols)
+    ctx.snapshot_sub = ctx.snapshot
+    ctx.universe = symbols
+    strategy.cash = 1e6
+    strategy.single_symbol_weight_limit = 0.6
+    strategy._get_weights_last = lambda: {s: 0 for s in symbols}
+
+    weights, msg = strategy.optimize_mc(constraints={'risk_aversion': 2.0})
+    assert msg == ""
+    w = np.array([weights[s] for s in symbols])
+    assert np.isclose(w.sum(), 1.0) and w.max() <= 0.6 + 1e-9
+    expected = PortfolioOptimizer(risk_aversion=2.0, max_weight=0.6, cost=1e-3).optimize(alpha, cov)
+    assert np.allclose(w, expected)
+
+    # industry neutral against an equal weight benchmark
+    ctx.snapshot['bench'] = 1.0
+    weights, _ = strategy.optimize_mc(constraints={'risk_aversion': 2.0, 'industry_limit': 0.0,
+                                                   'industry_field': 'sw1', 'benchmark_field': 'bench'})
+    assert np.isclose(weights['a'] + weights['b'], 0.5, atol=1e-5)
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
@@ -0,0 +1,149 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import time
+
+import numpy as np
+
+from jaqs.trade import common
+from jaqs.trade.tradegateway import OrderBook, DailyStockSimulator
+from jaqs.data.basic import Order, Bar, FixedPriceTypeOrder
+
+
+def _bar(symbol, low, high, vwap=None, t=93100):
+    return Bar.create_from_dict({'symbol': symbol, 'trade_date': 20170104, 'date': 20170104, 'time': t,
+                                 'open': low, 'close': high, 'low': low, 'high': high,
+                                 'vwap': (low + high) / 2.0 if vwap is None else vwap, 'volume': 1e6})
+
+
+def _naive_fill(order, bar):
+    """Fill price of an order on a bar by the rules of the original linear scan, None if not filled."""
+    buy = common.ORDER_ACTION.is_positive(order.entrust_action)
+    price = order.entrust_price
+    if order.order_type == common.ORDER_TYPE.LIMIT:
+        if buy and price >= bar.low:
+            return min(price, bar.high)
+        if not buy and price <= bar.high:
+            return max(price, bar.low)
+    elif order.order_type == common.ORDER_TYPE.STOP:
+        if buy and price <= bar.high:
+            return max(price, bar.low)
+        if not buy and price >= bar.low:
+            return min(price, bar.high)
+    elif order.order_type == common.ORDER_TYPE.VWAP:
+        return bar.vwap
+    return None
+
+
+def test_bar_matching_random():
+    rng = np.random.RandomState(1)
+    symbols = ['{:06d}.SZ'.format(i) for i in range(5)]
+    order_types = [common.ORDER_TYPE.LIMIT, common.ORDER_TYPE.STOP, common.ORDER_TYPE.VWAP]
+
+    book = OrderBook()
+    expected = dict()
+    orders = dict()
+    for n_bar in range(50):
+        for _ in range(20):
+            action = common.ORDER_ACTION.BUY if rng.rand() > 0.5 else common.ORDER_ACTION.SELL
+            order = Order.new_order(symbols[rng.randint(len(symbols))], action,
+                                    round(10 + rng.normal(0, 0.5), 2), 100 * rng.randint(1, 10), 20170104, 93000,
+                                    order_type=order_types[rng.choice(3, p=[0.7, 0.2, 0.1])])
+            no = book.add_order(order)
+            orders[no] = order
+
+        bars = dict()
+        for symbol in symbols:
+            low = round(10 + rng.normal(0, 0.3), 2)
+            bars[symbol] = _bar(symbol, low, low + 0.1)
+
+        # symbols without bar are skipped
+        del bars[symbols[-1]]
+
+        for no, order in list(orders.items()):
+            if order.symbol in bars:
+                price = _naive_fill(order, bars[order.symbol])
+                if price is not None:
+                    expected[no] = (price, order.entrust_size)
+                    orders.pop(no)
+
+        res = book.make_trade(bars, common.QUOTE_TYPE.MIN)
+        for trade, order_status in res:
+            assert order_status.order_status == common.ORDER_STATUS.FILLED
+            assert trade.fill_date == 20170104 and trade.fill_time == 93100
+        got = {trade.entrust_no: (trade.fill_price, trade.fill_size) for trade, _ in res}
+        assert got == expected
+        expected.clear()
+        assert set(book.orders.keys()) == set(orders.keys())
+
+
+def test_bar_price_priority():
+    book = OrderBook()
+    symbol = '000001.SZ'
+    no1 = book.add_order(Order.new_order(symbol, common.ORDER_ACTION.BUY, 10.0, 100, 20170104, 93000))
+    no2 = book.add_order(Order.new_order(symbol, common.ORDER_ACTION.BUY, 10.2, 100, 20170104, 93000))
+    no3 = book.add_order(Order.new_order(symbol, common.ORDER_ACTION.BUY, 10.2, 100, 20170104, 93000))
+    no4 = book.add_order(Order.new_order(symbol, common.ORDER_ACTION.BUY, 9.0, 100, 20170104, 93000))
+    no5 = book.add_order(Order.new_order(symbol, common.ORDER_ACTION.SELL, 11.0, 100, 20170104, 93000,
+                                         order_type=common.ORDER_TYPE.STOP))
+    book.cancel_order(no3)
+
+    res = book.make_trade({symbol: _bar(symbol, 9.95, 10.1)}, common.QUOTE_TYPE.MIN)
+    assert [(t.entrust_no, t.fill_price) for t, _ in res] == [(no2, 10.1), (no1, 10.0), (no5, 10.1)]
+    assert list(book.orders.keys()) == [no4]
+
+
+def test_bar_matching_scales_with_fills():
+    symbols = ['{:06d}.SZ'.format(i) for i in range(100)]
+    bars = [{symbol: _bar(symbol, 10.0, 10.1, t=93100 + i) for symbol in symbols} for i in range(200)]
+
+    def run(n_far):
+        book = OrderBook()
+        for i in range(n_far):
+            symbol = symbols[i % len(symbols)]
+            book.add_order(Order.new_order(symbol, common.ORDER_ACTION.BUY, 5.0 + i * 1e-4, 100, 20170104, 93000))
+            book.add_order(Order.new_order(symbol, common.ORDER_ACTION.SELL, 20.0 - i * 1e-4, 100, 20170104, 93000))
+        t0 = time.time()
+        for bar_dic in bars:
+            res = book.make_trade(bar_dic, common.QUOTE_TYPE.MIN)
+            assert res == []
+        return time.time() - t0
+
+    t_few = run(100)
+    t_many = run(10000)
+    print("200 resting orders {:.3f}s, 20000 resting orders {:.3f}s".format(t_few, t_many))
+    assert t_many < 3 * t_few + 0.05
+
+
+def test_daily_simulator():
+    sim = DailyStockSimulator()
+    sim.on_new_day(20170104)
+    nos = []
+    for symbol, target in [('000001.SZ', 'open'), ('000002.SZ', 'close'), ('000001.SZ', 'vwap')]:
+        order = FixedPriceTypeOrder.new_order(symbol, common.ORDER_ACTION.BUY, 0.0, 100, 20170104, 0)
+        order.price_target = target
+        nos.append(sim.add_order(order))
+    ind, msg = sim.cancel_order(nos[1])
+    assert msg == "" and ind.order_status == common.ORDER_STATUS.CANCELLED
+
+    price_dic = {'000001.SZ': {'open': 10.0, 'close': 11.0, 'vwap': 10.5},
+                 '000002.SZ': {'open': 20.0, 'close': 21.0, 'vwap': 20.5}}
+    res = sim.match(price_dic, date=20170104)
+    assert sorted((t.entrust_no, t.fill_price) for t, _ in res) == [(nos[0], 10.0), (nos[2], 10.5)]
+    assert sim.match_finished
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
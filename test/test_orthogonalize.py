@@ -0,0 +1,86 @@
+# encoding: utf-8
+
+from __future__ import print_function
+
+import numpy as np
+import pandas as pd
+
+from synthetic_data import make_dataview
+
+
+def schmidt(data):
+    """Gram-Schmidt on one date, the same as example/alpha/ICCombine.py."""
+    mat = data.values
+    output = np.zeros_like(mat)
+    for i in range(mat.shape[1]):
+        tmp = mat[:, i].copy()
+        for j in range(i):
+            tmp -= mat[:, i].dot(output[:, j]) / output[:, j].dot(output[:, j]) * output[:, j]
+        output[:, i] = tmp
+    return output
+
+
+def _make_factor_dataview(n_dates=30, n_symbols=50, seed=0):
+    rng = np.random.RandomState(seed)
+    a = rng.randn(n_dates, n_symbols)
+    b = 0.6 * a + rng.randn(n_dates, n_symbols)
+    c = 0.3 * a - 0.5 * b + rng.randn(n_dates, n_symbols)
+    b[rng.rand(n_dates, n_symbols) < 0.1] = np.nan
+    member = (rng.rand(n_dates, n_symbols) < 0.8).astype(float)
+    member[5, :] = 0.0
+    member[5, :2] = 1.0
+    dv = make_dataview(n_dates=n_dates, n_symbols=n_symbols, seed=seed,
+                       extra_fields={'fa': a, 'fb': b, 'fc': c, 'member': member})
+    return dv
+
+
+def test_gram_schmidt():
+    dv = _make_factor_dataview()
+    fields = ['fa', 'fb', 'fc']
+    dv.orthogonalize('fa,fb,fc', universe='member')
+    assert all(f + '_orth' in dv.fields for f in fields)
+
+    dates = dv.data_d.index
+    for i in [0, 5, 17]:
+        snap = dv.get_snapshot(dates[i], fields='fa,fb,fc,member,fa_orth,fb_orth,fc_orth')
+        valid = snap[fields].notnull().all(axis=1) & (snap['member'] > 0)
+        res = snap[[f + '_orth' for f in fields]]
+        assert res[~valid].isnull().all().all()
+        if valid.sum() < len(fields):
+            assert res.isnull().all().all()
+            continue
+        assert np.allclose(res[valid].values, schmidt(snap.loc[valid, fields]))
+
+
+def test_symmetric():
+    dv = _make_factor_dataview()
+    symbols = dv.symbol[:40]
+    dv.orthogonalize(['fa', 'fb', 'fc'], method='symmetric', universe=symbols, suffix='_sym')
+
+    dates = dv.data_d.index
+    for i in [0, 17]:
+        snap = dv.get_snapshot(dates[i], fields='fa,fb,fc,fa_sym,fb_sym,fc_sym')
+        valid = snap[['fa', 'fb', 'fc']].notnull().all(axis=1) & snap.index.isin(symbols)
+        x = snap.loc[valid, ['fa', 'fb', 'fc']].values
+        res = snap.loc[valid, ['fa_sym', 'fb_sym', 'fc_sym']].values
+        assert np.allclose(res.T.dot(res) / len(res), np.eye(3))
+        # the transform is symmetric: res = x * S with S = S'
+        s = np.linalg.lstsq(x, res, rcond=None)[0]
+        assert np.allclose(s, s.T)
+        assert snap.loc[~valid, 'fa_sym'].isnull().all()
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
@@ -0,0 +1,214 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import time
+
+import numpy as np
+
+from jaqs.trade import common
+from jaqs.trade import model
+from jaqs.trade import EventDrivenStrategy, EventBacktestInstance, BacktestTradeApi, PortfolioManager
+from jaqs.trade.tradegateway import OrderBook, DailyStockSimulator, allocate_capacity
+from jaqs.data.basic import Order, Bar, FixedPriceTypeOrder
+
+from synthetic_data import make_df_bar, MemoryDataService
+
+SYMBOL = '000001.SZ'
+
+
+def _bar(low, high, volume, t=93100, date=20170104):
+    return {SYMBOL: Bar.create_from_dict({'symbol': SYMBOL, 'trade_date': date, 'date': date, 'time': t,
+                                          'open': low, 'close': high, 'low': low, 'high': high,
+                                          'vwap': (low + high) / 2.0, 'volume': volume})}
+
+
+def _order(action, price, size, tif="", order_type=common.ORDER_TYPE.LIMIT):
+    order = Order.new_order(SYMBOL, action, price, size, 20170104, 93000, order_type=order_type)
+    order.time_in_force = tif
+    return order
+
+
+def test_allocate_capacity():
+    group = np.array([1, 0, 1, 1, 0, 2])
+    size = np.array([100, 200, 300, 100, 300, 50])
+    capacity = np.array([350, 400, 350, 350, 400, 0])
+    res = allocate_capacity(group, size, capacity)
+    assert res.tolist() == [100, 200, 250, 0, 200, 0]
+    assert res.dtype == size.dtype
+
+
+def test_order_book_participation():
+    book = OrderBook()
+    book.participation_rate = 0.1
+    no1 = book.add_order(_order(common.ORDER_ACTION.BUY, 10.0, 1000, tif=common.ORDER_TIME_IN_FORCE.GTC))
+    no2 = book.add_order(_order(common.ORDER_ACTION.BUY, 10.1, 200))
+    no3 = book.add_order(_order(common.ORDER_ACTION.SELL, 9.9, 100))
+
+    # capacity 300 each side: higher price first
+    res = book.make_trade(_bar(9.9, 10.0, 3000), common.QUOTE_TYPE.MIN)
+    assert [(t.entrust_no, t.fill_size) for t, _ in res] == [(no2, 200), (no1, 100), (no3, 100)]
+    assert res[1][1].order_status != common.ORDER_STATUS.FILLED
+
+    res = book.make_trade(_bar(9.9, 10.0, 5000, t=93200), common.QUOTE_TYPE.MIN)
+    assert [(t.entrust_no, t.fill_size) for t, _ in res] == [(no1, 500)]
+
+    # GTC order survives the end of day
+    assert book.expire_orders(common.ORDER_TIME_IN_FORCE.DAY) == []
+    book.on_new_day(20170105)
+    res = book.make_trade(_bar(9.9, 10.0, 10000, date=20170105), common.QUOTE_TYPE.MIN)
+    assert [(t.entrust_no, t.fill_size, t.fill_date) for t, _ in res] == [(no1, 400, 20170105)]
+    assert res[0][1].order_status == common.ORDER_STATUS.FILLED
+    assert res[0][1].fill_size == 1000
+    assert book.orders == {}
+
+
+def test_nan_volume():
+    # no volume (eg. suspended) means no capacity
+    book = OrderBook()
+    book.participation_rate = 0.1
+    no = book.add_order(_order(common.ORDER_ACTION.BUY, 10.0, 1000, tif=common.ORDER_TIME_IN_FORCE.GTC))
+    assert book.make_trade(_bar(9.9, 10.0, np.nan), common.QUOTE_TYPE.MIN) == []
+    res = book.make_trade(_bar(9.9, 10.0, 3000, t=93200), common.QUOTE_TYPE.MIN)
+    assert [(t.entrust_no, t.fill_size) for t, _ in res] == [(no, 300)]
+
+    sim = DailyStockSimulator()
+    sim.participation_rate = 0.2
+    sim.on_new_day(20170104)
+    order = FixedPriceTypeOrder.new_order(SYMBOL, common.ORDER_ACTION.BUY, 0.0, 600, 20170104, 0)
+    order.price_target = 'vwap'
+    no = sim.add_order(order)
+    assert sim.match({SYMBOL: {'vwap': 10.0, 'close': 10.5, 'volume': np.nan}}, date=20170104) == []
+    res = sim.match({SYMBOL: {'vwap': 10.0, 'close': 10.5, 'volume': 1000}}, date=20170105)
+    assert [(t.entrust_no, t.fill_size) for t, _ in res] == [(no, 200)]
+
+
+def test_order_book_time_in_force():
+    book = OrderBook()
+    book.participation_rate = 0.1
+    no_day = book.add_order(_order(common.ORDER_ACTION.BUY, 10.0, 1000))
+    no_ioc = book.add_order(_order(common.ORDER_ACTION.SELL, 9.9, 1000, tif=common.ORDER_TIME_IN_FORCE.IOC))
+
+    book.make_trade(_bar(9.9, 10.0, 3000), common.QUOTE_TYPE.MIN)
+    inds = book.expire_orders(common.ORDER_TIME_IN_FORCE.IOC)
+    assert [(ind.entrust_no, ind.order_status, ind.fill_size) for ind in inds] == \
+        [(no_ioc, common.ORDER_STATUS.CANCELLED, 300)]
+
+    inds = book.expire_orders(common.ORDER_TIME_IN_FORCE.DAY)
+    assert [(ind.entrust_no, ind.fill_size) for ind in inds] == [(no_day, 300)]
+    assert book.orders == {}
+
+
+def test_daily_simulator_participation():
+    sim = DailyStockSimulator()
+    sim.participation_rate = 0.2
+    sim.on_new_day(20170104)
+    nos = []
+    for action, size, tif in [(common.ORDER_ACTION.BUY, 600, ""),
+                              (common.ORDER_ACTION.BUY, 600, common.ORDER_TIME_IN_FORCE.DAY),
+                              (common.ORDER_ACTION.SELL, 300, "")]:
+        order = FixedPriceTypeOrder.new_order(SYMBOL, action, 0.0, size, 20170104, 0)
+        order.price_target = 'vwap'
+        order.time_in_force = tif
+        nos.append(sim.add_order(order))
+    price_dic = {SYMBOL: {'vwap': 10.0, 'close': 10.5, 'volume': 4000}}
+
+    res = sim.match(price_dic, date=20170104)
+    assert sorted((t.entrust_no, t.fill_size) for t, _ in res) == [(nos[0], 600), (nos[1], 200), (nos[2], 300)]
+    assert not sim.match_finished
+
+    # DAY order expires, the others are filled already
+    inds = sim.on_after_market_close()
+    assert [(ind.entrust_no, ind.order_status, ind.fill_size) for ind in inds] == \
+        [(nos[1], common.ORDER_STATUS.CANCELLED, 200)]
+    assert sim.match_finished
+
+
+def test_daily_simulator_speed():
+    sim = DailyStockSimulator()
+    sim.participation_rate = 0.1
+    sim.on_new_day(20170104)
+    n = 3000
+    price_dic = {}
+    for i in range(n):
+        symbol = '{:06d}.SZ'.format(i)
+        order = FixedPriceTypeOrder.new_order(symbol, common.ORDER_ACTION.BUY, 0.0, 10000, 20170104, 0)
+        order.price_target = 'vwap'
+        sim.add_order(order)
+        price_dic[symbol] = {'vwap': 10.0, 'volume': 50000.0}
+
+    t0 = time.time()
+    n_match = 0
+    while not sim.match_finished:
+        res = sim.match(price_dic, date=20170104)
+        assert len(res) == n
+        n_match += 1
+    print("{:d} matches of {:d} orders: {:.3f}s".format(n_match, n, time.time() - t0))
+    assert n_match == 2
+
+
+class BigOrderStrategy(EventDrivenStrategy):
+    """Send one large GTC buy order on the first bar."""
+    def __init__(self):
+        super(BigOrderStrategy, self).__init__()
+        self.sent = False
+        self.trades = []
+        self.task_inds = []
+
+    def on_bar(self, quote_dic):
+        if not self.sent:
+            self.sent = True
+            quote = quote_dic[SYMBOL]
+            self.ctx.trade_api.place_order(SYMBOL, common.ORDER_ACTION.BUY, quote.close * 2, 100000,
+                                           algo_param={'time_in_force': common.ORDER_TIME_IN_FORCE.GTC})
+
+    def on_trade(self, ind):
+        self.trades.append(ind)
+
+    def on_task_status(self, ind):
+        self.task_inds.append(ind)
+
+
+def test_backtest_participation():
+    dates = [20170103, 20170104]
+    df_bar = make_df_bar(n_symbols=3, n_times=240, dates=dates)
+    ds = MemoryDataService(df_bar)
+    props = {'symbol': ','.join(sorted(df_bar['symbol'].unique())),
+             'start_date': dates[0], 'end_date': dates[-1],
+             'bar_type': '1M', 'init_balance': 1e8,
+             'participation_rate': 0.05}
+
+    strategy = BigOrderStrategy()
+    bt = EventBacktestInstance()
+    model.Context(data_api=ds, trade_api=BacktestTradeApi(), instance=bt, strategy=strategy, pm=PortfolioManager())
+    bt.init_from_config(props)
+    bt.run()
+
+    df_symbol = df_bar.loc[df_bar['symbol'] == SYMBOL].set_index(['trade_date', 'time'])
+    fills = dict()
+    for trade in strategy.trades:
+        key = (trade.trade_date, trade.fill_time)
+        fills[key] = fills.get(key, 0) + trade.fill_size
+    for key, size in fills.items():
+        assert size <= np.floor(0.05 * df_symbol.loc[key, 'volume'])
+
+    # order is carried to the next day and filled entirely
+    assert {trade.trade_date for trade in strategy.trades} == set(dates)
+    assert sum(trade.fill_size for trade in strategy.trades) == 100000
+    assert len(strategy.task_inds) == 1
+    assert strategy.ctx.pm.get_position(SYMBOL).current_size == 100000
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
@@ -0,0 +1,103 @@
+# encoding: utf-8
+
+from __future__ import print_function
+
+import numpy as np
+
+from jaqs.trade import model
+from jaqs.trade.optimizer import FactorCovariance
+
+from synthetic_data import make_dataview
+
+
+def make_factor_dataview(n_dates=500, n_symbols=600, n_industries=4, seed=0):
+    """Returns generated by one style factor, industry factors and specific noise with known variance."""
+    rng = np.random.RandomState(seed)
+    size = rng.normal(size=n_symbols)
+    size = (size - size.mean()) / size.std()
+    industry = rng.randint(0, n_industries, n_symbols)
+
+    k = n_industries + 1
+    factor_vol = np.linspace(0.005, 0.015, k)
+    factor_ret = rng.normal(size=(n_dates, k)) * factor_vol
+    exposure = np.hstack([size[:, None], (industry[:, None] == np.arange(n_industries)).astype(float)])
+    specific_vol = rng.uniform(0.01, 0.03, n_symbols)
+    ret = factor_ret.dot(exposure.T) + rng.normal(size=(n_dates, n_symbols)) * specific_vol
+
+    extra = {'size': np.tile(size, (n_dates, 1)),
+             'sw1': np.tile(np.array(['ind{}'.format(i) for i in industry], dtype=object), (n_dates, 1))}
+    dv = make_dataview(n_dates=n_dates, n_symbols=n_symbols, seed=seed, ret=ret, extra_fields=extra)
+    return dv, np.diag(factor_vol ** 2), specific_vol ** 2
+
+
+def _make_model(dv, **kwargs):
+    ctx = model.AlphaContext(dataview=dv)
+    risk_model = model.FactorRiskModel(context=ctx, style_fields=['size'], industry_field='sw1', **kwargs)
+    return ctx, risk_model
+
+
+def test_factor_risk_estimates():
+    dv, factor_cov, specific_var = make_factor_dataview()
+    ctx, risk_model = _make_model(dv, halflife=1e6)
+    ctx.trade_date = dv.dates[-1]
+
+    cov = risk_model.calc_covariance(dv.symbol[:50])
+    assert isinstance(cov, FactorCovariance)
+    assert cov.exposure.shape == (50, 5)
+    assert risk_model.factor_names == ['size', 'industry_ind0', 'industry_ind1', 'industry_ind2', 'industry_ind3']
+
+    est = risk_model.get_factor_covariance()
+    assert np.allclose(np.diag(est), np.diag(factor_cov), rtol=0.2)
+    assert np.abs(est - np.diag(np.diag(est))).max() < 2e-5
+    assert np.allclose(risk_model.get_specific_variance(), specific_var, rtol=0.3)
+
+    # portfolio risk agrees with the dense covariance
+    w = np.random.RandomState(1).rand(50)
+    weights = dict(zip(dv.symbol[:50], w))
+    assert np.isclose(risk_model.calc_risk(weights), w.dot(cov.to_dense()).dot(w))
+
+
+def test_incremental_update():
+    dv, _, _ = make_factor_dataview(n_dates=200, n_symbols=40)
+    dates = dv.dates
+
+    ctx, risk_model = _make_model(dv, halflife=30, newey_west_lags=2, shrinkage=0.2)
+    for date in dates[50::20]:
+        ctx.trade_date = date
+        risk_model.calc_covariance(dv.symbol)
+    ctx.trade_date = dates[-1]
+    cov_inc = risk_model.calc_covariance(dv.symbol)
+
+    ctx_full, risk_model_full = _make_model(dv, halflife=30, newey_west_lags=2, shrinkage=0.2)
+    ctx_full.trade_date = dates[-1]
+    cov_full = risk_model_full.calc_covariance(dv.symbol)
+
+    assert risk_model.n_periods == risk_model_full.n_periods == len(dates) - 1
+    assert np.allclose(cov_inc.factor_cov, cov_full.factor_cov)
+    assert np.allclose(cov_inc.specific_var, cov_full.specific_var)
+    assert np.allclose(cov_inc.factor_cov, cov_inc.factor_cov.T)
+    assert np.all(np.linalg.eigvalsh(cov_inc.factor_cov) > 0)
+
+
+def test_min_periods():
+    dv, _, _ = make_factor_dataview(n_dates=30, n_symbols=20)
+    ctx, risk_model = _make_model(dv, min_periods=40)
+    ctx.trade_date = dv.dates[-1]
+    assert risk_model.calc_covariance(dv.symbol) is None
+    assert risk_model.calc_risk({dv.symbol[0]: 1.0}) == 0.0
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
@@ -0,0 +1,137 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import os
+import random
+
+import numpy as np
+import pandas as pd
+
+from jaqs.trade import common
+from jaqs.trade import model
+from jaqs.trade import (EventDrivenStrategy, EventBacktestInstance, ShardedEventBacktest,
+                        BacktestTradeApi, PortfolioManager)
+from jaqs.trade.sharding import split_symbols
+from jaqs.trade.analyze import EventAnalyzer
+
+from synthetic_data import make_df_bar, MemoryDataService
+
+
+class BreakoutStrategy(EventDrivenStrategy):
+    """Every 15 bars of a symbol, buy if its price went up since last check, otherwise sell."""
+    symbol_independent = True
+
+    def __init__(self):
+        super(BreakoutStrategy, self).__init__()
+        self.n_bars = dict()
+        self.last_price = dict()
+
+    def on_bar(self, quote_dic):
+        for symbol in sorted(quote_dic.keys()):
+            bar = quote_dic[symbol]
+            n = self.n_bars.get(symbol, 0) + 1
+            self.n_bars[symbol] = n
+            if n % 15:
+                continue
+            last = self.last_price.get(symbol, bar.close)
+            self.last_price[symbol] = bar.close
+            action = common.ORDER_ACTION.BUY if bar.close > last else common.ORDER_ACTION.SELL
+            self.ctx.trade_api.place_order(symbol, action, bar.close, 100)
+
+
+class CrossSectionStrategy(EventDrivenStrategy):
+    pass
+
+
+DATES = [20170103, 20170104, 20170105, 20170106]
+
+
+def _make_props(ds, n_jobs=1):
+    return {'symbol': ','.join(sorted(ds.df_bar['symbol'].unique())),
+            'start_date': DATES[0], 'end_date': DATES[-1],
+            'bar_type': '1M', 'init_balance': 1e7,
+            'n_prefetch': 0, 'n_jobs': n_jobs, 'n_shards': 3}
+
+
+def _sort_trades(df):
+    return df.sort_values(['symbol', 'fill_date', 'fill_time'], kind='mergesort').reset_index(drop=True)
+
+
+def test_split_symbols():
+    shards = split_symbols(['a', 'b', 'c', 'd', 'e'], 2)
+    assert shards == [['a', 'b', 'c'], ['d', 'e']]
+    assert split_symbols(['a', 'b'], 4) == [['a'], ['b']]
+
+
+def test_sharded_backtest():
+    ds = MemoryDataService(make_df_bar(n_symbols=12, n_times=60, dates=DATES))
+
+    # single process backtest over all symbols
+    bt = EventBacktestInstance()
+    model.Context(data_api=ds, trade_api=BacktestTradeApi(), instance=bt, strategy=BreakoutStrategy(),
+                  pm=PortfolioManager())
+    bt.init_from_config(_make_props(ds))
+    bt.run()
+    df_single = _sort_trades(bt.get_trades_df())
+    assert len(df_single) > 0
+
+    for n_jobs in [1, 3]:
+        sbt = ShardedEventBacktest(BreakoutStrategy, data_api=ds)
+        sbt.init_from_config(_make_props(ds, n_jobs=n_jobs))
+        sbt.run()
+        assert len(sbt.shards) == 3
+
+        df_trades = sbt.get_trades_df()
+        assert (np.diff(df_trades['fill_date'].values * 1000000 + df_trades['fill_time'].values) >= 0).all()
+        df_trades = _sort_trades(df_trades)
+        for col in ['symbol', 'entrust_action', 'fill_date', 'fill_time']:
+            assert (df_trades[col].values == df_single[col].values).all()
+        assert np.allclose(df_trades['fill_price'], df_single['fill_price'])
+        assert np.allclose(df_trades['fill_size'], df_single['fill_size'])
+
+        positions = sbt.get_position_matrix()
+        expected = bt.ctx.pm.get_position_matrix()
+        assert np.allclose(positions.reindex_like(expected).fillna(0.0), expected.fillna(0.0))
+
+    # daily PnL of shards adds up to that of the whole universe
+    df_close = ds.daily(_make_props(ds)['symbol'], DATES[0], DATES[-1])[0].pivot(
+        index='trade_date', columns='symbol', values='close')
+    from jaqs.trade.walkforward import calc_daily_pnl
+    pnl = calc_daily_pnl(bt.get_trades_df(), df_close, 1e7)
+    assert np.allclose(sbt.get_daily_pnl().values, pnl.values)
+
+    # merged result is read by EventAnalyzer as a normal backtest
+    folder = '../output/tests/sharding{:.6f}'.format(random.random())
+    sbt.save_results(folder)
+    assert os.path.exists(os.path.join(folder, 'daily_pnl.csv'))
+    ta = EventAnalyzer()
+    ta.initialize(data_server_=ds, file_folder=folder)
+    assert ta.init_balance == 1e7
+    assert ta.universe == set(df_single['symbol'])
+
+
+def test_not_symbol_independent():
+    ds = MemoryDataService(make_df_bar(n_symbols=4, n_times=10, dates=DATES[:2]))
+    sbt = ShardedEventBacktest(CrossSectionStrategy, data_api=ds)
+    try:
+        sbt.init_from_config(_make_props(ds, n_jobs=2))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("ValueError should have been raised.")
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
@@ -0,0 +1,131 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from jaqs.data import DataView
+
+from synthetic_data import make_dataview
+
+
+def _attach_and_sum(name, q):
+    dv = DataView.attach(name, timeout=5.0)
+    q.put(float(dv.get_ts('close').sum().sum()))
+
+
+def test_attach_same_data():
+    dv = make_dataview()
+    with dv.share('jaqs_test_attach') as host:
+        dv_shared = DataView.attach('jaqs_test_attach')
+
+        for name in ['data_d', 'data_q', 'data_benchmark', 'data_inst']:
+            pd.testing.assert_frame_equal(getattr(dv_shared, name), getattr(dv, name))
+        assert dv_shared.fields == dv.fields and dv_shared.start_date == dv.start_date
+
+        pd.testing.assert_frame_equal(dv_shared.get_ts('close'), dv.get_ts('close'))
+        pd.testing.assert_frame_equal(dv_shared.get(symbol='000001.SZ,000003.SZ', fields='open,trade_status'),
+                                      dv.get(symbol='000001.SZ,000003.SZ', fields='open,trade_status'))
+        pd.testing.assert_frame_equal(dv_shared.get_snapshot(dv.end_date), dv.get_snapshot(dv.end_date))
+
+        # numeric data is read-only and not copied: changes by the host are visible
+        blocks = [blk.values for blk in dv_shared.data_d._mgr.blocks if blk.values.dtype == np.float64]
+        assert len(blocks) == 1 and not blocks[0].flags.writeable
+        buf = np.ndarray(blocks[0].shape, dtype=np.float64, buffer=host._shm.buf, offset=0)
+        buf[:] += 1.0
+        pd.testing.assert_frame_equal(dv_shared.get_ts('close'), dv.get_ts('close') + 1.0)
+        try:
+            dv_shared.data_d.iloc[0, 0] = 0.0
+            assert False
+        except ValueError:
+            pass
+        dv_shared.detach()
+
+
+def test_private_formula():
+    dv = make_dataview()
+    with dv.share('jaqs_test_formula'):
+        dv1 = DataView.attach('jaqs_test_formula')
+        dv2 = DataView.attach('jaqs_test_formula')
+        formula = 'Rank(close / Delay(close, 1) - 1)'
+        dv.add_formula('rank_ret', formula, is_quarterly=False)
+        dv1.add_formula('rank_ret', formula, is_quarterly=False)
+
+        pd.testing.assert_frame_equal(dv1.get_ts('rank_ret'), dv.get_ts('rank_ret'))
+        pd.testing.assert_frame_equal(dv1.get(fields='close,rank_ret'), dv.get(fields='close,rank_ret'))
+        pd.testing.assert_frame_equal(dv1.get_snapshot(dv.end_date, fields='close,rank_ret'),
+                                      dv.get_snapshot(dv.end_date, fields='close,rank_ret'))
+        pd.testing.assert_frame_equal(dv1.get(), dv.get())
+        # formulas may use private fields
+        dv1.add_formula('rank_ret2', 'rank_ret * 2', is_quarterly=False)
+        assert np.allclose(dv1.get_ts('rank_ret2').values, 2 * dv.get_ts('rank_ret').values, equal_nan=True)
+
+        # shared data and other processes are not affected
+        assert 'rank_ret' not in dv1.data_d.columns.get_level_values('field')
+        assert 'rank_ret' not in dv2.fields
+
+        dv1.add_formula('rank_ret', 'Rank(close)', is_quarterly=False)
+        pd.testing.assert_frame_equal(dv1.get_ts('rank_ret'), dv2.get_ts('close').rank(axis=1), check_names=False)
+        dv1.remove_field('rank_ret,rank_ret2')
+        assert dv1.fields == dv2.fields and dv1._local_d is None
+        try:
+            dv1.remove_field('close')
+            assert False
+        except ValueError:
+            pass
+
+
+def test_private_orthogonalize():
+    dv = make_dataview()
+    with dv.share('jaqs_test_orth'):
+        dv1 = DataView.attach('jaqs_test_orth')
+        dv1.add_formula('mom5', 'close / Delay(close, 5) - 1', is_quarterly=False)
+        shared_d = dv1.data_d
+        for _ in range(2):
+            # overwrite private fields of the former call
+            dv1.orthogonalize('mom5,volume', overwrite=True)
+        assert dv1.data_d is shared_d
+        assert 'mom5_orth' in dv1._local_fields(False) and 'volume_orth' in dv1._local_fields(False)
+
+        dv.add_formula('mom5', 'close / Delay(close, 5) - 1', is_quarterly=False)
+        dv.orthogonalize('mom5,volume')
+        pd.testing.assert_frame_equal(dv1.get_ts('mom5_orth'), dv.get_ts('mom5_orth'))
+        pd.testing.assert_frame_equal(dv1.get_ts('volume_orth'), dv.get_ts('volume_orth'))
+        dv1.detach()
+
+
+def test_attach_from_other_process():
+    dv = make_dataview()
+    with dv.share('jaqs_test_process'):
+        q = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=_attach_and_sum, args=('jaqs_test_process', q)) for _ in range(2)]
+        for p in procs:
+            p.start()
+        res = [q.get(timeout=30) for _ in procs]
+        for p in procs:
+            p.join()
+    assert np.allclose(res, dv.get_ts('close').sum().sum())
+
+    try:
+        DataView.attach('jaqs_test_process')
+        assert False
+    except IOError:
+        pass
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
@@ -0,0 +1,131 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import warnings
+
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+
+from jaqs.trade import model
+from jaqs.trade.signalcombine import calc_rank_ic, calc_ic_weights, ICSignalCombiner
+
+from synthetic_data import make_dataview
+
+
+def test_rank_ic():
+    rng = np.random.RandomState(0)
+    factors = [rng.randn(20, 50), np.round(rng.randn(20, 50))]
+    ret = factors[0] * 0.5 + rng.randn(20, 50)
+    factors[0][rng.rand(20, 50) < 0.1] = np.nan
+    ret[rng.rand(20, 50) < 0.1] = np.nan
+    ret[3, :] = np.nan
+
+    ic = calc_rank_ic(factors, ret)
+    assert ic.shape == (20, 2)
+    assert np.all(np.isnan(ic[3]))
+    for t in [0, 7, 19]:
+        for k in range(2):
+            mask = np.isfinite(factors[k][t]) & np.isfinite(ret[t])
+            expected, _ = stats.spearmanr(factors[k][t][mask], ret[t][mask])
+            assert np.isclose(ic[t, k], expected)
+
+
+def test_ic_weights():
+    rng = np.random.RandomState(1)
+    ic = rng.randn(100, 3) * 0.1 + [0.05, 0.02, -0.01]
+    ic[40] = np.nan
+    window, period = 10, 2
+
+    weights = calc_ic_weights(ic, window, period=period)
+    assert np.all(np.isnan(weights[:window + period - 1]))
+    for t in [20, 45, 99]:
+        sub = ic[t - period - window + 1: t - period + 1]
+        sub = sub[np.all(np.isfinite(sub), axis=1)]
+        if len(sub) < window:
+            assert np.all(np.isnan(weights[t]))
+            continue
+        w = np.linalg.inv(np.cov(sub.T)).dot(sub.mean(axis=0))
+        assert np.allclose(weights[t], w / np.abs(w).sum())
+
+
+
+def test_ic_weights_singular():
+    rng = np.random.RandomState(3)
+    factor = rng.randn(30, 50)
+    ret = factor * 0.3 + rng.randn(30, 50)
+    ret[-1] = np.nan
+
+    # a factor and a rescaled copy have the same ranks, their IC covariance is singular
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        ic = calc_rank_ic([factor, factor * 2.0], ret)
+    assert np.all(np.isnan(ic[-1]))
+    weights = calc_ic_weights(ic, window=10)
+    valid = np.all(np.isfinite(weights), axis=1)
+    assert valid.sum() > 0
+    assert np.allclose(weights[valid], 0.5)
+
+    # at least K + 1 ICs are required
+    weights = calc_ic_weights(rng.randn(20, 3), window=10, min_periods=2)
+    assert np.all(np.isnan(weights[:4]))
+    assert np.all(np.isfinite(weights[4:]))
+
+def test_ic_signal_combiner():
+    n_dates, n_symbols = 120, 40
+    rng = np.random.RandomState(2)
+    ret = rng.normal(0, 0.02, (n_dates, n_symbols))
+    # good factor predicts return of the next day, bad one is noise
+    good = np.full_like(ret, np.nan)
+    good[:-1] = ret[1:] + rng.normal(0, 0.02, (n_dates - 1, n_symbols))
+    bad = rng.normal(size=ret.shape)
+    dv = make_dataview(n_dates=n_dates, n_symbols=n_symbols, ret=ret, extra_fields={'good': good, 'bad': bad})
+
+    combiner = ICSignalCombiner(dv, ['good', 'bad'], window=40)
+    combiner.add_combined_field('combined')
+    weights = combiner.weights
+    assert 'combined' in dv.fields
+    assert combiner.ic['good'].mean() > 0.5
+    last = weights.iloc[-1]
+    assert last['good'] > 0.8 and np.isclose(np.abs(last).sum(), 1.0)
+
+    date = dv.dates[-2]
+    combined = dv.get_snapshot(date, fields='combined')['combined']
+    snap = dv.get_snapshot(date, fields='good,bad')
+    assert np.allclose(combined, snap['good'] * weights.loc[date, 'good'] + snap['bad'] * weights.loc[date, 'bad'])
+
+    # the same weights are used by the signal model
+    ctx = model.AlphaContext(dataview=dv)
+    ctx.universe = dv.symbol
+    ctx.trade_date = date
+    ctx.snapshot = snap
+    signal_model = model.FactorSignalModel(context=ctx, forecast_weights=weights)
+    signal_model.add_signal('good', lambda context, user_options=None: context.snapshot['good'])
+    signal_model.add_signal('bad', lambda context, user_options=None: context.snapshot['bad'])
+    forecast = pd.Series(signal_model.make_forecast())
+    assert np.allclose(forecast.reindex(combined.index), combined)
+
+    # no weights during warm-up: signals are summed up instead of giving zero forecast
+    date = dv.dates[5]
+    assert weights.loc[date].isnull().all()
+    ctx.trade_date = date
+    ctx.snapshot = dv.get_snapshot(date, fields='good,bad')
+    forecast = pd.Series(signal_model.make_forecast())
+    expected = ctx.snapshot['good'] + ctx.snapshot['bad']
+    assert np.allclose(forecast.reindex(expected.index), expected)
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
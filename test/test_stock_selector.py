@@ -0,0 +1,72 @@
+# encoding: utf-8
+
+from __future__ import print_function
+
+import numpy as np
+
+from jaqs.trade import model
+
+from synthetic_data import make_dataview
+
+
+def positive_momentum(context, user_options=None):
+    snap = context.snapshot
+    return (snap['momentum'] > 0) & (snap['close'] > user_options['min_close'])
+
+
+def low_volume(context, user_options=None):
+    return context.snapshot['volume'] < 8e5
+
+
+def _make_selector(dv):
+    ctx = model.AlphaContext(dataview=dv)
+    ctx.universe = dv.symbol
+    return ctx, model.StockSelector(context=ctx)
+
+
+def test_selection_matrix():
+    dv = make_dataview(n_dates=60, n_symbols=30)
+
+    ctx, selector_slow = _make_selector(dv)
+    selector_slow.add_filter('positive_momentum', positive_momentum, options={'min_close': 10.0})
+    selector_slow.add_filter('low_volume', low_volume)
+
+    _, selector = _make_selector(dv)
+    selector.register_context(ctx)
+    selector.add_filter_formula('positive_momentum', '(momentum > 0) && (close > 10)')
+    selector.add_filter('low_volume', low_volume)
+
+    _, selector_fast = _make_selector(dv)
+    selector_fast.register_context(ctx)
+    dv.add_formula('low_volume', 'volume < 800000', is_quarterly=False)
+    selector_fast.add_filter_field('low_volume', 'low_volume')
+    selector_fast.add_filter_formula('positive_momentum', '(momentum > 0) && (close > 10)')
+
+    for date in dv.dates[1::5]:
+        ctx.trade_date = date
+        ctx.snapshot = dv.get_snapshot(date)
+        expected = selector_slow.get_selection()
+        assert selector.get_selection() == expected
+        assert selector_fast.get_selection() == expected
+        assert 0 < len(expected) < 30
+
+    matrix = selector_fast.selection_matrix
+    assert matrix.shape == (60, 30)
+    assert matrix.values.dtype == np.bool_
+    assert '_selector_positive_momentum' in dv.fields
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
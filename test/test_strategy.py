@@ -2,9 +2,13 @@
 
 from __future__ import print_function
 from jaqs.trade import model
+from jaqs.trade import AlphaStrategy
 import jaqs.util as jutil
 import random
 
+import numpy as np
+import pandas as pd
+
 
 def test_context():
     r = random.random()
@@ -20,6 +24,63 @@ def test_context():
     assert context.storage['me'] == 1.0
 
 
+def _make_alpha_strategy(symbols, close):
+    strategy = AlphaStrategy(pc_method='equal_weight')
+    ctx = model.AlphaContext(strategy=strategy)
+    strategy.init_from_config({})
+    ctx.universe = symbols
+    ctx.snapshot = pd.DataFrame({'close': close}, index=symbols)
+    return strategy
+
+
+def test_generate_weights_order():
+    symbols = ['a', 'b', 'c', 'd']
+    close = [10.0, 33.0, 7.0, 52.0]
+    prices = dict(zip(symbols, close))
+    strategy = _make_alpha_strategy(symbols, close)
+    strategy.portfolio_construction(symbols)
+    strategy.re_weight_suspension({'d'})
+    assert strategy.weights == {'a': 1. / 3, 'b': 1. / 3, 'c': 1. / 3, 'd': 0.0}
+
+    strategy.ctx.pm = None
+    weights = {'a': 0.4, 'b': 0.35, 'c': 0.25, 'd': 0.0}
+    goals, cash_left = strategy.generate_weights_order(weights, 100000.0, prices, suspensions=[])
+    # nearest lot
+    assert [g['size'] for g in goals] == [4000, 1100, 3600, 0]
+    assert np.isclose(cash_left, 100000.0 - 40000 - 36300 - 25200)
+
+    strategy.lot_rounding = 'greedy'
+    goals, cash_left = strategy.generate_weights_order(weights, 99000.0, prices, suspensions=[])
+    # rounded down to 3900, 1000, 3500; then cash 2500 buys one lot of a, can not buy b and buys one lot of c
+    assert [g['size'] for g in goals] == [4000, 1000, 3600, 0]
+    assert np.isclose(cash_left, 800.0)
+
+
+def test_pc_methods():
+    symbols = ['a', 'b', 'c', 'd']
+    strategy = _make_alpha_strategy(symbols, [10.0, 33.0, 7.0, 52.0])
+    strategy.ctx.snapshot = strategy.ctx.snapshot.assign(total_mv=[4.0, np.nan, 1.0, 9.0],
+                                                         index_member=[1.0, 1.0, np.nan, 1.0],
+                                                         index_weight=[0.5, 0.2, np.nan, 0.3])
+    strategy.ctx.snapshot_sub = strategy.ctx.snapshot.loc[['a', 'b', 'c'], :]
+    snap = strategy.ctx.snapshot_sub.copy()
+
+    # built-in methods return Series aligned to the sub-universe, without modifying the snapshot
+    for method, expected in [(strategy.equal_weight, [1.0, 1.0, 1.0]),
+                             (strategy.market_value_weight, [4.0, 0.0, 1.0]),
+                             (strategy.index_weight, [0.5, 0.2, 0.0]),
+                             (strategy.equal_index_weight, [(0.5 + 0.5 / 0.7) / 2, (0.5 + 0.2 / 0.7) / 2, 0.0])]:
+        weights, msg = method()
+        assert isinstance(weights, pd.Series)
+        assert list(weights.index) == ['a', 'b', 'c']
+        assert np.allclose(weights.values, expected)
+    pd.testing.assert_frame_equal(strategy.ctx.snapshot_sub, snap)
+
+    strategy.pc_method = 'market_value_weight'
+    strategy.portfolio_construction(['a', 'b', 'c'])
+    assert strategy.weights == {'a': 0.8, 'b': 0.0, 'c': 0.2, 'd': 0.0}
+
+
 if __name__ == "__main__":
     import time
     t_start = time.time()
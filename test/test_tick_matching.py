@@ -0,0 +1,193 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import time
+
+from jaqs.trade import common
+from jaqs.trade import model
+from jaqs.trade import EventDrivenStrategy, EventBacktestInstance, BacktestTradeApi, PortfolioManager
+from jaqs.trade.tradegateway import OrderBook
+from jaqs.data.basic import Order, Quote
+
+from synthetic_data import make_df_tick, MemoryDataService
+
+SYMBOL = '000001.SZ'
+
+
+def _tick(t, last, volume, bid, bidvol, ask, askvol):
+    return {SYMBOL: Quote.create_from_dict({'symbol': SYMBOL, 'trade_date': 20170104, 'date': 20170104,
+                                            'time': t, 'last': last, 'volume': volume,
+                                            'bidprice1': bid, 'bidvolume1': bidvol,
+                                            'askprice1': ask, 'askvolume1': askvol})}
+
+
+def _add(book, action, price, size, order_type=common.ORDER_TYPE.LIMIT):
+    order = Order.new_order(SYMBOL, action, price, size, 20170104, 93000, order_type=order_type)
+    return book.add_order(order)
+
+
+def _fills(result):
+    return [(trade.entrust_no, trade.fill_price, trade.fill_size) for trade, _ in result]
+
+
+def test_aggressive_partial_fill():
+    book = OrderBook()
+    no = _add(book, common.ORDER_ACTION.BUY, 10.02, 500)
+
+    # only 300 available at best ask, the rest keeps resting
+    res = book.make_trade(_tick(93000, 10.0, 1000, 9.99, 1000, 10.01, 300), common.QUOTE_TYPE.TICK)
+    assert _fills(res) == [(no, 10.01, 300)]
+    assert res[0][1].order_status != common.ORDER_STATUS.FILLED
+    assert no in book.orders
+
+    res = book.make_trade(_tick(93003, 10.01, 1000, 10.0, 1000, 10.02, 1000), common.QUOTE_TYPE.TICK)
+    assert _fills(res) == [(no, 10.02, 200)]
+    assert res[0][1].order_status == common.ORDER_STATUS.FILLED
+    assert res[0][1].fill_price == (10.01 * 300 + 10.02 * 200) / 500
+    assert no not in book.orders
+
+
+def test_queue_position():
+    book = OrderBook()
+
+    # join bid 10.00 behind 1000 shares
+    res = book.make_trade(_tick(93000, 10.0, 0, 10.0, 1000, 10.01, 1000), common.QUOTE_TYPE.TICK)
+    assert res == []
+    no1 = _add(book, common.ORDER_ACTION.BUY, 10.0, 300)
+    no2 = _add(book, common.ORDER_ACTION.BUY, 10.0, 300)
+    res = book.make_trade(_tick(93003, 10.0, 0, 10.0, 1000, 10.01, 1000), common.QUOTE_TYPE.TICK)
+    assert res == []
+
+    # 800 traded at 10.00: queue ahead not exhausted
+    res = book.make_trade(_tick(93006, 10.0, 800, 10.0, 200, 10.01, 1000), common.QUOTE_TYPE.TICK)
+    assert res == []
+
+    # 400 more: 200 to queue ahead, 200 to first order
+    res = book.make_trade(_tick(93009, 10.0, 1200, 10.0, 500, 10.01, 1000), common.QUOTE_TYPE.TICK)
+    assert _fills(res) == [(no1, 10.0, 200)]
+
+    # 500 more: first order finished, second order partially filled
+    res = book.make_trade(_tick(93012, 10.0, 1700, 10.0, 500, 10.01, 1000), common.QUOTE_TYPE.TICK)
+    assert _fills(res) == [(no1, 10.0, 100), (no2, 10.0, 300)]
+
+    # market trades through a sell price: filled without queue
+    no3 = _add(book, common.ORDER_ACTION.SELL, 10.05, 100)
+    res = book.make_trade(_tick(93015, 10.06, 1800, 10.05, 500, 10.07, 1000), common.QUOTE_TYPE.TICK)
+    assert _fills(res) == [(no3, 10.05, 100)]
+    assert book.orders == {}
+
+
+
+def test_queue_unknown_before_quote():
+    book = OrderBook()
+    no = _add(book, common.ORDER_ACTION.BUY, 9.99, 300)
+    res = book.make_trade(_tick(93001, 10.0, 0, 10.0, 1000, 10.01, 1000), common.QUOTE_TYPE.TICK)
+    assert res == []
+
+    # a print at our price while our level is below top of book: queue position unknown, no fill
+    res = book.make_trade(_tick(93003, 9.99, 500, 10.0, 1000, 10.01, 1000), common.QUOTE_TYPE.TICK)
+    assert res == []
+
+    # our level reaches top of book behind 400 shares
+    res = book.make_trade(_tick(93006, 9.99, 500, 9.99, 400, 10.0, 1000), common.QUOTE_TYPE.TICK)
+    assert res == []
+
+    # 600 more at 9.99: 400 to queue ahead, 200 to our order
+    res = book.make_trade(_tick(93009, 9.99, 1100, 9.99, 200, 10.0, 1000), common.QUOTE_TYPE.TICK)
+    assert _fills(res) == [(no, 9.99, 200)]
+    res = book.make_trade(_tick(93012, 9.99, 1200, 9.99, 200, 10.0, 1000), common.QUOTE_TYPE.TICK)
+    assert _fills(res) == [(no, 9.99, 100)]
+    assert book.orders == {}
+
+def test_price_priority_and_cancel():
+    book = OrderBook()
+    book.make_trade(_tick(93000, 10.0, 0, 9.99, 1000, 10.0, 1000), common.QUOTE_TYPE.TICK)
+    no_low = _add(book, common.ORDER_ACTION.BUY, 10.01, 100)
+    no_high = _add(book, common.ORDER_ACTION.BUY, 10.03, 100)
+    no_cancel = _add(book, common.ORDER_ACTION.BUY, 10.05, 100)
+    no_mkt = _add(book, common.ORDER_ACTION.SELL, 0.0, 50, order_type=common.ORDER_TYPE.MARKET)
+
+    ind = book.cancel_order(no_cancel)
+    assert ind.order_status == common.ORDER_STATUS.CANCELLED
+
+    # market sell hits best bid; higher buy price has priority on the ask side
+    res = book.make_trade(_tick(93003, 10.0, 0, 9.99, 1000, 10.04, 150), common.QUOTE_TYPE.TICK)
+    assert _fills(res) == [(no_mkt, 9.99, 50)]
+    res = book.make_trade(_tick(93006, 10.0, 0, 9.99, 1000, 10.01, 150), common.QUOTE_TYPE.TICK)
+    assert _fills(res) == [(no_high, 10.01, 100), (no_low, 10.01, 50)]
+
+
+def test_tick_throughput():
+    # many resting orders far from market should not slow down matching
+    quotes = [_tick(93000 + i, 10.0, 100 * i, 10.0, 1000, 10.01, 1000) for i in range(2000)]
+
+    def run(n_far):
+        book = OrderBook()
+        for i in range(n_far):
+            _add(book, common.ORDER_ACTION.BUY, 5.0 + i * 1e-4, 100)
+            _add(book, common.ORDER_ACTION.SELL, 20.0 - i * 1e-4, 100)
+        t0 = time.time()
+        for quote in quotes:
+            book.make_trade(quote, common.QUOTE_TYPE.TICK)
+        return time.time() - t0
+
+    t_few = run(10)
+    t_many = run(5000)
+    print("20 resting orders {:.3f}s, 10000 resting orders {:.3f}s".format(t_few, t_many))
+    assert t_many < 3 * t_few + 0.05
+
+
+class TickStrategy(EventDrivenStrategy):
+    """Post a bid at best bid every 200 ticks and record events."""
+    def __init__(self):
+        super(TickStrategy, self).__init__()
+        self.n_ticks = 0
+        self.trades = []
+        self.times = []
+
+    def on_tick(self, quote):
+        self.n_ticks += 1
+        self.times.append((quote.trade_date, quote.time))
+        assert self.ctx.time == quote.time
+        if self.n_ticks % 200 == 0:
+            self.ctx.trade_api.place_order(quote.symbol, common.ORDER_ACTION.BUY, quote.bidprice1, 200)
+
+    def on_trade(self, ind):
+        self.trades.append(ind)
+
+
+def test_backtest_tick():
+    dates = [20170104, 20170105]
+    df_tick = make_df_tick(n_symbols=5, n_ticks=1000, dates=dates)
+    ds = MemoryDataService(df_tick)
+    props = {'symbol': ','.join(sorted(df_tick['symbol'].unique())),
+             'start_date': dates[0], 'end_date': dates[-1],
+             'bar_type': '0', 'init_balance': 1e7}
+
+    strategy = TickStrategy()
+    bt = EventBacktestInstance()
+    model.Context(data_api=ds, trade_api=BacktestTradeApi(), instance=bt, strategy=strategy, pm=PortfolioManager())
+    bt.init_from_config(props)
+    bt.run()
+
+    assert strategy.n_ticks == len(df_tick)
+    assert strategy.times == sorted(strategy.times)
+    assert len(strategy.trades) > 0
+    for trade in strategy.trades:
+        assert trade.fill_size <= 200
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))
@@ -0,0 +1,142 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import os
+import random
+
+import numpy as np
+import pandas as pd
+
+from jaqs.trade import WalkForwardOptimizer, AlphaStrategy
+from jaqs.trade import model
+from jaqs.trade.walkforward import expand_param_grid, split_windows, calc_daily_pnl
+from jaqs.trade.analyze import AlphaAnalyzer
+
+from synthetic_data import make_dataview
+
+
+def top_momentum(context, user_options=None):
+    momentum = context.snapshot['momentum']
+    return momentum.rank(ascending=False) <= user_options['n']
+
+
+def strategy_factory(params):
+    stock_selector = model.StockSelector()
+    stock_selector.add_filter(name='top_momentum', func=top_momentum, options={'n': params['n']})
+    return AlphaStrategy(stock_selector=stock_selector, pc_method='equal_weight')
+
+
+def test_split_windows():
+    dates = np.arange(20)
+    windows = split_windows(dates, train_days=5, test_days=3)
+    assert len(windows) == 4
+    assert windows[0] == {'train_start': 0, 'train_end': 5, 'test_start': 5, 'test_end': 8}
+    # test windows are consecutive
+    for w1, w2 in zip(windows[:-1], windows[1:]):
+        assert w1['test_end'] == w2['test_start']
+    # gaps between test windows are allowed, overlaps are not
+    windows = split_windows(dates, train_days=5, test_days=3, step_days=4)
+    assert [w['test_start'] for w in windows] == [5, 9, 13]
+    try:
+        split_windows(dates, train_days=5, test_days=3, step_days=2)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("ValueError should have been raised.")
+    
+    assert len(expand_param_grid({'b': [1, 2], 'a': ['x', 'y', 'z']})) == 6
+    assert expand_param_grid(None) == [dict()]
+
+
+def test_dataview_view():
+    dv = make_dataview(n_dates=30)
+    view = dv.view(dv.dates[5], dv.dates[10])
+    assert view.data_d is dv.data_d
+    assert view.get_ts('close').shape[0] == 6
+    assert dv.start_date == dv.dates[1]
+
+
+def _run_walk_forward(n_jobs):
+    dv = make_dataview(n_dates=60)
+    props = {'start_date': dv.start_date, 'end_date': dv.end_date,
+             'period': 'day', 'n_periods': 2,
+             'init_balance': 1e8, 'position_ratio': 1.0,
+             'train_days': 20, 'test_days': 10,
+             'n_jobs': n_jobs}
+    wfo = WalkForwardOptimizer(dv, strategy_factory, param_grid={'n': [2, 4]})
+    wfo.init_from_config(props)
+    df = wfo.run()
+    return dv, wfo, df
+
+
+def test_walk_forward():
+    dv, wfo, df = _run_walk_forward(n_jobs=1)
+    
+    assert len(df) == len(wfo.windows) == 3
+    assert len(wfo.trials) == 3 * 2
+    assert (df['train_time'] > 0).all() and (df['test_time'] > 0).all()
+    for _, row in df.iterrows():
+        assert row['params'] in wfo.param_list
+    
+    # out-of-sample trades only fall in test windows and every window ends flat
+    trades = wfo.get_trades_df()
+    assert trades['fill_date'].min() > wfo.windows[0]['test_start']
+    assert trades['fill_date'].max() == wfo.windows[-1]['test_end']
+    sign = np.where(trades['entrust_action'] == 'Buy', 1.0, -1.0)
+    pos = (sign * trades['fill_size']).groupby(trades['symbol']).sum()
+    assert np.allclose(pos.values, 0.0)
+    
+    # parallel search gives the same result
+    _, wfo2, df2 = _run_walk_forward(n_jobs=2)
+    assert list(df['params']) == list(df2['params'])
+    assert np.allclose(wfo.get_daily_pnl().values, wfo2.get_daily_pnl().values)
+    
+    # result can be analyzed like a normal backtest
+    folder = '../output/tests/walk_forward{:.6f}'.format(random.random())
+    wfo.save_results(folder)
+    assert os.path.exists(os.path.join(folder, 'walk_forward.csv'))
+    ta = AlphaAnalyzer()
+    ta.initialize(dataview=dv, file_folder=folder)
+    ta.process_trades()
+    assert ta.start_date == wfo.windows[0]['test_start']
+    assert ta.init_balance == 1e8
+    assert len(ta.trades) == len(trades)
+
+
+def test_liquidate_suspended():
+    dv = make_dataview(n_dates=30)
+    wfo = WalkForwardOptimizer(dv, strategy_factory)
+    dates = [20170103, 20170104, 20170105]
+    # symbol is suspended on the last date of the test window
+    wfo._df_close = pd.DataFrame({'000001.SZ': [10.0, 11.0, np.nan]}, index=dates)
+    df_trades = pd.DataFrame({'task_id': '1', 'entrust_no': '1', 'entrust_action': 'Buy',
+                              'symbol': ['000001.SZ'], 'fill_price': 10.0, 'fill_size': 100.0,
+                              'fill_date': dates[0], 'fill_time': 150000, 'fill_no': '1',
+                              'commission': 0.0, 'trade_date': dates[0]})
+    cost_model = model.TradeCostModel(commission_rate=0.0, stamp_tax_rate=0.001)
+    
+    df = wfo._liquidate(df_trades, dates[-1], cost_model)
+    liq = df.iloc[-1]
+    assert len(df) == 2
+    assert liq['entrust_action'] == 'Sell' and liq['fill_size'] == 100.0
+    assert liq['fill_price'] == 11.0
+    assert np.isclose(liq['commission'], 11.0 * 100 * 0.001)
+    
+    pnl = calc_daily_pnl(df, wfo._df_close, 1e4)
+    assert np.allclose(pnl.values, [0.0, 100.0, -1.1])
+
+
+if __name__ == "__main__":
+    import time
+    t_start = time.time()
+    
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+    
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
+    
+    t3 = time.time() - t_start
+    print("\n\n\nTime lapsed in total: {:.1f}".format(t3))